@@ -3,8 +3,8 @@
 # Required: pip install customtkinter ultralytics opencv-python pillow firebase-admin openpyxl
 # Put your Firebase service account JSON next to this file as: serviceAccountKey.json
 
-import os, sys, time, json, uuid, glob, signal
-from datetime import datetime, date, timedelta, timezone
+import os, sys, json, glob, signal
+from datetime import datetime, date, timedelta
 
 import customtkinter as ctk
 import tkinter as tk
@@ -12,35 +12,33 @@ from tkinter import ttk
 from tkinter import font as tkfont
 from tkinter import messagebox
 
-import cv2
-import numpy as np
-from PIL import Image, ImageTk
-from ultralytics import YOLO
-
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
 from collections import Counter, defaultdict
-
-# -------- Emoji Support --------
-try:
-    import emojis
-    EMOJI_AVAILABLE = True
-except ImportError:
-    EMOJI_AVAILABLE = False
+from PIL import Image, ImageTk
+# dependency หนักโหลดแบบ lazy (ดู lazy_imports.py) → หน้าต่างขึ้นก่อน ค่อยจ่ายค่า import ตอนใช้จริง
+from lazy_imports import lazy_import, lazy_from, is_available
+
+openpyxl = lazy_import("openpyxl")
+Font = lazy_from("openpyxl.styles", "Font")
+Alignment = lazy_from("openpyxl.styles", "Alignment")
+PatternFill = lazy_from("openpyxl.styles", "PatternFill")
+Border = lazy_from("openpyxl.styles", "Border")
+Side = lazy_from("openpyxl.styles", "Side")
+get_column_letter = lazy_from("openpyxl.utils", "get_column_letter")
+
+# -------- Emoji Support (import ตอน log ครั้งแรก) --------
+EMOJI_AVAILABLE = is_available("emojis")
+if not EMOJI_AVAILABLE:
     print("Warning: emojis library not available. Install with: pip install emojis")
+emojis = lazy_import("emojis")
 
-try:
-    from colorama import init, Fore, Back, Style
-    init(autoreset=True)
-    COLORAMA_AVAILABLE = True
-except ImportError:
-    COLORAMA_AVAILABLE = False
+COLORAMA_AVAILABLE = is_available("colorama")
+if not COLORAMA_AVAILABLE:
     print("Warning: colorama library not available. Install with: pip install colorama")
+colorama = lazy_import("colorama", on_load=lambda m: m.init(autoreset=True))
 
-# -------- Firebase Admin SDK --------
-import firebase_admin
-from firebase_admin import credentials, db
+from plate_tracker import PlateTracker
+from inspection_core import cv2, YOLO, TwoStagePipeline, PlateSession, annotate, AppServices
+from runtime_config import RuntimeConfig, MAC_SCHEMA, MAC_RULES
 
 
 # ================================
@@ -100,12 +98,14 @@ class ExcelViewerDialog(ctk.CTkToplevel):
 
     def _refresh_file_list(self):
         prev = self.combo.get()
+        # รายงานเก่าถูก RetentionManager ย้ายไป archive/YYYY-MM/ → แสดงเป็น path ย่อยใต้ folder
         paths = sorted(
-            glob.glob(os.path.join(self.folder, "Report_*.xlsx")),
+            glob.glob(os.path.join(self.folder, "Report_*.xlsx"))
+            + glob.glob(os.path.join(self.folder, "archive", "*", "Report_*.xlsx")),
             key=lambda p: os.path.getmtime(p),
             reverse=True,
         )
-        names = [os.path.basename(p) for p in paths]
+        names = [os.path.relpath(p, self.folder) for p in paths]
         self.combo["values"] = names
 
         if not names:
@@ -298,12 +298,14 @@ class WeeklyExcelViewerDialog(ctk.CTkToplevel):
 
     def _refresh_file_list(self):
         prev = self.combo.get()
+        # รายงานเก่าถูก RetentionManager ย้ายไป archive/YYYY-MM/ → แสดงเป็น path ย่อยใต้ folder
         paths = sorted(
-            glob.glob(os.path.join(self.folder, "Weekly_*.xlsx")),
+            glob.glob(os.path.join(self.folder, "Weekly_*.xlsx"))
+            + glob.glob(os.path.join(self.folder, "archive", "*", "Weekly_*.xlsx")),
             key=lambda p: os.path.getmtime(p),
             reverse=True,
         )
-        names = [os.path.basename(p) for p in paths]
+        names = [os.path.relpath(p, self.folder) for p in paths]
         self.combo["values"] = names
         if not names:
             self.combo.set("")
@@ -513,8 +515,8 @@ class LeafPlateDetectionApp:
     def _print_colored_emoji_message(self, message, emoji_code, color="white"):
         if COLORAMA_AVAILABLE:
             emoji_char = self._get_colored_emoji(emoji_code)
-            color_func = getattr(Fore, color.upper(), Fore.WHITE)
-            print(f"{color_func}{emoji_char} {message}{Style.RESET_ALL}")
+            color_func = getattr(colorama.Fore, color.upper(), colorama.Fore.WHITE)
+            print(f"{color_func}{emoji_char} {message}{colorama.Style.RESET_ALL}")
         else:
             emoji_char = self._get_colored_emoji(emoji_code)
             print(f"{emoji_char} {message}")
@@ -534,12 +536,13 @@ class LeafPlateDetectionApp:
     def initialize_data(self):
         # ==== สเกลอัตโนมัติ ====
         self.BASE_W, self.BASE_H = 1920, 1080
-        _tmp = tk.Tk()
-        try:
-            screen_w = _tmp.winfo_screenwidth()
-            screen_h = _tmp.winfo_screenheight()
-        finally:
-            _tmp.destroy()
+        # สร้างหน้าต่างหลักครั้งเดียวแล้วซ่อนไว้อ่านขนาดจอ (เดิมสร้าง tk.Tk() ทิ้ง = เปิด Tcl interpreter 2 รอบ)
+        ctk.set_appearance_mode("light")
+        ctk.set_default_color_theme("blue")
+        self.app = ctk.CTk()
+        self.app.withdraw()
+        screen_w = self.app.winfo_screenwidth()
+        screen_h = self.app.winfo_screenheight()
 
         margin_w = 40
         margin_h = 80
@@ -625,52 +628,67 @@ class LeafPlateDetectionApp:
             "circle_leaf_plate": "circle",
         }
         self.shape_display_map = {"heart": "หัวใจ", "rectangle": "สี่เหลี่ยมผืนผ้า", "circle": "วงกลม"}
+        self._shape_model_names = {v: k for k, v in self.shape_map.items()}   # ป้ายบนภาพใช้ชื่อคลาสเต็ม
 
         # files
-        self.captures_dir = os.path.join(self.BASE_DIR, "captures")
-        os.makedirs(self.captures_dir, exist_ok=True)
+        # captures/ + retention + mining + Firebase (ปรับผ่าน env LEAFPLATE_* ; ดู inspection_core/services.py)
+        self.services = AppServices(self.BASE_DIR)
+        self.captures_dir = self.services.captures_dir
+        self.retention, self.miner, self.fb = self.services.retention, self.services.miner, self.services.fb
         self._auto_xlsx_path = None
         self._auto_json_path = None
         self._session_stamp = None
 
         # Firebase
-        self.firebase_base = "https://leaf-plate-defect-detec-w-cnn-default-rtdb.asia-southeast1.firebasedatabase.app"
         self.firebase_session_key = None
-        self._fb_ready = False
 
         # gating
         self.lbl_heart = self.lbl_rect = self.lbl_circle = None
-        self.gate_has_plate = False
-        self.gate_has_counted = False
-        self.gate_present_frames = 0
-        self.gate_absent_frames = 0
         self.gate_present_thresh = 1
         self.gate_absent_thresh = 2
         self.lbl_plate_status = None
-        self._latched_defect_counts = {"crack": 0, "hole": 0, "bulge": 0, "burn": 0}
-        self._latched_shapes = set()
-        self._freeze_after_count = False  # when true, ignore new detections until plate leaves
-        self._last_shape_bbox = None      # (x1,y1,x2,y2) of best shape
-        self._shape_change_frames = 0
-        self.shape_change_thresh = 5
-        self.shape_change_iou = 0.15
-        self._shape_move_frames = 0
-        # require a noticeable movement for several frames to consider new plate
-        self.shape_move_frames_thresh = 3
-        self.shape_move_dist_px = max(20, int(min(self.cam_w, self.cam_h) * 0.12))
-        # ROI texture-change based new-plate detection
-        self._prev_shape_roi_gray = None
-        self._roi_change_frames = 0
-        self.roi_change_frames_thresh = 3
-        self.roi_change_mae_thresh = 10.0  # mean abs diff 0-255
-        # shape voting per plate
-        self._shape_votes = Counter()
-        
-        # เพิ่มตัวแปรสำหรับการติดตามสถานะแบบไดนามิก
-        self._plate_final_status = None  # None, "pass", "defect"
-        self._defect_detected_flag = False  # ถ้าเป็น True แล้วจะไม่เปลี่ยนกลับเป็น False
-        self._current_defect_count = 0
-        self._plate_counted_already = False  # ติดตามว่านับจานไปแล้วหรือยัง
+        # จำนวนตำหนิของจานปัจจุบัน จากหลักฐานที่รวมข้ามเฟรม (defect_fusion.py)
+        self._plate_defect_counts = {"crack": 0, "hole": 0, "bulge": 0, "burn": 0}
+        # plate tracker: ID จานคงที่ข้ามเฟรม (แทน IoU ต่ำ / ระยะเคลื่อนที่ / ROI-MAE)
+        # track ต้องเห็นอย่างน้อย 2 เฟรมก่อนยืนยัน กันกล่องหลอกเฟรมเดียวถูกนับเป็นจาน
+        self.track_low_thresh = 0.30  # กล่อง shape conf ต่ำกว่า shape_conf_thr ใช้ต่อ track เดิมเท่านั้น
+        self.tracker = PlateTracker(
+            high_thresh=self.shape_conf_thr,
+            low_thresh=self.track_low_thresh,
+            min_hits=max(2, self.gate_present_thresh),
+            max_misses=self.gate_absent_thresh,
+        )
+        self.session = PlateSession(self.tracker, track_conf=self.track_low_thresh)
+        self.pipeline = None   # TwoStagePipeline (สร้างหลังโหลดโมเดล)
+
+        # runtime config (config/mac.yaml): ค่าข้างบน = default, แก้ไฟล์ระหว่างรันได้
+        self.config = RuntimeConfig(
+            os.environ.get("LEAFPLATE_CONFIG", os.path.join(self.BASE_DIR, "config", "mac.yaml")),
+            MAC_SCHEMA, MAC_RULES,
+        ).bind(self)
+        self._apply_config(self.config.load())
+
+    def _apply_config(self, changed):
+        """ใช้ค่า config ที่เปลี่ยน (เรียกระหว่างเฟรม ไม่ reload โมเดล)"""
+        if not changed:
+            return
+        for key, value in changed.items():
+            setattr(self, key, value)
+        self.tracker.high_thresh = self.shape_conf_thr
+        self.tracker.low_thresh = self.track_low_thresh
+        self.tracker.min_hits = max(2, self.gate_present_thresh)
+        self.tracker.max_misses = self.gate_absent_thresh
+        self.session.track_conf = self.track_low_thresh
+        if self.pipeline is not None:
+            self.pipeline.configure(**self._pipeline_params())
+
+    def _pipeline_params(self):
+        # shape กับ defect ใช้ imgsz / iou ชุดเดียวกัน
+        return dict(
+            imgsz=self.imgsz, shape_conf=self.shape_conf_thr, track_conf=self.track_low_thresh,
+            shape_iou=self.iou_thr, defect_conf=self.defect_conf_thr, defect_iou=self.iou_thr,
+            candidate_conf=self.services.candidate_conf,
+        )
 
     def generate_lot_id(self):
         """สร้าง lot_id โดยตรวจสอบข้อมูลเดิมในวันเดียวกันและนับต่อจากชุดล่าสุด"""
@@ -700,9 +718,9 @@ class LeafPlateDetectionApp:
         today_date = self.thai_date(datetime.now())
         base_pattern = f"PTP{today_str}"
         existing_lots = set()
-        
-        # ตรวจสอบไฟล์ Report_*.xlsx ทั้งหมดในโฟลเดอร์
-        for report_file in glob.glob(os.path.join(self.save_root, "Report_*.xlsx")):
+
+        # ตรวจสอบเฉพาะไฟล์ Report_*.xlsx ที่ถูกแก้ไขวันนี้ (แถวของวันนี้ต้องถูกเขียนวันนี้เสมอ)
+        for report_file in self._reports_modified_since(date.today()):
             try:
                 wb = openpyxl.load_workbook(report_file, data_only=True)
                 sh = wb.active
@@ -743,6 +761,18 @@ class LeafPlateDetectionApp:
         
         return list(existing_lots)
 
+    def _reports_modified_since(self, since_d: date):
+        """คืน Report_*.xlsx ที่ถูกแก้ไขตั้งแต่ since_d — กรองด้วย mtime ก่อน ไม่ต้องเปิดทุกไฟล์ด้วย openpyxl"""
+        since_ts = datetime.combine(since_d, datetime.min.time()).timestamp()
+        paths = []
+        for p in glob.glob(os.path.join(self.save_root, "Report_*.xlsx")):
+            try:
+                if os.path.getmtime(p) >= since_ts:
+                    paths.append(p)
+            except OSError:
+                continue
+        return paths
+
     def _check_and_continue_session(self):
         """ตรวจสอบว่ามีเซสชันในวันเดียวกันหรือไม่ และอัปเดตข้อมูลให้เหมาะสม"""
         # เพิ่มการตรวจสอบความปลอดภัย
@@ -812,62 +842,9 @@ class LeafPlateDetectionApp:
         except Exception:
             pass
 
-    # ---------------- Firebase helpers ----------------
-    def _fb_init(self):
-        if self._fb_ready:
-            return
-        try:
-            cred_path = os.path.join(self.BASE_DIR, "serviceAccountKey.json")
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred, {"databaseURL": self.firebase_base})
-            self._fb_ready = True
-        except Exception as e:
-            print(f"[Firebase] Admin init failed, will fallback to REST. reason={e}")
-            self._fb_ready = False
-
-    def _firebase_post(self, path, obj):
-        payload = {
-            **obj,
-            "_meta": {"source": "python-admin", "pushed_at": datetime.now(timezone.utc).isoformat(), "server_id": str(uuid.uuid4())}
-        }
-        try:
-            self._fb_init()
-            if self._fb_ready:
-                db.reference(path).push(payload)
-                return
-        except Exception as e:
-            print(f"[Firebase] Admin push failed, fallback REST. reason={e}")
-        try:
-            import urllib.request
-            url = f"{self.firebase_base}/{path}.json"
-            data = json.dumps(payload).encode("utf-8")
-            req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
-            with urllib.request.urlopen(req, timeout=5): pass
-        except Exception as e:
-            print(f"[Firebase] REST POST error: {e}")
-
-    def _firebase_put(self, path, obj):
-        try:
-            self._fb_init()
-            if self._fb_ready:
-                db.reference(path).set(obj)
-                return
-        except Exception as e:
-            print(f"[Firebase] Admin set failed, fallback REST. reason={e}")
-        try:
-            import urllib.request
-            url = f"{self.firebase_base}/{path}.json"
-            data = json.dumps(obj).encode("utf-8")
-            req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="PUT")
-            with urllib.request.urlopen(req, timeout=5): pass
-        except Exception as e:
-            print(f"[Firebase] REST PUT error: {e}")
-
     # ---------------- App / Camera / Model ----------------
     def setup_app(self):
-        ctk.set_appearance_mode("light")
-        ctk.set_default_color_theme("blue")
-        self.app = ctk.CTk()
+        # self.app ถูกสร้าง (ซ่อนไว้) ใน initialize_data แล้ว
         self.app.title("Leaf Plate Defect Detection")
 
         # macOS: ปิด tk scaling เพื่อไม่ให้ซ้ำกับ Retina แล้วใช้ self.SCALE คุมเอง
@@ -882,23 +859,12 @@ class LeafPlateDetectionApp:
         self.app.configure(fg_color="#ffffff")
         self.app.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.app.report_callback_exception = self._report_callback_exception
+        self.app.deiconify()
 
     def setup_camera(self):
-        if sys.platform.startswith("win"):
-            backend = cv2.CAP_DSHOW
-        elif sys.platform == "darwin":
-            backend = cv2.CAP_AVFOUNDATION
-        else:
-            backend = cv2.CAP_V4L2
-        self.cap = cv2.VideoCapture(0, backend)
-        if not self.cap or not self.cap.isOpened():
-            self.cap = cv2.VideoCapture(0)
-        if not self.cap or not self.cap.isOpened():
-            print("Cannot open camera"); self.cap = None; return
         target_w = max(640, min(1280, self.cam_w))
         target_h = max(360, min(720, self.cam_h))
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, target_w)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, target_h)
+        self.cap = self.services.open_camera(target_w, target_h)
 
     def setup_model(self):
         shape_ok = defect_ok = False
@@ -916,6 +882,11 @@ class LeafPlateDetectionApp:
         except Exception as e:
             self._log_with_emoji("error", f"โหลดโมเดลตำหนิไม่สำเร็จ: {e}")
             self.defect_model = None
+        # กล่องรูปทรงคนละคลาสที่ซ้อนกันบนจานเดียว → NMS ข้ามคลาสอีกรอบ (shape_nms_iou)
+        self.pipeline = TwoStagePipeline(
+            self.shape_model, self.defect_model, self.shape_map, self.defect_classes,
+            shape_nms_iou=self.shape_nms_iou, **self._pipeline_params()
+        )
         if not (shape_ok and defect_ok):
             messagebox.showerror("Model Error", "โหลดโมเดลไม่ครบ กรุณาตรวจสอบไฟล์ shape.pt และ defect.pt")
 
@@ -1285,19 +1256,19 @@ class LeafPlateDetectionApp:
         self._update_lot_label()
 
     def _reset_defect_table(self):
-        for k in list(self._latched_defect_counts.keys()):
-            self._latched_defect_counts[k] = 0
+        for k in list(self._plate_defect_counts.keys()):
+            self._plate_defect_counts[k] = 0
         for defect, (status, color) in self._defect_defaults.items():
             lbl = self.status_labels.get(defect)
             if lbl:
                 status_color = "#199129" if color == "green" else "#e74c3c"
                 lbl.configure(text=status, text_color=status_color)
 
-    def _render_latched_defect_counts(self):
+    def _render_plate_defect_counts(self):
         for en_name, th_name in self.defect_th_map.items():
             lbl = self.status_labels.get(th_name)
             if not lbl: continue
-            cnt = int(self._latched_defect_counts.get(en_name, 0))
+            cnt = int(self._plate_defect_counts.get(en_name, 0))
             if cnt > 0:
                 lbl.configure(text=str(cnt), text_color="#e74c3c")
             else:
@@ -1362,88 +1333,12 @@ class LeafPlateDetectionApp:
                 "end_time": datetime.now().strftime("%H:%M:%S")
             }
         }
-        self._firebase_put(f"sessions/{self.firebase_session_key}/meta", meta)
-        self._firebase_post(f"sessions/{self.firebase_session_key}/records", row)
+        self.fb.put(f"sessions/{self.firebase_session_key}/meta", meta)
+        self.fb.post(f"sessions/{self.firebase_session_key}/records", row)
 
         return row
 
     # ---------------- Detection ----------------
-    def _annotate_and_summarize(self, frame_bgr, res_shape=None, res_defect=None):
-        annotated = frame_bgr.copy()
-        shapes_found, defect_names = set(), set()
-        defect_counts = {}
-        best_shape_bbox = None
-        best_shape_conf = -1.0
-
-        # Draw shapes (blue boxes)
-        if res_shape is not None and hasattr(res_shape, "boxes") and res_shape.boxes is not None and self.shape_model is not None:
-            names_s = self.shape_model.names
-            boxes = res_shape.boxes
-            xyxy = boxes.xyxy.cpu().numpy()
-            clss = boxes.cls.cpu().numpy().astype(int)
-            conf = boxes.conf.cpu().numpy()
-
-            # Collect detections and apply simple class-agnostic NMS to avoid overlapping multi-class boxes
-            dets = []  # (x1,y1,x2,y2,conf,label)
-            for (x1, y1, x2, y2), c, p in zip(xyxy, clss, conf):
-                label = names_s.get(int(c), str(c))
-                if label not in self.shape_map:
-                    continue
-                dets.append((float(x1), float(y1), float(x2), float(y2), float(p), label))
-
-            dets.sort(key=lambda d: d[4], reverse=True)
-            kept = []
-            def iou(a, b):
-                ax1, ay1, ax2, ay2 = a[0], a[1], a[2], a[3]
-                bx1, by1, bx2, by2 = b[0], b[1], b[2], b[3]
-                inter_x1 = max(ax1, bx1)
-                inter_y1 = max(ay1, by1)
-                inter_x2 = min(ax2, bx2)
-                inter_y2 = min(ay2, by2)
-                iw = max(0.0, inter_x2 - inter_x1)
-                ih = max(0.0, inter_y2 - inter_y1)
-                inter = iw * ih
-                area_a = max(0.0, (ax2 - ax1)) * max(0.0, (ay2 - ay1))
-                area_b = max(0.0, (bx2 - bx1)) * max(0.0, (by2 - by1))
-                union = area_a + area_b - inter
-                return (inter / union) if union > 0 else 0.0
-            for d in dets:
-                suppressed = False
-                for k in kept:
-                    if iou(d, k) >= self.shape_nms_iou:
-                        suppressed = True
-                        break
-                if not suppressed:
-                    kept.append(d)
-
-            for x1, y1, x2, y2, p, label in kept:
-                xi1, yi1, xi2, yi2 = int(x1), int(y1), int(x2), int(y2)
-                cv2.rectangle(annotated, (xi1, yi1), (xi2, yi2), (0, 102, 255), 2)
-                cv2.putText(annotated, f"{label} {p:.2f}", (xi1, max(20, yi1 - 6)),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 102, 255), 2, cv2.LINE_AA)
-                shapes_found.add(self.shape_map[label])
-                if p > best_shape_conf:
-                    best_shape_conf = p
-                    best_shape_bbox = (xi1, yi1, xi2, yi2)
-
-        # Draw defects (red boxes)
-        if res_defect is not None and hasattr(res_defect, "boxes") and res_defect.boxes is not None and self.defect_model is not None:
-            names_d = self.defect_model.names
-            boxes = res_defect.boxes
-            xyxy = boxes.xyxy.cpu().numpy().astype(int)
-            clss = boxes.cls.cpu().numpy().astype(int)
-            conf = boxes.conf.cpu().numpy()
-            for (x1, y1, x2, y2), c, p in zip(xyxy, clss, conf):
-                label = names_d.get(int(c), str(c))
-                cv2.rectangle(annotated, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                cv2.putText(annotated, f"{label} {p:.2f}", (x1, max(20, y1 - 6)),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (20, 20, 255), 2, cv2.LINE_AA)
-                if label in self.defect_classes:
-                    defect_names.add(label)
-                    defect_counts[label] = defect_counts.get(label, 0) + 1
-
-        return annotated, shapes_found, defect_counts, defect_names, best_shape_bbox
-
     # ---------------- Camera loop ----------------
     def start_camera(self):
         if self.cap:
@@ -1458,6 +1353,7 @@ class LeafPlateDetectionApp:
     def update_camera(self):
         if not self.camera_running or not self.cap:
             return
+        self._apply_config(self.config.poll())
         ret, frame = self.cap.read()
         if not ret:
             self.app.after(30, self.update_camera); return
@@ -1466,199 +1362,33 @@ class LeafPlateDetectionApp:
 
         if self.is_collecting_data and (self.shape_model is not None or self.defect_model is not None):
             try:
-                res_shape = None
-                res_defect = None
-                if self.shape_model is not None:
-                    results_s = self.shape_model.predict(
-                        source=frame_resized, imgsz=self.imgsz,
-                        conf=self.shape_conf_thr, iou=self.iou_thr, verbose=False
-                    )
-                    res_shape = results_s[0]
-                if self.defect_model is not None:
-                    results_d = self.defect_model.predict(
-                        source=frame_resized, imgsz=self.imgsz,
-                        conf=self.defect_conf_thr, iou=self.iou_thr, verbose=False
-                    )
-                    res_defect = results_d[0]
-                annotated, shapes_found, defect_counts, defect_names, best_bbox = self._annotate_and_summarize(frame_resized, res_shape, res_defect)
+                result = self.pipeline.run(frame_resized)
+                annotated = annotate(frame_resized, result,
+                                     shape_color=(0, 102, 255), shape_text_color=(0, 102, 255),
+                                     defect_color=(255, 0, 0), shape_names=self._shape_model_names)
                 frame_to_show = annotated
 
-                # ปรับเงื่อนไขการตรวจจับจานให้รวมทั้งรูปทรงและตำหนิ
-                plate_detected = len(shapes_found) > 0 or len(defect_names) > 0
-                
-                # Detect new plate arrival by low IoU and noticeable movement of best shape bbox
-                if plate_detected and best_bbox is not None:
-                    def iou_xyxy(a, b):
-                        ax1, ay1, ax2, ay2 = a
-                        bx1, by1, bx2, by2 = b
-                        inter_x1 = max(ax1, bx1); inter_y1 = max(ay1, by1)
-                        inter_x2 = min(ax2, bx2); inter_y2 = min(ay2, by2)
-                        iw = max(0, inter_x2 - inter_x1); ih = max(0, inter_y2 - inter_y1)
-                        inter = iw * ih
-                        area_a = max(0, ax2 - ax1) * max(0, ay2 - ay1)
-                        area_b = max(0, bx2 - bx1) * max(0, by2 - by1)
-                        union = area_a + area_b - inter
-                        return (inter / union) if union > 0 else 0.0
-                    if self._last_shape_bbox is not None:
-                        iou_now = iou_xyxy(best_bbox, self._last_shape_bbox)
-                        if iou_now < self.shape_change_iou:
-                            self._shape_change_frames += 1
-                        else:
-                            self._shape_change_frames = 0
-                        # movement check
-                        cx_prev = (self._last_shape_bbox[0] + self._last_shape_bbox[2]) / 2
-                        cy_prev = (self._last_shape_bbox[1] + self._last_shape_bbox[3]) / 2
-                        cx_now = (best_bbox[0] + best_bbox[2]) / 2
-                        cy_now = (best_bbox[1] + best_bbox[3]) / 2
-                        dist = ((cx_now - cx_prev) ** 2 + (cy_now - cy_prev) ** 2) ** 0.5
-                        if dist > self.shape_move_dist_px:
-                            self._shape_move_frames += 1
-                        else:
-                            self._shape_move_frames = 0
-                    # update movement state and ROI change state
-                    self._last_shape_bbox = best_bbox
-                    try:
-                        x1, y1, x2, y2 = [max(0, int(v)) for v in best_bbox]
-                        roi = cv2.cvtColor(frame_resized[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
-                        roi_small = cv2.resize(roi, (96, 96)) if roi.size > 0 else None
-                        if roi_small is not None and roi_small.size > 0:
-                            if self._prev_shape_roi_gray is not None and self._prev_shape_roi_gray.shape == roi_small.shape:
-                                mae = float(np.mean(np.abs(roi_small.astype(np.float32) - self._prev_shape_roi_gray.astype(np.float32))))
-                                if mae > self.roi_change_mae_thresh:
-                                    self._roi_change_frames += 1
-                                else:
-                                    self._roi_change_frames = 0
-                            self._prev_shape_roi_gray = roi_small
-                    except Exception:
-                        self._roi_change_frames = 0
-                else:
-                    self._shape_change_frames = 0
-                    self._shape_move_frames = 0
-                    self._roi_change_frames = 0
-
-                # If we already counted and a new plate appears without a full absence, reset state for next count
-                if self._freeze_after_count and (
-                    self._shape_change_frames >= self.shape_change_thresh or
-                    self._shape_move_frames >= self.shape_move_frames_thresh or
-                    self._roi_change_frames >= self.roi_change_frames_thresh
-                ):
-                    # Reset for new plate
-                    self._reset_plate_state()
+                # ---- Plate tracking: ID จานคงที่ข้ามเฟรม นับครั้งเดียวต่อ track ----
+                upd = self.session.update(result, annotated)
+                self.miner.offer(frame_resized, result, {"lot": self.lot_id,
+                                                          "plate": upd.plate.track_id if upd.plate is not None else None})
 
-                if plate_detected:
-                    if not self._freeze_after_count:
-                        # อัปเดต latched defect counts
-                        for k, v in defect_counts.items():
-                            self._latched_defect_counts[k] = max(self._latched_defect_counts.get(k, 0), int(v))
-                        if shapes_found:
-                            # remember last stable shape(s) during the presence window
-                            self._latched_shapes = set(shapes_found)
-                        self._render_latched_defect_counts()
-
-                if plate_detected:
-                    self.gate_present_frames += 1; self.gate_absent_frames = 0
-                else:
-                    self.gate_absent_frames += 1; self.gate_present_frames = 0
-
-                # เมื่อตรวจพบจานครั้งแรก
-                if (not self.gate_has_plate) and plate_detected and self.gate_present_frames >= self.gate_present_thresh:
-                    self.gate_has_plate = True
-                    self.gate_has_counted = False
-                    self._plate_counted_already = False
-                    self._defect_detected_flag = False
-                    self._plate_final_status = None
-                    self._current_defect_count = 0
-                    self._set_plate_status("pending")
-                    self._latched_shapes = set()
-                    self._render_latched_defect_counts()
-
-                # อัปเดตสถานะแบบไดนามิกระหว่างที่จานยังอยู่
-                if self.gate_has_plate and self.gate_present_frames >= self.gate_present_thresh:
-                    # นับจานเพียงครั้งเดียว
-                    if not self._plate_counted_already:
-                        self.shape_counts["total"] += 1
-                        self.total_number_label.configure(text=str(self.shape_counts["total"]))
-                        self.lbl_plate_order.configure(text=str(self.shape_counts["total"]))
-                        self._plate_counted_already = True
-                    
-                    # อัปเดตการนับรูปทรง (เฉพาะครั้งแรกที่เจอ)
-                    shapes_to_use = self._latched_shapes if len(self._latched_shapes) > 0 else shapes_found
-                    for shp in shapes_to_use:
-                        if shp in self.shape_counts:
-                            # ตรวจสอบว่าเคยนับรูปทรงนี้ไปแล้วหรือยัง
-                            if not hasattr(self, '_counted_shapes'):
-                                self._counted_shapes = set()
-                            if shp not in self._counted_shapes:
-                                self.shape_counts[shp] += 1
-                                self._counted_shapes.add(shp)
-                    
-                    self.lbl_heart.configure(text=str(self.shape_counts["heart"]))
-                    self.lbl_rect.configure(text=str(self.shape_counts["rectangle"]))
-                    self.lbl_circle.configure(text=str(self.shape_counts["circle"]))
-
-                    # ตรวจสอบตำหนิแบบไดนามิก
-                    latched_defect_total = int(sum(self._latched_defect_counts.values()))
-                    current_defect_total = int(sum(defect_counts.values()))
-                    has_defects_now = latched_defect_total > 0 or current_defect_total > 0 or len(defect_names) > 0
-                    
-                    # อัปเดตสถานะการตรวจพบตำหนิ
-                    if has_defects_now and not self._defect_detected_flag:
-                        # เจอตำหนิครั้งแรก - ตีตราถาวร
-                        self._defect_detected_flag = True
-                        self._current_defect_count = max(latched_defect_total, current_defect_total, len(defect_names))
-                        self._plate_final_status = "defect"
-                        
-                        # บันทึกข้อมูลทันทีเมื่อเจอตำหนิ
-                        if not self.gate_has_counted:
-                            self._save_detection_record(annotated, defect_names, shapes_to_use)
-                            self.gate_has_counted = True
-                        
-                        self._set_plate_status("counted", self._current_defect_count)
-                        self._log_with_emoji("warning", f"พบตำหนิ {self._current_defect_count} จุด ในจานที่ {self.plate_id_counter-1}")
-                        
-                    elif has_defects_now and self._defect_detected_flag:
-                        # อัปเดตจำนวนตำหนิถ้ามีมากกว่าเดิม
-                        new_defect_count = max(latched_defect_total, current_defect_total, len(defect_names))
-                        if new_defect_count > self._current_defect_count:
-                            self._current_defect_count = new_defect_count
-                            self._set_plate_status("counted", self._current_defect_count)
-                            
-                    elif not has_defects_now and not self._defect_detected_flag:
-                        # ยังไม่เจอตำหนิ - สถานะผ่านชั่วคราว
-                        if self._plate_final_status != "defect":
-                            self._plate_final_status = "pass"
-                            self._set_plate_status("counted", 0)
-                    
-                    # ถ้ายังไม่เคยบันทึกและจานกำลังจะออกไป ให้บันทึก
-                    if not self.gate_has_counted and self.gate_absent_frames > 0:
-                        final_defects = defect_names if self._defect_detected_flag else set()
-                        self._save_detection_record(annotated, final_defects, shapes_to_use)
-                        self.gate_has_counted = True
-                        
-                        if not self._defect_detected_flag:
-                            self._log_with_emoji("success", f"จานที่ {self.plate_id_counter-1} ผ่านการตรวจสอบ")
-
-                # เมื่อจานออกไปจากระบบ
-                if self.gate_has_plate and self.gate_absent_frames >= self.gate_absent_thresh:
-                    # บันทึกข้อมูลครั้งสุดท้ายก่อนรีเซ็ต (ถ้ายังไม่ได้บันทึก)
-                    if not self.gate_has_counted:
-                        shapes_to_use = self._latched_shapes if len(self._latched_shapes) > 0 else shapes_found
-                        final_defects = set()
-                        if self._defect_detected_flag:
-                            # ใช้ defect_names ล่าสุดหรือ latched
-                            for k, v in self._latched_defect_counts.items():
-                                if v > 0:
-                                    final_defects.add(k)
-                        
-                        self._save_detection_record(annotated, final_defects, shapes_to_use)
-                        
-                        if self._defect_detected_flag:
-                            self._log_with_emoji("warning", f"พบตำหนิ {self._current_defect_count} จุด ในจานที่ {self.plate_id_counter-1}")
-                        else:
-                            self._log_with_emoji("success", f"จานที่ {self.plate_id_counter-1} ผ่านการตรวจสอบ")
-                    
+                # เมื่อจานออกไปจากระบบ (track หลุดเกิน gate_absent_thresh เฟรม) → บันทึกผลรวมของจาน
+                for gone in upd.finished:
+                    self._finalize_plate(gone)
+
+                # เมื่อตรวจพบจานใหม่ (track ใหม่ที่ยืนยันแล้ว) หรือจานเดิมออกไปแล้ว
+                if upd.new_plate or (upd.plate is None and upd.finished):
                     self._reset_plate_state()
 
+                # อัปเดตสถานะแบบไดนามิกระหว่างที่จานยังอยู่ จากหลักฐานที่รวมแล้ว
+                if upd.evidence is not None and upd.plate.state == upd.plate.TRACKED:
+                    ev = upd.evidence
+                    self._plate_defect_counts.update({k: 0 for k in self._plate_defect_counts})
+                    self._plate_defect_counts.update(ev.counts())
+                    self._render_plate_defect_counts()
+                    self._set_plate_status("counted", ev.total())
+
             except Exception as e:
                 print(f"Inference error: {e}")
                 frame_to_show = frame_resized
@@ -1677,25 +1407,39 @@ class LeafPlateDetectionApp:
 
         self.app.after(30, self.update_camera)
 
+    def _finalize_plate(self, track):
+        """จบจานหนึ่งใบ: นับจาน/รูปทรงครั้งเดียวต่อ track + บันทึกผลจากหลักฐานตำหนิที่รวมแล้ว"""
+        if track.counted:
+            return None
+        track.counted = True
+        ev = self.session.evidence_of(track)
+        shapes = {track.label} if track.label else set()
+
+        self.shape_counts["total"] += 1
+        if track.label in self.shape_counts:
+            self.shape_counts[track.label] += 1
+        self.total_number_label.configure(text=str(self.shape_counts["total"]))
+        self.lbl_plate_order.configure(text=str(self.shape_counts["total"]))
+        self.lbl_heart.configure(text=str(self.shape_counts["heart"]))
+        self.lbl_rect.configure(text=str(self.shape_counts["rectangle"]))
+        self.lbl_circle.configure(text=str(self.shape_counts["circle"]))
+
+        snapshot = track.data.get("snapshot")
+        if snapshot is None:
+            return None
+        row = self._save_detection_record(snapshot, ev.names(), shapes)
+        self._set_plate_status("counted", ev.total())
+        if ev.total() > 0:
+            self._log_with_emoji("warning", f"พบตำหนิ {ev.total()} จุด ในจานที่ {row['plate_id']}")
+        else:
+            self._log_with_emoji("success", f"จานที่ {row['plate_id']} ผ่านการตรวจสอบ")
+        return row
+
     def _reset_plate_state(self):
         """รีเซ็ตสถานะสำหรับจานใหม่"""
-        self.gate_has_plate = False
-        self.gate_has_counted = False
-        self._plate_counted_already = False
-        self._defect_detected_flag = False
-        self._plate_final_status = None
-        self._current_defect_count = 0
         self._set_plate_status("pending")
-        self._latched_shapes = set()
-        self._latched_defect_counts = {"crack": 0, "hole": 0, "bulge": 0, "burn": 0}
         self._reset_defect_table()
-        self._render_latched_defect_counts()
-        self._freeze_after_count = False
-        self.gate_present_frames = 0
-        self.gate_absent_frames = 0
-        self._prev_shape_roi_gray = None
-        if hasattr(self, '_counted_shapes'):
-            self._counted_shapes = set()
+        self._render_plate_defect_counts()
 
     # ---------------- Events ----------------
     def toggle_data_collection(self):
@@ -1708,10 +1452,9 @@ class LeafPlateDetectionApp:
             self.is_collecting_data = True
             self.session_meta.setdefault("start_time", datetime.now().strftime("%H:%M:%S"))
             self.toggle_button.configure(text="หยุด", fg_color=self.COLOR_DANGER, hover_color=self.COLOR_DANGER_HOVER)
-            self.gate_has_plate = self.gate_has_counted = False
-            self.gate_present_frames = self.gate_absent_frames = 0
+            self.session.reset()
             self._set_plate_status("pending")
-            self._reset_defect_table(); self._render_latched_defect_counts()
+            self._reset_defect_table(); self._render_plate_defect_counts()
             self._ensure_session_files(); self._update_excel_session_times()
             self._log_with_emoji("success", f"เริ่มการตรวจสอบจานใบไม้ (ชุด: {self.lot_id})")
         else:
@@ -1739,6 +1482,9 @@ class LeafPlateDetectionApp:
     def stop_and_finalize(self):
         self.is_collecting_data = False
         self._log_with_emoji("info", "หยุดการตรวจสอบจานใบไม้")
+        # จานที่ยังอยู่ในภาพตอนกดหยุด → บันทึกก่อนปิดรอบ
+        for t in self.session.flush():
+            self._finalize_plate(t)
         try:
             self.toggle_button.configure(text="เริ่ม", fg_color=self.COLOR_PRIMARY, hover_color=self.COLOR_PRIMARY_HOVER)
         except Exception:
@@ -1754,7 +1500,7 @@ class LeafPlateDetectionApp:
                     "end_time": datetime.now().strftime("%H:%M:%S")
                 }
             }
-            self._firebase_put(f"sessions/{self.firebase_session_key}/meta", meta)
+            self.fb.put(f"sessions/{self.firebase_session_key}/meta", meta)
             self._log_with_emoji("success", "บันทึกรายงานเรียบร้อย")
 
         self._reset_all_and_next_lot()
@@ -1780,10 +1526,9 @@ class LeafPlateDetectionApp:
         self._session_stamp = None
         self.firebase_session_key = None
 
-        self.gate_has_plate = self.gate_has_counted = False
-        self.gate_present_frames = self.gate_absent_frames = 0
+        self.session.reset()
         self._set_plate_status("pending")
-        self._reset_defect_table(); self._render_latched_defect_counts()
+        self._reset_defect_table(); self._render_plate_defect_counts()
 
         self._increment_lot_id()
 
@@ -1797,6 +1542,7 @@ class LeafPlateDetectionApp:
             if not messagebox.askyesno("ออกจากโปรแกรม", f"{warning_emoji} กำลังตรวจจับอยู่ ต้องการออกทันทีหรือไม่?"):
                 return
             self.stop_and_finalize()
+        self.services.stop()
         self.stop_camera()
         self.app.destroy()
 
@@ -1847,7 +1593,8 @@ class LeafPlateDetectionApp:
         stats = {}
         defect_counter = defaultdict(Counter)
 
-        for rp in glob.glob(os.path.join(self.save_root, "Report_*.xlsx")):
+        # ไฟล์ที่ไม่ได้แก้ไขตั้งแต่ต้นสัปดาห์ ไม่มีแถวของสัปดาห์นี้แน่นอน
+        for rp in self._reports_modified_since(start_d):
             wb = openpyxl.load_workbook(rp, data_only=True)
             sh = wb.active
             head_r = 1
@@ -1959,10 +1706,12 @@ if __name__ == "__main__":
     app.initialize_data()
     app.setup_app()
     app.setup_fonts()
+    app.create_widgets()
+    app.app.update()        # วาดหน้าต่างให้ขึ้นก่อน แล้วค่อยเปิดกล้อง/โหลดโมเดล (import cv2/ultralytics ตอนนี้)
     app.setup_camera()
     app.setup_model()
-    app.create_widgets()
     app.start_camera()
+    app.services.start()
 
     print("✅ โปรแกรมพร้อมใช้งาน!")
 
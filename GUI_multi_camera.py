@@ -0,0 +1,695 @@
+# GUI_multi_camera.py
+# -*- coding: utf-8 -*-
+# ตรวจจานหลายสายพานพร้อมกัน: กล้อง N ตัว + โมเดล shape/defect ชุดเดียว (shared worker)
+# ติดตั้งที่ต้องใช้ (ถ้ายังไม่มี):
+# pip install customtkinter ultralytics opencv-python pillow firebase-admin numpy
+#
+# ใช้งาน:
+#   python GUI_multi_camera.py            # ใช้กล้อง 0 และ 1
+#   python GUI_multi_camera.py 0 1 2      # ระบุ index กล้องเอง
+
+import customtkinter as ctk
+import tkinter as tk
+from tkinter import font as tkfont
+from tkinter import messagebox
+
+from PIL import Image, ImageTk
+
+from datetime import datetime
+import os, sys, csv, time, signal, threading
+
+from plate_tracker import PlateTracker
+# cv2 / YOLO แบบ lazy มาจาก inspection_core → หน้าต่างขึ้นก่อน ค่อยจ่ายค่า import ตอนใช้จริง
+from inspection_core import cv2, YOLO, open_source, TwoStagePipeline, PlateSession, annotate, AppServices
+
+
+class CameraLane:
+    """
+    หนึ่งสายพาน = กล้องหนึ่งตัว + state การนับจาน/ล็อตของตัวเอง
+    - thread อ่านกล้องเก็บเฉพาะเฟรมล่าสุด (เฟรมเก่าที่ยังไม่ถูก infer จะถูกทิ้ง)
+    - ผล inference ถูกส่งกลับมาที่ result slot ให้ UI thread หยิบไปวาด/นับ
+    """
+
+    def __init__(self, lane_no, source, infer_size, session):
+        self.lane_no = lane_no
+        self.source = source
+        self.name = f"CAM{lane_no}"
+        self.infer_w, self.infer_h = infer_size
+        self.cap = None
+
+        self._lock = threading.Lock()
+        self._frame = None            # เฟรมล่าสุดจากกล้อง (ขนาด infer)
+        self._frame_seq = 0
+        self._frame_ts = 0.0
+        self._taken_seq = 0           # seq ที่ worker หยิบไปแล้ว
+        self._result = None           # (seq, frame, InspectionResult, t_capture, t_done)
+        self._running = False
+        self._thread = None
+
+        # ---- throughput stats ----
+        self.capture_fps = 0.0
+        self.infer_fps = 0.0
+        self.latency_ms = 0.0
+        self.dropped = 0
+        self._last_cap_t = None
+        self._last_res_t = None
+
+        # ---- plate gating (PlateSession ของกล้องนี้เอง) ----
+        self.session = session
+
+        # ---- lot counters ----
+        self.shape_counts = {"heart": 0, "rectangle": 0, "circle": 0, "total": 0}
+        self.plate_id_counter = 1
+        self.lot_id = "PTP" + datetime.now().strftime("%y%m%d") + "_01"
+        self.session_rows = []
+        self.csv_path = None
+        self.session_key = None
+
+        # UI widgets (set ใน create_tile)
+        self.image_label = None
+        self.lbl_counts = None
+        self.lbl_stats = None
+        self.lbl_status = None
+
+    # -----------------------------
+    # Capture thread
+    # -----------------------------
+    def open(self):
+        # lane มี capture thread ของตัวเองอยู่แล้ว → ใช้ source แบบไม่มี grab thread ซ้อน
+        self.cap = open_source(self.source, width=1280, height=720, threaded=False, loop=True)
+        if not self.cap.isOpened():
+            print(f"[{self.name}] Cannot open camera {self.source}")
+            self.cap = None
+            return False
+        print(f"[{self.name}] {self.cap.stats()}")
+        return True
+
+    def start(self):
+        if self.cap is None or self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._capture_loop, name=f"capture-{self.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+        if self.cap is not None:
+            try:
+                self.cap.release()
+            except Exception:
+                pass
+            self.cap = None
+
+    def _capture_loop(self):
+        while self._running:
+            pkt = self.cap.read_packet()
+            if pkt is None:
+                time.sleep(0.03)
+                continue
+            now = pkt.t_capture
+            small = cv2.resize(pkt.frame, (self.infer_w, self.infer_h))
+            with self._lock:
+                if self._frame_seq > self._taken_seq:
+                    self.dropped += 1
+                self._frame = small
+                self._frame_seq += 1
+                self._frame_ts = now
+            if self._last_cap_t is not None:
+                dt = now - self._last_cap_t
+                if dt > 0:
+                    self.capture_fps = 0.9 * self.capture_fps + 0.1 * (1.0 / dt)
+            self._last_cap_t = now
+
+    # -----------------------------
+    # Worker hand-off
+    # -----------------------------
+    def take_frame(self):
+        """worker เรียก: คืน (seq, frame, ts) ถ้ามีเฟรมใหม่ ไม่งั้น None"""
+        with self._lock:
+            if self._frame is None or self._frame_seq == self._taken_seq:
+                return None
+            self._taken_seq = self._frame_seq
+            return self._frame_seq, self._frame, self._frame_ts
+
+    def latest_frame(self):
+        with self._lock:
+            return self._frame
+
+    def put_result(self, seq, frame, result, t_capture):
+        now = time.perf_counter()
+        with self._lock:
+            self._result = (seq, frame, result, t_capture, now)
+        self.latency_ms = 0.9 * self.latency_ms + 0.1 * ((now - t_capture) * 1000.0)
+        if self._last_res_t is not None:
+            dt = now - self._last_res_t
+            if dt > 0:
+                self.infer_fps = 0.9 * self.infer_fps + 0.1 * (1.0 / dt)
+        self._last_res_t = now
+
+    def pop_result(self):
+        with self._lock:
+            r, self._result = self._result, None
+            return r
+
+    # -----------------------------
+    # Gating / lot helpers
+    # -----------------------------
+    def reset_gate(self):
+        self.session.reset()
+
+    def next_lot(self):
+        now_short = datetime.now().strftime("%y%m%d")
+        seq = 1
+        try:
+            old_base, old_seq = self.lot_id.split("_", 1)
+            if old_base.endswith(now_short):
+                seq = int(old_seq) + 1
+        except Exception:
+            seq = 1
+        self.lot_id = f"PTP{now_short}_{seq:02d}"
+        self.shape_counts = {"heart": 0, "rectangle": 0, "circle": 0, "total": 0}
+        self.plate_id_counter = 1
+        self.session_rows = []
+        self.csv_path = None
+        self.session_key = None
+        self.reset_gate()
+
+
+class SharedInferenceWorker:
+    """
+    thread เดียวถือ TwoStagePipeline หนึ่งชุด
+    รวมเฟรมใหม่ของทุกกล้องเป็น batch เดียว → predict ครั้งเดียวต่อโมเดล (pipeline.run_batch)
+    """
+
+    def __init__(self, lanes, pipeline):
+        self.lanes = lanes
+        self.pipeline = pipeline
+
+        self.enabled = False          # เปิดเมื่อกด "เริ่ม"
+        self.batch_ms = 0.0
+        self.batch_size = 0.0
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="shared-inference", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def _loop(self):
+        while self._running:
+            if not self.enabled:
+                time.sleep(0.05)
+                continue
+
+            batch = []
+            for lane in self.lanes:
+                item = lane.take_frame()
+                if item is not None:
+                    batch.append((lane,) + item)
+            if not batch:
+                time.sleep(0.005)
+                continue
+
+            frames = [b[2] for b in batch]
+            t0 = time.perf_counter()
+            try:
+                results = self.pipeline.run_batch(frames)
+            except Exception as e:
+                print(f"[Worker] Inference error: {e}")
+                time.sleep(0.05)
+                continue
+            dt_ms = (time.perf_counter() - t0) * 1000.0
+            self.batch_ms = 0.9 * self.batch_ms + 0.1 * dt_ms
+            self.batch_size = 0.9 * self.batch_size + 0.1 * len(batch)
+
+            for (lane, seq, frame, ts), result in zip(batch, results):
+                lane.put_result(seq, frame, result, ts)
+
+
+class MultiCameraInspectionApp:
+    """
+    Multi-camera two-stage inspection:
+      - กล้องแต่ละตัวมี gating + ตัวนับล็อตของตัวเอง
+      - โมเดลโหลดครั้งเดียว ใช้ร่วมกันผ่าน SharedInferenceWorker (batch ข้ามกล้อง)
+      - หน้าจอแสดง tile ต่อกล้อง พร้อมสถิติ throughput
+    """
+
+    # -----------------------------
+    # Layout constants for Full HD
+    # -----------------------------
+    def set_layout_constants(self):
+        self.W, self.H = 1920, 1080
+        self.M = 25
+        self.HEADER_Y, self.HEADER_H = 20, 90
+        self.GRID_Y = 130
+        self.FOOTER_H = 80
+        self.GRID_H = self.H - self.GRID_Y - self.FOOTER_H - self.M
+        self.GRID_W = self.W - 2 * self.M
+        self.TILE_INFO_H = 96
+
+    def setup_fonts(self):
+        self.FONT_FAMILY = "Arial"
+        for name in (
+            "TkDefaultFont", "TkHeadingFont", "TkTextFont", "TkMenuFont",
+            "TkFixedFont", "TkTooltipFont", "TkCaptionFont",
+            "TkSmallCaptionFont", "TkIconFont"
+        ):
+            try:
+                tkfont.nametofont(name).configure(family=self.FONT_FAMILY)
+            except tk.TclError:
+                pass
+
+        self.F = lambda size, bold=False: ctk.CTkFont(
+            family=self.FONT_FAMILY, size=size, weight=("bold" if bold else "normal")
+        )
+        self.FTK = lambda size, bold=False: (
+            (self.FONT_FAMILY, size, "bold") if bold else (self.FONT_FAMILY, size)
+        )
+
+    # -----------------------------
+    # Data / Config
+    # -----------------------------
+    def initialize_data(self, sources):
+        self.BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+        self.save_root = os.path.join(self.BASE_DIR, "savefile")
+        os.makedirs(self.save_root, exist_ok=True)
+        # captures/ + retention + Firebase (ปรับผ่าน env LEAFPLATE_* ; ดู inspection_core/services.py)
+        self.services = AppServices(self.BASE_DIR, mining=False)
+        self.captures_dir = self.services.captures_dir
+        self.retention, self.fb = self.services.retention, self.services.fb
+
+        self.SHAPE_WEIGHTS  = os.path.join(self.BASE_DIR, "models", "shape_best_rf.pt")
+        self.DEFECT_WEIGHTS = os.path.join(self.BASE_DIR, "models", "defect_best.pt")
+        self.shape_model = None
+        self.defect_model = None
+
+        self.imgsz = 896
+        self.conf_shape = 0.55
+        self.iou_shape  = 0.72
+        self.conf_defect= 0.25
+        self.iou_defect = 0.65
+
+        # ขนาดเฟรมที่ส่งเข้าโมเดล (เท่ากันทุกกล้อง → batch ได้)
+        self.infer_size = (960, 540)
+
+        self.shape_classes_ultra = {"circle_leaf_plate", "heart_shaped_leaf_plate", "rectangular_leaf_plate"}
+        self.defect_classes_ultra = {"crack", "hole"}
+        self.shape_map = {
+            "heart_shaped_leaf_plate": "heart",
+            "rectangular_leaf_plate": "rectangle",
+            "circle_leaf_plate": "circle",
+        }
+        self.shape_display_map = {"heart": "หัวใจ", "rectangle": "สี่เหลี่ยมผืนผ้า", "circle": "วงกลม"}
+        self.defect_th_map = {"crack": "รอยแตก", "hole": "รูเข็ม"}
+        self._shape_model_names = {v: k for k, v in self.shape_map.items()}
+
+        self.gate_present_thresh = 5
+        self.gate_absent_thresh = 10
+        self.track_low_thresh = 0.25   # กล่องรูปทรง conf ต่ำกว่า conf_shape ใช้ต่อ track เดิมเท่านั้น
+
+        self.is_collecting_data = False
+        self.session_start = None
+
+        self.lanes = [CameraLane(i + 1, src, self.infer_size, self._new_session()) for i, src in enumerate(sources)]
+        self.pipeline = None
+        self.worker = None
+
+    def _new_session(self):
+        tracker = PlateTracker(
+            high_thresh=self.conf_shape,
+            low_thresh=self.track_low_thresh,
+            min_hits=self.gate_present_thresh,
+            max_misses=self.gate_absent_thresh,
+            class_aware=True,
+        )
+        return PlateSession(tracker, track_conf=self.track_low_thresh)
+
+    def thai_date(self, dt: datetime):
+        return dt.strftime(f"%d/%m/{dt.year + 543}")
+
+    def title_date(self, dt: datetime):
+        return dt.strftime("%d/%m/%y")
+
+    # -----------------------------
+    # App / Cameras / Models
+    # -----------------------------
+    def setup_app(self):
+        self.set_layout_constants()
+        ctk.set_appearance_mode("light")
+        ctk.set_default_color_theme("blue")
+        self.app = ctk.CTk()
+        self.app.title(f"Leaf Plate Defect Detection - {len(self.lanes)} Cameras")
+        self.app.geometry(f"{self.W}x{self.H}+0+0")
+        self.app.resizable(False, False)
+        self.app.configure(fg_color="#ffffff")
+        self.app.protocol("WM_DELETE_WINDOW", self.on_closing)
+        try:
+            signal.signal(signal.SIGINT, lambda sig, frm: self.safe_after(0, self.on_closing))
+        except Exception:
+            pass
+
+    def setup_cameras(self):
+        for lane in self.lanes:
+            lane.open()
+
+    def setup_models(self):
+        try:
+            assert os.path.exists(self.SHAPE_WEIGHTS), f"ไม่พบ shape weights: {self.SHAPE_WEIGHTS}"
+            self.shape_model = YOLO(self.SHAPE_WEIGHTS)
+        except Exception as e:
+            messagebox.showerror("Model Error (Shape)", f"โหลดโมเดลรูปทรงไม่สำเร็จ:\n{e}")
+            self.shape_model = None
+        try:
+            assert os.path.exists(self.DEFECT_WEIGHTS), f"ไม่พบ defect weights: {self.DEFECT_WEIGHTS}"
+            self.defect_model = YOLO(self.DEFECT_WEIGHTS)
+        except Exception as e:
+            messagebox.showerror("Model Error (Defect)", f"โหลดโมเดลตำหนิไม่สำเร็จ:\n{e}")
+            self.defect_model = None
+
+        if self.shape_model is not None and self.defect_model is not None:
+            # จานเดียวต่อเฟรมต่อกล้อง → max_det 1 + agnostic NMS
+            self.pipeline = TwoStagePipeline(
+                self.shape_model, self.defect_model, self.shape_map, self.defect_classes_ultra,
+                imgsz=self.imgsz, shape_conf=self.conf_shape, track_conf=self.track_low_thresh,
+                shape_iou=self.iou_shape, defect_conf=self.conf_defect, defect_iou=self.iou_defect,
+                shape_max_det=1, shape_agnostic=True,
+            )
+            self.worker = SharedInferenceWorker(self.lanes, self.pipeline)
+        else:
+            messagebox.showwarning("Warning", "ต้องโหลดโมเดลครบทั้ง shape และ defect ก่อนเริ่มทำงาน")
+
+    # -----------------------------
+    # UI
+    # -----------------------------
+    def create_widgets(self):
+        header = ctk.CTkFrame(self.app, width=self.W - 2 * self.M, height=self.HEADER_H,
+                              fg_color="#7A5429", corner_radius=10)
+        header.place(x=self.M, y=self.HEADER_Y)
+        ctk.CTkLabel(header, text=f"โปรแกรมตรวจจานใบไม้หลายสายพาน ({len(self.lanes)} กล้อง)",
+                     font=self.F(32, True), text_color="white").place(x=50, y=28)
+        self.lbl_worker = ctk.CTkLabel(header, text="worker: -", font=self.F(16, True), text_color="white")
+        self.lbl_worker.place(x=self.W - 2 * self.M - 520, y=32)
+
+        # grid: 1 กล้อง = เต็มจอ, 2 = ซ้าย/ขวา, 3-4 = 2x2
+        n = max(1, len(self.lanes))
+        cols = 1 if n == 1 else 2
+        rows = (n + cols - 1) // cols
+        gap = 20
+        tile_w = (self.GRID_W - gap * (cols - 1)) // cols
+        tile_h = (self.GRID_H - gap * (rows - 1)) // rows
+        img_h = tile_h - self.TILE_INFO_H
+        img_w = min(tile_w - 20, int(img_h * self.infer_size[0] / self.infer_size[1]))
+        self.tile_img_size = (img_w, img_h)
+
+        for i, lane in enumerate(self.lanes):
+            r, c = divmod(i, cols)
+            self.create_tile(lane, self.M + c * (tile_w + gap), self.GRID_Y + r * (tile_h + gap), tile_w, tile_h)
+
+        footer_y = self.H - self.FOOTER_H - self.M + 15
+        self.toggle_button = ctk.CTkButton(
+            self.app, width=180, height=50, text="เริ่ม",
+            font=self.F(18, True), text_color="#FFFFFF",
+            fg_color="#253BFA", hover_color="#0F0D69",
+            command=self.toggle_data_collection
+        )
+        self.toggle_button.place(x=self.M, y=footer_y)
+        ctk.CTkButton(
+            self.app, width=180, height=50, text="ปิดล็อต (ทุกกล้อง)",
+            font=self.F(18, True), text_color="#FFFFFF",
+            fg_color="#7A5429", hover_color="#5A3E1F",
+            command=self.close_all_lots
+        ).place(x=self.M + 200, y=footer_y)
+
+    def create_tile(self, lane, x, y, w, h):
+        frame = ctk.CTkFrame(self.app, width=w, height=h, fg_color="#ffffff", corner_radius=12,
+                             border_width=2, border_color="#7A5429")
+        frame.place(x=x, y=y)
+        img_w, img_h = self.tile_img_size
+        lane.image_label = tk.Label(frame, text=f"{lane.name}: ไม่พบกล้อง" if lane.cap is None else "Initializing...",
+                                    font=self.FTK(14), fg="white", bg="#7A5429")
+        lane.image_label.place(x=(w - img_w) // 2, y=8, width=img_w, height=img_h)
+
+        info_y = img_h + 14
+        ctk.CTkLabel(frame, text=lane.name, font=self.F(20, True), text_color="#7A5429").place(x=16, y=info_y)
+        lane.lbl_status = ctk.CTkLabel(frame, text="ยังไม่ได้ตรวจ", font=self.F(18, True), text_color="#888888")
+        lane.lbl_status.place(x=110, y=info_y)
+        lane.lbl_counts = ctk.CTkLabel(frame, text=self._counts_text(lane), font=self.F(16), text_color="#1a2a3a")
+        lane.lbl_counts.place(x=16, y=info_y + 32)
+        lane.lbl_stats = ctk.CTkLabel(frame, text="", font=self.F(14), text_color="#555555")
+        lane.lbl_stats.place(x=w // 2, y=info_y + 4)
+
+    def _counts_text(self, lane):
+        sc = lane.shape_counts
+        return (f"ล็อต {lane.lot_id}  |  รวม {sc['total']}  |  หัวใจ {sc['heart']}  "
+                f"สี่เหลี่ยม {sc['rectangle']}  วงกลม {sc['circle']}")
+
+    def _set_lane_status(self, lane, mode, defect_count=0):
+        if lane.lbl_status is None:
+            return
+        if mode == "pending":
+            lane.lbl_status.configure(text="ยังไม่ได้ตรวจ", text_color="#888888")
+        elif defect_count > 0:
+            lane.lbl_status.configure(text=f"มีตำหนิ ({defect_count})", text_color="#e74c3c")
+        else:
+            lane.lbl_status.configure(text="ผ่าน", text_color="#199129")
+
+    # -----------------------------
+    # Detection helpers
+    # -----------------------------
+    def _gate_lane(self, lane, result, annotated):
+        upd = lane.session.update(result, annotated)
+        for gone in upd.finished:
+            self._finalize_lane_plate(lane, gone)
+        if upd.new_plate:
+            self._set_lane_status(lane, "pending")
+
+    def _finalize_lane_plate(self, lane, track):
+        """จบจานหนึ่งใบของกล้องนี้: นับรูปทรง + บันทึกแถวเดียวต่อ track จากหลักฐานตำหนิที่รวมแล้ว"""
+        if track.counted:
+            return None
+        track.counted = True
+        snapshot = track.data.get("snapshot")
+        if snapshot is None:
+            return None
+        ev = lane.session.evidence_of(track)
+        shapes_found = {track.label} if track.label else set()
+        for shp in shapes_found:
+            if shp in lane.shape_counts:
+                lane.shape_counts[shp] += 1
+        lane.shape_counts["total"] += 1
+        row = self._save_lane_record(lane, snapshot, ev.names(), shapes_found)
+        self._set_lane_status(lane, "counted", ev.total())
+        if lane.lbl_counts is not None:
+            lane.lbl_counts.configure(text=self._counts_text(lane))
+        return row
+
+    def _flush_lanes(self):
+        """หยุดตรวจ/ปิดล็อต: จานที่ยังอยู่ในภาพของทุกกล้อง → บันทึก"""
+        for lane in self.lanes:
+            for t in lane.session.flush():
+                self._finalize_lane_plate(lane, t)
+
+    # -----------------------------
+    # Persistence (per lane)
+    # -----------------------------
+    def _ensure_lane_session(self, lane):
+        if lane.csv_path:
+            return
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        lane.session_key = f"{stamp}_{lane.name}"
+        lane.csv_path = os.path.join(self.save_root, f"Report_{lane.session_key}.csv")
+        with open(lane.csv_path, "w", newline="", encoding="utf-8-sig") as f:
+            w = csv.writer(f)
+            w.writerow([f"รายงานการตรวจจานใบไม้ {lane.name} วันที่ {self.title_date(datetime.now())}"])
+            w.writerow(["วันที่", "เวลา", "Plate ID", "Lot ID", "กล้อง", "รูปทรงจาน", "ตำหนิที่พบ", "หมายเหตุ"])
+
+    def _save_lane_record(self, lane, annotated_bgr, defect_names, shapes_found):
+        now = datetime.now()
+        ts = now.strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        try:
+            # ชื่อกล้องอยู่ในชื่อไฟล์: หลายกล้องจบจานใน ms เดียวกันได้ ไม่ให้เขียนทับกัน
+            cv2.imwrite(os.path.join(self.captures_dir, f"detect_{ts}_{lane.name}.jpg"), annotated_bgr)
+        except Exception as e:
+            print(f"[{lane.name}] Save image error: {e}")
+
+        defects_th = [self.defect_th_map.get(d, d) for d in sorted(defect_names)]
+        shape_text = " / ".join(self.shape_display_map.get(s, s) for s in sorted(shapes_found)) or "-"
+        row = {
+            "date": self.thai_date(now),
+            "time": now.strftime("%H:%M:%S"),
+            "plate_id": lane.plate_id_counter,
+            "lot_id": lane.lot_id,
+            "camera": lane.name,
+            "shape": shape_text,
+            "defects": " / ".join(defects_th) if defects_th else "-",
+            "note": ""
+        }
+        lane.plate_id_counter += 1
+        lane.session_rows.append(row)
+
+        self._ensure_lane_session(lane)
+        with open(lane.csv_path, "a", newline="", encoding="utf-8-sig") as f:
+            csv.writer(f).writerow([row["date"], row["time"], row["plate_id"], row["lot_id"],
+                                    row["camera"], row["shape"], row["defects"], row["note"]])
+        self.fb.post(f"sessions/{lane.session_key}/records", row)
+        return row
+
+    # -----------------------------
+    # Loops
+    # -----------------------------
+    def safe_after(self, delay_ms, func):
+        try:
+            if self.app is not None and self.app.winfo_exists():
+                self.app.after(delay_ms, func)
+        except tk.TclError:
+            pass
+
+    def start(self):
+        for lane in self.lanes:
+            lane.start()
+        if self.worker is not None:
+            self.worker.start()
+        self._update_tiles()
+        self._update_stats()
+
+    def _update_tiles(self):
+        for lane in self.lanes:
+            if lane.cap is None:
+                continue
+            frame_to_show = None
+            res = lane.pop_result() if self.is_collecting_data else None
+            if res is not None:
+                _, frame, result, _, _ = res
+                try:
+                    annotated = annotate(frame, result,
+                                         shape_color=(0, 140, 255), shape_text_color=(10, 90, 255),
+                                         defect_color=(255, 0, 0), shape_names=self._shape_model_names)
+                    self._gate_lane(lane, result, annotated)
+                    frame_to_show = annotated
+                except Exception as e:
+                    print(f"[{lane.name}] Post-process error: {e}")
+            elif not self.is_collecting_data:
+                frame_to_show = lane.latest_frame()
+
+            if frame_to_show is None:
+                continue
+            try:
+                tile = cv2.resize(frame_to_show, self.tile_img_size)
+                imgtk = ImageTk.PhotoImage(Image.fromarray(cv2.cvtColor(tile, cv2.COLOR_BGR2RGB)))
+                lane.image_label.configure(image=imgtk, text="")
+                lane.image_label.image = imgtk
+            except Exception as e:
+                print(f"[{lane.name}] Display error: {e}")
+
+        self.safe_after(15, self._update_tiles)
+
+    def _update_stats(self):
+        for lane in self.lanes:
+            if lane.lbl_stats is None or lane.cap is None:
+                continue
+            lane.lbl_stats.configure(
+                text=(f"capture {lane.capture_fps:4.1f} fps  |  infer {lane.infer_fps:4.1f} fps  |  "
+                      f"latency {lane.latency_ms:5.0f} ms  |  dropped {lane.dropped}")
+            )
+        if self.worker is not None:
+            self.lbl_worker.configure(
+                text=f"shared worker: batch {self.worker.batch_size:3.1f} เฟรม / {self.worker.batch_ms:5.0f} ms"
+            )
+        self.safe_after(500, self._update_stats)
+
+    # -----------------------------
+    # Events
+    # -----------------------------
+    def toggle_data_collection(self):
+        if not self.is_collecting_data:
+            if self.worker is None:
+                messagebox.showerror("Model Error", "ยังโหลดโมเดลไม่ครบ (shape/defect)")
+                return
+            for lane in self.lanes:
+                lane.reset_gate()
+                lane.pop_result()
+                self._set_lane_status(lane, "pending")
+            self.is_collecting_data = True
+            self.worker.enabled = True
+            self.toggle_button.configure(text="หยุด", fg_color="#e74c3c", hover_color="#c0392b")
+        else:
+            self.stop_and_finalize()
+            self.toggle_button.configure(text="เริ่ม", fg_color="#253BFA", hover_color="#0F0D69")
+
+    def stop_and_finalize(self):
+        """หยุดตรวจ: บันทึกจานที่ยังอยู่ในภาพของทุกกล้อง แล้วปิด session ของแต่ละกล้อง (เวลาสิ้นสุดขึ้น Firebase)"""
+        self.is_collecting_data = False
+        if self.worker is not None:
+            self.worker.enabled = False
+        self._flush_lanes()
+        for lane in self.lanes:
+            if not lane.session_key:
+                continue
+            self.fb.put(f"sessions/{lane.session_key}/meta", {
+                "report_title": f"รายงานการตรวจจานใบไม้ {lane.name} วันที่ {self.title_date(datetime.now())}",
+                "lot_id": lane.lot_id,
+                "camera": lane.name,
+                "session": {
+                    "start_time": lane.session_rows[0]["time"] if lane.session_rows else None,
+                    "end_time": datetime.now().strftime("%H:%M:%S")
+                }
+            })
+
+    def close_all_lots(self):
+        self._flush_lanes()
+        for lane in self.lanes:
+            if lane.session_rows:
+                print(f"[{lane.name}] ปิดล็อต {lane.lot_id}: {len(lane.session_rows)} จาน -> {lane.csv_path}")
+            lane.next_lot()
+            self._set_lane_status(lane, "pending")
+            if lane.lbl_counts is not None:
+                lane.lbl_counts.configure(text=self._counts_text(lane))
+
+    def on_closing(self):
+        # จานที่ยังอยู่ในภาพ → บันทึกก่อนหยุด worker / กล้อง (เหมือน GUI_w_two_stage_model)
+        if self.is_collecting_data:
+            self.stop_and_finalize()
+        self.services.stop()
+        if self.worker is not None:
+            self.worker.stop()
+        for lane in self.lanes:
+            lane.stop()
+        try:
+            self.app.destroy()
+        except Exception:
+            pass
+
+    def run(self):
+        self.app.mainloop()
+
+
+# ----------------- Boot -----------------
+if __name__ == "__main__":
+    sources = [int(a) if a.isdigit() else a for a in sys.argv[1:]] or [0, 1]
+
+    app = MultiCameraInspectionApp()
+    app.initialize_data(sources)
+    app.setup_app()
+    app.setup_fonts()
+    app.setup_cameras()
+    app.setup_models()
+    app.create_widgets()
+    app.start()
+    app.services.start()
+    try:
+        app.run()
+    except KeyboardInterrupt:
+        try:
+            app.on_closing()
+        except Exception:
+            pass
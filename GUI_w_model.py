@@ -8,20 +8,14 @@ import tkinter as tk
 from tkinter import font as tkfont
 from tkinter import filedialog, messagebox  # เมนู Export ยังใช้ได้
 
-import cv2
-import numpy as np
 from PIL import Image, ImageTk
-from ultralytics import YOLO
 
 from datetime import datetime
-import os, sys, json, csv, time
-import urllib.request, urllib.error  # fallback REST ถ้า Admin SDK init ไม่สำเร็จ
-import uuid
-from datetime import datetime, timezone
+import os, json, csv, time
 
-# -------- Firebase Admin SDK --------
-import firebase_admin
-from firebase_admin import credentials, db
+from plate_tracker import PlateTracker
+# cv2 / YOLO แบบ lazy มาจาก inspection_core → หน้าต่างขึ้นก่อน ค่อยจ่ายค่า import ตอนใช้จริง
+from inspection_core import cv2, YOLO, SingleModelPipeline, PlateSession, annotate, AppServices
 
 
 class LeafPlateDetectionApp:
@@ -114,6 +108,7 @@ class LeafPlateDetectionApp:
         self.imgsz = 896
         self.conf_thr = 0.27
         self.iou_thr  = 0.65
+        self.pipeline = None   # SingleModelPipeline (สร้างหลังโหลดโมเดล)
 
         # กลุ่มคลาส
         self.shape_classes  = {"circle_leaf_plate", "heart_shaped_leaf_plate", "rectangular_leaf_plate"}
@@ -129,10 +124,12 @@ class LeafPlateDetectionApp:
             "rectangle": "สี่เหลี่ยมผืนผ้า",
             "circle": "วงกลม",
         }
+        self._shape_model_names = {v: k for k, v in self.shape_map.items()}   # ป้ายบนภาพใช้ชื่อคลาสเต็ม
 
-        # โฟลเดอร์รูป Annotated
-        self.captures_dir = os.path.join(self.BASE_DIR, "captures")
-        os.makedirs(self.captures_dir, exist_ok=True)
+        # captures/ + retention + mining + Firebase (ปรับผ่าน env LEAFPLATE_* ; ดู inspection_core/services.py)
+        self.services = AppServices(self.BASE_DIR)
+        self.captures_dir = self.services.captures_dir
+        self.retention, self.miner, self.fb = self.services.retention, self.services.miner, self.services.fb
         self.save_cooldown_ms = 1200
         self._last_save_ms = 0
 
@@ -142,26 +139,30 @@ class LeafPlateDetectionApp:
         self._session_stamp = None
 
         # ---------- Firebase ----------
-        self.firebase_base = "https://leaf-plate-defect-detec-w-cnn-default-rtdb.asia-southeast1.firebasedatabase.app"
         self.firebase_session_key = None
-        self._fb_ready = False  # Admin SDK พร้อมหรือยัง
 
         # label บนการ์ดนับรูปทรง
         self.lbl_heart = None
         self.lbl_rect  = None
         self.lbl_circle= None
-        # Plate gating state
-        self.gate_has_plate = False
-        self.gate_has_counted = False
-        self.gate_present_frames = 0
-        self.gate_absent_frames = 0
+        # Plate gating: เห็นต่อเนื่องกี่เฟรมถึงยืนยันจาน / หายกี่เฟรมถือว่าออกไปแล้ว
         self.gate_present_thresh = 5
         self.gate_absent_thresh = 10
+        # Plate tracker + หลักฐานตำหนิต่อจาน (inspection_core.PlateSession)
+        self.track_low_thresh = 0.15  # กล่องรูปทรง conf ต่ำกว่า conf_thr ใช้ต่อ track เดิมเท่านั้น
+        self.tracker = PlateTracker(
+            high_thresh=self.conf_thr,
+            low_thresh=self.track_low_thresh,
+            min_hits=self.gate_present_thresh,
+            max_misses=self.gate_absent_thresh,
+            class_aware=True,
+        )
+        self.session = PlateSession(self.tracker, track_conf=self.track_low_thresh)
 
         # Plate status label placeholder
         self.lbl_plate_status = None
-        # Latched defect counts per plate
-        self._latched_defect_counts = {"crack": 0, "hole": 0}
+        # จำนวนตำหนิของจานปัจจุบัน จากหลักฐานที่รวมข้ามเฟรม
+        self._plate_defect_counts = {"crack": 0, "hole": 0}
 
     # -----------------------------
     # Helpers for date/lot/defects
@@ -175,73 +176,6 @@ class LeafPlateDetectionApp:
     def title_date(self, dt: datetime):
         return dt.strftime("%d/%m/%y")
 
-    # -----------------------------
-    # Firebase Admin helpers
-    # -----------------------------
-    def _fb_init(self):
-        """Init Firebase Admin ด้วย service account 'serviceAccountKey.json' หนึ่งครั้ง"""
-        if self._fb_ready:
-            return
-        try:
-            cred_path = os.path.join(self.BASE_DIR, "serviceAccountKey.json")  # เปลี่ยนชื่อไฟล์
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred, {"databaseURL": self.firebase_base})
-            self._fb_ready = True
-        except Exception as e:
-            print(f"[Firebase] Admin init failed, fallback to REST. reason={e}")
-            self._fb_ready = False
-
-    def _firebase_post(self, path, obj):
-        """POST (push) : Admin SDK ก่อน, ไม่งั้น fallback REST"""
-        # เพิ่ม meta เหมือน mock_data.py
-        payload = {
-            **obj,
-            "_meta": {
-                "source": "python-admin",
-                "pushed_at": datetime.now(timezone.utc).isoformat(),
-                "server_id": str(uuid.uuid4())
-            }
-        }
-        try:
-            self._fb_init()
-            if self._fb_ready:
-                ref = db.reference(path)
-                ref.push(payload)
-                return
-        except Exception as e:
-            print(f"[Firebase] Admin push failed, fallback to REST. reason={e}")
-
-        # --- Fallback: REST ---
-        try:
-            url = f"{self.firebase_base}/{path}.json"
-            data = json.dumps(payload).encode("utf-8")
-            req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
-            with urllib.request.urlopen(req, timeout=5):
-                pass
-        except Exception as e:
-            print(f"[Firebase] REST POST error: {e}")
-
-    def _firebase_put(self, path, obj):
-        """PUT (set) : Admin SDK ก่อน, ไม่งั้น fallback REST"""
-        try:
-            self._fb_init()
-            if self._fb_ready:
-                ref = db.reference(path)
-                ref.set(obj)
-                return
-        except Exception as e:
-            print(f"[Firebase] Admin set failed, fallback to REST. reason={e}")
-
-        # --- Fallback: REST ---
-        try:
-            url = f"{self.firebase_base}/{path}.json"
-            data = json.dumps(obj).encode("utf-8")
-            req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="PUT")
-            with urllib.request.urlopen(req, timeout=5):
-                pass
-        except Exception as e:
-            print(f"[Firebase] REST PUT error: {e}")
-
     # -----------------------------
     # App / Camera / Model
     # -----------------------------
@@ -257,21 +191,7 @@ class LeafPlateDetectionApp:
         self.app.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def setup_camera(self):
-        if sys.platform.startswith("win"):
-            backend = cv2.CAP_DSHOW
-        elif sys.platform == "darwin":
-            backend = cv2.CAP_AVFOUNDATION
-        else:
-            backend = cv2.CAP_V4L2
-
-        self.cap = cv2.VideoCapture(0, backend)
-        if not self.cap or not self.cap.isOpened():
-            self.cap = cv2.VideoCapture(0)
-        if not self.cap or not self.cap.isOpened():
-            print("Cannot open camera"); self.cap = None; return
-
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        self.cap = self.services.open_camera(1280, 720)
 
     def setup_model(self):
         try:
@@ -279,6 +199,12 @@ class LeafPlateDetectionApp:
         except Exception as e:
             messagebox.showerror("Model Error", f"โหลดโมเดลไม่สำเร็จ:\n{e}")
             self.model = None
+            return
+        self.pipeline = SingleModelPipeline(
+            self.model, self.shape_map, self.defect_classes, imgsz=self.imgsz, iou=self.iou_thr,
+            shape_conf=self.conf_thr, track_conf=self.track_low_thresh, defect_conf=self.conf_thr,
+            candidate_conf=self.services.candidate_conf,
+        )
 
     # -----------------------------
     # UI
@@ -825,10 +751,10 @@ class LeafPlateDetectionApp:
                 "end_time": datetime.now().strftime("%H:%M:%S")
             }
         }
-        self._firebase_put(f"sessions/{self.firebase_session_key}/meta", meta)
+        self.fb.put(f"sessions/{self.firebase_session_key}/meta", meta)
 
         # โพสต์แถวล่าสุดเข้า Firebase (POST)
-        self._firebase_post(f"sessions/{self.firebase_session_key}/records", row)
+        self.fb.post(f"sessions/{self.firebase_session_key}/records", row)
 
     # ----------------- Lot/Reset helpers -----------------
     def _update_lot_label(self):
@@ -887,14 +813,11 @@ class LeafPlateDetectionApp:
         self.firebase_session_key = None
 
         # Reset gating and statuses
-        self.gate_has_plate = False
-        self.gate_has_counted = False
-        self.gate_present_frames = 0
-        self.gate_absent_frames = 0
+        self.session.reset()
         self._set_plate_status("pending")
         try:
             self._reset_defect_table()
-            self._render_latched_defect_counts()
+            self._render_plate_defect_counts()
         except Exception:
             pass
 
@@ -928,37 +851,22 @@ class LeafPlateDetectionApp:
             if lbl:
                 lbl.configure(text="พบตำหนิ", text_color="#e74c3c")
 
-    # ----------------- Additional defect counts UI (parity with GUI_mac) -----------------
-    def _update_defect_counts_ui(self, defect_counts: dict):
-        """Update bottom table with numeric counts per defect (red when >0, else green 'ยังไม่พบ')."""
-        for en_name, th_name in self.defect_th_map.items():
-            lbl = self.status_labels.get(th_name)
-            if not lbl:
-                continue
-            cnt = int(defect_counts.get(en_name, 0))
-            if cnt > 0:
-                lbl.configure(text=str(cnt), text_color="#e74c3c")
-            else:
-                default_status, default_color = self._defect_defaults.get(th_name, ("ยังไม่พบ", "green"))
-                status_color = "#199129" if default_color == "green" else "#e74c3c"
-                lbl.configure(text=default_status, text_color=status_color)
-
     def _reset_defect_table(self):
         """รีเซ็ตตารางสถานะ defect กลับค่าเริ่มต้น เมื่อเริ่มตรวจจานใหม่"""
-        for k in list(self._latched_defect_counts.keys()):
-            self._latched_defect_counts[k] = 0
+        for k in list(self._plate_defect_counts.keys()):
+            self._plate_defect_counts[k] = 0
         for defect, (status, color) in self._defect_defaults.items():
             lbl = self.status_labels.get(defect)
             if lbl:
                 status_color = "#199129" if color == "green" else "#e74c3c"
                 lbl.configure(text=status, text_color=status_color)
 
-    def _render_latched_defect_counts(self):
+    def _render_plate_defect_counts(self):
         for en_name, th_name in self.defect_th_map.items():
             lbl = self.status_labels.get(th_name)
             if not lbl:
                 continue
-            cnt = int(self._latched_defect_counts.get(en_name, 0))
+            cnt = int(self._plate_defect_counts.get(en_name, 0))
             if cnt > 0:
                 lbl.configure(text=str(cnt), text_color="#e74c3c")
             else:
@@ -1029,34 +937,33 @@ class LeafPlateDetectionApp:
         self._update_defect_status_ui(defect_names)
         return row
 
-    def _annotate_and_summarize(self, frame_bgr, res):
-        annotated = frame_bgr.copy()
-        shapes_found, defect_names = set(), set()
-        defect_counts = {}
-
-        if not hasattr(res, "boxes") or res.boxes is None:
-            return annotated, shapes_found, defect_counts, defect_names
-
-        names = self.model.names
-        boxes = res.boxes
-
-        xyxy = boxes.xyxy.cpu().numpy().astype(int)
-        clss = boxes.cls.cpu().numpy().astype(int)
-        conf = boxes.conf.cpu().numpy()
-
-        for (x1, y1, x2, y2), c, p in zip(xyxy, clss, conf):
-            label = names.get(int(c), str(c))
-            cv2.rectangle(annotated, (x1, y1), (x2, y2), (255, 0, 0), 2)
-            cv2.putText(annotated, f"{label} {p:.2f}", (x1, max(20, y1 - 6)),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (20, 20, 255), 2, cv2.LINE_AA)
-
-            if label in self.shape_classes:
-                shapes_found.add(self.shape_map[label])
-            if label in self.defect_classes:
-                defect_names.add(label)
-                defect_counts[label] = defect_counts.get(label, 0) + 1
-
-        return annotated, shapes_found, defect_counts, defect_names
+    def _finalize_plate(self, track):
+        """จบจานหนึ่งใบ: นับรูปทรง + บันทึกแถวเดียวต่อ track จากหลักฐานตำหนิที่รวมแล้ว"""
+        if track.counted:
+            return None
+        track.counted = True
+        ev = self.session.evidence_of(track)
+        defect_names = ev.names()
+        plate_shapes = {track.label} if track.label else set()
+
+        self._update_shape_counters(plate_shapes)
+        # If only defects detected (no shapes), still increment total count
+        if (not plate_shapes) and (len(defect_names) > 0):
+            self.shape_counts["total"] += 1
+            self.total_number_label.configure(text=str(self.shape_counts["total"]))
+
+        snapshot = track.data.get("snapshot")
+        if snapshot is None:
+            return None
+        row = self._save_detection_record(snapshot, defect_names, plate_shapes)
+        # เซฟ CSV/JSON อัตโนมัติ + ส่ง Firebase
+        self._append_csv_json_and_firebase(row)
+        self._set_plate_status("counted", ev.total())
+        self._last_save_ms = time.time() * 1000.0
+        # อัปเดตป้ายเลขจานปัจจุบัน
+        if hasattr(self, "lbl_plate_no") and self.lbl_plate_no is not None:
+            self.lbl_plate_no.configure(text=f"จานที่ : {row['plate_id']}")
+        return row
 
     # ----------------- Camera update -----------------
     def start_camera(self):
@@ -1079,72 +986,33 @@ class LeafPlateDetectionApp:
 
         frame_resized = cv2.resize(frame, (self.cam_w, self.cam_h))
 
-        if self.is_collecting_data and self.model is not None:
+        if self.is_collecting_data and self.pipeline is not None:
             try:
-                results = self.model.predict(
-                    source=frame_resized,
-                    imgsz=self.imgsz,
-                    conf=self.conf_thr,
-                    iou=self.iou_thr,
-                    verbose=False
-                )
-                res = results[0]
-                annotated, shapes_found, defect_counts, defect_names = self._annotate_and_summarize(frame_resized, res)
+                result = self.pipeline.run(frame_resized)
+                annotated = annotate(frame_resized, result,
+                                     shape_color=(255, 0, 0), shape_text_color=(20, 20, 255),
+                                     defect_color=(255, 0, 0), shape_names=self._shape_model_names)
                 frame_to_show = annotated
 
-                # อัปเดตตาราง defect ด้วยจำนวน defect ล่าสุด
-                self._update_defect_counts_ui(defect_counts)
-
-                # Single-count gating per plate
-                plate_detected = (len(shapes_found) > 0) or (len(defect_names) > 0)
-                # อัปเดตตัวเลข defect แบบค้างต่อจาน (monotonic)
-                if plate_detected:
-                    for k, v in defect_counts.items():
-                        try:
-                            iv = int(v)
-                        except Exception:
-                            iv = 0
-                        self._latched_defect_counts[k] = max(self._latched_defect_counts.get(k, 0), iv)
-                    self._render_latched_defect_counts()
-                if plate_detected:
-                    self.gate_present_frames += 1
-                    self.gate_absent_frames = 0
-                else:
-                    self.gate_absent_frames += 1
-                    self.gate_present_frames = 0
+                # Plate tracking: นับ/บันทึกครั้งเดียวต่อจาน ตอนจานออกจากภาพ
+                upd = self.session.update(result, annotated)
+                self.miner.offer(frame_resized, result, {"lot": self.lot_id,
+                                                          "plate": upd.plate.track_id if upd.plate is not None else None})
+                for gone in upd.finished:
+                    self._finalize_plate(gone)
 
                 # New stable plate appears
-                if (not self.gate_has_plate) and plate_detected and self.gate_present_frames >= self.gate_present_thresh:
-                    self.gate_has_plate = True
-                    self.gate_has_counted = False
+                if upd.new_plate:
                     self._set_plate_status("pending")
                     # รีเซ็ตตาราง defect สำหรับจานใหม่
                     self._reset_defect_table()
-                    self._render_latched_defect_counts()
-
-                # Count once per plate
-                if self.gate_has_plate and (not self.gate_has_counted) and self.gate_present_frames >= self.gate_present_thresh:
-                    self._update_shape_counters(shapes_found)
-                    # If only defects detected (no shapes), still increment total count
-                    if (not shapes_found) and (len(defect_names) > 0):
-                        self.shape_counts["total"] += 1
-                        self.total_number_label.configure(text=str(self.shape_counts["total"]))
-                    row = self._save_detection_record(annotated, defect_names, shapes_found)
-                    # เซฟ CSV/JSON อัตโนมัติ + ส่ง Firebase
-                    self._append_csv_json_and_firebase(row)
-                    defect_count = sum(defect_counts.values())  # <--- เพิ่มบรรทัดนี้
-                    self._set_plate_status("counted", defect_count)  # <--- ส่ง defect_count เข้าไป
-                    self.gate_has_counted = True
-                    self._last_save_ms = time.time() * 1000.0
-                    # อัปเดตป้ายเลขจานปัจจุบัน
-                    if hasattr(self, "lbl_plate_no") and self.lbl_plate_no is not None:
-                        self.lbl_plate_no.configure(text=f"จานที่ : {row['plate_id']}")
-
-                # Plate removed -> reset gate
-                if self.gate_has_plate and self.gate_absent_frames >= self.gate_absent_thresh:
-                    self.gate_has_plate = False
-                    self.gate_has_counted = False
-                    self._set_plate_status("pending")
+                    self._render_plate_defect_counts()
+
+                # อัปเดตตาราง defect จากหลักฐานที่รวมข้ามเฟรมของจานนี้
+                if upd.evidence is not None:
+                    self._plate_defect_counts.update({k: 0 for k in self._plate_defect_counts})
+                    self._plate_defect_counts.update(upd.evidence.counts())
+                    self._render_plate_defect_counts()
 
             except Exception as e:
                 print(f"Inference error: {e}")
@@ -1172,6 +1040,10 @@ class LeafPlateDetectionApp:
         except Exception:
             pass
 
+        # จานที่ยังอยู่ในภาพตอนกดหยุด → บันทึกก่อน export
+        for t in self.session.flush():
+            self._finalize_plate(t)
+
         if self.session_rows:
             try:
                 self._write_csv(self.save_root)
@@ -1193,7 +1065,7 @@ class LeafPlateDetectionApp:
                     "end_time": datetime.now().strftime("%H:%M:%S")
                 }
             }
-            self._firebase_put(f"sessions/{self.firebase_session_key}/meta", meta)
+            self.fb.put(f"sessions/{self.firebase_session_key}/meta", meta)
         # Reset plate status when finalized
         self._set_plate_status("pending")
 
@@ -1253,10 +1125,7 @@ class LeafPlateDetectionApp:
             self.session_meta.setdefault("start_time", datetime.now().strftime("%H:%M:%S"))
             self.toggle_button.configure(text="หยุด", fg_color="#e74c3c", hover_color="#c0392b")
             # Reset gating state when starting
-            self.gate_has_plate = False
-            self.gate_has_counted = False
-            self.gate_present_frames = 0
-            self.gate_absent_frames = 0
+            self.session.reset()
             self._set_plate_status("pending")
             # รีเซ็ตตาราง defect และอัปเดตเลขจานที่ทำเสร็จก่อนหน้า
             try:
@@ -1280,6 +1149,7 @@ class LeafPlateDetectionApp:
             # หยุด + export + อัปเดต meta
             self.stop_and_finalize()
 
+        self.services.stop()
         self.stop_camera()
         self.app.destroy()
 
@@ -1298,4 +1168,5 @@ if __name__ == "__main__":
     app.setup_model()
     app.create_widgets()
     app.start_camera()
+    app.services.start()
     app.run()
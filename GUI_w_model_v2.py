@@ -3,8 +3,8 @@
 # Required: pip install customtkinter ultralytics opencv-python pillow firebase-admin openpyxl
 # Put your Firebase service account JSON next to this file as: serviceAccountKey.json
 
-import os, sys, time, json, uuid, glob, signal
-from datetime import datetime, timezone
+import os, sys, json, glob, signal
+from datetime import datetime
 
 import customtkinter as ctk
 import tkinter as tk
@@ -12,33 +12,30 @@ from tkinter import ttk
 from tkinter import font as tkfont
 from tkinter import messagebox
 
-import cv2
-import numpy as np
 from PIL import Image, ImageTk
-from ultralytics import YOLO
-
-import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-
-# -------- Emoji Support --------
-try:
-    import emojis
-    EMOJI_AVAILABLE = True
-except ImportError:
-    EMOJI_AVAILABLE = False
+# dependency หนักโหลดแบบ lazy (ดู lazy_imports.py) → หน้าต่างขึ้นก่อน ค่อยจ่ายค่า import ตอนใช้จริง
+from lazy_imports import lazy_import, lazy_from, is_available
+
+openpyxl = lazy_import("openpyxl")
+Font = lazy_from("openpyxl.styles", "Font")
+Alignment = lazy_from("openpyxl.styles", "Alignment")
+PatternFill = lazy_from("openpyxl.styles", "PatternFill")
+Border = lazy_from("openpyxl.styles", "Border")
+Side = lazy_from("openpyxl.styles", "Side")
+
+# -------- Emoji Support (import ตอน log ครั้งแรก) --------
+EMOJI_AVAILABLE = is_available("emojis")
+if not EMOJI_AVAILABLE:
     print("Warning: emojis library not available. Install with: pip install emojis")
+emojis = lazy_import("emojis")
 
-try:
-    from colorama import init, Fore, Back, Style
-    init(autoreset=True)  # เริ่มต้น colorama สำหรับ Windows
-    COLORAMA_AVAILABLE = True
-except ImportError:
-    COLORAMA_AVAILABLE = False
+COLORAMA_AVAILABLE = is_available("colorama")
+if not COLORAMA_AVAILABLE:
     print("Warning: colorama library not available. Install with: pip install colorama")
+colorama = lazy_import("colorama", on_load=lambda m: m.init(autoreset=True))  # init colorama สำหรับ Windows
 
-# -------- Firebase Admin SDK --------
-import firebase_admin
-from firebase_admin import credentials, db
+from plate_tracker import PlateTracker
+from inspection_core import cv2, YOLO, SingleModelPipeline, PlateSession, annotate, AppServices
 
 
 # ================================
@@ -95,12 +92,14 @@ class ExcelViewerDialog(ctk.CTkToplevel):
 
     def _refresh_file_list(self):
         prev = self.combo.get()
+        # รายงานเก่าถูก RetentionManager ย้ายไป archive/YYYY-MM/ → แสดงเป็น path ย่อยใต้ folder
         paths = sorted(
-            glob.glob(os.path.join(self.folder, "Report_*.xlsx")),
+            glob.glob(os.path.join(self.folder, "Report_*.xlsx"))
+            + glob.glob(os.path.join(self.folder, "archive", "*", "Report_*.xlsx")),
             key=lambda p: os.path.getmtime(p),
             reverse=True,
         )
-        names = [os.path.basename(p) for p in paths]
+        names = [os.path.relpath(p, self.folder) for p in paths]
         self.combo["values"] = names
 
         if not names:
@@ -329,8 +328,8 @@ class LeafPlateDetectionApp:
         """พิมพ์ข้อความที่มี emoji แบบมีสีสันใน console"""
         if COLORAMA_AVAILABLE:
             emoji_char = self._get_colored_emoji(emoji_code)
-            color_func = getattr(Fore, color.upper(), Fore.WHITE)
-            print(f"{color_func}{emoji_char} {message}{Style.RESET_ALL}")
+            color_func = getattr(colorama.Fore, color.upper(), colorama.Fore.WHITE)
+            print(f"{color_func}{emoji_char} {message}{colorama.Style.RESET_ALL}")
         else:
             emoji_char = self._get_colored_emoji(emoji_code)
             print(f"{emoji_char} {message}")
@@ -407,6 +406,9 @@ class LeafPlateDetectionApp:
         self.imgsz = 896
         self.conf_thr = 0.27
         self.iou_thr = 0.65
+        # geometry hint: กล่องรูปทรง conf < high แก้ชื่อด้วยรูปร่างเส้นขอบ (< low เชื่อ hint เต็มที่)
+        self.shape_geom_low, self.shape_geom_high = 0.62, 0.78
+        self.pipeline = None
 
         # class groups
         self.shape_classes = {"circle_leaf_plate", "heart_shaped_leaf_plate", "rectangular_leaf_plate"}
@@ -418,30 +420,35 @@ class LeafPlateDetectionApp:
             "circle_leaf_plate": "circle",
         }
         self.shape_display_map = {"heart": "หัวใจ", "rectangle": "สี่เหลี่ยมผืนผ้า", "circle": "วงกลม"}
+        self._shape_model_names = {v: k for k, v in self.shape_map.items()}
 
         # files
-        self.captures_dir = os.path.join(self.BASE_DIR, "captures")
-        os.makedirs(self.captures_dir, exist_ok=True)
+        # captures/ + retention + mining + Firebase (ปรับผ่าน env LEAFPLATE_* ; ดู inspection_core/services.py)
+        self.services = AppServices(self.BASE_DIR)
+        self.captures_dir = self.services.captures_dir
+        self.retention, self.miner, self.fb = self.services.retention, self.services.miner, self.services.fb
         self._auto_xlsx_path = None
         self._auto_json_path = None
         self._session_stamp = None
 
         # Firebase
-        self.firebase_base = "https://leaf-plate-defect-detec-w-cnn-default-rtdb.asia-southeast1.firebasedatabase.app"
         self.firebase_session_key = None
-        self._fb_ready = False
 
-        # gating
+        # gating: PlateTracker + หลักฐานตำหนิต่อจาน (นับ/บันทึกครั้งเดียวตอนจานออกจากภาพ)
         self.lbl_heart = self.lbl_rect = self.lbl_circle = None
-        self.gate_has_plate = False
-        theFalse = False
-        self.gate_has_counted = False
-        self.gate_present_frames = 0
-        self.gate_absent_frames = 0
         self.gate_present_thresh = 5
         self.gate_absent_thresh = 10
+        self.track_low_thresh = 0.15
+        self.tracker = PlateTracker(
+            high_thresh=self.conf_thr,
+            low_thresh=self.track_low_thresh,
+            min_hits=self.gate_present_thresh,
+            max_misses=self.gate_absent_thresh,
+            class_aware=True,
+        )
+        self.session = PlateSession(self.tracker, track_conf=self.track_low_thresh)
         self.lbl_plate_status = None
-        self._latched_defect_counts = {"crack": 0, "hole": 0, "bulge": 0, "burn": 0}
+        self._plate_defect_counts = {"crack": 0, "hole": 0, "bulge": 0, "burn": 0}
 
     def generate_lot_id(self):
         return "PTP" + datetime.now().strftime("%y%m%d") + "_01"
@@ -459,57 +466,6 @@ class LeafPlateDetectionApp:
         except Exception:
             pass
 
-    # ---------------- Firebase helpers ----------------
-    def _fb_init(self):
-        if self._fb_ready:
-            return
-        try:
-            cred_path = os.path.join(self.BASE_DIR, "serviceAccountKey.json")
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred, {"databaseURL": self.firebase_base})
-            self._fb_ready = True
-        except Exception as e:
-            print(f"[Firebase] Admin init failed, will fallback to REST. reason={e}")
-            self._fb_ready = False
-
-    def _firebase_post(self, path, obj):
-        payload = {
-            **obj,
-            "_meta": {"source": "python-admin", "pushed_at": datetime.now(timezone.utc).isoformat(), "server_id": str(uuid.uuid4())}
-        }
-        try:
-            self._fb_init()
-            if self._fb_ready:
-                db.reference(path).push(payload)
-                return
-        except Exception as e:
-            print(f"[Firebase] Admin push failed, fallback REST. reason={e}")
-        try:
-            import urllib.request
-            url = f"{self.firebase_base}/{path}.json"
-            data = json.dumps(payload).encode("utf-8")
-            req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
-            with urllib.request.urlopen(req, timeout=5): pass
-        except Exception as e:
-            print(f"[Firebase] REST POST error: {e}")
-
-    def _firebase_put(self, path, obj):
-        try:
-            self._fb_init()
-            if self._fb_ready:
-                db.reference(path).set(obj)
-                return
-        except Exception as e:
-            print(f"[Firebase] Admin set failed, fallback REST. reason={e}")
-        try:
-            import urllib.request
-            url = f"{self.firebase_base}/{path}.json"
-            data = json.dumps(obj).encode("utf-8")
-            req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="PUT")
-            with urllib.request.urlopen(req, timeout=5): pass
-        except Exception as e:
-            print(f"[Firebase] REST PUT error: {e}")
-
     # ---------------- App / Camera / Model ----------------
     def setup_app(self):
         ctk.set_appearance_mode("light")
@@ -523,19 +479,7 @@ class LeafPlateDetectionApp:
         self.app.report_callback_exception = self._report_callback_exception
 
     def setup_camera(self):
-        if sys.platform.startswith("win"):
-            backend = cv2.CAP_DSHOW
-        elif sys.platform == "darwin":
-            backend = cv2.CAP_AVFOUNDATION
-        else:
-            backend = cv2.CAP_V4L2
-        self.cap = cv2.VideoCapture(0, backend)
-        if not self.cap or not self.cap.isOpened():
-            self.cap = cv2.VideoCapture(0)
-        if not self.cap or not self.cap.isOpened():
-            print("Cannot open camera"); self.cap = None; return
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 1080)
+        self.cap = self.services.open_camera(1920, 1080)
 
     def setup_model(self):
         try:
@@ -551,6 +495,13 @@ class LeafPlateDetectionApp:
             self._log_with_emoji("error", f"โหลดโมเดลไม่สำเร็จ: {e}")
             messagebox.showerror("Model Error", f"โหลดโมเดลไม่สำเร็จ:\n{e}")
             self.model = None
+            return
+        self.pipeline = SingleModelPipeline(
+            self.model, self.shape_map, self.defect_classes, imgsz=self.imgsz, iou=self.iou_thr,
+            shape_conf=self.conf_thr, track_conf=self.track_low_thresh, defect_conf=self.conf_thr,
+            candidate_conf=self.services.candidate_conf,
+            class_nms_iou=self.iou_thr, geometry_hint=(self.shape_geom_low, self.shape_geom_high),
+        )
         # ---------------- UI ----------------
     def create_widgets(self):
         self.create_header()
@@ -850,42 +801,6 @@ class LeafPlateDetectionApp:
             print(f"Write JSON error: {e}")
 
     # ---------------- Helpers ----------------
-    
-    def _shape_hint_from_geometry(self, roi_bgr):
-
-        if roi_bgr is None or roi_bgr.size == 0:
-            return None
-        try:
-            gray = cv2.cvtColor(roi_bgr, cv2.COLOR_BGR2GRAY)
-            gray = cv2.GaussianBlur(gray, (5, 5), 0)
-            thr = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU | cv2.THRESH_BINARY_INV)[1]
-            cnts, _ = cv2.findContours(thr, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            if not cnts:
-                return None
-            c = max(cnts, key=cv2.contourArea)
-            A = cv2.contourArea(c)
-            if A < 50:   # เลี่ยงจุดรบกวนเล็ก ๆ
-                return None
-            P = cv2.arcLength(c, True) + 1e-6
-            circularity = 4.0 * np.pi * A / (P * P)  # ~1.0 = กลม
-
-            x, y, w, h = cv2.boundingRect(c)
-            rect_area = float(w * h) + 1e-6
-            rectangularity = A / rect_area         # ~1.0 = เติมเต็มสี่เหลี่ยม
-            ar = w / float(h)
-
-            # เกณฑ์หยาบที่ใช้งานจริงได้ดี
-            if circularity > 0.80 and 0.85 <= ar <= 1.15:
-                return "circle"
-            if rectangularity > 0.86 and (ar < 0.80 or ar > 1.20):
-                return "rectangle"
-            if circularity < 0.78 and rectangularity < 0.88:
-                return "heart"
-        except Exception:
-            pass
-        return None
-
-    
     def thai_date(self, dt):  # 11/09/2568
         return dt.strftime(f"%d/%m/{dt.year + 543}")
 
@@ -913,19 +828,19 @@ class LeafPlateDetectionApp:
         self._update_lot_label()
 
     def _reset_defect_table(self):
-        for k in list(self._latched_defect_counts.keys()):
-            self._latched_defect_counts[k] = 0
+        for k in list(self._plate_defect_counts.keys()):
+            self._plate_defect_counts[k] = 0
         for defect, (status, color) in self._defect_defaults.items():
             lbl = self.status_labels.get(defect)
             if lbl:
                 status_color = "#199129" if color == "green" else "#e74c3c"
                 lbl.configure(text=status, text_color=status_color)
 
-    def _render_latched_defect_counts(self):
+    def _render_plate_defect_counts(self):
         for en_name, th_name in self.defect_th_map.items():
             lbl = self.status_labels.get(th_name)
             if not lbl: continue
-            cnt = int(self._latched_defect_counts.get(en_name, 0))
+            cnt = int(self._plate_defect_counts.get(en_name, 0))
             if cnt > 0:
                 lbl.configure(text=str(cnt), text_color="#e74c3c")
             else:
@@ -994,143 +909,50 @@ class LeafPlateDetectionApp:
                 "end_time": datetime.now().strftime("%H:%M:%S")
             }
         }
-        self._firebase_put(f"sessions/{self.firebase_session_key}/meta", meta)
-        self._firebase_post(f"sessions/{self.firebase_session_key}/records", row)
+        self.fb.put(f"sessions/{self.firebase_session_key}/meta", meta)
+        self.fb.post(f"sessions/{self.firebase_session_key}/records", row)
 
         return row
 
     # ---------------- Detection ----------------
-    def _annotate_and_summarize(self, frame_bgr, res):
- 
-        annotated = frame_bgr.copy()
-        shapes_found, defect_names = set(), set()
-        defect_counts = {}
-    
-        # กันเคสไม่มีกล่อง
-        if not hasattr(res, "boxes") or res.boxes is None:
-            return annotated, shapes_found, defect_counts, defect_names
-    
-        names = self.model.names  # YOLO class id -> name
-        boxes = res.boxes
-        xyxy = boxes.xyxy.cpu().numpy()
-        clss = boxes.cls.cpu().numpy().astype(int)
-        conf = boxes.conf.cpu().numpy()
-    
-        # ---------- utils ----------
-        def iou_xyxy(a, b):
-            ax1, ay1, ax2, ay2 = a
-            bx1, by1, bx2, by2 = b
-            inter_x1 = max(ax1, bx1)
-            inter_y1 = max(ay1, by1)
-            inter_x2 = min(ax2, bx2)
-            inter_y2 = min(ay2, by2)
-            iw = max(0.0, inter_x2 - inter_x1)
-            ih = max(0.0, inter_y2 - inter_y1)
-            inter = iw * ih
-            area_a = max(0.0, ax2 - ax1) * max(0.0, ay2 - ay1)
-            area_b = max(0.0, bx2 - bx1) * max(0.0, by2 - by1)
-            union = area_a + area_b - inter
-            return (inter / union) if union > 0 else 0.0
-    
-        def classwise_nms(dets, iou_thr):
-            """
-            dets: list of dict {label, conf, xyxy(tuple)}
-            return kept list after doing greedy NMS PER CLASS
-            """
-            by_label = {}
-            for d in dets:
-                by_label.setdefault(d["label"], []).append(d)
-    
-            kept = []
-            for lbl, arr in by_label.items():
-                arr.sort(key=lambda x: x["conf"], reverse=True)
-                used = []
-                for d in arr:
-                    suppress = False
-                    for k in used:
-                        if iou_xyxy(d["xyxy"], k["xyxy"]) >= iou_thr:
-                            suppress = True
-                            break
-                    if not suppress:
-                        used.append(d)
-                kept.extend(used)
-            return kept
-    
-        # เตรียมดีเทคทั้งหมด
-        dets = []
-        for (x1, y1, x2, y2), c, p in zip(xyxy, clss, conf):
-            label = names.get(int(c), str(c))
-            dets.append({"label": label,
-                         "conf": float(p),
-                         "xyxy": (float(x1), float(y1), float(x2), float(y2))})
-    
-        # ---------- NMS แยกตามคลาส ----------
-        kept = classwise_nms(dets, getattr(self, "iou_thr", 0.65))
-    
-        # reverse map: "heart"/"rectangle"/"circle" -> ชื่อคลาสโมเดล
-        if not hasattr(self, "_rev_shape_map"):
-            self._rev_shape_map = {}
-            for k, v in self.shape_map.items():
-                # ถ้าชื่อในโมเดลซ้ำหลายตัวกับ v จะเก็บตัวแรก
-                self._rev_shape_map.setdefault(v, k)
-    
-        # กำหนดเกณฑ์การทับด้วย geometry hint
-        # - ต่ำกว่า low: override ได้เต็มที่
-        # - ระหว่าง low..high: override ถ้า hint ไม่ตรงกับที่โมเดลทำนาย
-        geom_low = getattr(self, "shape_geom_low", 0.62)
-        geom_high = getattr(self, "shape_geom_high", 0.78)
-    
-        # ---------- วาด + นับ ----------
-        for d in kept:
-            label = d["label"]
-            p = d["conf"]
-            (x1, y1, x2, y2) = map(int, d["xyxy"])
-    
-            # ถ้าเป็น "shape class" → ให้มีสิทธิ์ใช้ geometry hint
-            if label in self.shape_classes:
-                final_label = label
-    
-                # geometry hint เฉพาะตอนความมั่นใจยังไม่สูง
-                if p < geom_high:
-                    # crop ROI แล้วเดา geometry
-                    x1c, y1c = max(0, x1), max(0, y1)
-                    x2c, y2c = min(annotated.shape[1], x2), min(annotated.shape[0], y2)
-                    roi = annotated[y1c:y2c, x1c:x2c]
-                    hint = self._shape_hint_from_geometry(roi)  # -> "heart"/"rectangle"/"circle"/None
-    
-                    if hint is not None:
-                        # แปลง hint -> class name ของโมเดล
-                        hint_label = self._rev_shape_map.get(hint, None)
-                        if hint_label is not None:
-                            # ถ้ามั่นใจต่ำมาก (p < low) หรือ hint ขัดกับสิ่งที่โมเดลทำนาย ให้ override
-                            if (p < geom_low) or (self.shape_map.get(label) != hint):
-                                final_label = hint_label
-    
-                # วาดกรอบสีน้ำเงิน
-                cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 102, 255), 2)
-                cv2.putText(
-                    annotated, f"{final_label} {p:.2f}",
-                    (x1, max(20, y1 - 6)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 102, 255), 2, cv2.LINE_AA
-                )
-    
-                # เก็บผลในเชิงตรรกะ (เป็นคีย์ภายใน: heart/rectangle/circle)
-                shapes_found.add(self.shape_map.get(final_label, final_label))
-    
-            # ถ้าเป็น defect class → วาดแดง + นับ
-            elif label in self.defect_classes:
-                cv2.rectangle(annotated, (x1, y1), (x2, y2), (255, 0, 0), 2)
-                cv2.putText(
-                    annotated, f"{label} {p:.2f}",
-                    (x1, max(20, y1 - 6)),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (20, 20, 255), 2, cv2.LINE_AA
-                )
-                defect_names.add(label)
-                defect_counts[label] = defect_counts.get(label, 0) + 1
-    
-            # อื่น ๆ (คลาสที่เราไม่สนใจ) ก็ข้าม
-    
-        return annotated, shapes_found, defect_counts, defect_names
+    def _finalize_plate(self, track):
+        """จบจานหนึ่งใบ: นับรูปทรง + บันทึกแถวเดียวต่อ track จากหลักฐานตำหนิที่รวมแล้ว"""
+        if track.counted:
+            return None
+        track.counted = True
+        ev = self.session.evidence_of(track)
+        defect_names = ev.names()
+        shapes_found = {track.label} if track.label else set()
+
+        # count
+        if shapes_found:
+            for shp in shapes_found:
+                if shp in self.shape_counts:
+                    self.shape_counts[shp] += 1
+                    self.shape_counts["total"] += 1
+        elif len(defect_names) > 0:
+            self.shape_counts["total"] += 1
+
+        # update UI counters
+        self.total_number_label.configure(text=str(self.shape_counts["total"]))
+        self.lbl_plate_order.configure(text=str(self.shape_counts["total"]))
+        self.lbl_heart.configure(text=str(self.shape_counts["heart"]))
+        self.lbl_rect.configure(text=str(self.shape_counts["rectangle"]))
+        self.lbl_circle.configure(text=str(self.shape_counts["circle"]))
+
+        snapshot = track.data.get("snapshot")
+        if snapshot is None:
+            return None
+        row = self._save_detection_record(snapshot, defect_names, shapes_found)
+        defect_count = ev.total()
+        self._set_plate_status("counted", defect_count)
+
+        # Log การตรวจจับสำเร็จ
+        if defect_count > 0:
+            self._log_with_emoji("warning", f"พบตำหนิ {defect_count} จุด ในจานที่ {row['plate_id']}")
+        else:
+            self._log_with_emoji("success", f"จานที่ {row['plate_id']} ผ่านการตรวจสอบ")
+        return row
 
 
     # ---------------- Camera loop ----------------
@@ -1153,65 +975,30 @@ class LeafPlateDetectionApp:
 
         frame_resized = cv2.resize(frame, (self.cam_w, self.cam_h))
 
-        if self.is_collecting_data and self.model is not None:
+        if self.is_collecting_data and self.pipeline is not None:
             try:
-                results = self.model.predict(
-                    source=frame_resized, imgsz=self.imgsz,
-                    conf=self.conf_thr, iou=self.iou_thr, verbose=False
-                )
-                res = results[0]
-                annotated, shapes_found, defect_counts, defect_names = self._annotate_and_summarize(frame_resized, res)
+                result = self.pipeline.run(frame_resized)
+                annotated = annotate(frame_resized, result,
+                                     shape_color=(0, 102, 255), shape_text_color=(0, 102, 255),
+                                     defect_color=(255, 0, 0), shape_names=self._shape_model_names)
                 frame_to_show = annotated
 
-                # latched counts and gating
-                plate_detected = (len(shapes_found) > 0) or (len(defect_names) > 0)
-                if plate_detected:
-                    for k, v in defect_counts.items():
-                        self._latched_defect_counts[k] = max(self._latched_defect_counts.get(k, 0), int(v))
-                    self._render_latched_defect_counts()
-
-                if plate_detected:
-                    self.gate_present_frames += 1; self.gate_absent_frames = 0
-                else:
-                    self.gate_absent_frames += 1; self.gate_present_frames = 0
+                # plate tracking: จานที่ออกจากภาพแล้ว → นับ + บันทึก
+                upd = self.session.update(result, annotated)
+                self.miner.offer(frame_resized, result, {"lot": self.lot_id,
+                                                          "plate": upd.plate.track_id if upd.plate is not None else None})
+                for gone in upd.finished:
+                    self._finalize_plate(gone)
 
-                if (not self.gate_has_plate) and plate_detected and self.gate_present_frames >= self.gate_present_thresh:
-                    self.gate_has_plate = True; self.gate_has_counted = False
-                    self._set_plate_status("pending")
-                    self._reset_defect_table(); self._render_latched_defect_counts()
-
-                if self.gate_has_plate and (not self.gate_has_counted) and self.gate_present_frames >= self.gate_present_thresh:
-                    # count
-                    if shapes_found:
-                        for shp in shapes_found:
-                            if shp in self.shape_counts:
-                                self.shape_counts[shp] += 1
-                                self.shape_counts["total"] += 1
-                    elif len(defect_names) > 0:
-                        self.shape_counts["total"] += 1
-
-                    # update UI counters
-                    self.total_number_label.configure(text=str(self.shape_counts["total"]))
-                    self.lbl_plate_order.configure(text=str(self.shape_counts["total"]))
-                    self.lbl_heart.configure(text=str(self.shape_counts["heart"]))
-                    self.lbl_rect.configure(text=str(self.shape_counts["rectangle"]))
-                    self.lbl_circle.configure(text=str(self.shape_counts["circle"]))
-
-                    row = self._save_detection_record(annotated, defect_names, shapes_found)
-                    defect_count = sum(defect_counts.values())
-                    self._set_plate_status("counted", defect_count)
-                    self.gate_has_counted = True
-                    
-                    # Log การตรวจจับสำเร็จ
-                    if defect_count > 0:
-                        self._log_with_emoji("warning", f"พบตำหนิ {defect_count} จุด ในจานที่ {self.plate_id_counter-1}")
-                    else:
-                        self._log_with_emoji("success", f"จานที่ {self.plate_id_counter-1} ผ่านการตรวจสอบ")
-
-                if self.gate_has_plate and self.gate_absent_frames >= self.gate_absent_thresh:
-                    self.gate_has_plate = False
-                    self.gate_has_counted = False
+                if upd.new_plate:
                     self._set_plate_status("pending")
+                    self._reset_defect_table(); self._render_plate_defect_counts()
+
+                # ตาราง defect = หลักฐานที่รวมข้ามเฟรมของจานปัจจุบัน
+                if upd.evidence is not None:
+                    self._plate_defect_counts.update({k: 0 for k in self._plate_defect_counts})
+                    self._plate_defect_counts.update(upd.evidence.counts())
+                    self._render_plate_defect_counts()
 
             except Exception as e:
                 print(f"Inference error: {e}")
@@ -1239,10 +1026,9 @@ class LeafPlateDetectionApp:
             self.is_collecting_data = True
             self.session_meta.setdefault("start_time", datetime.now().strftime("%H:%M:%S"))
             self.toggle_button.configure(text="หยุด", fg_color="#e74c3c", hover_color="#c0392b")
-            self.gate_has_plate = self.gate_has_counted = False
-            self.gate_present_frames = self.gate_absent_frames = 0
+            self.session.reset()
             self._set_plate_status("pending")
-            self._reset_defect_table(); self._render_latched_defect_counts()
+            self._reset_defect_table(); self._render_plate_defect_counts()
             # ensure workbook created with start time
             self._ensure_session_files()
             self._update_excel_session_times()
@@ -1272,6 +1058,10 @@ class LeafPlateDetectionApp:
         except Exception:
             pass
 
+        # จานที่ยังอยู่ในภาพตอนกดหยุด → บันทึกก่อนปิดรายงาน
+        for t in self.session.flush():
+            self._finalize_plate(t)
+
         # ปรับ end_time ในไฟล์ล่าสุด
         if self._session_stamp:
             self._update_excel_session_times()
@@ -1283,7 +1073,7 @@ class LeafPlateDetectionApp:
                     "end_time": datetime.now().strftime("%H:%M:%S")
                 }
             }
-            self._firebase_put(f"sessions/{self.firebase_session_key}/meta", meta)
+            self.fb.put(f"sessions/{self.firebase_session_key}/meta", meta)
             self._log_with_emoji("success", "บันทึกรายงานเรียบร้อย")
 
         # reset to next lot
@@ -1310,10 +1100,9 @@ class LeafPlateDetectionApp:
         self._session_stamp = None
         self.firebase_session_key = None
 
-        self.gate_has_plate = self.gate_has_counted = False
-        self.gate_present_frames = self.gate_absent_frames = 0
+        self.session.reset()
         self._set_plate_status("pending")
-        self._reset_defect_table(); self._render_latched_defect_counts()
+        self._reset_defect_table(); self._render_plate_defect_counts()
 
         self._increment_lot_id()
 
@@ -1327,6 +1116,7 @@ class LeafPlateDetectionApp:
             if not messagebox.askyesno("ออกจากโปรแกรม", f"{warning_emoji} กำลังตรวจจับอยู่ ต้องการออกทันทีหรือไม่?"):
                 return
             self.stop_and_finalize()
+        self.services.stop()
         self.stop_camera()
         self.app.destroy()
 
@@ -1359,6 +1149,7 @@ if __name__ == "__main__":
     app.setup_model()
     app.create_widgets()
     app.start_camera()
+    app.services.start()
     
     print("✅ โปรแกรมพร้อมใช้งาน!")
     
@@ -8,18 +8,18 @@ import tkinter as tk
 from tkinter import font as tkfont
 from tkinter import filedialog, messagebox
 
-import cv2
-import numpy as np
 from PIL import Image, ImageTk
-from ultralytics import YOLO
 
-from datetime import datetime, timezone
-import os, sys, json, csv, time, uuid, signal
-import urllib.request, urllib.error
+from datetime import datetime
+import os, json, csv, time, signal
+from concurrent.futures import ThreadPoolExecutor
 
-# -------- Firebase Admin SDK --------
-import firebase_admin
-from firebase_admin import credentials, db
+from plate_tracker import PlateTracker
+from sliced_inference import SlicedDefectInference
+# cv2 / YOLO แบบ lazy มาจาก inspection_core → หน้าต่างขึ้นก่อน ค่อยจ่ายค่า import ตอนใช้จริง
+from inspection_core import (cv2, YOLO, TwoStagePipeline, PlateSession, annotate,
+                             ProcessInferencePool, build_spec, AppServices)
+from runtime_config import RuntimeConfig, TWO_STAGE_SCHEMA, TWO_STAGE_RULES
 
 
 class LeafPlateTwoStageApp:
@@ -116,7 +116,7 @@ class LeafPlateTwoStageApp:
 
         # threshold แยกกันสำหรับสองโมเดล
         self.conf_shape = 0.55
-        self.iou_shape  = 0.70
+        self.iou_shape  = 0.72
         self.conf_defect= 0.25
         self.iou_defect = 0.65
 
@@ -134,6 +134,8 @@ class LeafPlateTwoStageApp:
             "rectangular_leaf_plate": "rectangle",
             "circle_leaf_plate": "circle",
         }
+        # ชื่อคลาสเต็มสำหรับป้ายบนภาพ (short -> ชื่อคลาสโมเดล)
+        self._shape_model_names = {v: k for k, v in self.shape_map.items()}
         # Display names for shapes in Thai
         self.shape_display_map = {
             "heart": "หัวใจ",
@@ -141,11 +143,10 @@ class LeafPlateTwoStageApp:
             "circle": "วงกลม",
         }
 
-        # โฟลเดอร์รูป Annotated
-        self.captures_dir = os.path.join(self.BASE_DIR, "captures")
-        os.makedirs(self.captures_dir, exist_ok=True)
-        self.save_cooldown_ms = 1200
-        self._last_save_ms = 0
+        # captures/ + retention + mining + Firebase (ปรับผ่าน env LEAFPLATE_* ; ดู inspection_core/services.py)
+        self.services = AppServices(self.BASE_DIR)
+        self.captures_dir = self.services.captures_dir
+        self.retention, self.miner, self.fb = self.services.retention, self.services.miner, self.services.fb
 
         # ไฟล์ CSV/JSON อัตโนมัติของ "รอบนี้"
         self._auto_csv_path = None
@@ -153,38 +154,99 @@ class LeafPlateTwoStageApp:
         self._session_stamp = None
 
         # ---------- Firebase ----------
-        self.firebase_base = "https://leaf-plate-defect-detec-w-cnn-default-rtdb.asia-southeast1.firebasedatabase.app"
         self.firebase_session_key = None
-        self._fb_ready = False  # Admin SDK พร้อมหรือยัง
+
+        # ---------- Startup metrics ----------
+        self._t_launch = time.perf_counter()
+        self._t_start_pressed = None
+        self._t_first_infer = None
+        self._models_ready = False
+        self.ready_at = None
+        self.startup_metrics = {}
 
         # UI labels (จะ set ใน create_xxx)
         self.lbl_heart = None
         self.lbl_rect  = None
         self.lbl_circle= None
 
-        # Plate gating state
-        self.gate_has_plate = False
-        self.gate_has_counted = False
-        self.gate_present_frames = 0
-        self.gate_absent_frames = 0
+        # Plate gating: เห็นต่อเนื่องกี่เฟรมถึงยืนยันจาน / หายกี่เฟรมถือว่าออกไปแล้ว
         self.gate_present_thresh = 5
         self.gate_absent_thresh = 10
 
         # Plate status label placeholder
         self.lbl_plate_status = None
 
-        # defect counts ต่อจาน (latched)
-        self._latched_defect_counts = {"crack": 0, "hole": 0}
-
-        # ติดตาม bbox จานก่อนไว้เทียบ IoU
-        self._last_plate_bbox = None
-        self._ioulow_frames = 0
-        self._iou_new_plate_thresh = 0.18  # ต่ำกว่านี้ถือว่าเป็นจานใหม่
+        # defect counts ต่อจาน: รวมหลักฐานข้ามเฟรมต่อ track (ดู defect_fusion.py)
+        self._plate_defect_counts = {"crack": 0, "hole": 0}
+        # รันโมเดล defect ทุก N เฟรม / ที่ imgsz นี้ (ลดได้โดยผลระดับจานไม่ตก เพราะรวมหลักฐานข้ามเฟรม)
+        self.defect_every_n = 1
+        self.defect_imgsz = self.imgsz
+        # "sliced": ตรวจตำหนิเป็นไทล์เฉพาะกรอบจานบนเฟรมกล้องเต็ม (รูเข็มไม่หายไปกับการย่อภาพ)
+        self.defect_mode = "full"   # "full" | "sliced"
+        self.slice_tile = 640
+        self.slice_overlap = 0.2
+        self.sliced_defect = None
+        self.pipeline = None        # TwoStagePipeline (สร้างหลังโหลดโมเดล)
+        # inference หลาย process (CPU หลาย core): LEAFPLATE_INFER_PROCS = replica ต่อโมเดล (0 = รันใน process นี้)
+        self.infer_procs = int(os.environ.get("LEAFPLATE_INFER_PROCS", "0"))
+        self.infer_mode = os.environ.get("LEAFPLATE_INFER_MODE", "stage")   # "stage" | "round_robin"
+        self.infer_pool = None
+        self._last_annotated = None
+
+        # Plate tracker: ID จานคงที่ข้ามเฟรม → นับครั้งเดียวต่อ track
+        # (class_aware: วางจานคนละรูปทรงแทนที่เดิม = track ใหม่ แม้กล่องซ้อนกัน)
+        self.track_low_thresh = 0.25  # กล่อง shape ที่ conf ต่ำกว่า conf_shape ใช้ต่อ track เดิมเท่านั้น
+        self.tracker = PlateTracker(
+            high_thresh=self.conf_shape,
+            low_thresh=self.track_low_thresh,
+            min_hits=self.gate_present_thresh,
+            max_misses=self.gate_absent_thresh,
+            class_aware=True,
+        )
+        self.session = PlateSession(self.tracker, track_conf=self.track_low_thresh)
+
+        # ---------- Runtime config (config/two_stage.yaml, แก้ระหว่างรันได้) ----------
+        # ค่าข้างบน = default ; ไฟล์ทับค่า แล้ว _update_camera poll ระหว่างเฟรม
+        self.config = RuntimeConfig(
+            os.environ.get("LEAFPLATE_CONFIG", os.path.join(self.BASE_DIR, "config", "two_stage.yaml")),
+            TWO_STAGE_SCHEMA, TWO_STAGE_RULES,
+        ).bind(self)
+        self._apply_config(self.config.load())
+
+    def _apply_config(self, changed):
+        """ใช้ค่า config ที่เปลี่ยน (เรียกระหว่างเฟรม ไม่ reload โมเดล)"""
+        if not changed:
+            return
+        # defect_imgsz ที่ยังเท่ากับ imgsz เดิม = ไม่ได้ตั้งแยก → ตาม imgsz ใหม่ไปด้วย
+        if "imgsz" in changed and "defect_imgsz" not in changed and self.defect_imgsz == self.imgsz:
+            changed = dict(changed, defect_imgsz=changed["imgsz"])
+        for key, value in changed.items():
+            setattr(self, key, value)
+        # object ที่ถือสำเนาค่าไว้
+        self.tracker.high_thresh = self.conf_shape
+        self.tracker.low_thresh = self.track_low_thresh
+        self.tracker.min_hits = self.gate_present_thresh
+        self.tracker.max_misses = self.gate_absent_thresh
+        self.session.track_conf = self.track_low_thresh
+        if self.sliced_defect is not None:
+            for k, v in self._sliced_params().items():
+                setattr(self.sliced_defect, k, v)
+        if self.pipeline is not None:
+            self.pipeline.configure(**self._pipeline_params())
+        if self.infer_pool is not None:
+            self.infer_pool.configure(sliced=self._sliced_params(), **self._pipeline_params())
+
+    def _pipeline_params(self):
+        return dict(
+            imgsz=self.imgsz, shape_conf=self.conf_shape, track_conf=self.track_low_thresh,
+            shape_iou=self.iou_shape, defect_conf=self.conf_defect, defect_iou=self.iou_defect,
+            defect_imgsz=self.defect_imgsz, defect_every_n=self.defect_every_n, defect_mode=self.defect_mode,
+            candidate_conf=self.services.candidate_conf,
+        )
 
-        # NEW: จับ “เปลี่ยนรูปทรงต่อเนื่อง = จานใหม่” แม้ IoU สูง
-        self._last_shapes = set()
-        self._shape_change_frames = 0
-        self._shape_change_thresh = 5  # เห็นรูปทรงใหม่ซ้ำ 5 เฟรมค่อยยอม
+    def _sliced_params(self):
+        return dict(tile=self.slice_tile, imgsz=self.slice_tile, overlap=self.slice_overlap,
+                    conf=self.conf_defect, iou=self.iou_defect)
 
     # -----------------------------
     # Helpers for date/lot/defects
@@ -198,72 +260,6 @@ class LeafPlateTwoStageApp:
     def title_date(self, dt: datetime):
         return dt.strftime("%d/%m/%y")
 
-    # -----------------------------
-    # Firebase Admin helpers
-    # -----------------------------
-    def _fb_init(self):
-        """Init Firebase Admin ด้วย service account 'serviceAccountKey.json' หนึ่งครั้ง"""
-        if self._fb_ready:
-            return
-        try:
-            cred_path = os.path.join(self.BASE_DIR, "serviceAccountKey.json")
-            cred = credentials.Certificate(cred_path)
-            firebase_admin.initialize_app(cred, {"databaseURL": self.firebase_base})
-            self._fb_ready = True
-        except Exception as e:
-            print(f"[Firebase] Admin init failed, fallback to REST. reason={e}")
-            self._fb_ready = False
-
-    def _firebase_post(self, path, obj):
-        """POST (push) : Admin SDK ก่อน, ไม่งั้น fallback REST"""
-        payload = {
-            **obj,
-            "_meta": {
-                "source": "python-admin",
-                "pushed_at": datetime.now(timezone.utc).isoformat(),
-                "server_id": str(uuid.uuid4())
-            }
-        }
-        try:
-            self._fb_init()
-            if self._fb_ready:
-                ref = db.reference(path)
-                ref.push(payload)
-                return
-        except Exception as e:
-            print(f"[Firebase] Admin push failed, fallback to REST. reason={e}")
-
-        # --- Fallback: REST ---
-        try:
-            url = f"{self.firebase_base}/{path}.json"
-            data = json.dumps(payload).encode("utf-8")
-            req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
-            with urllib.request.urlopen(req, timeout=5):
-                pass
-        except Exception as e:
-            print(f"[Firebase] REST POST error: {e}")
-
-    def _firebase_put(self, path, obj):
-        """PUT (set) : Admin SDK ก่อน, ไม่งั้น fallback REST"""
-        try:
-            self._fb_init()
-            if self._fb_ready:
-                ref = db.reference(path)
-                ref.set(obj)
-                return
-        except Exception as e:
-            print(f"[Firebase] Admin set failed, fallback to REST. reason={e}")
-
-        # --- Fallback: REST ---
-        try:
-            url = f"{self.firebase_base}/{path}.json"
-            data = json.dumps(obj).encode("utf-8")
-            req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method="PUT")
-            with urllib.request.urlopen(req, timeout=5):
-                pass
-        except Exception as e:
-            print(f"[Firebase] REST PUT error: {e}")
-
     # -----------------------------
     # App / Camera / Models
     # -----------------------------
@@ -285,30 +281,20 @@ class LeafPlateTwoStageApp:
             pass
 
     def setup_camera(self):
-        if sys.platform.startswith("win"):
-            backend = cv2.CAP_DSHOW
-        elif sys.platform == "darwin":
-            backend = cv2.CAP_AVFOUNDATION
-        else:
-            backend = cv2.CAP_V4L2
-
-        self.cap = cv2.VideoCapture(0, backend)
-        if not self.cap or not self.cap.isOpened():
-            self.cap = cv2.VideoCapture(0)
-        if not self.cap or not self.cap.isOpened():
-            print("Cannot open camera"); self.cap = None; return
-
         # คงไว้เฉพาะขนาดเฟรม (ไม่ยุ่งค่า auto-focus/auto-exposure)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+        self.cap = self.services.open_camera(1280, 720)
 
-    def setup_models(self):
+    def _load_models(self):
+        """โหลดโมเดลทั้งสอง (ไม่แตะ UI เรียกจาก thread ได้) คืนรายการ (kind, title, msg) ที่ต้องแจ้งผู้ใช้"""
+        if self.infer_procs > 0:
+            return self._start_infer_pool()
+        notices = []
         # โหลดโมเดล shape
         try:
             assert os.path.exists(self.SHAPE_WEIGHTS), f"ไม่พบ shape weights: {self.SHAPE_WEIGHTS}"
             self.shape_model = YOLO(self.SHAPE_WEIGHTS)
         except Exception as e:
-            messagebox.showerror("Model Error (Shape)", f"โหลดโมเดลรูปทรงไม่สำเร็จ:\n{e}")
+            notices.append(("error", "Model Error (Shape)", f"โหลดโมเดลรูปทรงไม่สำเร็จ:\n{e}"))
             self.shape_model = None
 
         # โหลดโมเดล defect
@@ -316,11 +302,132 @@ class LeafPlateTwoStageApp:
             assert os.path.exists(self.DEFECT_WEIGHTS), f"ไม่พบ defect weights: {self.DEFECT_WEIGHTS}"
             self.defect_model = YOLO(self.DEFECT_WEIGHTS)
         except Exception as e:
-            messagebox.showerror("Model Error (Defect)", f"โหลดโมเดลตำหนิไม่สำเร็จ:\n{e}")
+            notices.append(("error", "Model Error (Defect)", f"โหลดโมเดลตำหนิไม่สำเร็จ:\n{e}"))
             self.defect_model = None
 
+        if self.defect_model is not None:
+            self.sliced_defect = SlicedDefectInference(
+                self.defect_model, tile=self.slice_tile, overlap=self.slice_overlap,
+                conf=self.conf_defect, iou=self.iou_defect, classes=self.defect_classes_ultra,
+            )
+        # shape: จานเดียวต่อเฟรม (max_det 1 + agnostic NMS) ; defect: เต็มภาพหรือไทล์ในกรอบจาน
+        self.pipeline = TwoStagePipeline(
+            self.shape_model, self.defect_model, self.shape_map, self.defect_classes_ultra,
+            shape_max_det=1, shape_agnostic=True, sliced=self.sliced_defect, **self._pipeline_params()
+        )
+
         if (self.shape_model is None) or (self.defect_model is None):
-            messagebox.showwarning("Warning", "ต้องโหลดโมเดลครบทั้ง shape และ defect ก่อนเริ่มทำงาน")
+            notices.append(("warning", "Warning", "ต้องโหลดโมเดลครบทั้ง shape และ defect ก่อนเริ่มทำงาน"))
+        return notices
+
+    def _start_infer_pool(self):
+        """replica ของโมเดลใน process แยก (แต่ละ worker โหลด + warm-up เอง) ; ไม่โหลดโมเดลใน process นี้"""
+        try:
+            for path in (self.SHAPE_WEIGHTS, self.DEFECT_WEIGHTS):
+                assert os.path.exists(path), f"ไม่พบ weights: {path}"
+            spec = build_spec(
+                self.SHAPE_WEIGHTS, self.DEFECT_WEIGHTS, self.shape_map, self.defect_classes_ultra,
+                sliced=self._sliced_params(), shape_max_det=1, shape_agnostic=True, **self._pipeline_params()
+            )
+            self.infer_pool = ProcessInferencePool(spec, replicas=self.infer_procs, mode=self.infer_mode).start()
+        except Exception as e:
+            self.infer_pool = None
+            return [("error", "Model Error", f"เริ่ม inference process ไม่สำเร็จ:\n{e}")]
+        print(f"[InferPool] {self.infer_pool.stats()}")
+        return []
+
+    def _inference_ready(self):
+        if self.infer_pool is not None:
+            return True
+        return (self.shape_model is not None) and (self.defect_model is not None)
+
+    def _show_notices(self, notices):
+        for kind, title, msg in notices:
+            if kind == "error":
+                messagebox.showerror(title, msg)
+            else:
+                messagebox.showwarning(title, msg)
+
+    def _warmup_models(self):
+        """
+        dummy inference ที่ imgsz จริงของแต่ละโมเดล: ค่า lazy init (fuse layer, จอง memory, CUDA context)
+        ไปจ่ายตอนเปิดโปรแกรม แทนที่จะไปตกกับจานแรกหลังกด "เริ่ม"
+        """
+        if self.pipeline is not None:
+            self.pipeline.warmup()
+
+    def _load_and_warmup(self):
+        notices = self._load_models()
+        t0 = time.perf_counter()
+        try:
+            self._warmup_models()
+        except Exception as e:
+            print(f"[Startup] warm-up failed: {e}")
+        self.startup_metrics["warmup_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+        return notices
+
+    def _timed_step(self, name, fn):
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            self.startup_metrics[f"{name}_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+
+    def start_parallel_init(self):
+        """เปิดกล้อง / โหลดโมเดล + warm-up / init Firebase พร้อมกันใน thread ขณะที่หน้าต่างแสดงแล้ว"""
+        self._startup_pool = ThreadPoolExecutor(max_workers=3, thread_name_prefix="startup")
+        self._startup_jobs = {
+            "camera": self._startup_pool.submit(self._timed_step, "camera", self.setup_camera),
+            "models": self._startup_pool.submit(self._timed_step, "models", self._load_and_warmup),
+            "firebase": self._startup_pool.submit(self._timed_step, "firebase", self.fb.init),
+        }
+        self._camera_started = False
+        self.safe_after(50, self._poll_startup)
+
+    def _poll_startup(self):
+        """ตรวจงาน startup บน Tk thread (UI แตะได้จาก thread นี้เท่านั้น)"""
+        jobs = self._startup_jobs
+        if jobs["camera"].done() and not self._camera_started:
+            self._camera_started = True
+            if jobs["camera"].exception() is not None:
+                print(f"[Startup] camera failed: {jobs['camera'].exception()}")
+            if self.cap:
+                self.start_camera()
+            else:
+                self.camera_label.configure(text="Cannot open camera")
+
+        if not all(f.done() for f in jobs.values()):
+            self.safe_after(50, self._poll_startup)
+            return
+
+        notices = []
+        if jobs["models"].exception() is not None:
+            notices.append(("error", "Model Error", f"โหลดโมเดลไม่สำเร็จ:\n{jobs['models'].exception()}"))
+        else:
+            notices = jobs["models"].result() or []
+        self._startup_pool.shutdown(wait=False)
+
+        self._models_ready = True
+        self.ready_at = datetime.now()
+        self.startup_metrics["ready_s"] = round(time.perf_counter() - self._t_launch, 3)
+        m = self.startup_metrics
+        print(f"[Startup] ready at {self.ready_at.strftime('%H:%M:%S.%f')[:-3]} "
+              f"({m['ready_s']:.2f}s after launch) | camera {m.get('camera_ms', 0):.0f} ms, "
+              f"models {m.get('models_ms', 0):.0f} ms (warm-up {m.get('warmup_ms', 0):.0f} ms), "
+              f"firebase {m.get('firebase_ms', 0):.0f} ms")
+        self._show_notices(notices)
+
+    def _record_first_inference(self, infer_ms):
+        """time-to-first-inference: นับจากเปิดโปรแกรม และจากตอนกดปุ่มเริ่ม"""
+        self._t_first_infer = time.perf_counter()
+        m = self.startup_metrics
+        m["first_inference_ms"] = round(infer_ms, 1)
+        m["time_to_first_inference_s"] = round(self._t_first_infer - self._t_launch, 3)
+        if self._t_start_pressed is not None:
+            m["start_to_first_inference_ms"] = round((self._t_first_infer - self._t_start_pressed) * 1000.0, 1)
+        print(f"[Startup] first inference {m['first_inference_ms']:.0f} ms | "
+              f"{m['time_to_first_inference_s']:.2f}s after launch | "
+              f"{m.get('start_to_first_inference_ms', 0):.0f} ms after start")
 
     # -----------------------------
     # UI
@@ -745,8 +852,8 @@ class LeafPlateTwoStageApp:
                 "end_time": datetime.now().strftime("%H:%M:%S")
             }
         }
-        self._firebase_put(f"sessions/{self.firebase_session_key}/meta", meta)
-        self._firebase_post(f"sessions/{self.firebase_session_key}/records", row)
+        self.fb.put(f"sessions/{self.firebase_session_key}/meta", meta)
+        self.fb.post(f"sessions/{self.firebase_session_key}/records", row)
 
     # ----------------- Lot/Reset helpers -----------------
     def _update_lot_label(self):
@@ -800,22 +907,15 @@ class LeafPlateTwoStageApp:
         self._session_stamp = None
         self.firebase_session_key = None
 
-        self.gate_has_plate = False
-        self.gate_has_counted = False
-        self.gate_present_frames = 0
-        self.gate_absent_frames = 0
         self._set_plate_status("pending")
         try:
             self._reset_defect_table()
-            self._render_latched_defect_counts()
+            self._render_plate_defect_counts()
         except Exception:
             pass
 
         # reset tracking states
-        self._last_plate_bbox = None
-        self._ioulow_frames = 0
-        self._last_shapes = set()
-        self._shape_change_frames = 0
+        self.session.reset()
 
         self._increment_lot_id()
 
@@ -845,34 +945,21 @@ class LeafPlateTwoStageApp:
             if lbl:
                 lbl.configure(text="พบตำหนิ", text_color="#e74c3c")
 
-    def _update_defect_counts_ui(self, defect_counts: dict):
-        for en_name, th_name in self.defect_th_map.items():
-            lbl = self.status_labels.get(th_name)
-            if not lbl:
-                continue
-            cnt = int(defect_counts.get(en_name, 0))
-            if cnt > 0:
-                lbl.configure(text=str(cnt), text_color="#e74c3c")
-            else:
-                default_status, default_color = self._defect_defaults.get(th_name, ("ยังไม่พบ", "green"))
-                status_color = "#199129" if default_color == "green" else "#e74c3c"
-                lbl.configure(text=default_status, text_color=status_color)
-
     def _reset_defect_table(self):
-        for k in list(self._latched_defect_counts.keys()):
-            self._latched_defect_counts[k] = 0
+        for k in list(self._plate_defect_counts.keys()):
+            self._plate_defect_counts[k] = 0
         for defect, (status, color) in self._defect_defaults.items():
             lbl = self.status_labels.get(defect)
             if lbl:
                 status_color = "#199129" if color == "green" else "#e74c3c"
                 lbl.configure(text=status, text_color=status_color)
 
-    def _render_latched_defect_counts(self):
+    def _render_plate_defect_counts(self):
         for en_name, th_name in self.defect_th_map.items():
             lbl = self.status_labels.get(th_name)
             if not lbl:
                 continue
-            cnt = int(self._latched_defect_counts.get(en_name, 0))
+            cnt = int(self._plate_defect_counts.get(en_name, 0))
             if cnt > 0:
                 lbl.configure(text=str(cnt), text_color="#e74c3c")
             else:
@@ -937,102 +1024,33 @@ class LeafPlateTwoStageApp:
         self._update_defect_status_ui(defect_names)
         return row
 
-    # bbox helpers
-    def _union_bbox(self, xyxy_list):
-        if len(xyxy_list) == 0:
+    def _finalize_plate(self, track):
+        """จบจานหนึ่งใบ: นับรูปทรง + บันทึกแถวเดียวต่อ track จากหลักฐานตำหนิที่รวมแล้ว"""
+        if track.counted:
             return None
-        xs1 = [b[0] for b in xyxy_list]
-        ys1 = [b[1] for b in xyxy_list]
-        xs2 = [b[2] for b in xyxy_list]
-        ys2 = [b[3] for b in xyxy_list]
-        return [int(min(xs1)), int(min(ys1)), int(max(xs2)), int(max(ys2))]
-
-    def _bbox_iou(self, a, b):
-        if a is None or b is None:
-            return 0.0
-        ax1, ay1, ax2, ay2 = a
-        bx1, by1, bx2, by2 = b
-        inter_x1 = max(ax1, bx1); inter_y1 = max(ay1, by1)
-        inter_x2 = min(ax2, bx2); inter_y2 = min(ay2, by2)
-        iw = max(0, inter_x2 - inter_x1)
-        ih = max(0, inter_y2 - inter_y1)
-        inter = iw * ih
-        area_a = max(0, ax2 - ax1) * max(0, ay2 - ay1)
-        area_b = max(0, bx2 - bx1) * max(0, by2 - by1)
-        union = area_a + area_b - inter
-        if union <= 0:
-            return 0.0
-        return inter / union
-
-    def _annotate_and_summarize_two_stage(self, frame_bgr, shape_res, defect_res):
-        """
-        รวมผลสองโมเดลในเฟรมเดียว → annotate + คืนสรุป
-        """
-        annotated = frame_bgr.copy()
-        shapes_found, defect_names = set(), set()
-        defect_counts = {}
-
-        shape_xyxy_all = []
-        shape_labels   = []   
-        defect_xyxy_all = []
-
-        # stage-1: shapes
-        if shape_res is not None and hasattr(shape_res, "boxes") and shape_res.boxes is not None:
-            names = self.shape_model.names if self.shape_model else {}
-            boxes = shape_res.boxes
-            xyxy = boxes.xyxy.cpu().numpy().astype(int) if boxes.xyxy is not None else []
-            clss = boxes.cls.cpu().numpy().astype(int)   if boxes.cls is not None else []
-            conf = boxes.conf.cpu().numpy()              if boxes.conf is not None else []
-
-            for (x1, y1, x2, y2), c, p in zip(xyxy, clss, conf):
-                label = names.get(int(c), str(c))
-                if label in self.shape_classes_ultra:
-                    cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 140, 255), 2)
-                    cv2.putText(annotated, f"{label} {p:.2f}", (x1, max(20, y1 - 6)),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (10, 90, 255), 2, cv2.LINE_AA)
-                    short = self.shape_map.get(label, label)
-                    shapes_found.add(short)
-                    shape_xyxy_all.append([x1, y1, x2, y2])
-
-        # --- คัดให้เหลือกล่องเดียวถ้าเกิดมีหลายกล่อง ---
-        if len(shape_xyxy_all) > 1:
-          areas = [(x2 - x1) * (y2 - y1) for (x1, y1, x2, y2) in shape_xyxy_all]
-          keep = int(np.argmax(areas))
-          shape_xyxy_all = [shape_xyxy_all[keep]]
-          # ตั้งชื่อให้ตรงกับกรอบที่คงไว้
-          if shape_labels:
-              shapes_found = {shape_labels[keep]}
-          else:
-              # กันพลาดถ้าไม่มี labels (ป้องกันไม่ให้เกิด)
-              if len(shapes_found) > 1:
-                  shapes_found = {next(iter(shapes_found))}
-
-
-        # stage-2: defects
-        if defect_res is not None and hasattr(defect_res, "boxes") and defect_res.boxes is not None:
-            names = self.defect_model.names if self.defect_model else {}
-            boxes = defect_res.boxes
-            xyxy = boxes.xyxy.cpu().numpy().astype(int) if boxes.xyxy is not None else []
-            clss = boxes.cls.cpu().numpy().astype(int)   if boxes.cls is not None else []
-            conf = boxes.conf.cpu().numpy()              if boxes.conf is not None else []
-
-            for (x1, y1, x2, y2), c, p in zip(xyxy, clss, conf):
-                label = names.get(int(c), str(c))
-                if label in self.shape_classes_ultra:
-                    cv2.rectangle(annotated, (x1, y1), (x2, y2), (0, 140, 255), 2)
-                    cv2.putText(annotated, f"{label} {p:.2f}", (x1, max(20, y1 - 6)),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (10, 90, 255), 2, cv2.LINE_AA)
-                    short = self.shape_map.get(label, label)
-                    shapes_found.add(short)
-                    shape_xyxy_all.append([x1, y1, x2, y2])
-                    shape_labels.append(short)  # ให้เก็บชนิดของกรอบด้วย
-
-        # union bbox of shapes (fallback defects)
-        union_bbox = self._union_bbox(shape_xyxy_all) if len(shape_xyxy_all) > 0 else self._union_bbox(defect_xyxy_all)
-
-        return annotated, shapes_found, defect_counts, defect_names, union_bbox
-    
-    
+        track.counted = True
+        ev = self.session.evidence_of(track)
+        defect_names = ev.names()
+        plate_shapes = {track.label} if track.label else set()
+
+        self._update_shape_counters(plate_shapes)
+        if (not plate_shapes) and (len(defect_names) > 0):
+            self.shape_counts["total"] += 1
+            self.total_number_label.configure(text=str(self.shape_counts["total"]))
+
+        snapshot = track.data.get("snapshot")
+        if snapshot is None:
+            return None
+        row = self._save_detection_record(snapshot, defect_names, plate_shapes)
+        self._append_csv_json_and_firebase(row)
+        self._set_plate_status("counted", ev.total())
+
+        if hasattr(self, "lbl_plate_no") and self.lbl_plate_no is not None:
+            try:
+                self.lbl_plate_no.configure(text=f"จานที่ : {row['plate_id']}")
+            except Exception:
+                pass
+        return row
 
     # ----------------- Camera loop (safe_after) -----------------
     def safe_after(self, delay_ms, func):
@@ -1060,159 +1078,35 @@ class LeafPlateTwoStageApp:
     def _update_camera(self):
         if not self.camera_running or not self.cap:
             return
+        self._apply_config(self.config.poll())
 
         ret, frame = self.cap.read()
         if not ret:
             self.safe_after(30, self._update_camera)
             return
 
-        frame_resized = cv2.resize(frame, (self.cam_w, self.cam_h))
+        dst = None
+        if self.is_collecting_data and self.infer_pool is not None:
+            # ย่อเฟรมลง slot ของ shared-memory ring ตรง ๆ → worker อ่าน view เดียวกัน (ไม่ pickle เฟรม)
+            dst = self.infer_pool.claim_frame((self.cam_h, self.cam_w, 3))
+        frame_resized = cv2.resize(frame, (self.cam_w, self.cam_h), dst=dst)
         frame_to_show = frame_resized
 
-        if self.is_collecting_data and (self.shape_model is not None) and (self.defect_model is not None):
+        if self.is_collecting_data and self.infer_pool is not None:
             try:
-                # Stage-1 (shape)
-                shape_results = self.shape_model.predict(
-                    source=frame_resized,
-                    imgsz=self.imgsz,
-                    conf=0.55,
-                    iou=0.72,
-                    max_det=1,
-                    agnostic_nms=True,
-                    verbose=False
-                )
-                shape_res = shape_results[0]
-
-                # Stage-2 (defect)
-                defect_results = self.defect_model.predict(
-                    source=frame_resized,
-                    imgsz=self.imgsz,
-                    conf=self.conf_defect,
-                    iou=self.iou_defect,
-                    verbose=False
-                )
-                defect_res = defect_results[0]
-
-                annotated, shapes_found, defect_counts, defect_names, union_bbox = \
-                    self._annotate_and_summarize_two_stage(frame_resized, shape_res, defect_res)
-
-                frame_to_show = annotated
-
-                # อัปเดตตาราง defect ด้วยจำนวน defect ล่าสุด
-                self._update_defect_counts_ui(defect_counts)
-
-                # Gating per plate
-                plate_detected = (len(shapes_found) > 0) or (len(defect_names) > 0)
-
-                # latched defect counts ต่อจาน
-                if plate_detected:
-                    for k, v in defect_counts.items():
-                        try:
-                            iv = int(v)
-                        except Exception:
-                            iv = 0
-                        self._latched_defect_counts[k] = max(self._latched_defect_counts.get(k, 0), iv)
-                    self._render_latched_defect_counts()
-
-                if plate_detected:
-                    self.gate_present_frames += 1
-                    self.gate_absent_frames = 0
-                else:
-                    self.gate_absent_frames += 1
-                    self.gate_present_frames = 0
-
-                # ถ้านับไปแล้ว แล้วยังมีวัตถุอยู่ และ IoU กับกรอบเดิมต่ำต่อเนื่อง -> จานใหม่
-                if self.gate_has_plate and self.gate_has_counted and plate_detected and union_bbox is not None:
-                    iou = self._bbox_iou(self._last_plate_bbox, union_bbox)
-                    if iou < self._iou_new_plate_thresh:
-                        self._ioulow_frames += 1
-                    else:
-                        self._ioulow_frames = 0
-
-                    if self._ioulow_frames >= self.gate_present_thresh:
-                        self._reset_defect_table()
-                        self._render_latched_defect_counts()
-                        self.gate_has_plate = True
-                        self.gate_has_counted = False
-                        self._set_plate_status("pending")
-                        self.gate_present_frames = self.gate_present_thresh
-                        self.gate_absent_frames = 0
-                        self._last_plate_bbox = union_bbox
-                        self._ioulow_frames = 0
-                        self._last_shapes = set(shapes_found)
-                        self._shape_change_frames = 0
-
-                # NEW: ถ้านับไปแล้ว และรูปทรงในเฟรม "ต่างจากจานก่อน" ต่อเนื่องหลายเฟรม -> จานใหม่
-                if self.gate_has_plate and self.gate_has_counted and plate_detected:
-                    if len(shapes_found) > 0 and set(shapes_found) != set(self._last_shapes):
-                        self._shape_change_frames += 1
-                    else:
-                        self._shape_change_frames = 0
-
-                    if self._shape_change_frames >= self._shape_change_thresh:
-                        self._reset_defect_table()
-                        self._render_latched_defect_counts()
-                        self.gate_has_plate = True
-                        self.gate_has_counted = False
-                        self._set_plate_status("pending")
-                        self.gate_present_frames = self.gate_present_thresh
-                        self.gate_absent_frames = 0
-                        self._last_plate_bbox = union_bbox
-                        self._ioulow_frames = 0
-                        self._last_shapes = set(shapes_found)
-                        self._shape_change_frames = 0
-
-                # New stable plate appears (ปกติ)
-                if (not self.gate_has_plate) and plate_detected and self.gate_present_frames >= self.gate_present_thresh:
-                    self._reset_defect_table()
-                    self._render_latched_defect_counts()
-
-                    self.gate_has_plate = True
-                    self.gate_has_counted = False
-                    self._set_plate_status("pending")
-
-                    self._last_plate_bbox = union_bbox
-                    self._ioulow_frames = 0
-                    self._last_shapes = set(shapes_found)
-                    self._shape_change_frames = 0
-
-                # Count once per plate
-                if self.gate_has_plate and (not self.gate_has_counted) and self.gate_present_frames >= self.gate_present_thresh:
-                    self._update_shape_counters(shapes_found)
-                    if (not shapes_found) and (len(defect_names) > 0):
-                        self.shape_counts["total"] += 1
-                        self.total_number_label.configure(text=str(self.shape_counts["total"]))
-
-                    row = self._save_detection_record(annotated, defect_names, shapes_found)
-                    self._append_csv_json_and_firebase(row)
-
-                    defect_count = sum(defect_counts.values())
-                    self._set_plate_status("counted", defect_count)
-                    self.gate_has_counted = True
-                    self._last_save_ms = time.time() * 1000.0
-
-                    self._last_plate_bbox = union_bbox
-                    self._ioulow_frames = 0
-                    self._last_shapes = set(shapes_found)
-                    self._shape_change_frames = 0
-
-                    if hasattr(self, "lbl_plate_no") and self.lbl_plate_no is not None:
-                        try:
-                            self.lbl_plate_no.configure(text=f"จานที่ : {row['plate_id']}")
-                        except Exception:
-                            pass
-
-                # Plate removed -> reset gate
-                if self.gate_has_plate and self.gate_absent_frames >= self.gate_absent_thresh:
-                    self.gate_has_plate = False
-                    self.gate_has_counted = False
-                    self.gate_present_frames = 0
-                    self._set_plate_status("pending")
-                    self._last_plate_bbox = None
-                    self._ioulow_frames = 0
-                    self._last_shapes = set()
-                    self._shape_change_frames = 0
-
+                # ส่งเฟรมเข้า process pool แล้วรับผลที่เสร็จ (เรียงตาม seq) ; pool เต็ม = ข้ามเฟรมนี้
+                self.infer_pool.submit(frame_resized, frame_full=frame, plate_hint=self.session.plate_box())
+                for _, frm, result in self.infer_pool.poll():
+                    self._last_annotated = self._on_result(frm, result)
+                if self._last_annotated is not None:
+                    frame_to_show = self._last_annotated
+            except Exception as e:
+                print(f"Inference error: {e}")
+        elif self.is_collecting_data and self._inference_ready():
+            try:
+                # shape ทุกเฟรม + defect ทุก defect_every_n เฟรม (เต็มภาพ หรือไทล์ในกรอบจานบนเฟรมต้นฉบับ)
+                result = self.pipeline.run(frame_resized, frame_full=frame, plate_hint=self.session.plate_box())
+                frame_to_show = self._on_result(frame_resized, result)
             except Exception as e:
                 print(f"Inference error: {e}")
                 frame_to_show = frame_resized
@@ -1229,6 +1123,37 @@ class LeafPlateTwoStageApp:
 
         self.safe_after(30, self._update_camera)
 
+    def _on_result(self, frame_resized, result):
+        """ผลตรวจหนึ่งเฟรม → วาด + plate tracking/gating ; คืนภาพที่วาดแล้ว"""
+        annotated = annotate(frame_resized, result, shape_names=self._shape_model_names)
+        if self._t_first_infer is None:
+            self._record_first_inference(result.infer_ms)
+
+        # ---- Plate tracking + หลักฐานตำหนิต่อจาน ----
+        upd = self.session.update(result, annotated)
+        self.miner.offer(frame_resized, result, {"lot": self.lot_id,
+                                                  "plate": upd.plate.track_id if upd.plate is not None else None})
+
+        # จานออกไปแล้ว (track หลุดเกิน gate_absent_thresh เฟรม) -> บันทึกผลรวมของจาน
+        for gone in upd.finished:
+            self._finalize_plate(gone)
+
+        # track ใหม่ที่ยืนยันแล้ว = จานใหม่
+        if upd.new_plate:
+            self._reset_defect_table()
+            self._render_plate_defect_counts()
+            self._set_plate_status("pending")
+
+        # สถานะสดของจานที่กำลังตรวจ จากหลักฐานที่รวมแล้ว
+        if upd.evidence is not None:
+            ev = upd.evidence
+            self._plate_defect_counts.update({k: 0 for k in self._plate_defect_counts})
+            self._plate_defect_counts.update(ev.counts())
+            self._render_plate_defect_counts()
+            if ev.total() > 0:
+                self._set_plate_status("fail", ev.total())
+        return annotated
+
     # ----------------- Stop confirm popup -----------------
     def stop_and_finalize(self):
         """หยุดการตรวจ + export อัตโนมัติลง ./savefile/ + อัปเดต meta ไป Firebase"""
@@ -1238,6 +1163,10 @@ class LeafPlateTwoStageApp:
         except Exception:
             pass
 
+        # จานที่ยังอยู่ในภาพตอนกดหยุด → บันทึกก่อน export
+        for t in self.session.flush():
+            self._finalize_plate(t)
+
         if self.session_rows:
             try:
                 self._write_csv(self.save_root)
@@ -1259,7 +1188,7 @@ class LeafPlateTwoStageApp:
                     "end_time": datetime.now().strftime("%H:%M:%S")
                 }
             }
-            self._firebase_put(f"sessions/{self.firebase_session_key}/meta", meta)
+            self.fb.put(f"sessions/{self.firebase_session_key}/meta", meta)
         self._set_plate_status("pending")
 
     def show_stop_confirm_dialog(self):
@@ -1307,18 +1236,19 @@ class LeafPlateTwoStageApp:
     # ----------------- Events -----------------
     def toggle_data_collection(self):
         if not self.is_collecting_data:
-            if (self.shape_model is None) or (self.defect_model is None):
+            if not self._models_ready:
+                messagebox.showinfo("กำลังเตรียมระบบ", "กำลังโหลดโมเดลและ warm-up กรุณารอสักครู่")
+                return
+            if not self._inference_ready():
                 messagebox.showerror("Model Error", "ยังโหลดโมเดลไม่ครบ (shape/defect)")
                 return
             self.is_collecting_data = True
+            if self._t_start_pressed is None:
+                self._t_start_pressed = time.perf_counter()
             self.session_meta.setdefault("start_time", datetime.now().strftime("%H:%M:%S"))
             self.toggle_button.configure(text="หยุด", fg_color="#e74c3c", hover_color="#c0392b")
 
             # Reset gating state when starting
-            self.gate_has_plate = False
-            self.gate_has_counted = False
-            self.gate_present_frames = 0
-            self.gate_absent_frames = 0
             self._set_plate_status("pending")
 
             try:
@@ -1329,10 +1259,10 @@ class LeafPlateTwoStageApp:
                 pass
 
             # reset tracking states on start
-            self._last_plate_bbox = None
-            self._ioulow_frames = 0
-            self._last_shapes = set()
-            self._shape_change_frames = 0
+            self.session.reset()
+            if self.infer_pool is not None:
+                self.infer_pool.reset()
+                self._last_annotated = None
         else:
             self.show_stop_confirm_dialog()
 
@@ -1352,7 +1282,10 @@ class LeafPlateTwoStageApp:
                 pass
             self.stop_and_finalize()
 
+        self.services.stop()
         self.stop_camera()
+        if self.infer_pool is not None:
+            self.infer_pool.close()
         try:
             self.app.destroy()
         except Exception:
@@ -1369,10 +1302,10 @@ if __name__ == "__main__":
     app.initialize_data()
     app.setup_app()
     app.setup_fonts()
-    app.setup_camera()
-    app.setup_models()
     app.create_widgets()
-    app.start_camera()
+    # กล้อง / โมเดล (+warm-up) / Firebase โหลดพร้อมกันเบื้องหลัง หน้าต่างขึ้นได้ทันที
+    app.start_parallel_init()
+    app.services.start()
     try:
         app.run()
     except KeyboardInterrupt:
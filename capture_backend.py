@@ -0,0 +1,455 @@
+# capture_backend.py
+# -*- coding: utf-8 -*-
+# ชั้น capture กลาง: กล้อง / ไฟล์วิดีโอ / ลำดับรูปภาพ ผ่าน interface เดียวกัน
+#
+# - API เข้ากันกับ cv2.VideoCapture: read() -> (ret, frame), isOpened(), release()
+# - read_packet() คืน FramePacket ที่มี timestamp ตอนจับภาพ → วัด frame age ได้
+# - กล้อง: ต่อรอง pixel format (MJPG ก่อน แล้ว YUYV) + ขนาด buffer
+#   และมี grab thread เก็บเฉพาะเฟรมล่าสุด ไม่ให้เฟรมค้างใน buffer เพิ่ม latency
+# - stats(): effective fps, frame age, dropped, format ที่ต่อรองได้จริง
+#
+# ทดสอบบน Linux โดยไม่ต้องมีกล้อง:
+#   python capture_backend.py --make-test-clip /tmp/clip.avi
+#   python capture_backend.py --source /tmp/clip.avi --frames 300
+#   python capture_backend.py --source "captures/*.jpg" --fps 15
+
+import os, sys, glob, time, argparse, threading
+from collections import deque
+
+import numpy as np
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)   # import ตอนเปิด source ครั้งแรก
+
+
+class FramePacket:
+    """เฟรมหนึ่งเฟรม + เวลา capture (perf_counter) และลำดับเฟรม"""
+    __slots__ = ("seq", "frame", "t_capture")
+
+    def __init__(self, seq, frame, t_capture):
+        self.seq = seq
+        self.frame = frame
+        self.t_capture = t_capture
+
+    def age_ms(self, now=None):
+        return ((now or time.perf_counter()) - self.t_capture) * 1000.0
+
+
+class CaptureSource:
+    """base class: subclass ต้อง implement _open() และ _grab() -> frame หรือ None"""
+
+    FPS_WINDOW = 30
+
+    def __init__(self, name="source"):
+        self.name = name
+        self._opened = False
+        self._seq = 0
+        self._last = None
+        self._cap_times = deque(maxlen=self.FPS_WINDOW)   # เวลาที่ได้เฟรมจากแหล่ง
+        self._read_times = deque(maxlen=self.FPS_WINDOW)  # เวลาที่ consumer อ่าน
+        self.dropped = 0
+        self.eof = False
+
+    # ---- cv2.VideoCapture compatible ----
+    def isOpened(self):
+        return self._opened
+
+    def read(self):
+        pkt = self.read_packet()
+        if pkt is None:
+            return False, None
+        return True, pkt.frame
+
+    def release(self):
+        self._opened = False
+
+    def set(self, prop, value):
+        return False
+
+    def get(self, prop):
+        return 0.0
+
+    # ---- packet API ----
+    def open(self):
+        self._opened = bool(self._open())
+        return self._opened
+
+    def read_packet(self):
+        if not self._opened:
+            return None
+        frame = self._grab()
+        if frame is None:
+            return None
+        now = time.perf_counter()
+        self._seq += 1
+        self._cap_times.append(now)
+        self._read_times.append(now)
+        self._last = FramePacket(self._seq, frame, now)
+        return self._last
+
+    # ---- stats ----
+    @staticmethod
+    def _fps(times):
+        if len(times) < 2:
+            return 0.0
+        span = times[-1] - times[0]
+        return (len(times) - 1) / span if span > 0 else 0.0
+
+    def frame_age_ms(self):
+        """อายุของเฟรมล่าสุดที่ consumer ได้ไป (ms) — ยิ่งมากแปลว่าภาพที่ใช้ตัดสินใจเก่า"""
+        return self._last.age_ms() if self._last is not None else 0.0
+
+    def stats(self):
+        return {
+            "source": self.name,
+            "frames": self._seq,
+            "capture_fps": round(self._fps(self._cap_times), 2),
+            "read_fps": round(self._fps(self._read_times), 2),
+            "frame_age_ms": round(self.frame_age_ms(), 1),
+            "dropped": self.dropped,
+        }
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _grab(self):
+        raise NotImplementedError
+
+
+class CameraSource(CaptureSource):
+    """
+    กล้อง USB/ในตัว
+    - backend ตาม OS (DSHOW/AVFOUNDATION/V4L2) แล้ว fallback เป็นค่า default ของ OpenCV
+    - ลอง fourcc ตามลำดับ (MJPG → YUYV) แล้วอ่านค่ากลับมาเช็คว่ากล้องยอมรับจริง
+    - threaded=True: grab thread อ่านเฟรมตลอด เก็บแค่ล่าสุด (เฟรมที่ไม่มีใครอ่าน = dropped)
+    """
+
+    def __init__(self, index=0, width=1280, height=720, fps=None,
+                 fourcc=("MJPG", "YUYV"), buffer_size=1, threaded=True, read_timeout=0.1):
+        super().__init__(name=f"camera:{index}")
+        self.index = index
+        self.width, self.height, self.fps = width, height, fps
+        self.fourcc_prefs = (fourcc,) if isinstance(fourcc, str) else tuple(fourcc or ())
+        self.buffer_size = buffer_size
+        self.threaded = threaded
+        self.read_timeout = read_timeout   # read() ใน Tk loop ไม่ควรบล็อกนาน
+        self.cap = None
+        self.negotiated = {}
+
+        self._lock = threading.Condition()
+        self._pending = None
+        self._running = False
+        self._thread = None
+
+    @staticmethod
+    def _default_backend():
+        if sys.platform.startswith("win"):
+            return cv2.CAP_DSHOW
+        if sys.platform == "darwin":
+            return cv2.CAP_AVFOUNDATION
+        return cv2.CAP_V4L2
+
+    @staticmethod
+    def _fourcc_str(v):
+        v = int(v)
+        return "".join(chr((v >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00")
+
+    def _open(self):
+        self.cap = cv2.VideoCapture(self.index, self._default_backend())
+        if not self.cap or not self.cap.isOpened():
+            self.cap = cv2.VideoCapture(self.index)
+        if not self.cap or not self.cap.isOpened():
+            print(f"Cannot open camera {self.index}")
+            self.cap = None
+            return False
+
+        # fourcc ต้องตั้งก่อนขนาดเฟรม (บาง driver รีเซ็ตขนาดเมื่อเปลี่ยน format)
+        fmt = None
+        for pref in self.fourcc_prefs:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*pref))
+            if self._fourcc_str(self.cap.get(cv2.CAP_PROP_FOURCC)) == pref:
+                fmt = pref
+                break
+        if self.width and self.height:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            self.cap.set(cv2.CAP_PROP_FPS, self.fps)
+        buf_ok = bool(self.buffer_size) and self.cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+
+        self.negotiated = {
+            "fourcc": fmt or self._fourcc_str(self.cap.get(cv2.CAP_PROP_FOURCC)) or "?",
+            "width": int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "fps": float(self.cap.get(cv2.CAP_PROP_FPS) or 0.0),
+            "buffer_size": int(self.cap.get(cv2.CAP_PROP_BUFFERSIZE)) if buf_ok else None,
+        }
+
+        if self.threaded:
+            self._running = True
+            self._thread = threading.Thread(target=self._grab_loop, name=f"grab-{self.index}", daemon=True)
+            self._thread.start()
+        return True
+
+    def _grab_loop(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            now = time.perf_counter()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            with self._lock:
+                if self._pending is not None:
+                    self.dropped += 1
+                self._pending = (frame, now)
+                self._cap_times.append(now)
+                self._lock.notify()
+
+    def read_packet(self, timeout=None):
+        if not self._opened:
+            return None
+        if not self.threaded:
+            ret, frame = self.cap.read()
+            if not ret:
+                return None
+            now = time.perf_counter()
+            self._cap_times.append(now)
+            self._read_times.append(now)
+            self._seq += 1
+            self._last = FramePacket(self._seq, frame, now)
+            return self._last
+
+        with self._lock:
+            if self._pending is None:
+                self._lock.wait(self.read_timeout if timeout is None else timeout)
+            if self._pending is None:
+                return None
+            frame, t_cap = self._pending
+            self._pending = None
+        self._seq += 1
+        self._read_times.append(time.perf_counter())
+        self._last = FramePacket(self._seq, frame, t_cap)
+        return self._last
+
+    def set(self, prop, value):
+        return bool(self.cap is not None and self.cap.set(prop, value))
+
+    def get(self, prop):
+        return self.cap.get(prop) if self.cap is not None else 0.0
+
+    def release(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self.cap is not None:
+            try:
+                self.cap.release()
+            except Exception:
+                pass
+            self.cap = None
+        super().release()
+
+    def stats(self):
+        s = super().stats()
+        s.update(self.negotiated)
+        return s
+
+
+class VideoFileSource(CaptureSource):
+    """
+    อ่านจากไฟล์วิดีโอ
+    - realtime=True: หน่วงตาม fps ของไฟล์ (จำลองกล้องจริง) / False: อ่านเร็วที่สุด
+    - loop=True: วนกลับต้นไฟล์เมื่อจบ
+    """
+
+    def __init__(self, path, realtime=True, loop=False, fps=None):
+        super().__init__(name=f"video:{os.path.basename(path)}")
+        self.path = path
+        self.realtime = realtime
+        self.loop = loop
+        self.fps = fps
+        self.cap = None
+        self._next_t = None
+
+    def _open(self):
+        if not os.path.exists(self.path):
+            print(f"Video not found: {self.path}")
+            return False
+        self.cap = cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            return False
+        self.fps = self.fps or float(self.cap.get(cv2.CAP_PROP_FPS) or 30.0)
+        return True
+
+    def _pace(self):
+        if not self.realtime or not self.fps:
+            return
+        now = time.perf_counter()
+        if self._next_t is None:
+            self._next_t = now
+        delay = self._next_t - now
+        if delay > 0:
+            time.sleep(delay)
+        self._next_t = max(self._next_t + 1.0 / self.fps, time.perf_counter() - 1.0 / self.fps)
+
+    def _grab(self):
+        self._pace()
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            self.eof = True
+            return None
+        return frame
+
+    def get(self, prop):
+        return self.cap.get(prop) if self.cap is not None else 0.0
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        super().release()
+
+
+class ImageSequenceSource(VideoFileSource):
+    """อ่านรูปจากโฟลเดอร์หรือ glob pattern ตามลำดับชื่อไฟล์"""
+
+    EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, pattern, fps=15.0, realtime=True, loop=False):
+        CaptureSource.__init__(self, name=f"images:{pattern}")
+        self.pattern = pattern
+        self.fps = fps
+        self.realtime = realtime
+        self.loop = loop
+        self.files = []
+        self._i = 0
+        self._next_t = None
+        self.cap = None
+
+    def _open(self):
+        if os.path.isdir(self.pattern):
+            files = [os.path.join(self.pattern, f) for f in os.listdir(self.pattern)]
+        else:
+            files = glob.glob(self.pattern)
+        self.files = sorted(f for f in files if f.lower().endswith(self.EXTS))
+        return len(self.files) > 0
+
+    def _grab(self):
+        self._pace()
+        while True:
+            if self._i >= len(self.files):
+                if not self.loop:
+                    self.eof = True
+                    return None
+                self._i = 0
+            path = self.files[self._i]
+            self._i += 1
+            frame = cv2.imread(path)
+            if frame is not None:
+                return frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.files))
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps or 0.0)
+        return 0.0
+
+
+def open_source(spec=0, width=1280, height=720, fourcc=("MJPG", "YUYV"), buffer_size=1,
+                threaded=True, realtime=True, loop=False, fps=None):
+    """
+    สร้าง source จาก spec:
+      - int หรือสตริงตัวเลข → กล้อง
+      - โฟลเดอร์ หรือ pattern ที่มี * → ลำดับรูป
+      - path ไฟล์อื่น ๆ → ไฟล์วิดีโอ
+    คืน source ที่ open แล้ว (ใช้ isOpened() เช็คผล)
+    """
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        src = CameraSource(int(spec), width=width, height=height, fps=fps,
+                           fourcc=fourcc, buffer_size=buffer_size, threaded=threaded)
+    elif os.path.isdir(spec) or any(ch in spec for ch in "*?["):
+        src = ImageSequenceSource(spec, fps=fps or 15.0, realtime=realtime, loop=loop)
+    else:
+        src = VideoFileSource(spec, realtime=realtime, loop=loop, fps=fps)
+    src.open()
+    return src
+
+
+def make_test_clip(path, frames=150, size=(1280, 720), fps=30.0):
+    """สร้างคลิปทดสอบ (วงกลมเคลื่อนที่) สำหรับทดสอบ pipeline บนเครื่องที่ไม่มีกล้อง"""
+    w, h = size
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (w, h))
+    for i in range(frames):
+        img = np.full((h, w, 3), 200, np.uint8)
+        cx = int((i / max(1, frames - 1)) * (w - 300)) + 150
+        cv2.circle(img, (cx, h // 2), 140, (40, 120, 60), -1)
+        cv2.putText(img, f"{i:04d}", (20, 50), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+        writer.write(img)
+    writer.release()
+    return path
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Capture backend probe: negotiated format, fps and frame age")
+    ap.add_argument("--source", default="0", help="index กล้อง, ไฟล์วิดีโอ, โฟลเดอร์ หรือ glob ของรูป")
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--fps", type=float, default=None)
+    ap.add_argument("--fourcc", default="MJPG,YUYV")
+    ap.add_argument("--buffer", type=int, default=1)
+    ap.add_argument("--no-thread", action="store_true")
+    ap.add_argument("--fast", action="store_true", help="ไฟล์: อ่านเร็วที่สุด ไม่หน่วงตาม fps")
+    ap.add_argument("--work-ms", type=float, default=0.0, help="จำลองเวลา inference ต่อเฟรม")
+    ap.add_argument("--make-test-clip", metavar="PATH")
+    args = ap.parse_args(argv)
+
+    if args.make_test_clip:
+        print(f"[OK] wrote {make_test_clip(args.make_test_clip)}")
+        return 0
+
+    src = open_source(args.source, fourcc=tuple(f for f in args.fourcc.split(",") if f),
+                      buffer_size=args.buffer, threaded=not args.no_thread,
+                      realtime=not args.fast, fps=args.fps)
+    if not src.isOpened():
+        print(f"[ERROR] cannot open source {args.source}")
+        return 1
+
+    ages = []
+    t0 = time.perf_counter()
+    n = misses = 0
+    while n < args.frames:
+        pkt = src.read_packet()
+        if pkt is None:
+            misses += 1
+            if src.eof or misses > 50:
+                break
+            continue
+        misses = 0
+        ages.append(pkt.age_ms())
+        n += 1
+        if args.work_ms > 0:
+            time.sleep(args.work_ms / 1000.0)
+    dt = time.perf_counter() - t0
+    s = src.stats()
+    src.release()
+
+    ages.sort()
+    p50 = ages[len(ages) // 2] if ages else 0.0
+    p95 = ages[int(len(ages) * 0.95)] if ages else 0.0
+    print(f"source      : {s['source']}")
+    for k in ("fourcc", "width", "height", "fps", "buffer_size"):
+        if k in s:
+            print(f"{k:<12}: {s[k]}")
+    print(f"frames      : {n} in {dt:.2f}s ({n / dt if dt > 0 else 0:.1f} fps delivered)")
+    print(f"capture_fps : {s['capture_fps']}")
+    print(f"frame age   : p50 {p50:.1f} ms / p95 {p95:.1f} ms")
+    print(f"dropped     : {s['dropped']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,324 @@
+# dataset_check.py
+# -*- coding: utf-8 -*-
+# ตรวจชุดข้อมูล YOLO (data.yaml) ก่อนเทรน + สถิติของชุดข้อมูล
+#
+# - label: รูปแบบบรรทัด (cls x y w h), class id อยู่ใน 0..nc-1, พิกัดอยู่ใน 0..1, w/h > 0, บรรทัดซ้ำ
+# - สถิติ: จำนวนกล่องต่อคลาสต่อ split, การกระจายขนาดกล่อง, รูปที่ไม่มี label / label ที่ไม่มีรูป
+# - อ่านไฟล์ label แบบขนานใน process pool ; ผลต่อไฟล์ cache ไว้ที่ <โฟลเดอร์ data.yaml>/.label_check.json
+#   (key = path + size + mtime) รันซ้ำบนชุดที่ไม่เปลี่ยนจึงแค่ stat ไฟล์ ไม่ต้องเปิดอ่าน
+# ใช้ได้ทั้งชุด defect (fine_tune_2_stage.py) และชุด shape (yolo_train_2_stage.py)
+#
+# ใช้งาน:
+#   python dataset_check.py dataset2_only_defect/data.yaml --nc 2
+#   python dataset_check.py dataset2_only_shape/data.yaml --json shape_stats.json
+#   python dataset_check.py dataset2_only_shape/data.yaml --no-cache --workers 8
+
+import os, sys, json, time, argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+SPLITS = ("train", "val", "test")
+IMG_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff"}
+SIZE_EDGES = (0.02, 0.05, 0.10, 0.20, 0.40)     # sqrt(w*h) ของกล่อง เทียบด้านภาพ
+SIZE_NAMES = ("<2%", "2-5%", "5-10%", "10-20%", "20-40%", ">=40%")
+CACHE_NAME = ".label_check.json"
+CACHE_VERSION = 1
+POOL_MIN_FILES = 200      # ไฟล์ที่ต้องอ่านใหม่น้อยกว่านี้อ่านใน process หลัก (ไม่คุ้มเปิด pool)
+MAX_ERRORS_PER_FILE = 20
+
+
+def _size_bin(v):
+    for i, edge in enumerate(SIZE_EDGES):
+        if v < edge:
+            return i
+    return len(SIZE_EDGES)
+
+
+def check_label_file(path, nc):
+    """
+    อ่าน label หนึ่งไฟล์ → {"boxes": n, "classes": {"cid": n}, "sizes": [n ต่อช่องขนาด], "errors": [[line_no, เหตุผล, บรรทัด]]}
+    (key ของ classes เป็น str เพื่อให้เก็บลง JSON cache ได้ตรง ๆ)
+    """
+    res = {"boxes": 0, "classes": {}, "sizes": [0] * len(SIZE_NAMES), "errors": []}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except (OSError, UnicodeDecodeError) as e:
+        res["errors"].append([0, f"อ่านไฟล์ไม่ได้: {e}", ""])
+        return res
+
+    errors, seen = res["errors"], set()
+    for ln, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        parts = line.split()
+        reason = None
+        if len(parts) != 5:
+            reason = f"ต้องมี 5 ค่า (cls x y w h) พบ {len(parts)}"
+        else:
+            try:
+                cid = int(parts[0])
+                x, y, w, h = (float(v) for v in parts[1:])
+            except ValueError:
+                reason = "แปลงเป็นตัวเลขไม่ได้"
+            else:
+                if cid < 0 or cid >= nc:
+                    reason = f"class id {cid} เกินช่วง 0..{nc - 1}"
+                elif not all(0.0 <= v <= 1.0 for v in (x, y, w, h)):
+                    reason = "พิกัดเกินช่วง 0..1"
+                elif w <= 0 or h <= 0:
+                    reason = "กล่องกว้าง/สูงเป็น 0"
+                elif line in seen:
+                    reason = "บรรทัดซ้ำ"
+        if reason is not None:
+            if len(errors) < MAX_ERRORS_PER_FILE:
+                errors.append([ln, reason, line])
+            continue
+        seen.add(line)
+        res["boxes"] += 1
+        res["classes"][str(cid)] = res["classes"].get(str(cid), 0) + 1
+        res["sizes"][_size_bin((w * h) ** 0.5)] += 1
+    return res
+
+
+def _check_many(paths, nc):
+    return [check_label_file(p, nc) for p in paths]
+
+
+# -----------------------------
+# data.yaml / ไฟล์ในชุดข้อมูล
+# -----------------------------
+def load_data_yaml(data_yaml):
+    """คืน (cfg, names, nc, {split: [โฟลเดอร์รูป]}) ; path ใน data.yaml อ้างจากโฟลเดอร์ของ data.yaml"""
+    data_yaml = Path(data_yaml)
+    with open(data_yaml, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    names = cfg.get("names") or []
+    if isinstance(names, dict):
+        names = [names[k] for k in sorted(names)]
+    nc = int(cfg.get("nc", len(names)))
+    root = data_yaml.parent / cfg.get("path", "")
+    splits = {}
+    for split in SPLITS:
+        if not cfg.get(split):
+            continue
+        entries = cfg[split] if isinstance(cfg[split], list) else [cfg[split]]
+        splits[split] = [(root / p).resolve() for p in entries]
+    return cfg, list(names), nc, splits
+
+
+def _labels_dir(images_dir):
+    return images_dir.parent / "labels"
+
+
+def _scan(top, exts, stat=False):
+    """{path สัมพัทธ์ไม่มีนามสกุล: (path, size, mtime_ns)} ของไฟล์ใต้ top (recursive, os.scandir)"""
+    out = {}
+    if not top.is_dir():
+        return out
+    stack = [str(top)]
+    n_top = len(str(top)) + 1
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for e in it:
+                if e.is_dir(follow_symlinks=False):
+                    stack.append(e.path)
+                    continue
+                stem, ext = os.path.splitext(e.path)
+                if ext.lower() not in exts:
+                    continue
+                if stat:
+                    st = e.stat()
+                    out[stem[n_top:]] = (e.path, st.st_size, st.st_mtime_ns)
+                else:
+                    out[stem[n_top:]] = (e.path, 0, 0)
+    return out
+
+
+# -----------------------------
+# cache
+# -----------------------------
+def _load_cache(path, nc):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            c = json.load(f)
+        if c.get("version") == CACHE_VERSION and c.get("nc") == nc:
+            return c.get("files", {})
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+def _save_cache(path, nc, files):
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "nc": nc, "files": files}, f, separators=(",", ":"))
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[CHECK] เขียน cache ไม่ได้: {e}")
+
+
+# -----------------------------
+# รายงาน
+# -----------------------------
+class DatasetReport:
+    """ผลตรวจทั้งชุด: errors = [(label path, line_no, เหตุผล, บรรทัด)] ; splits[split] = สถิติของ split"""
+
+    def __init__(self, data_yaml, names, nc):
+        self.data_yaml = str(data_yaml)
+        self.names = names
+        self.nc = nc
+        self.splits = {}
+        self.errors = []
+        self.labels_total = 0
+        self.labels_parsed = 0
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def _new_split(self):
+        return {"images": 0, "labels": 0, "boxes": 0, "empty": 0,
+                "classes": [0] * self.nc, "sizes": [0] * len(SIZE_NAMES),
+                "no_label": [], "no_image": []}
+
+    def class_name(self, cid):
+        return self.names[cid] if cid < len(self.names) else str(cid)
+
+    def to_dict(self):
+        return {"data_yaml": self.data_yaml, "nc": self.nc, "names": self.names,
+                "size_bins": list(SIZE_NAMES), "splits": self.splits,
+                "errors": [list(e) for e in self.errors]}
+
+    def summary(self, samples=5):
+        cached = self.labels_total - self.labels_parsed
+        out = [f"[CHECK] {self.data_yaml}  nc={self.nc}  label {self.labels_total} ไฟล์ "
+               f"(cache {cached}, อ่านใหม่ {self.labels_parsed}) {self.elapsed:.2f}s"]
+        out.append(f"  {'split':<6}{'images':>8}{'labels':>8}{'boxes':>8}{'empty':>7}{'no-label':>10}{'no-image':>10}")
+        for split, s in self.splits.items():
+            out.append(f"  {split:<6}{s['images']:>8}{s['labels']:>8}{s['boxes']:>8}{s['empty']:>7}"
+                       f"{len(s['no_label']):>10}{len(s['no_image']):>10}")
+
+        out.append("  กล่องต่อคลาส:")
+        for cid in range(self.nc):
+            cells = "  ".join(f"{split} {s['classes'][cid]}" for split, s in self.splits.items())
+            out.append(f"    {cid} {self.class_name(cid):<14} {cells}")
+
+        out.append("  ขนาดกล่อง sqrt(w*h) เทียบด้านภาพ:")
+        for i, name in enumerate(SIZE_NAMES):
+            cells = "  ".join(f"{split} {s['sizes'][i]}" for split, s in self.splits.items())
+            out.append(f"    {name:<7} {cells}")
+
+        for split, s in self.splits.items():
+            for key, what in (("no_label", "รูปที่ไม่มี label (ถือเป็น background)"), ("no_image", "label ที่ไม่มีรูป")):
+                if s[key]:
+                    out.append(f"  [{split}] {what} {len(s[key])} ไฟล์ เช่น " + ", ".join(s[key][:samples]))
+        if self.errors:
+            out.append(f"  [ERROR] label ผิด {len(self.errors)} บรรทัด")
+        return "\n".join(out)
+
+    def print_errors(self, limit=30):
+        for path, ln, reason, line in self.errors[:limit]:
+            print(f"  {path} : line {ln} -> {reason}: {line}")
+        if len(self.errors) > limit:
+            print(f"  ... อีก {len(self.errors) - limit} บรรทัด")
+
+
+def check_dataset(data_yaml, nc=None, workers=None, use_cache=True):
+    """
+    ตรวจทุก split ใน data.yaml → DatasetReport
+      nc       : จำนวนคลาส (None = ใช้ค่าใน data.yaml)
+      workers  : จำนวน process ที่อ่าน label (None = จำนวน CPU)
+    """
+    t0 = time.perf_counter()
+    data_yaml = Path(data_yaml)
+    _, names, yaml_nc, splits = load_data_yaml(data_yaml)
+    nc = yaml_nc if nc is None else int(nc)
+    report = DatasetReport(data_yaml, names, nc)
+
+    cache_path = data_yaml.parent / CACHE_NAME
+    cache = _load_cache(cache_path, nc) if use_cache else {}
+
+    # สแกนไฟล์ทุก split ก่อน แล้วอ่านเฉพาะ label ที่ไม่อยู่ใน cache ทีเดียว
+    per_split, todo = {}, []
+    for split, dirs in splits.items():
+        images, labels = {}, {}
+        for d in dirs:
+            images.update(_scan(d, IMG_EXTS))
+            labels.update(_scan(_labels_dir(d), {".txt"}, stat=True))
+        per_split[split] = (images, labels)
+        for path, size, mtime in labels.values():
+            hit = cache.get(path)
+            if hit is None or hit[0] != size or hit[1] != mtime:
+                todo.append(path)
+
+    todo = sorted(set(todo))
+    results = {}
+    if todo:
+        workers = workers or os.cpu_count() or 1
+        if workers > 1 and len(todo) >= POOL_MIN_FILES:
+            # ส่งเป็นก้อน ๆ ลด overhead ของ IPC ต่อไฟล์
+            step = max(32, len(todo) // (workers * 4))
+            chunks = [todo[i:i + step] for i in range(0, len(todo), step)]
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                for chunk, res in zip(chunks, ex.map(_check_many, chunks, [nc] * len(chunks))):
+                    results.update(zip(chunk, res))
+        else:
+            results.update(zip(todo, _check_many(todo, nc)))
+
+    new_cache = {}
+    for split, (images, labels) in per_split.items():
+        s = report.splits[split] = report._new_split()
+        s["images"], s["labels"] = len(images), len(labels)
+        s["no_label"] = sorted(k for k in images if k not in labels)
+        s["no_image"] = sorted(k for k in labels if k not in images)
+        for path, size, mtime in labels.values():
+            res = results[path] if path in results else cache[path][2]
+            new_cache[path] = [size, mtime, res]
+            s["boxes"] += res["boxes"]
+            if res["boxes"] == 0 and not res["errors"]:
+                s["empty"] += 1
+            for cid, n in res["classes"].items():
+                s["classes"][int(cid)] += n
+            for i, n in enumerate(res["sizes"]):
+                s["sizes"][i] += n
+            report.errors.extend((path, ln, reason, line) for ln, reason, line in res["errors"])
+
+    report.labels_total = len(new_cache)
+    report.labels_parsed = len(results)
+    if use_cache and (results or len(new_cache) != len(cache)):
+        _save_cache(cache_path, nc, new_cache)
+    report.elapsed = time.perf_counter() - t0
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Validate YOLO labels of a data.yaml dataset and print dataset statistics")
+    ap.add_argument("data_yaml")
+    ap.add_argument("--nc", type=int, default=None, help="จำนวนคลาสที่ต้องการ (ค่าเริ่มต้น = ตาม data.yaml)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--no-cache", action="store_true", help="อ่านทุกไฟล์ใหม่ ไม่ใช้/ไม่เขียน cache")
+    ap.add_argument("--json", help="บันทึกสถิติ + รายการ error เป็น JSON")
+    ap.add_argument("--errors", type=int, default=30, help="จำนวนบรรทัด error ที่แสดง")
+    args = ap.parse_args(argv)
+
+    if not os.path.isfile(args.data_yaml):
+        print(f"ไม่พบ {args.data_yaml}")
+        return 2
+    report = check_dataset(args.data_yaml, nc=args.nc, workers=args.workers, use_cache=not args.no_cache)
+    print(report.summary())
+    if report.errors:
+        report.print_errors(args.errors)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, ensure_ascii=False, indent=2)
+    return 0 if report.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
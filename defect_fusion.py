@@ -0,0 +1,104 @@
+# defect_fusion.py
+# -*- coding: utf-8 -*-
+# รวมหลักฐานตำหนิ (defect) ข้ามเฟรมตลอดช่วงที่จานหนึ่งใบอยู่ในภาพ
+#
+# เดิม: จำนวนตำหนิต่อจาน = max ของแต่ละเฟรม + flag ติดถาวร → เฟรมเดียวที่ noise ก็ตัดสินผลทั้งจาน
+# ใหม่: ต่อ track ของจาน (ดู plate_tracker.py)
+#   - ตำแหน่งตำหนิเก็บเป็นพิกัดสัมพัทธ์กับกล่องจาน (u,v ∈ [0,1]) → จานเลื่อนบนสายพานก็ยังรวมเป็นจุดเดียวกัน
+#   - ตำหนิชนิดเดียวกันที่อยู่ใกล้กัน (ระยะ < merge_radius) ถือเป็นจุดเดียว (de-dup ข้ามเฟรม)
+#   - แต่ละจุดสะสมคะแนน = ผลรวม conf ของทุกเฟรมที่เห็น (confidence-weighted vote)
+#   - ยืนยันจุดเมื่อ คะแนน ≥ min_score และเห็น ≥ min_hits เฟรม หรือ conf เฟรมเดียว ≥ strong_conf
+# ผลคือรันโมเดล defect ถี่น้อยลง/ความละเอียดต่ำลงได้ โดยผลระดับจานไม่ตก
+
+import math
+
+
+class DefectCluster:
+    """ตำหนิหนึ่งจุดบนจาน (รวมจากหลายเฟรม)"""
+    __slots__ = ("label", "u", "v", "score", "hits", "max_conf", "last_box")
+
+    def __init__(self, label, u, v, conf, box):
+        self.label = label
+        self.u, self.v = u, v
+        self.score = float(conf)
+        self.hits = 1
+        self.max_conf = float(conf)
+        self.last_box = box
+
+    def add(self, u, v, conf, box):
+        # ตำแหน่งเฉลี่ยถ่วงน้ำหนักด้วย conf
+        w_old, w_new = self.score, float(conf)
+        tot = w_old + w_new
+        if tot > 0:
+            self.u = (self.u * w_old + u * w_new) / tot
+            self.v = (self.v * w_old + v * w_new) / tot
+        self.score = tot
+        self.hits += 1
+        self.max_conf = max(self.max_conf, float(conf))
+        self.last_box = box
+
+
+class DefectEvidence:
+    """
+    หลักฐานตำหนิของจานหนึ่งใบ
+      add(plate_box, dets)  : dets = [(xyxy, label, conf), ...] ในพิกัดเฟรมเดียวกับ plate_box
+      counts()              : {label: จำนวนจุดที่ยืนยันแล้ว}
+      names()               : set ของชนิดตำหนิที่ยืนยันแล้ว
+    """
+
+    def __init__(self, merge_radius=0.12, min_score=0.6, min_hits=2, strong_conf=0.80):
+        self.merge_radius = merge_radius
+        self.min_score = min_score
+        self.min_hits = min_hits
+        self.strong_conf = strong_conf
+        self.clusters = []
+        self.frames = 0          # จำนวนเฟรมที่รันโมเดล defect บนจานนี้
+
+    @staticmethod
+    def _relative(plate_box, box):
+        px1, py1, px2, py2 = plate_box
+        pw = max(1.0, float(px2 - px1))
+        ph = max(1.0, float(py2 - py1))
+        cx = (box[0] + box[2]) / 2.0
+        cy = (box[1] + box[3]) / 2.0
+        return (cx - px1) / pw, (cy - py1) / ph
+
+    def add(self, plate_box, dets):
+        self.frames += 1
+        if plate_box is None:
+            return
+        used = set()
+        # conf สูงจับคู่ก่อน กันกล่องอ่อนแย่งจุดของกล่องที่ชัดกว่า
+        for box, label, conf in sorted(dets, key=lambda d: d[2], reverse=True):
+            u, v = self._relative(plate_box, box)
+            best, best_d = None, self.merge_radius
+            for k, c in enumerate(self.clusters):
+                if c.label != label or k in used:
+                    continue
+                d = math.hypot(c.u - u, c.v - v)
+                if d < best_d:
+                    best, best_d = k, d
+            if best is None:
+                self.clusters.append(DefectCluster(label, u, v, conf, box))
+                used.add(len(self.clusters) - 1)
+            else:
+                self.clusters[best].add(u, v, conf, box)
+                used.add(best)
+
+    def is_confirmed(self, c):
+        return (c.score >= self.min_score and c.hits >= self.min_hits) or c.max_conf >= self.strong_conf
+
+    def confirmed(self):
+        return [c for c in self.clusters if self.is_confirmed(c)]
+
+    def counts(self):
+        out = {}
+        for c in self.confirmed():
+            out[c.label] = out.get(c.label, 0) + 1
+        return out
+
+    def names(self):
+        return {c.label for c in self.confirmed()}
+
+    def total(self):
+        return len(self.confirmed())
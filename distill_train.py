@@ -0,0 +1,258 @@
+# distill_train.py
+# -*- coding: utf-8 -*-
+# knowledge distillation: เทรน student ขนาด yolo11n ให้เลียนแบบ teacher (yolo11s ที่เทรนแล้ว)
+# สำหรับเครื่องหน้าไลน์แบบ fanless ที่รัน yolo11s ไม่ทัน
+#
+# - ชุดข้อมูล/ค่าเทรนเดียวกับ yolo_train_2_stage.py (shape) และ fine_tune_2_stage.py (defect) ผ่าน TRAIN_ARGS
+#   student เริ่มจาก yolo11n (COCO) จึงไม่ freeze backbone (ตั้งได้ด้วย --freeze)
+# - loss = loss ปกติของ ultralytics (box/cls/dfl กับ label จริง)
+#        + alpha * T^2 * [ BCE(cls ของ student, sigmoid(cls ของ teacher / T))
+#                          + KL(การกระจาย DFL ของ student || teacher) ถ่วงด้วยความมั่นใจของ teacher ]
+#   ใช้ได้เพราะ yolo11n/yolo11s มี head แบบเดียวกัน (stride, reg_max, nc) → output ทุก anchor ตรงกันตำแหน่งต่อตำแหน่ง
+# - teacher ผูกเป็น criterion ของ student ตอนเริ่มเทรนเท่านั้น checkpoint ที่บันทึกเป็นโมเดล ultralytics ปกติ
+#   (GUI / model_promote.py โหลดได้เลย)
+# - จบแล้วเทียบ student กับ teacher: mAP, recall ต่อคลาส, latency CPU ที่ imgsz ตอนรันจริง → runs/distill/report_<task>.json
+#
+# ใช้งาน:
+#   python distill_train.py --task shape
+#   python distill_train.py --task both --epochs 150 --alpha 1.0 --temperature 2.0
+#   python distill_train.py --task defect --report-only runs/distill/defect_student_yolo11n/weights/best.pt
+
+import os, sys, json, argparse, importlib
+import multiprocessing as mp
+
+TASKS = {
+    "shape":  {"module": "yolo_train_2_stage", "teacher": os.path.join("models", "shape_best.pt")},
+    "defect": {"module": "fine_tune_2_stage",  "teacher": os.path.join("models", "defect_best.pt")},
+}
+STUDENT = "yolo11n.pt"
+ALPHA = 1.0
+TEMPERATURE = 2.0
+PROJECT = os.path.join("runs", "distill")
+
+
+def _head(model):
+    return model.model[-1]
+
+
+class DistillLoss:
+    """ห่อ criterion เดิมของ student แล้วบวก distillation loss จาก teacher (ไม่มี gradient ไป teacher)"""
+
+    def __init__(self, base, teacher, alpha=ALPHA, temperature=TEMPERATURE):
+        self.base = base
+        self.teacher = teacher
+        self.alpha = alpha
+        self.T = temperature
+        head = _head(teacher)
+        self.nc = head.nc
+        self.reg_max = head.reg_max
+        self.kd_sum = 0.0
+        self.kd_n = 0
+
+    def kd_loss(self, s_feats, t_feats):
+        import torch
+        import torch.nn.functional as F
+        T, nc, rm = self.T, self.nc, self.reg_max
+        loss = 0.0
+        for s, t in zip(s_feats, t_feats):
+            s_box, s_cls = s.float().split((rm * 4, nc), 1)
+            t_box, t_cls = t.float().split((rm * 4, nc), 1)
+            loss_cls = F.binary_cross_entropy_with_logits(s_cls / T, torch.sigmoid(t_cls / T))
+            b, _, h, w = s_box.shape
+            kl = F.kl_div(F.log_softmax(s_box.view(b, 4, rm, h, w) / T, 2),
+                          F.softmax(t_box.view(b, 4, rm, h, w) / T, 2), reduction="none").sum(2).mean(1)
+            weight = torch.sigmoid(t_cls).amax(1)          # เน้น anchor ที่ teacher เห็นวัตถุ
+            loss_box = (kl * weight).sum() / weight.sum().clamp(min=1.0)
+            loss = loss + (loss_cls + loss_box) * T * T
+        return loss / max(1, len(s_feats))
+
+    def __call__(self, preds, batch):
+        import torch
+        loss, items = self.base(preds, batch)
+        feats = preds[1] if isinstance(preds, tuple) else preds
+        with torch.no_grad():
+            t_out = self.teacher(batch["img"])
+        t_feats = t_out[1] if isinstance(t_out, tuple) else t_out
+        kd = self.alpha * self.kd_loss(feats, t_feats)
+        self.kd_sum += float(kd.detach())
+        self.kd_n += 1
+        bs = batch["img"].shape[0]
+        if loss.dim() == 0:
+            loss = loss + kd * bs
+        else:        # บางเวอร์ชันคืน loss แยก [box, cls, dfl] แล้วให้ trainer sum เอง
+            loss = loss.clone()
+            loss[1] = loss[1] + kd * bs
+        return loss, items
+
+
+def load_teacher(path, device):
+    from ultralytics import YOLO
+    teacher = YOLO(str(path)).model.to(device).float().eval()
+    for p in teacher.parameters():
+        p.requires_grad_(False)
+    return teacher
+
+
+def check_compatible(student, teacher, data_names=None):
+    """head ต้องเหมือนกันทุกจุด ไม่งั้น output ของแต่ละ anchor ไม่ตรงกัน"""
+    s, t = _head(student), _head(teacher)
+    problems = []
+    if s.nc != t.nc:
+        problems.append(f"nc: student {s.nc} / teacher {t.nc}")
+    if s.reg_max != t.reg_max:
+        problems.append(f"reg_max: student {s.reg_max} / teacher {t.reg_max}")
+    if list(map(float, s.stride)) != list(map(float, t.stride)):
+        problems.append(f"stride: student {list(s.stride)} / teacher {list(t.stride)}")
+    t_names = list((getattr(teacher, "names", None) or {}).values())
+    if data_names and t_names and list(data_names) != t_names:
+        problems.append(f"ชื่อคลาส: data {list(data_names)} / teacher {t_names}")
+    if problems:
+        raise ValueError("teacher กับ student ใช้ distillation ร่วมกันไม่ได้: " + "; ".join(problems))
+
+
+def distill_trainer(teacher_path, alpha=ALPHA, temperature=TEMPERATURE, base=None):
+    """class ของ trainer สำหรับ model.train(trainer=...) ; base = trainer อื่นที่จะต่อยอด (เช่น packed_trainer)"""
+    from ultralytics.models.yolo.detect import DetectionTrainer
+    base = base or DetectionTrainer
+
+    class DistillTrainer(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.add_callback("on_pretrain_routine_end", self._attach_teacher)
+            self.add_callback("on_train_epoch_end", self._log_kd)
+
+        def _attach_teacher(self, trainer):
+            teacher = load_teacher(teacher_path, self.device)
+            check_compatible(self.model, teacher, list(self.data["names"].values())
+                             if isinstance(self.data.get("names"), dict) else self.data.get("names"))
+            # criterion ของ self.model เท่านั้น: EMA (ตัวที่ validate/บันทึก) ยังใช้ loss ปกติ
+            self.model.criterion = DistillLoss(self.model.init_criterion(), teacher, alpha, temperature)
+            print(f"[DISTILL] teacher = {teacher_path}  alpha={alpha}  T={temperature}")
+
+        def _log_kd(self, trainer):
+            crit = getattr(self.model, "criterion", None)
+            if isinstance(crit, DistillLoss) and crit.kd_n:
+                print(f"[DISTILL] epoch {self.epoch + 1}: kd_loss {crit.kd_sum / crit.kd_n:.4f}")
+                crit.kd_sum, crit.kd_n = 0.0, 0
+
+    return DistillTrainer
+
+
+# -----------------------------
+# เทรน + รายงาน
+# -----------------------------
+def train_student(task, student=STUDENT, teacher=None, epochs=None, freeze=0, alpha=ALPHA,
+                  temperature=TEMPERATURE, device="cpu"):
+    from ultralytics import YOLO
+    from packed_dataset import packed_trainer
+    from train_cache import default_cache_dir, INDEX_NAME
+    from train_telemetry import attach_telemetry
+
+    spec = TASKS[task]
+    mod = importlib.import_module(spec["module"])
+    teacher = teacher or spec["teacher"]
+    if not os.path.isfile(teacher):
+        raise FileNotFoundError(f"ไม่พบ teacher {teacher}")
+
+    args = dict(mod.TRAIN_ARGS)
+    args.update(project=os.path.abspath(PROJECT), name=f"{task}_student_{os.path.splitext(os.path.basename(student))[0]}",
+                exist_ok=True, device=device, freeze=freeze, pretrained=True)
+    if epochs:
+        args["epochs"] = epochs
+    args.pop("cache", None)
+    base = None
+    cache_dir = default_cache_dir(args["data"], args["imgsz"])
+    if os.path.isfile(os.path.join(cache_dir, INDEX_NAME)):
+        base = packed_trainer(cache_dir)
+        args["cache"] = False
+    args["trainer"] = distill_trainer(teacher, alpha, temperature, base)
+
+    model = YOLO(student)
+    attach_telemetry(model)
+    model.train(**args)
+    save_dir = str(model.trainer.save_dir)
+    best = os.path.join(save_dir, "weights", "best.pt")
+    return best if os.path.isfile(best) else os.path.join(save_dir, "weights", "last.pt")
+
+
+def compare(task, student_weights, teacher=None, n_frames=30, device="cpu"):
+    """student vs teacher บน test split เดียวกัน → dict + บันทึก runs/distill/report_<task>.json"""
+    from ultralytics import YOLO
+    from model_eval import eval_metrics, fixed_frames, bench_latency, split_for_eval, model_size_mb
+    from model_promote import runtime_imgsz
+
+    spec = TASKS[task]
+    mod = importlib.import_module(spec["module"])
+    teacher = teacher or spec["teacher"]
+    data = mod.TRAIN_ARGS["data"]
+    imgsz = runtime_imgsz(task)
+    split = split_for_eval(data)
+    frames = fixed_frames(data, split, n_frames)
+    report = {"task": task, "imgsz": imgsz, "split": split, "frames": len(frames), "models": {}}
+    for label, path in (("teacher", teacher), ("student", student_weights)):
+        m = YOLO(path)
+        res = eval_metrics(m, data, split=split, imgsz=imgsz, device=device)
+        res["latency"] = bench_latency(m, frames, imgsz, device=device)
+        res["size_mb"] = model_size_mb(path)
+        res["weights"] = os.path.abspath(path)
+        report["models"][label] = res
+
+    os.makedirs(PROJECT, exist_ok=True)
+    out = os.path.join(PROJECT, f"report_{task}.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_report(report)
+    print(f"[DISTILL] บันทึกรายงาน {out}")
+    return report
+
+
+def print_report(report):
+    t, s = report["models"]["teacher"], report["models"]["student"]
+    print(f"\n[DISTILL] {report['task']}  imgsz={report['imgsz']}  split={report['split']}  frames={report['frames']}")
+    print(f"  {'':<9}{'mAP50-95':>10}{'mAP50':>8}{'recall':>8}{'lat ms':>9}{'p90 ms':>9}{'MB':>7}")
+    for label, r in (("teacher", t), ("student", s)):
+        lat = r["latency"]
+        print(f"  {label:<9}{r['map50_95']:>10.4f}{r['map50']:>8.4f}{r['recall']:>8.3f}"
+              f"{lat['median_ms'] or 0:>9.1f}{lat['p90_ms'] or 0:>9.1f}{r['size_mb'] or 0:>7.1f}")
+    for name in t["per_class"]:
+        rt = t["per_class"][name]["r"]
+        rs = s["per_class"].get(name, {}).get("r", 0.0)
+        print(f"  recall {name:<14} teacher {rt:.3f}  student {rs:.3f}  ({rs - rt:+.3f})")
+    if t["latency"]["median_ms"] and s["latency"]["median_ms"]:
+        print(f"  speedup x{t['latency']['median_ms'] / s['latency']['median_ms']:.2f}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Distill a yolo11n student from the trained shape/defect teachers")
+    ap.add_argument("--task", choices=["shape", "defect", "both"], default="both")
+    ap.add_argument("--student", default=STUDENT)
+    ap.add_argument("--teacher", help="ค่าเริ่มต้น models/shape_best.pt / models/defect_best.pt ตาม task")
+    ap.add_argument("--epochs", type=int, default=None, help="ค่าเริ่มต้นตาม TRAIN_ARGS ของสคริปต์เทรน")
+    ap.add_argument("--freeze", type=int, default=0)
+    ap.add_argument("--alpha", type=float, default=ALPHA)
+    ap.add_argument("--temperature", type=float, default=TEMPERATURE)
+    ap.add_argument("--device", default="cpu")
+    ap.add_argument("--frames", type=int, default=30, help="จำนวนเฟรมคงที่ที่ใช้วัด latency")
+    ap.add_argument("--report-only", metavar="STUDENT_PT", help="ข้ามการเทรน เทียบ student ที่มีอยู่กับ teacher")
+    args = ap.parse_args(argv)
+
+    tasks = ["shape", "defect"] if args.task == "both" else [args.task]
+    if args.report_only and len(tasks) > 1:
+        ap.error("--report-only ใช้กับ --task shape หรือ defect")
+    for task in tasks:
+        try:
+            if args.report_only:
+                student = args.report_only
+            else:
+                student = train_student(task, args.student, args.teacher, args.epochs, args.freeze,
+                                        args.alpha, args.temperature, args.device)
+            compare(task, student, args.teacher, args.frames, args.device)
+        except (FileNotFoundError, ValueError) as e:
+            print(f"[DISTILL] {task}: {e}")
+            return 2
+    return 0
+
+
+if __name__ == "__main__":
+    mp.freeze_support()
+    sys.exit(main())
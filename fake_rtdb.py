@@ -0,0 +1,258 @@
+# fake_rtdb.py
+# -*- coding: utf-8 -*-
+# Firebase Realtime Database จำลองบนเครื่อง (HTTP) สำหรับทดสอบ sync โดยไม่ต้องต่อเน็ต
+#
+# - รองรับ REST ชุดที่ FirebaseClient ใช้: PUT / POST (push → {"name": id}) ที่ <path>.json และ GET ไว้ตรวจข้อมูล
+# - ฉีดปัญหาได้ระหว่างรัน: latency (+jitter), error_rate (ตอบ 5xx), outage
+#     outage="hang"  → ค้าง request ไว้จนกว่า outage จะจบ (เหมือนเน็ตหลุดเงียบ ๆ → client รอจน timeout)
+#     outage="drop"  → ปิด connection ทันทีไม่ตอบ (เหมือน router / proxy ตัดทิ้ง)
+# - ปรับค่าจากภายนอก: PUT /.faults.json {"latency_ms": 300, "outage": "hang"} ; ดูสถิติ: GET /.stats.json
+# - ชี้ GUI มาที่นี่: LEAFPLATE_FIREBASE_URL=http://127.0.0.1:9000 (ไม่มี serviceAccountKey.json = ใช้ REST)
+#
+# ใช้งาน:
+#   python fake_rtdb.py --port 9000
+#   python fake_rtdb.py --port 9000 --latency 150 --jitter 100 --error-rate 0.05
+#   curl -X PUT -d '{"outage": "hang"}' http://127.0.0.1:9000/.faults.json
+
+import sys, json, time, random, argparse, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAULT_KEYS = ("latency_ms", "jitter_ms", "error_rate", "error_status", "outage", "hang_max_s")
+OUTAGES = (None, "hang", "drop")
+
+
+class FakeRTDB:
+    """
+    ฐานข้อมูลในหน่วยความจำ + HTTP server (thread เบื้องหลัง)
+    start() แล้วใช้ .url เป็น base_url ของ FirebaseClient ; set_faults(...) เปลี่ยนพฤติกรรมได้ทุกเมื่อ
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0,
+                 error_status=503, outage=None, hang_max_s=60.0, seed=None):
+        self.host, self.port = host, port
+        self.data = {}
+        self._lock = threading.Lock()
+        self._faults = {}
+        self._rng = random.Random(seed)
+        self._push_seq = 0
+        self._server = None
+        self._thread = None
+        self.counts = {}
+        self.set_faults(latency_ms=latency_ms, jitter_ms=jitter_ms, error_rate=error_rate,
+                        error_status=error_status, outage=outage, hang_max_s=hang_max_s)
+
+    # ---------- faults / stats ----------
+    def set_faults(self, **kw):
+        bad = set(kw) - set(FAULT_KEYS)
+        if bad:
+            raise ValueError(f"unknown fault keys: {sorted(bad)}")
+        if kw.get("outage") not in OUTAGES:
+            raise ValueError(f"outage must be one of {OUTAGES}")
+        with self._lock:
+            self._faults.update(kw)
+
+    def faults(self):
+        with self._lock:
+            return dict(self._faults)
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {"counts": dict(self.counts), "faults": dict(self._faults)}
+
+    # ---------- data ----------
+    @staticmethod
+    def _parts(path):
+        return [p for p in path.strip("/").split("/") if p]
+
+    def get(self, path):
+        with self._lock:
+            node = self.data
+            for p in self._parts(path):
+                if not isinstance(node, dict) or p not in node:
+                    return None
+                node = node[p]
+            return json.loads(json.dumps(node))
+
+    def _set(self, parts, value):
+        if not parts:
+            self.data = value if isinstance(value, dict) else {}
+            return
+        node = self.data
+        for p in parts[:-1]:
+            if not isinstance(node.get(p), dict):
+                node[p] = {}
+            node = node[p]
+        if value is None:
+            node.pop(parts[-1], None)
+        else:
+            node[parts[-1]] = value
+
+    def put(self, path, value):
+        with self._lock:
+            self._set(self._parts(path), value)
+
+    def push(self, path, value):
+        with self._lock:
+            self._push_seq += 1
+            key = f"-{int(time.time() * 1000):012x}{self._push_seq:08x}"   # เรียงตามเวลาเหมือน push id จริง
+            self._set(self._parts(path) + [key], value)
+        return key
+
+    # ---------- server ----------
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _make_handler(self))
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-rtdb", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self.set_faults(outage=None)          # ปล่อย request ที่ค้างอยู่
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass            # client timeout ไปก่อนแล้ว (ปกติระหว่าง outage) ไม่ต้องพิมพ์ traceback
+
+
+def _make_handler(rtdb):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _body(self):
+            n = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(n) if n else b""
+            return json.loads(raw.decode("utf-8")) if raw else None
+
+        def _send(self, status, obj):
+            raw = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def _path(self):
+            path = self.path.split("?", 1)[0]
+            if not path.endswith(".json"):
+                return None
+            return path[:-len(".json")]
+
+        def _inject(self):
+            """True = ตอบตามปกติต่อได้ ; False = จัดการแล้ว (error / ตัด connection)"""
+            f = rtdb.faults()
+            if f["outage"] == "hang":
+                rtdb._count("hung")
+                deadline = time.monotonic() + f["hang_max_s"]
+                while rtdb.faults()["outage"] == "hang" and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                f = rtdb.faults()
+            if f["outage"]:                          # drop หรือ hang ที่เกิน hang_max_s
+                rtdb._count("dropped")
+                self.close_connection = True
+                return False
+            delay = f["latency_ms"] + (rtdb._rng.uniform(0, f["jitter_ms"]) if f["jitter_ms"] else 0.0)
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+            if f["error_rate"] and rtdb._rng.random() < f["error_rate"]:
+                rtdb._count("errors")
+                self._send(f["error_status"], {"error": "injected"})
+                return False
+            return True
+
+        def _handle(self, method):
+            path = self._path()
+            try:
+                body = self._body() if method in ("PUT", "POST") else None
+            except ValueError:
+                self._send(400, {"error": "Invalid data; couldn't parse JSON object."})
+                return
+            if path == "/.faults" and method in ("PUT", "GET"):
+                try:
+                    if method == "PUT":
+                        rtdb.set_faults(**(body or {}))
+                except (TypeError, ValueError) as e:
+                    self._send(400, {"error": str(e)})
+                    return
+                self._send(200, rtdb.faults())
+                return
+            if path == "/.stats" and method == "GET":
+                self._send(200, rtdb.stats())
+                return
+            if path is None:
+                self._send(404, {"error": "path must end with .json"})
+                return
+            if not self._inject():
+                return
+            rtdb._count(method)
+            if method == "GET":
+                self._send(200, rtdb.get(path))
+            elif method == "PUT":
+                rtdb.put(path, body)
+                self._send(200, body)
+            else:
+                self._send(200, {"name": rtdb.push(path, body)})
+
+        def do_GET(self):
+            self._handle("GET")
+
+        def do_PUT(self):
+            self._handle("PUT")
+
+        def do_POST(self):
+            self._handle("POST")
+
+    return Handler
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Local stand-in for the Firebase Realtime Database REST API")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--latency", type=float, default=0.0, help="ms ต่อ request")
+    ap.add_argument("--jitter", type=float, default=0.0, help="ms สุ่มเพิ่ม 0..jitter")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--error-status", type=int, default=503)
+    ap.add_argument("--outage", choices=["hang", "drop"])
+    ap.add_argument("--dump", help="เขียนข้อมูลทั้งหมดเป็น JSON ตอนปิด (Ctrl+C)")
+    args = ap.parse_args(argv)
+
+    rtdb = FakeRTDB(args.host, args.port, args.latency, args.jitter, args.error_rate, args.error_status,
+                    args.outage).start()
+    print(f"[FakeRTDB] {rtdb.url}  faults={rtdb.faults()}")
+    try:
+        while True:
+            time.sleep(10)
+            c = rtdb.stats()["counts"]
+            if c:
+                print(f"[FakeRTDB] {c}")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rtdb.stop()
+        if args.dump:
+            with open(args.dump, "w", encoding="utf-8") as f:
+                json.dump(rtdb.data, f, ensure_ascii=False, indent=2)
+            print(f"[FakeRTDB] dump → {args.dump}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,7 +2,12 @@
 from ultralytics import YOLO
 from pathlib import Path
 import multiprocessing as mp
-import torch, shutil, yaml, glob
+import torch, glob
+
+from dataset_check import check_dataset
+from packed_dataset import packed_trainer
+from train_telemetry import attach_telemetry
+from model_promote import promote
 
 # ✅ ใช้ชุด defect และน้ำหนักจากสเตจ shape ตามโฟลเดอร์ที่คุณแสดง
 DATA_YAML = Path("dataset2_only_defect/data.yaml")   # ชุดข้อมูลตำหนิ
@@ -12,38 +17,37 @@ EPOCHS    = 100
 IMGSZ     = 896
 BATCH     = 8
 FREEZE    = 10   # แช่แข็ง backbone บางส่วน
+# รูปที่ decode + resize แล้วแบบ memmap (python train_cache.py dataset2_only_defect/data.yaml --imgsz 896)
+# ไม่มีโฟลเดอร์นี้ = decode JPEG ทุก epoch แบบเดิม
+PACKED_CACHE = Path(f"cache/dataset2_only_defect_img{IMGSZ}")
+
+# argument ของ model.train นอกจาก name/device (hparam_sweep.py ใช้ชุดนี้เป็นค่าตั้งต้นแล้วแทนค่าเฉพาะที่ค้นหา)
+TRAIN_ARGS = dict(
+    data=str(DATA_YAML),
+    epochs=EPOCHS,
+    imgsz=IMGSZ,
+    batch=BATCH,
+    lr0=0.001,
+    optimizer="auto",
+    close_mosaic=5,
+    copy_paste=0.2,
+    patience=20,
+    workers=2,
+    freeze=FREEZE,
+    project="runs",
+    pretrained=True,
+    verbose=True,
+)
 
 def check_labels(data_yaml: Path):
-    with open(data_yaml, "r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
-    nc = int(cfg.get("nc", 0))
+    # ตรวจทุก split แบบขนาน + cache ผลต่อไฟล์ (ดู dataset_check.py) รันซ้ำบนชุดเดิมแทบไม่เสียเวลา
+    report = check_dataset(data_yaml)
+    nc = report.nc
     assert nc == 2, f"data.yaml nc ต้องเป็น 2 (ตอนนี้ = {nc})"
-    def _labels_dir(split_key):
-        p = cfg[split_key]
-        p = (data_yaml.parent / p).resolve()
-        return p.parent / "labels"
-
-    bad = []
-    for split in ("train", "val", "test"):
-        if split not in cfg:
-            continue
-        labels_dir = _labels_dir(split)
-        for txt in labels_dir.glob("**/*.txt"):
-            with open(txt, "r", encoding="utf-8") as f:
-                for ln, line in enumerate(f, 1):
-                    line=line.strip()
-                    if not line: 
-                        continue
-                    try:
-                        cid = int(line.split()[0])
-                    except Exception:
-                        bad.append((txt, ln, line)); continue
-                    if cid < 0 or cid >= nc:
-                        bad.append((txt, ln, line))
-    if bad:
-        print("\n[ERROR] พบ class id เกินช่วง 0..1 ในไฟล์ label ต่อไปนี้:")
-        for p, ln, line in bad[:30]:
-            print(f"  {p} : line {ln} -> {line}")
+    print(report.summary())
+    if not report.ok:
+        print("\n[ERROR] พบ label ผิด (class id เกินช่วง 0..1 / พิกัดเกิน 0..1 / รูปแบบผิด) ในไฟล์ต่อไปนี้:")
+        report.print_errors(30)
         raise SystemExit("กรุณาแก้ label ให้มีเฉพาะ 0 (crack), 1 (hole) แล้วรันใหม่ครับ")
     else:
         print("[CHECK] labels OK (class id มีเฉพาะ 0/1)")
@@ -61,27 +65,16 @@ def main():
     check_labels(DATA_YAML)
 
     model = YOLO(str(WEIGHTS))
+    attach_telemetry(model)   # เวลาราย epoch → <run dir>/telemetry.jsonl (python train_telemetry.py <run dir>)
 
     run_name = f"{OUT_NAME}_img{IMGSZ}_e{EPOCHS}"
 
-    model.train(
-        data=str(DATA_YAML),
-        epochs=EPOCHS,
-        imgsz=IMGSZ,
-        batch=BATCH,
-        lr0=0.001,
-        optimizer="auto",
-        close_mosaic=5,
-        copy_paste=0.2,
-        patience=20,
-        workers=2,
-        freeze=FREEZE,
-        project="runs",
-        name=run_name,
-        pretrained=True,
-        device=device,
-        verbose=True,
-    )
+    train_kw = {}
+    if (PACKED_CACHE / "index.json").exists():
+        print(f"[INFO] PACKED_CACHE = {PACKED_CACHE}")
+        train_kw["trainer"] = packed_trainer(PACKED_CACHE)
+
+    model.train(**TRAIN_ARGS, name=run_name, device=device, **train_kw)
 
     model.val(
         data=str(DATA_YAML),
@@ -92,12 +85,15 @@ def main():
         device=device,
     )
 
+    # ไม่คัดลอกทับ models/defect_best.pt ตรง ๆ: export + วัด latency + val แล้วเทียบกับตัวที่ใช้อยู่
+    # promote เฉพาะเมื่อ accuracy ไม่ลดและ latency ไม่เพิ่ม (ดู model_promote.py, models/registry.json)
     save_dir = latest_run_dir(f"runs/{run_name}*") or latest_run_dir("runs/*")
     if save_dir and (save_dir / "weights/best.pt").exists():
-        dst = Path("models/defect_best.pt")
-        dst.parent.mkdir(parents=True, exist_ok=True)
-        shutil.copy2(save_dir / "weights/best.pt", dst)
-        print(f"[OK] คัดลอก best.pt -> {dst}")
+        rec = promote(str(save_dir), "defect", data_yaml=str(DATA_YAML))
+        if rec["promoted"]:
+            print(f"[OK] promote best.pt -> models/defect_best.pt (v{rec['version']:03d})")
+        else:
+            print("[WARN] ไม่ promote: " + "; ".join(rec["reason"]))
     else:
         print("[WARN] หา best.pt ไม่เจอ ลองดูที่โฟลเดอร์ runs/ ด้วยตนเองนะครับ")
 
@@ -0,0 +1,225 @@
+# firebase_loadtest.py
+# -*- coding: utf-8 -*-
+# load test ของ sync ขึ้น Firebase กับ fake_rtdb.py (ไม่ต้องต่อเน็ต)
+#
+# - เลียนลำดับเดียวกับ GUI ตอนจบจานหนึ่งใบ (_append_csv_json_and_firebase):
+#   FirebaseClient.put(sessions/<stamp>/meta) แล้ว .post(sessions/<stamp>/records) บน thread เดียวกับ UI
+# - ป้อนจานตามอัตรา --rate (จาน/ชั่วโมง) ผ่านหลายช่วง (phase) ที่ฉีด latency / 5xx / outage ต่างกัน
+# - วัดต่อจาน: เวลาที่ UI ถูกบล็อก (stall), backlog = จานที่ถึงเวลาบันทึกแล้วแต่ยังรออยู่
+#   ต่อ phase: p50/p95/max stall, เฟรมกล้องที่หลุด (stall / frame budget), backlog สูงสุด, error ที่ client log
+#   ท้ายรอบ: เวลาฟื้นตัว (หลัง phase สุดท้ายที่มีปัญหาจบ จน backlog กลับเป็น 0) และ record ที่หายเงียบ (ส่งแล้วไม่ถึง server)
+# - client ไม่มี serviceAccountKey → init Admin SDK ไม่ผ่านทุกครั้ง แล้ว fallback เป็น REST (ค่านี้รวมอยู่ใน stall ด้วย)
+#
+# ใช้งาน:
+#   python firebase_loadtest.py                                  # scenario มาตรฐาน ~6 นาที ที่ 5000 จาน/ชม.
+#   python firebase_loadtest.py --rate 10000 --scale 0.25        # ย่อเวลาทุก phase เหลือ 1/4
+#   python firebase_loadtest.py --phase base:60:latency_ms=80 --phase down:30:outage=hang --phase rec:60
+#   python firebase_loadtest.py --url http://127.0.0.1:9000      # ใช้ fake_rtdb.py ที่รันแยกไว้
+
+import io, os, sys, json, time, random, argparse, contextlib, urllib.request
+from datetime import datetime
+
+import numpy as np
+
+from fake_rtdb import FakeRTDB
+from inspection_core import FirebaseClient
+
+FRAME_MS = 33.3                 # budget ต่อเฟรมของ loop กล้อง (~30 fps)
+SHAPES = ["หัวใจ", "สี่เหลี่ยมผืนผ้า", "วงกลม"]
+DEFECTS = ["รอยแตก", "รูเข็ม"]
+# (ชื่อ, วินาที, faults) ; faults ที่ไม่ระบุ = ค่าปกติ
+DEFAULT_PHASES = [
+    ("baseline", 60, {"latency_ms": 60, "jitter_ms": 40}),
+    ("slow", 60, {"latency_ms": 800, "jitter_ms": 400}),
+    ("errors", 60, {"latency_ms": 60, "error_rate": 0.3}),
+    ("outage_hang", 45, {"outage": "hang"}),
+    ("outage_drop", 30, {"outage": "drop"}),
+    ("recovery", 90, {"latency_ms": 60, "jitter_ms": 40}),
+]
+NORMAL = {"latency_ms": 0, "jitter_ms": 0, "error_rate": 0.0, "outage": None}
+
+
+def parse_phase(text):
+    """"name:sec[:k=v,k=v]" → (name, sec, faults)"""
+    parts = text.split(":", 2)
+    if len(parts) < 2:
+        raise argparse.ArgumentTypeError(f"phase ต้องเป็น name:sec[:k=v,...] ได้ '{text}'")
+    faults = {}
+    for kv in (parts[2].split(",") if len(parts) > 2 and parts[2] else []):
+        k, v = kv.split("=", 1)
+        faults[k] = None if v in ("", "none") else v if k == "outage" else float(v)
+    return parts[0], float(parts[1]), faults
+
+
+def set_faults(url, faults):
+    req = urllib.request.Request(f"{url}/.faults.json", data=json.dumps({**NORMAL, **faults}).encode("utf-8"),
+                                 headers={"Content-Type": "application/json"}, method="PUT")
+    with urllib.request.urlopen(req, timeout=5):
+        pass
+
+
+def get_json(url, path):
+    with urllib.request.urlopen(f"{url}/{path}.json", timeout=30) as r:
+        return json.loads(r.read().decode("utf-8"))
+
+
+class _ClientLog(io.StringIO):
+    """นับบรรทัด [Firebase] ... error ที่ FirebaseClient print ออกมา (client กลืน exception เอง)"""
+
+    def __init__(self):
+        super().__init__()
+        self.counts = {}
+
+    def write(self, s):
+        for key in ("REST PUT error", "REST POST error"):
+            if key in s:
+                self.counts[key] = self.counts.get(key, 0) + 1
+        return len(s)
+
+
+def make_row(now, plate_id, lot_id, rng):
+    n_def = rng.choices([0, 1, 2], weights=[80, 17, 3])[0]
+    return {
+        "date": now.strftime(f"%d/%m/{now.year + 543}"),
+        "time": now.strftime("%H:%M:%S"),
+        "plate_id": plate_id,
+        "lot_id": lot_id,
+        "shape": rng.choice(SHAPES),
+        "defects": " / ".join(rng.sample(DEFECTS, n_def)) or "-",
+        "note": "",
+    }
+
+
+def run(url, phases, rate, lot_size=500, timeout=5, seed=0, log=print):
+    fb = FirebaseClient(url, os.path.join(os.path.dirname(os.path.abspath(__file__)), "_no_service_account.json"),
+                        timeout=timeout)
+    rng = random.Random(seed)
+    interval = 3600.0 / rate
+    samples, client_log = [], _ClientLog()
+    sessions = {}
+    stamp, lot_id, plate_id = None, None, 1
+    t0 = time.perf_counter()
+    i = 0
+    bounds, acc = [], 0.0
+    for name, sec, faults in phases:
+        bounds.append((acc, acc + sec, name, faults))
+        acc += sec
+    phase_idx = -1
+    while True:
+        due = t0 + i * interval
+        if due - t0 >= acc:
+            break
+        now = time.perf_counter()
+        if now < due:
+            time.sleep(due - now)
+            now = due
+        k = next(j for j, b in enumerate(bounds) if b[0] <= now - t0 < b[1]) if now - t0 < acc else len(bounds) - 1
+        if k != phase_idx:
+            phase_idx = k
+            set_faults(url, bounds[k][3])
+            log(f"[{now - t0:7.1f}s] phase {bounds[k][2]}  {bounds[k][3] or 'ปกติ'}")
+        if stamp is None or plate_id > lot_size:                  # ขึ้นล็อตใหม่ = session ใหม่เหมือน reset ใน GUI
+            stamp = f"{datetime.now():%Y%m%d_%H%M%S}_{len(sessions):03d}"
+            lot_id = f"PTP{datetime.now():%y%m%d}_{len(sessions) + 1:02d}"
+            sessions[stamp] = 0
+            plate_id = 1
+        wall = datetime.now()
+        row = make_row(wall, plate_id, lot_id, rng)
+        meta = {"report_title": f"รายงานการตรวจจานใบไม้ วันที่ {wall:%d/%m/%y}", "lot_id": lot_id,
+                "session": {"start_time": "00:00:00", "end_time": wall.strftime("%H:%M:%S")}}
+        s0 = time.perf_counter()
+        with contextlib.redirect_stdout(client_log):
+            fb.put(f"sessions/{stamp}/meta", meta)
+            fb.post(f"sessions/{stamp}/records", row)
+        s1 = time.perf_counter()
+        sessions[stamp] += 1
+        plate_id += 1
+        backlog = max(0, int((s1 - t0) / interval) - i)
+        samples.append({"t": round(now - t0, 3), "phase": bounds[phase_idx][2], "stall_ms": round((s1 - s0) * 1000, 2),
+                        "backlog": backlog})
+        i += 1
+        if i % max(1, int(rate / 360)) == 0:                      # ~ทุก 10 วินาที
+            log(f"[{s1 - t0:7.1f}s] จาน {i}  stall {samples[-1]['stall_ms']:.0f} ms  backlog {backlog}")
+    set_faults(url, {})
+    return samples, sessions, client_log.counts, bounds
+
+
+def summarize(samples, sessions, client_errors, bounds, url, rate):
+    rows = []
+    for start, end, name, faults in bounds:
+        ps = [s for s in samples if s["phase"] == name]
+        st = np.array([s["stall_ms"] for s in ps]) if ps else np.zeros(1)
+        rows.append({"phase": name, "faults": faults, "plates": len(ps),
+                     "stall_p50_ms": float(np.percentile(st, 50)), "stall_p95_ms": float(np.percentile(st, 95)),
+                     "stall_max_ms": float(st.max()), "frames_dropped": int(sum(st // FRAME_MS)),
+                     "max_backlog": max((s["backlog"] for s in ps), default=0)})
+
+    # ฟื้นตัว: นับจากจบ phase สุดท้ายที่มี fault จนจานแรกที่ backlog = 0
+    recovery_s = None
+    faulty = [b for b in bounds if any(b[3].get(k) for k in ("outage", "error_rate")) or b[3].get("latency_ms", 0) > 200]
+    if faulty:
+        end = faulty[-1][1]
+        after = [s for s in samples if s["t"] >= end]
+        first_ok = next((s for s in after if s["backlog"] == 0), None)
+        recovery_s = round(first_ok["t"] - end, 1) if first_ok else None
+
+    stored = {}
+    for stamp in sessions:
+        recs = get_json(url, f"sessions/{stamp}/records") or {}
+        stored[stamp] = len(recs)
+    sent, got = sum(sessions.values()), sum(stored.values())
+    return {"created": datetime.now().isoformat(timespec="seconds"), "rate_per_hour": rate, "phases": rows,
+            "plates_sent": sent, "records_stored": got, "records_lost": sent - got, "client_errors": client_errors,
+            "recovery_s": recovery_s, "server": get_json(url, ".stats")}
+
+
+def print_report(rep):
+    print(f"\n{'phase':<14}{'plates':>7}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}{'frames':>8}{'backlog':>9}")
+    for r in rep["phases"]:
+        print(f"{r['phase']:<14}{r['plates']:>7}{r['stall_p50_ms']:>9.0f}{r['stall_p95_ms']:>9.0f}"
+              f"{r['stall_max_ms']:>9.0f}{r['frames_dropped']:>8}{r['max_backlog']:>9}")
+    rec = "ไม่ฟื้นภายในรอบทดสอบ" if rep["recovery_s"] is None else f"{rep['recovery_s']} s"
+    print(f"\nส่ง {rep['plates_sent']} จาน → server ได้ {rep['records_stored']} (หายเงียบ {rep['records_lost']})"
+          f"  client error {rep['client_errors']}  ฟื้นตัว {rec}")
+    print("frames = เฟรมกล้องที่ loop UI ไม่ได้ประมวลผลระหว่างรอ sync ; backlog = จานที่รอ sync ต่อคิว")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Load-test the Firebase sync path against a local RTDB stand-in")
+    ap.add_argument("--rate", type=float, default=5000, help="จาน/ชั่วโมง")
+    ap.add_argument("--phase", action="append", type=parse_phase, help="name:sec[:k=v,...] (ซ้ำได้ ; แทน scenario มาตรฐาน)")
+    ap.add_argument("--scale", type=float, default=1.0, help="คูณความยาวทุก phase")
+    ap.add_argument("--lot-size", type=int, default=500, help="จานต่อล็อต (= ต่อ session ใน RTDB)")
+    ap.add_argument("--timeout", type=float, default=5, help="timeout ของ FirebaseClient (ค่าเดียวกับ GUI)")
+    ap.add_argument("--url", help="fake_rtdb.py ที่รันไว้แล้ว (ไม่ระบุ = เปิดในโปรเซสนี้)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=os.path.join("runs", "firebase_loadtest"))
+    args = ap.parse_args(argv)
+
+    phases = [(n, s * args.scale, f) for n, s, f in (args.phase or DEFAULT_PHASES)]
+    rtdb = None
+    url = args.url
+    if not url:
+        rtdb = FakeRTDB(hang_max_s=max(s for _, s, _ in phases) + 5).start()
+        url = rtdb.url
+    print(f"[LOADTEST] {url}  {args.rate:.0f} จาน/ชม.  {sum(s for _, s, _ in phases):.0f} s")
+    try:
+        samples, sessions, client_errors, bounds = run(url, phases, args.rate, args.lot_size, args.timeout, args.seed)
+        rep = summarize(samples, sessions, client_errors, bounds, url, args.rate)
+    except KeyboardInterrupt:
+        print("[LOADTEST] หยุด")
+        return 1
+    finally:
+        if rtdb is not None:
+            rtdb.stop()
+    print_report(rep)
+    os.makedirs(args.out, exist_ok=True)
+    path = os.path.join(args.out, f"report_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**rep, "samples": samples}, f, ensure_ascii=False, indent=2)
+    print(f"[LOADTEST] → {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
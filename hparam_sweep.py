@@ -0,0 +1,425 @@
+# hparam_sweep.py
+# -*- coding: utf-8 -*-
+# sweep hyperparameter ของการเทรน shape (yolo_train_2_stage.py) / defect (fine_tune_2_stage.py)
+# แทนการแก้ค่าคงที่ในสคริปต์ทีละรอบ
+#
+# - search space อยู่ในไฟล์ YAML (ตัวอย่าง config/sweep_shape.yaml, config/sweep_defect.yaml)
+#   ค่าที่ไม่ได้ค้นหาใช้ TRAIN_ARGS ของสคริปต์เทรนตาม base
+# - รันหลาย trial พร้อมกันภายใน core budget: ต่อ trial ใช้ threads (torch) + workers (DataLoader) core
+#   แต่ละ trial เป็น process แยก (python hparam_sweep.py --trial ID) log อยู่ที่ runs/sweeps/<ชื่อ>/trial_XXX.log
+# - หยุด trial ที่แย่ก่อนจบ (median stopping): ตั้งแต่ epoch warmup ถ้า fitness ต่ำกว่า median ของ trial อื่น
+#   ที่ epoch เดียวกัน (ต้องมีอย่างน้อย min_peers ตัว) → หยุดเทรน สถานะ pruned
+# - ผลเก็บใน SQLite (runs/sweeps.db): params, fitness ราย epoch, mAP, recall ต่อคลาส, latency CPU
+#   latency วัดหลังทุก trial เทรนเสร็จ ทีละโมเดลในโปรเซสหลัก (เครื่องว่าง) ไม่ใช่ใน trial ที่ยังแย่ง core กันอยู่
+#   หยุดกลางคันแล้วรันคำสั่งเดิมซ้ำ = ทำต่อเฉพาะ trial ที่ยังไม่เสร็จ
+# - รายงาน: เรียงตาม mAP50-95 และ mark Pareto front ของ mAP50-95 vs latency
+#
+# ใช้งาน:
+#   python hparam_sweep.py config/sweep_shape.yaml --cores 16 --threads 4 --workers 2
+#   python hparam_sweep.py --report sweep_shape
+#   python hparam_sweep.py --list
+
+import os, sys, json, math, time, random, sqlite3, argparse, itertools, importlib, subprocess, statistics
+from datetime import datetime
+
+import yaml
+
+BASES = {"shape": "yolo_train_2_stage", "defect": "fine_tune_2_stage"}
+DB_PATH = os.path.join("runs", "sweeps.db")
+SWEEP_DIR = os.path.join("runs", "sweeps")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweeps (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE, base TEXT, config TEXT, created TEXT);
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY, sweep_id INTEGER, params TEXT, status TEXT,
+    started TEXT, finished TEXT, epochs_done INTEGER DEFAULT 0, best_fitness REAL,
+    map50 REAL, map50_95 REAL, recall TEXT, latency_ms REAL, save_dir TEXT, error TEXT);
+CREATE TABLE IF NOT EXISTS epochs (
+    trial_id INTEGER, epoch INTEGER, fitness REAL, PRIMARY KEY (trial_id, epoch));
+"""
+
+
+def connect(db_path=DB_PATH):
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    con = sqlite3.connect(db_path, timeout=30)
+    con.row_factory = sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")      # trial หลาย process เขียนพร้อมกันได้
+    con.executescript(SCHEMA)
+    return con
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# -----------------------------
+# search space
+# -----------------------------
+def load_sweep(path):
+    """อ่าน + validate ไฟล์ sweep → dict ; ผิดรูปแบบ → ValueError"""
+    with open(path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f) or {}
+    cfg.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    cfg.setdefault("trials", 8)
+    cfg.setdefault("sampler", "random")
+    cfg.setdefault("seed", 0)
+    cfg.setdefault("epochs", None)
+    cfg.setdefault("device", "cpu")
+    cfg.setdefault("latency_frames", 20)
+    prune = cfg.setdefault("prune", {})
+    prune.setdefault("warmup", 5)
+    prune.setdefault("min_peers", 2)
+
+    if cfg.get("base") not in BASES:
+        raise ValueError(f"base ต้องเป็น {' / '.join(BASES)} (ได้ {cfg.get('base')!r})")
+    if cfg["sampler"] not in ("random", "grid"):
+        raise ValueError(f"sampler ต้องเป็น random / grid (ได้ {cfg['sampler']!r})")
+    space = cfg.get("space")
+    if not isinstance(space, dict) or not space:
+        raise ValueError("ต้องมี space: {ชื่อ argument: [ตัวเลือก] หรือ {low, high, log, int}}")
+    for key, spec in space.items():
+        if isinstance(spec, list):
+            if not spec:
+                raise ValueError(f"space.{key}: รายการว่าง")
+        elif isinstance(spec, dict):
+            if "low" not in spec or "high" not in spec or spec["low"] >= spec["high"]:
+                raise ValueError(f"space.{key}: ต้องมี low < high")
+            if spec.get("log") and spec["low"] <= 0:
+                raise ValueError(f"space.{key}: log ต้องมี low > 0")
+            if cfg["sampler"] == "grid":
+                raise ValueError(f"space.{key}: sampler grid รับเฉพาะรายการตัวเลือก")
+        else:
+            raise ValueError(f"space.{key}: ต้องเป็นรายการหรือ {{low, high}}")
+    return cfg
+
+
+def _sample_one(spec, rng):
+    if isinstance(spec, list):
+        return rng.choice(spec)
+    lo, hi = spec["low"], spec["high"]
+    if spec.get("log"):
+        v = 10 ** rng.uniform(math.log10(lo), math.log10(hi))
+    else:
+        v = rng.uniform(lo, hi)
+    return int(round(v)) if spec.get("int") else round(v, 6)
+
+
+def sample_trials(cfg):
+    """รายการ params ของทุก trial (ไม่ซ้ำกัน) ; grid = ทุกชุด (สลับลำดับด้วย seed) ตัดที่ trials ถ้ากำหนด"""
+    space, rng = cfg["space"], random.Random(cfg["seed"])
+    keys = sorted(space)
+    if cfg["sampler"] == "grid":
+        combos = [dict(zip(keys, vals)) for vals in itertools.product(*(space[k] for k in keys))]
+        rng.shuffle(combos)
+        return combos[:cfg["trials"]] if cfg["trials"] else combos
+    out, seen = [], set()
+    for _ in range(cfg["trials"] * 50):
+        p = {k: _sample_one(space[k], rng) for k in keys}
+        sig = json.dumps(p, sort_keys=True)
+        if sig not in seen:
+            seen.add(sig)
+            out.append(p)
+        if len(out) >= cfg["trials"]:
+            break
+    return out
+
+
+# -----------------------------
+# runner (process หลัก)
+# -----------------------------
+def create_or_resume(con, cfg, retry_failed=False):
+    row = con.execute("SELECT id FROM sweeps WHERE name=?", (cfg["name"],)).fetchone()
+    if row is not None:
+        sweep_id = row["id"]
+        # trial ที่ค้าง running จากรอบที่ถูก kill → รันใหม่
+        con.execute("UPDATE trials SET status='pending' WHERE sweep_id=? AND status='running'", (sweep_id,))
+        if retry_failed:
+            con.execute("UPDATE trials SET status='pending' WHERE sweep_id=? AND status='failed'", (sweep_id,))
+        con.commit()
+        return sweep_id, False
+    cur = con.execute("INSERT INTO sweeps (name, base, config, created) VALUES (?, ?, ?, ?)",
+                      (cfg["name"], cfg["base"], json.dumps(cfg, ensure_ascii=False), _now()))
+    sweep_id = cur.lastrowid
+    con.executemany("INSERT INTO trials (sweep_id, params, status) VALUES (?, ?, 'pending')",
+                    [(sweep_id, json.dumps(p, sort_keys=True)) for p in sample_trials(cfg)])
+    con.commit()
+    return sweep_id, True
+
+
+def run_sweep(cfg, db_path=DB_PATH, cores=None, threads=4, workers=2, retry_failed=False, poll=2.0):
+    con = connect(db_path)
+    sweep_id, created = create_or_resume(con, cfg, retry_failed)
+    cores = cores or os.cpu_count() or 1
+    slots = max(1, cores // (threads + workers))
+    log_dir = os.path.join(SWEEP_DIR, cfg["name"])
+    os.makedirs(log_dir, exist_ok=True)
+    pending = [r["id"] for r in con.execute(
+        "SELECT id FROM trials WHERE sweep_id=? AND status='pending' ORDER BY id", (sweep_id,))]
+    print(f"[SWEEP] {cfg['name']} ({'ใหม่' if created else 'ทำต่อ'}) base={cfg['base']} "
+          f"รอรัน {len(pending)} trial, พร้อมกัน {slots} (cores={cores}, threads={threads}, workers={workers})")
+
+    env = dict(os.environ)
+    for k in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        env[k] = str(threads)
+    running = {}
+    try:
+        while pending or running:
+            while pending and len(running) < slots:
+                tid = pending.pop(0)
+                log = open(os.path.join(log_dir, f"trial_{tid:03d}.log"), "w", encoding="utf-8")
+                cmd = [sys.executable, os.path.abspath(__file__), "--trial", str(tid), "--db", db_path,
+                       "--threads", str(threads), "--workers", str(workers)]
+                running[tid] = (subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT), log)
+                print(f"[SWEEP] เริ่ม trial {tid}")
+            time.sleep(poll)
+            for tid, (proc, log) in list(running.items()):
+                rc = proc.poll()
+                if rc is None:
+                    continue
+                log.close()
+                del running[tid]
+                row = con.execute("SELECT status, map50_95 FROM trials WHERE id=?", (tid,)).fetchone()
+                if row["status"] not in ("done", "pruned", "failed"):    # process ตายก่อนบันทึกผล
+                    con.execute("UPDATE trials SET status='failed', finished=?, error=? WHERE id=?",
+                                (_now(), f"exit code {rc}", tid))
+                    con.commit()
+                    print(f"[SWEEP] trial {tid} failed (exit {rc}) ดู {log.name}")
+                else:
+                    print(f"[SWEEP] trial {tid} {row['status']}"
+                          + (f" mAP50-95={row['map50_95']:.4f}" if row["map50_95"] is not None else ""))
+    except KeyboardInterrupt:
+        print("[SWEEP] หยุด: รอ trial ที่กำลังรันปิดตัว (รันคำสั่งเดิมอีกครั้งเพื่อทำต่อ)")
+        for proc, log in running.values():
+            proc.terminate()
+        for proc, log in running.values():
+            proc.wait()
+            log.close()
+        con.execute("UPDATE trials SET status='pending' WHERE sweep_id=? AND status='running'", (sweep_id,))
+        con.commit()
+    else:
+        bench_trials(con, cfg, sweep_id, threads)
+    print_report(con, cfg["name"])
+    con.close()
+
+
+def _trial_args(base, params, cfg):
+    mod = importlib.import_module(BASES[base])
+    args = dict(mod.TRAIN_ARGS)
+    args.update(params)
+    if cfg.get("epochs"):
+        args["epochs"] = int(cfg["epochs"])
+    return mod, args
+
+
+def bench_trials(con, cfg, sweep_id, threads=4):
+    """latency ของ trial ที่ done แต่ยังไม่มีค่า: วัดทีละโมเดลหลังไม่มี trial ไหนเทรนอยู่ (ผลไม่ขึ้นกับการจัดคิว)"""
+    rows = con.execute("SELECT id, params, save_dir FROM trials WHERE sweep_id=? AND status='done' "
+                       "AND latency_ms IS NULL ORDER BY id", (sweep_id,)).fetchall()
+    if not rows:
+        return
+    import torch
+    from ultralytics import YOLO
+    from model_eval import fixed_frames, bench_latency, split_for_eval
+
+    torch.set_num_threads(threads)      # threads เท่ากันทุก trial → เทียบกันได้
+    device = cfg.get("device", "cpu")
+    print(f"[SWEEP] วัด latency {len(rows)} trial (ทีละตัว, torch threads={threads})")
+    for r in rows:
+        _, args = _trial_args(cfg["base"], json.loads(r["params"]), cfg)
+        best = os.path.join(r["save_dir"], "weights", "best.pt")
+        model = YOLO(best if os.path.isfile(best) else os.path.join(r["save_dir"], "weights", "last.pt"))
+        frames = fixed_frames(args["data"], split_for_eval(args["data"]), cfg["latency_frames"])
+        lat = bench_latency(model, frames, args["imgsz"], device=device)
+        con.execute("UPDATE trials SET latency_ms=? WHERE id=?", (lat["median_ms"], r["id"]))
+        con.commit()
+        print(f"[SWEEP] trial {r['id']} latency={_fmt(lat['median_ms'], '.1f')} ms")
+
+
+# -----------------------------
+# trial (process ลูก)
+# -----------------------------
+class MedianPruner:
+    """callback on_fit_epoch_end: บันทึก fitness ต่อ epoch แล้วหยุด trial ที่ต่ำกว่า median ของ trial อื่น"""
+
+    def __init__(self, db_path, trial_id, sweep_id, warmup=5, min_peers=2):
+        self.db_path = db_path
+        self.trial_id = trial_id
+        self.sweep_id = sweep_id
+        self.warmup = warmup
+        self.min_peers = min_peers
+        self.pruned = False
+        self._last_epoch = 0
+
+    def __call__(self, trainer):
+        epoch = int(trainer.epoch) + 1
+        if epoch <= self._last_epoch:
+            return          # final_eval() เรียก on_fit_epoch_end ซ้ำหลัง epoch สุดท้าย
+        self._last_epoch = epoch
+        fitness = float(trainer.fitness or 0.0)
+        con = connect(self.db_path)
+        try:
+            con.execute("INSERT OR REPLACE INTO epochs (trial_id, epoch, fitness) VALUES (?, ?, ?)",
+                        (self.trial_id, epoch, fitness))
+            con.execute("UPDATE trials SET epochs_done=?, best_fitness=MAX(COALESCE(best_fitness, 0), ?) "
+                        "WHERE id=?", (epoch, fitness, self.trial_id))
+            con.commit()
+            # epoch สุดท้าย / early stop ของ ultralytics เอง = trial จบครบแล้ว ไม่ใช่ถูก prune
+            if epoch < self.warmup or trainer.stop or epoch >= trainer.epochs:
+                return
+            peers = [r[0] for r in con.execute(
+                "SELECT e.fitness FROM epochs e JOIN trials t ON t.id = e.trial_id "
+                "WHERE t.sweep_id=? AND e.trial_id<>? AND e.epoch=?", (self.sweep_id, self.trial_id, epoch))]
+        finally:
+            con.close()
+        if len(peers) >= self.min_peers and fitness < statistics.median(peers):
+            print(f"[SWEEP] prune ที่ epoch {epoch}: fitness {fitness:.4f} < median {statistics.median(peers):.4f}")
+            self.pruned = True
+            trainer.stop = True
+
+
+def run_trial(db_path, trial_id, threads=4, workers=2):
+    import torch
+    from ultralytics import YOLO
+    from packed_dataset import packed_trainer
+    from train_cache import default_cache_dir, INDEX_NAME
+    from model_eval import eval_metrics, split_for_eval
+
+    torch.set_num_threads(threads)
+    con = connect(db_path)
+    row = con.execute("SELECT t.*, s.name AS sweep_name, s.base, s.config FROM trials t "
+                      "JOIN sweeps s ON s.id = t.sweep_id WHERE t.id=?", (trial_id,)).fetchone()
+    cfg, params = json.loads(row["config"]), json.loads(row["params"])
+    con.execute("UPDATE trials SET status='running', started=?, error=NULL WHERE id=?", (_now(), trial_id))
+    con.commit()
+    con.close()
+
+    def _finish(**cols):
+        c = connect(db_path)
+        sets = ", ".join(f"{k}=?" for k in cols)
+        c.execute(f"UPDATE trials SET {sets}, finished=? WHERE id=?", (*cols.values(), _now(), trial_id))
+        c.commit()
+        c.close()
+
+    try:
+        mod, args = _trial_args(row["base"], params, cfg)
+        device = cfg.get("device", "cpu")
+        args.update(project=os.path.abspath(os.path.join(SWEEP_DIR, row["sweep_name"])),
+                    name=f"trial_{trial_id:03d}", exist_ok=True, device=device,
+                    workers=min(int(args.get("workers", workers)), workers), plots=False, verbose=False)
+        # ไม่ใช้ cache="ram": หลาย trial พร้อมกันจะถือรูปทั้งชุดคนละก้อน ; ใช้ memmap cache ถ้า build ไว้
+        args.pop("cache", None)
+        cache_dir = default_cache_dir(args["data"], args["imgsz"])
+        if os.path.isfile(os.path.join(cache_dir, INDEX_NAME)):
+            args.update(cache=False, trainer=packed_trainer(cache_dir))
+        if row["base"] == "shape":
+            init = mod.WEIGHTS_OLD if mod.WEIGHTS_OLD.exists() else mod.WEIGHTS_S
+        else:
+            init = mod.WEIGHTS
+        print(f"[TRIAL {trial_id}] params={params} init={init}")
+
+        model = YOLO(str(init))
+        pruner = MedianPruner(db_path, trial_id, row["sweep_id"], **cfg["prune"])
+        model.add_callback("on_fit_epoch_end", pruner)
+        model.train(**args)
+        save_dir = str(model.trainer.save_dir)
+        if pruner.pruned:
+            _finish(status="pruned", save_dir=save_dir)
+            return 0
+
+        best = os.path.join(save_dir, "weights", "best.pt")
+        trained = YOLO(best if os.path.isfile(best) else os.path.join(save_dir, "weights", "last.pt"))
+        split = split_for_eval(args["data"])
+        m = eval_metrics(trained, args["data"], split=split, imgsz=args["imgsz"], device=device,
+                         batch=args.get("batch", 8))
+        recall = {k: v["r"] for k, v in m["per_class"].items()}
+        # latency วัดทีหลังใน bench_trials : ตอนนี้ trial อื่นยังเทรนอยู่บน core เดียวกัน
+        _finish(status="done", map50=m["map50"], map50_95=m["map50_95"], recall=json.dumps(recall),
+                save_dir=save_dir)
+        return 0
+    except Exception as e:
+        _finish(status="failed", error=f"{type(e).__name__}: {e}")
+        raise
+
+
+# -----------------------------
+# รายงาน
+# -----------------------------
+def pareto_front(rows):
+    """id ของ trial ที่ไม่มี trial อื่นดีกว่าทั้ง mAP50-95 (มากกว่า) และ latency (น้อยกว่า)"""
+    pts = [(r["id"], r["map50_95"], r["latency_ms"]) for r in rows
+           if r["map50_95"] is not None and r["latency_ms"] is not None]
+    front = set()
+    for i, acc, lat in pts:
+        dominated = any(a >= acc and l <= lat and (a > acc or l < lat) for j, a, l in pts if j != i)
+        if not dominated:
+            front.add(i)
+    return front
+
+
+def _fmt(v, spec):
+    return format(v, spec) if v is not None else "-"
+
+
+def print_report(con, name):
+    sw = con.execute("SELECT * FROM sweeps WHERE name=?", (name,)).fetchone()
+    if sw is None:
+        print(f"ไม่พบ sweep {name}")
+        return
+    rows = con.execute("SELECT * FROM trials WHERE sweep_id=? ORDER BY map50_95 IS NULL, map50_95 DESC, id",
+                       (sw["id"],)).fetchall()
+    front = pareto_front(rows)
+    counts = {}
+    for r in rows:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    print(f"\n[SWEEP] {name} base={sw['base']}  " + "  ".join(f"{k} {v}" for k, v in sorted(counts.items())))
+    print(f"  {'':1}{'id':>4} {'status':<8}{'ep':>4}{'mAP50-95':>10}{'mAP50':>8}{'lat ms':>8}  recall / params")
+    for r in rows:
+        mark = "*" if r["id"] in front else " "
+        recall = json.loads(r["recall"]) if r["recall"] else {}
+        rec = " ".join(f"{k}={v:.2f}" for k, v in recall.items())
+        print(f"  {mark}{r['id']:>4} {r['status']:<8}{r['epochs_done'] or 0:>4}{_fmt(r['map50_95'], '.4f'):>10}"
+              f"{_fmt(r['map50'], '.4f'):>8}{_fmt(r['latency_ms'], '.1f'):>8}  {rec}  {r['params']}")
+    if front:
+        print("  * = Pareto front (mAP50-95 สูงสุดที่ latency นั้น)")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Parallel hyperparameter sweep for the shape/defect training scripts")
+    ap.add_argument("config", nargs="?", help="ไฟล์ sweep YAML (เช่น config/sweep_shape.yaml)")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--cores", type=int, default=None, help="จำนวน core ที่ให้ sweep ใช้ (ค่าเริ่มต้น = ทั้งเครื่อง)")
+    ap.add_argument("--threads", type=int, default=4, help="torch threads ต่อ trial")
+    ap.add_argument("--workers", type=int, default=2, help="DataLoader workers ต่อ trial")
+    ap.add_argument("--retry-failed", action="store_true", help="ทำต่อ sweep เดิมโดยรัน trial ที่ failed ใหม่ด้วย")
+    ap.add_argument("--report", metavar="NAME", help="แสดงผลของ sweep")
+    ap.add_argument("--list", action="store_true", help="รายชื่อ sweep ใน DB")
+    ap.add_argument("--trial", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+
+    if args.trial is not None:
+        return run_trial(args.db, args.trial, args.threads, args.workers)
+    if args.list or args.report:
+        con = connect(args.db)
+        if args.list:
+            for r in con.execute("SELECT s.name, s.base, s.created, COUNT(t.id) AS n FROM sweeps s "
+                                 "LEFT JOIN trials t ON t.sweep_id = s.id GROUP BY s.id ORDER BY s.id"):
+                print(f"{r['name']:<30} {r['base']:<7} {r['created']}  {r['n']} trial")
+        if args.report:
+            print_report(con, args.report)
+        con.close()
+        return 0
+    if not args.config:
+        ap.error("ต้องระบุไฟล์ sweep หรือ --report / --list")
+    try:
+        cfg = load_sweep(args.config)
+    except (OSError, ValueError) as e:
+        print(f"[SWEEP] config ไม่ถูกต้อง: {e}")
+        return 2
+    run_sweep(cfg, args.db, cores=args.cores, threads=args.threads, workers=args.workers,
+              retry_failed=args.retry_failed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+# inspection_core/__init__.py
+# -*- coding: utf-8 -*-
+# แกนการตรวจจานที่ทุก GUI ใช้ร่วมกัน (GUI เหลือแค่ส่วนแสดงผล/นับ/export)
+#
+#   capture      : open_source / CaptureSource (capture_backend.py)
+#   pipelines    : SingleModelPipeline (โมเดลเดียว) / TwoStagePipeline (shape + defect) → InspectionResult
+#   detections   : แปลงผล YOLO, NMS, กรองตำหนิในกรอบจาน, geometry hint
+#   annotate     : วาดกล่องลงเฟรม
+#   gating       : PlateSession = PlateTracker + หลักฐานตำหนิต่อจาน (DefectEvidence)
+#   firebase     : FirebaseClient (Admin SDK + REST fallback)
+#   process_pool : ProcessInferencePool (replica ของโมเดลหลาย process บน CPU หลาย core)
+#   frame_ring   : SharedFrameRing (เฟรมใน shared memory ส่งข้าม process แค่ slot index)
+#   mining       : HardExampleMiner (เก็บเฟรมที่โมเดลไม่แน่ใจไว้เทรนต่อ แบบ async + dedup)
+#   services     : AppServices (captures/ + retention + mining + Firebase + กล้องจาก env) ; cv2 / YOLO แบบ lazy
+# ปรับปรุงที่นี่ที่เดียว → ได้ผลทุก GUI
+
+from capture_backend import open_source, CaptureSource
+
+from .detections import result_dets, nms_dets, union_box, dets_in_box, shape_hint_from_geometry, GeometryHintCache
+from .pipelines import InspectionResult, InspectionPipeline, SingleModelPipeline, TwoStagePipeline
+from .annotate import annotate, draw_dets
+from .gating import PlateSession, PlateUpdate
+from .firebase import FirebaseClient
+from .process_pool import ProcessInferencePool, build_spec
+from .frame_ring import SharedFrameRing
+from .mining import HardExampleMiner
+from .services import AppServices, cv2, YOLO
+
+__all__ = [
+    "open_source", "CaptureSource",
+    "result_dets", "nms_dets", "union_box", "dets_in_box", "shape_hint_from_geometry", "GeometryHintCache",
+    "InspectionResult", "InspectionPipeline", "SingleModelPipeline", "TwoStagePipeline",
+    "annotate", "draw_dets",
+    "PlateSession", "PlateUpdate",
+    "FirebaseClient",
+    "ProcessInferencePool", "build_spec",
+    "SharedFrameRing",
+    "HardExampleMiner",
+    "AppServices", "cv2", "YOLO",
+]
@@ -0,0 +1,31 @@
+# inspection_core/annotate.py
+# -*- coding: utf-8 -*-
+# วาดผลตรวจลงเฟรม (สีเป็น BGR ตาม OpenCV ; แต่ละ GUI ส่งสีของตัวเองได้)
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+SHAPE_COLOR = (0, 140, 255)
+SHAPE_TEXT_COLOR = (10, 90, 255)
+DEFECT_COLOR = (0, 0, 255)
+DEFECT_TEXT_COLOR = (20, 20, 255)
+
+
+def draw_dets(img, dets, color, text_color=None, names=None):
+    """วาดกล่อง + ป้าย "label conf" ลง img (in-place) ; names = แมปชื่อที่แสดง"""
+    text_color = color if text_color is None else text_color
+    for (x1, y1, x2, y2), label, p in dets:
+        text = names.get(label, label) if names else label
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, 2)
+        cv2.putText(img, f"{text} {p:.2f}", (x1, max(20, y1 - 6)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, text_color, 2, cv2.LINE_AA)
+    return img
+
+
+def annotate(frame, result, shape_color=SHAPE_COLOR, shape_text_color=SHAPE_TEXT_COLOR,
+             defect_color=DEFECT_COLOR, defect_text_color=DEFECT_TEXT_COLOR, shape_names=None):
+    """สำเนาเฟรมพร้อมกล่องรูปทรง (เฉพาะที่มั่นใจ) และกล่องตำหนิ"""
+    out = frame.copy()
+    draw_dets(out, result.shapes(), shape_color, shape_text_color, shape_names)
+    draw_dets(out, result.defect_dets, defect_color, defect_text_color)
+    return out
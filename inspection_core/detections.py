@@ -0,0 +1,266 @@
+# inspection_core/detections.py
+# -*- coding: utf-8 -*-
+# post-processing ของกล่องตรวจจับ ใช้รูปแบบเดียวทั้งระบบ: det = (xyxy [int x4], label, conf)
+#
+# Benchmark geometry hint (ความละเอียดเต็ม vs ย่อ vs ย่อ + cache):
+#   python -m inspection_core.detections --frames 200 --shapes 4
+
+import sys, time, argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+
+def result_dets(res, names, keep=None, rename=None):
+    """ผล ultralytics ของภาพหนึ่งใบ → [(xyxy, label, conf)] ; keep = ชื่อคลาสที่เอา, rename = แมปชื่อคลาส→ชื่อสั้น"""
+    boxes = getattr(res, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return []
+    xyxy = boxes.xyxy.cpu().numpy().astype(int)
+    clss = boxes.cls.cpu().numpy().astype(int)
+    conf = boxes.conf.cpu().numpy()
+    out = []
+    for box, c, p in zip(xyxy, clss, conf):
+        label = names.get(int(c), str(c))
+        if keep is not None and label not in keep:
+            continue
+        if rename:
+            label = rename.get(label, label)
+        out.append(([int(v) for v in box], label, float(p)))
+    return out
+
+
+def box_iou(a, b):
+    iw = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    ih = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = iw * ih
+    union = max(0.0, a[2] - a[0]) * max(0.0, a[3] - a[1]) + max(0.0, b[2] - b[0]) * max(0.0, b[3] - b[1]) - inter
+    return (inter / union) if union > 0 else 0.0
+
+
+def nms_dets(dets, iou_thr, class_wise=False):
+    """greedy NMS ตาม conf ; class_wise=False = กล่องคนละคลาสที่ทับกันก็ตัด (กัน multi-class บนจานเดียว)"""
+    kept = []
+    for d in sorted(dets, key=lambda d: d[2], reverse=True):
+        if any((not class_wise or k[1] == d[1]) and box_iou(d[0], k[0]) >= iou_thr for k in kept):
+            continue
+        kept.append(d)
+    return kept
+
+
+def union_box(boxes):
+    if not boxes:
+        return None
+    xs = np.asarray(boxes)
+    return [int(xs[:, 0].min()), int(xs[:, 1].min()), int(xs[:, 2].max()), int(xs[:, 3].max())]
+
+
+def dets_in_box(box, dets, margin=0.05):
+    """เลือกเฉพาะกล่องที่จุดศูนย์กลางอยู่ในกรอบ box (ขยายขอบเล็กน้อย)"""
+    x1, y1, x2, y2 = box
+    mx, my = (x2 - x1) * margin, (y2 - y1) * margin
+    out = []
+    for d in dets:
+        bx1, by1, bx2, by2 = d[0]
+        cx, cy = (bx1 + bx2) / 2, (by1 + by2) / 2
+        if x1 - mx <= cx <= x2 + mx and y1 - my <= cy <= y2 + my:
+            out.append(d)
+    return out
+
+
+HINT_SIDE = 128   # ด้านยาวของ ROI ที่ใช้หาเส้นขอบ (ค่าที่ใช้ตัดสินเป็นอัตราส่วน ไม่ขึ้นกับขนาดภาพ)
+
+
+def shape_hint_from_geometry(roi_bgr, side=HINT_SIDE):
+    """
+    เดารูปทรงจากเส้นขอบ (circularity / rectangularity / aspect ratio) → "circle"/"rectangle"/"heart"/None
+    side : ย่อ ROI ให้ด้านยาวเหลือประมาณเท่านี้ก่อน blur/threshold/findContours (None = ความละเอียดเดิม)
+           ย่อด้วยการข้าม pixel (stride) ก่อนแปลงเป็น gray ซึ่งถูกกว่า resize แบบ INTER_AREA ของภาพ 3 ช่องมาก
+    """
+    if roi_bgr is None or roi_bgr.size == 0:
+        return None
+    try:
+        min_area = 50.0
+        step = -(-max(roi_bgr.shape[:2]) // side) if side else 1
+        if step > 1:
+            roi_bgr = np.ascontiguousarray(roi_bgr[::step, ::step])
+            min_area /= step * step
+        gray = cv2.cvtColor(roi_bgr, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, (5, 5), 0)
+        thr = cv2.threshold(gray, 0, 255, cv2.THRESH_OTSU | cv2.THRESH_BINARY_INV)[1]
+        cnts, _ = cv2.findContours(thr, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not cnts:
+            return None
+        c = max(cnts, key=cv2.contourArea)
+        A = cv2.contourArea(c)
+        if A < min_area:   # เลี่ยงจุดรบกวนเล็ก ๆ
+            return None
+        P = cv2.arcLength(c, True) + 1e-6
+        circularity = 4.0 * np.pi * A / (P * P)  # ~1.0 = กลม
+
+        x, y, w, h = cv2.boundingRect(c)
+        rect_area = float(w * h) + 1e-6
+        rectangularity = A / rect_area         # ~1.0 = เติมเต็มสี่เหลี่ยม
+        ar = w / float(h)
+
+        # เกณฑ์หยาบที่ใช้งานจริงได้ดี
+        if circularity > 0.80 and 0.85 <= ar <= 1.15:
+            return "circle"
+        if rectangularity > 0.86 and (ar < 0.80 or ar > 1.20):
+            return "rectangle"
+        if circularity < 0.78 and rectangularity < 0.88:
+            return "heart"
+    except Exception:
+        pass
+    return None
+
+
+class GeometryHintCache:
+    """
+    cache ผล geometry hint ต่อจาน โดยใช้กรอบเป็นลายเซ็น: กล่องที่ IoU กับกล่องที่เคยคำนวณ >= iou
+    ใช้ผลเดิม (จานเดียวกันที่ขยับเล็กน้อย) ; ขยับมาก / ครบ max_age เฟรม → คำนวณใหม่
+      max_entries : จำนวนจานที่จำ (LRU)
+    """
+
+    def __init__(self, iou=0.85, max_age=30, max_entries=16):
+        self.iou = iou
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries = OrderedDict()    # key -> [box, hint, age]
+        self._next_key = 0
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._entries.clear()
+
+    def get(self, frame, box, side=HINT_SIDE):
+        best_key, best_iou = None, self.iou
+        for key, (cbox, _, _) in self._entries.items():
+            v = box_iou(box, cbox)
+            if v >= best_iou:
+                best_key, best_iou = key, v
+        if best_key is not None:
+            entry = self._entries[best_key]
+            entry[2] += 1
+            if entry[2] <= self.max_age:
+                self._entries.move_to_end(best_key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[best_key]
+
+        self.misses += 1
+        hint = shape_hint_from_geometry(crop(frame, box), side)
+        self._entries[self._next_key] = [list(box), hint, 0]
+        self._next_key += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return hint
+
+
+def crop(frame, box):
+    h, w = frame.shape[:2]
+    x1, y1, x2, y2 = box
+    return frame[max(0, y1):min(h, y2), max(0, x1):min(w, x2)]
+
+
+def apply_geometry_hint(frame, shape_dets, low=0.62, high=0.78, cache=None, side=HINT_SIDE):
+    """
+    แก้ชื่อรูปทรงด้วย geometry hint เฉพาะกล่องที่โมเดลยังไม่มั่นใจ (conf < high)
+      - conf < low            : เชื่อ hint เต็มที่
+      - low <= conf < high    : ใช้ hint ถ้าขัดกับที่โมเดลทำนาย
+    cache = GeometryHintCache (None = คำนวณทุกกล่องทุกเฟรม)
+    """
+    out = []
+    for box, label, p in shape_dets:
+        if p < high:
+            if cache is not None:
+                hint = cache.get(frame, box, side)
+            else:
+                hint = shape_hint_from_geometry(crop(frame, box), side)
+            if hint is not None and (p < low or hint != label):
+                label = hint
+        out.append((box, label, p))
+    return out
+
+
+# ---------------- benchmark ----------------
+def _synthetic_frames(n_frames, n_shapes, size=(540, 960), seed=0):
+    """เฟรมจำลอง: จานสีเข้มบนพื้นสว่าง (วงกลม/สี่เหลี่ยม/หัวใจ) ขยับเล็กน้อยทีละเฟรม → (frame, [(box, label)])"""
+    rng = np.random.default_rng(seed)
+    h, w = size
+    kinds = ["circle", "rectangle", "heart"]
+    cols = max(1, n_shapes)
+    plates = []
+    for i in range(n_shapes):
+        r = int(min(h * 0.35, w / cols * 0.4))
+        plates.append([kinds[i % 3], (i + 0.5) * w / cols, h / 2.0, r])
+    for _ in range(n_frames):
+        frame = np.full((h, w, 3), 200, np.uint8)
+        frame += rng.integers(0, 20, frame.shape, dtype=np.uint8)
+        truth = []
+        for pl in plates:
+            kind, cx, cy, r = pl
+            pl[1] = cx + rng.uniform(-1.5, 1.5)
+            pl[2] = cy + rng.uniform(-1.5, 1.5)
+            c = (int(cx), int(cy))
+            if kind == "circle":
+                cv2.circle(frame, c, r, (60, 70, 60), -1)
+            elif kind == "rectangle":
+                cv2.rectangle(frame, (c[0] - r, c[1] - r // 2), (c[0] + r, c[1] + r // 2), (60, 70, 60), -1)
+            else:
+                t = np.linspace(0, 2 * np.pi, 120)
+                hx = 16 * np.sin(t) ** 3
+                hy = -(13 * np.cos(t) - 5 * np.cos(2 * t) - 2 * np.cos(3 * t) - np.cos(4 * t))
+                pts = np.stack([c[0] + hx * r / 17.0, c[1] + hy * r / 17.0], 1).astype(np.int32)
+                cv2.fillPoly(frame, [pts], (60, 70, 60))
+            pad = int(r * 0.15)
+            truth.append(([c[0] - r - pad, c[1] - r - pad, c[0] + r + pad, c[1] + r + pad], kind))
+        yield frame, truth
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="benchmark geometry shape hint")
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--shapes", type=int, default=4, help="จำนวนจาน conf ต่ำต่อเฟรม")
+    ap.add_argument("--side", type=int, default=HINT_SIDE)
+    ap.add_argument("--size", default="1920x1080", help="ขนาดเฟรม WxH")
+    args = ap.parse_args(argv)
+
+    w, h = (int(v) for v in args.size.lower().split("x"))
+    frames = list(_synthetic_frames(args.frames, args.shapes, size=(h, w)))
+    # ทุกกล่องให้ conf ต่ำกว่า low → ทุกกล่องต้องใช้ hint
+    modes = [
+        ("full-res", dict(side=None)),
+        (f"side={args.side}", dict(side=args.side)),
+        (f"side={args.side}+cache", dict(side=args.side, cache=GeometryHintCache())),
+    ]
+    baseline = None
+    for name, kw in modes:
+        labels, correct = [], 0
+        t0 = time.perf_counter()
+        for frame, truth in frames:
+            dets = [(box, None, 0.3) for box, _ in truth]
+            out = apply_geometry_hint(frame, dets, **kw)
+            labels.append([d[1] for d in out])
+            correct += sum(d[1] == kind for d, (_, kind) in zip(out, truth))
+        ms = (time.perf_counter() - t0) * 1000.0 / len(frames)
+        total = sum(len(t) for _, t in frames)
+        line = f"{name:<22} {ms:7.2f} ms/frame  ถูก {correct}/{total}"
+        if baseline is None:
+            baseline = labels
+        else:
+            same = sum(a == b for la, lb in zip(labels, baseline) for a, b in zip(la, lb))
+            line += f"  ตรงกับ full-res {same}/{total}"
+        cache = kw.get("cache")
+        if cache is not None:
+            line += f"  cache hit {cache.hits}/{cache.hits + cache.misses}"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
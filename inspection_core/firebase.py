@@ -0,0 +1,82 @@
+# inspection_core/firebase.py
+# -*- coding: utf-8 -*-
+# Firebase Realtime Database: Admin SDK ก่อน ถ้า init/ส่งไม่สำเร็จ fallback เป็น REST
+
+import json, uuid, threading
+import urllib.request, urllib.error
+from datetime import datetime, timezone
+
+from lazy_imports import lazy_import
+firebase_admin = lazy_import("firebase_admin")
+credentials = lazy_import("firebase_admin.credentials")
+db = lazy_import("firebase_admin.db")
+
+
+class FirebaseClient:
+    """
+    base_url  : URL ของ RTDB
+    cred_path : service account (serviceAccountKey.json) ; init ครั้งเดียว เรียกจากหลาย thread ได้
+    """
+
+    def __init__(self, base_url, cred_path, timeout=5):
+        self.base_url = base_url
+        self.cred_path = cred_path
+        self.timeout = timeout
+        self.ready = False        # Admin SDK พร้อมหรือยัง
+        self._lock = threading.Lock()
+
+    def init(self):
+        """Init Firebase Admin ด้วย service account หนึ่งครั้ง"""
+        with self._lock:
+            if self.ready:
+                return
+            try:
+                cred = credentials.Certificate(self.cred_path)
+                firebase_admin.initialize_app(cred, {"databaseURL": self.base_url})
+                self.ready = True
+            except Exception as e:
+                print(f"[Firebase] Admin init failed, fallback to REST. reason={e}")
+                self.ready = False
+
+    def _rest(self, method, path, obj):
+        url = f"{self.base_url}/{path}.json"
+        data = json.dumps(obj).encode("utf-8")
+        req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"}, method=method)
+        with urllib.request.urlopen(req, timeout=self.timeout):
+            pass
+
+    def post(self, path, obj):
+        """POST (push) : Admin SDK ก่อน, ไม่งั้น fallback REST"""
+        payload = {
+            **obj,
+            "_meta": {
+                "source": "python-admin",
+                "pushed_at": datetime.now(timezone.utc).isoformat(),
+                "server_id": str(uuid.uuid4())
+            }
+        }
+        try:
+            self.init()
+            if self.ready:
+                db.reference(path).push(payload)
+                return
+        except Exception as e:
+            print(f"[Firebase] Admin push failed, fallback to REST. reason={e}")
+        try:
+            self._rest("POST", path, payload)
+        except Exception as e:
+            print(f"[Firebase] REST POST error: {e}")
+
+    def put(self, path, obj):
+        """PUT (set) : Admin SDK ก่อน, ไม่งั้น fallback REST"""
+        try:
+            self.init()
+            if self.ready:
+                db.reference(path).set(obj)
+                return
+        except Exception as e:
+            print(f"[Firebase] Admin set failed, fallback to REST. reason={e}")
+        try:
+            self._rest("PUT", path, obj)
+        except Exception as e:
+            print(f"[Firebase] REST PUT error: {e}")
@@ -0,0 +1,120 @@
+# inspection_core/frame_ring.py
+# -*- coding: utf-8 -*-
+# ring buffer ของเฟรมใน shared memory: ส่งเฟรมข้าม process โดยไม่ pickle/copy ผ่าน queue
+#
+# - slot จองไว้ล่วงหน้า ขนาดเท่าเฟรมใหญ่สุด (max_shape) ; เฟรมเล็กกว่าใช้ส่วนต้นของ slot
+# - control block ต่อ slot: seq, refcount, h, w, c (อยู่ใน shared memory เดียวกัน ทุก process เห็นตรงกัน)
+# - ผู้เขียน acquire slot ว่าง (refcount 0) → เขียนลง view ตรง ๆ → retain ตามจำนวนผู้อ่าน
+#   ผู้อ่าน read(slot, seq) ได้ numpy view (seq ไม่ตรง = slot ถูกเขียนทับ) แล้ว release เมื่อใช้เสร็จ
+# - ข้าม queue ส่งแค่ (slot, seq)
+# ส่ง ring ให้ process ลูกเป็น argument ของ Process ได้ (pickle = ชื่อ shared memory + lock แล้ว attach ใหม่)
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+SEQ, REFS, H, W, C = range(5)
+_ALIGN = 64
+
+
+class SharedFrameRing:
+    """
+    slots     : จำนวน slot
+    max_shape : (h, w, c) ของเฟรมใหญ่สุดที่รับ (uint8)
+    lock      : multiprocessing Lock จาก context เดียวกับ process ลูก (ใช้แก้ refcount)
+    """
+
+    def __init__(self, slots, max_shape, lock, name=None):
+        self.slots = int(slots)
+        self.max_shape = tuple(int(v) for v in max_shape)
+        self.slot_bytes = int(np.prod(self.max_shape))
+        self._lock = lock
+        self._owner = name is None
+        ctrl_bytes = self.slots * 5 * 8
+        self._data_off = (ctrl_bytes + _ALIGN - 1) // _ALIGN * _ALIGN
+        size = self._data_off + self.slots * self.slot_bytes
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._ctrl = np.ndarray((self.slots, 5), dtype=np.int64, buffer=self._shm.buf)
+        if self._owner:
+            self._ctrl[:] = 0
+            self._ctrl[:, SEQ] = -1
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __getstate__(self):
+        return {"slots": self.slots, "max_shape": self.max_shape, "lock": self._lock, "name": self.name}
+
+    def __setstate__(self, state):
+        self.__init__(state["slots"], state["max_shape"], state["lock"], name=state["name"])
+
+    def fits(self, shape):
+        return len(shape) == 3 and int(np.prod(shape)) <= self.slot_bytes
+
+    def _view(self, slot, shape):
+        off = self._data_off + slot * self.slot_bytes
+        return np.ndarray(shape, dtype=np.uint8, buffer=self._shm.buf, offset=off)
+
+    # ---- writer ----
+    def acquire(self, seq, shape):
+        """จอง slot ว่างที่เก่าที่สุด (refcount = 1 ของผู้เขียน) คืน (slot, view) หรือ (None, None) ถ้าเต็ม"""
+        if not self.fits(shape):
+            return None, None
+        with self._lock:
+            free = np.flatnonzero(self._ctrl[:, REFS] == 0)
+            if len(free) == 0:
+                return None, None
+            slot = int(free[np.argmin(self._ctrl[free, SEQ])])
+            self._ctrl[slot, REFS] = 1
+            self._ctrl[slot, SEQ] = seq
+            self._ctrl[slot, H:C + 1] = shape
+        return slot, self._view(slot, tuple(shape))
+
+    def put(self, frame, seq):
+        """copy เฟรมลง slot ว่าง (memcpy ครั้งเดียว) คืน slot หรือ None ถ้าเต็ม/ใหญ่เกิน"""
+        slot, view = self.acquire(seq, frame.shape)
+        if slot is not None:
+            view[...] = frame
+        return slot
+
+    def retain(self, slot, n=1):
+        with self._lock:
+            self._ctrl[slot, REFS] += n
+
+    def set_seq(self, slot, seq):
+        with self._lock:
+            self._ctrl[slot, SEQ] = seq
+
+    # ---- reader ----
+    def read(self, slot, seq):
+        """view ของเฟรมใน slot (ไม่ copy) ; ValueError ถ้า slot ถูกเขียนทับไปแล้ว"""
+        if int(self._ctrl[slot, SEQ]) != seq:
+            raise ValueError(f"slot {slot} ถูกเขียนทับ (ต้องการ seq {seq} พบ {int(self._ctrl[slot, SEQ])})")
+        h, w, c = (int(v) for v in self._ctrl[slot, H:C + 1])
+        return self._view(slot, (h, w, c))
+
+    def release(self, slot):
+        with self._lock:
+            if self._ctrl[slot, REFS] > 0:
+                self._ctrl[slot, REFS] -= 1
+
+    def in_use(self):
+        return int(np.count_nonzero(self._ctrl[:, REFS]))
+
+    # ---- lifecycle ----
+    def close(self):
+        """ปล่อย mapping ของ process นี้ ; เจ้าของ (ผู้สร้าง) unlink shared memory ด้วย"""
+        self._ctrl = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass      # ยังมี view ค้างอยู่ mapping หายเมื่อ GC
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
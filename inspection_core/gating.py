@@ -0,0 +1,92 @@
+# inspection_core/gating.py
+# -*- coding: utf-8 -*-
+# gating จาน: PlateTracker (ID จานคงที่ข้ามเฟรม) + หลักฐานตำหนิต่อจาน (DefectEvidence)
+# นับ/บันทึกครั้งเดียวต่อ track ตอนจานออกจากภาพ (finished) หรือตอนหยุดตรวจ (flush)
+
+from defect_fusion import DefectEvidence
+from .detections import union_box, dets_in_box
+
+
+class PlateUpdate:
+    """ผลของ PlateSession.update หนึ่งเฟรม"""
+    __slots__ = ("plate", "new_plate", "finished", "evidence")
+
+    def __init__(self, plate, new_plate, finished, evidence):
+        self.plate = plate            # track จานที่กำลังตรวจ (None = ไม่มี)
+        self.new_plate = new_plate    # True = เพิ่งยืนยันจานใหม่ในเฟรมนี้
+        self.finished = finished      # track ที่ออกไปแล้ว → ผู้เรียก finalize
+        self.evidence = evidence      # DefectEvidence ของจานปัจจุบัน ถ้าเห็นจานในเฟรมนี้
+
+
+class PlateSession:
+    """
+    ต่อผลตรวจแต่ละเฟรมเข้ากับ tracker
+      update(result, annotated) : เฟรมใหม่ → PlateUpdate
+      flush()                   : หยุดตรวจ → track ที่ยืนยันแล้วแต่ยังไม่ได้นับ
+      evidence_of(track)        : หลักฐานตำหนิที่รวมแล้วของ track
+    ภาพ annotate ที่เห็นตำหนิมากที่สุดของแต่ละจานเก็บไว้ที่ track.data["snapshot"]
+    """
+
+    def __init__(self, tracker, track_conf=0.25, evidence_factory=DefectEvidence):
+        self.tracker = tracker
+        self.track_conf = track_conf
+        self.evidence_factory = evidence_factory
+        self.active_id = None
+
+    def reset(self):
+        self.tracker.reset()
+        self.active_id = None
+
+    def plate_box(self):
+        plate = self.tracker.primary()
+        return plate.box if plate is not None else None
+
+    def evidence_of(self, track):
+        return track.data.get("defects") or self.evidence_factory()
+
+    def update(self, result, annotated):
+        if result.shape_dets:
+            boxes = [d[0] for d in result.shape_dets]
+            labels = [d[1] for d in result.shape_dets]
+            scores = [d[2] for d in result.shape_dets]
+        elif result.defect_dets:
+            # เห็นแต่ตำหนิ → กรอบรวมของตำหนิเป็นกล่อง conf ต่ำ (ต่อ track เดิมได้อย่างเดียว)
+            boxes, labels, scores = [union_box([d[0] for d in result.defect_dets])], [None], [self.track_conf]
+        else:
+            boxes, labels, scores = [], [], []
+        tracker = self.tracker
+        tracker.update(boxes, scores, labels)
+
+        # สะสมหลักฐานตำหนิให้ทุก track ที่เห็นในเฟรมนี้ (รวม track ที่ยังไม่ยืนยัน)
+        for t in tracker.tracks:
+            if t.last_frame != tracker.frame_idx:
+                continue
+            ev = t.data.setdefault("defects", self.evidence_factory())
+            in_plate = dets_in_box(t.box, result.defect_dets) if result.ran_defect else []
+            if result.ran_defect:
+                ev.add(t.box, in_plate)
+            if "snapshot" not in t.data or len(in_plate) >= t.data["snapshot_n"]:
+                t.data["snapshot"], t.data["snapshot_n"] = annotated, len(in_plate)
+
+        finished = list(tracker.removed)
+        if any(t.track_id == self.active_id for t in finished):
+            self.active_id = None
+
+        # จานปัจจุบันคงเดิมจนกว่า track จะหลุด แล้วค่อยเลือก track ที่ยืนยันแล้วที่ใหญ่ที่สุด
+        plate, new_plate = None, False
+        if self.active_id is not None:
+            plate = next((t for t in tracker.tracks if t.track_id == self.active_id), None)
+        if plate is None:
+            plate = tracker.primary()
+            if plate is not None:
+                self.active_id = plate.track_id
+                new_plate = True
+
+        evidence = None
+        if plate is not None and plate.last_frame == tracker.frame_idx:
+            evidence = plate.data.get("defects")
+        return PlateUpdate(plate, new_plate, finished, evidence)
+
+    def flush(self):
+        self.active_id = None
+        return self.tracker.flush()
@@ -0,0 +1,326 @@
+# inspection_core/mining.py
+# -*- coding: utf-8 -*-
+# เก็บ "เฟรมยาก" ระหว่างรันจริงไว้เทรนรอบถัดไป โดยไม่ต้องเก็บทุกเฟรม
+#
+# เฟรมถูกเลือกเมื่อ
+#   - ตำหนิมี conf อยู่ในช่วงไม่แน่ใจ defect_band (รอบ conf_defect=0.25 ; รวม result.candidates
+#     ที่ pipeline คืนมาเมื่อตั้ง candidate_conf ต่ำกว่า defect_conf)
+#   - กล่องรูปทรงมี conf อยู่ในช่วง shape_band (รอบ conf_shape)
+#   - รูปทรงที่โมเดลทาย ขัดกับ shape_hint_from_geometry ของกรอบเดียวกัน
+# ฝั่ง GUI (offer) แค่เช็คเงื่อนไข + copy เฟรมลง queue จำกัดขนาด (เต็ม = ทิ้ง ไม่รอ)
+# thread เบื้องหลัง: pHash → ข้ามเฟรมที่คล้ายของเดิม (Hamming <= dedup_bits) → เขียน
+#   mining/<YYYYMMDD>/<เวลา>_<hash>.jpg (ภาพดิบ ไม่มีกรอบ) + .json (ผลทำนาย, เหตุผล, meta)
+# เกิน max_items / max_bytes → ลบคู่ที่เก่าที่สุด ; .json เขียนทีหลัง .jpg (tmp + os.replace) = ไฟล์ครบคู่เสมอ
+#
+# ใช้งาน:
+#   miner = HardExampleMiner("mining") ; miner.offer(frame, result, meta={"lot": lot_id}) ; miner.stop()
+#   python -m inspection_core.mining mining --stats
+#   python -m inspection_core.mining mining --export retrain_batch1 --move   # images/ + labels/ (pre-label YOLO)
+
+import os, sys, json, time, queue, shutil, argparse, threading
+from datetime import datetime
+
+import numpy as np
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+from .detections import GeometryHintCache
+
+DEFECT_BAND = (0.15, 0.35)
+SHAPE_BAND = (0.40, 0.65)
+MAX_ITEMS = 5000
+MAX_BYTES = 2 * 1024 ** 3
+DEDUP_BITS = 6          # pHash 64 bit ต่างกันไม่เกินนี้ = ภาพซ้ำ
+QUEUE_SIZE = 8
+MIN_INTERVAL_S = 1.0    # เก็บห่างกันอย่างน้อยเท่านี้ (จานเดียวกันหลายเฟรมติดกันแทบเหมือนกัน)
+
+
+def phash(img):
+    """perceptual hash 64 bit (DCT 32x32 ของภาพ gray) → int"""
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def _dets_json(dets):
+    return [[[round(float(v), 1) for v in d[0]], d[1], round(float(d[2]), 4)] for d in dets]
+
+
+class HardExampleMiner:
+    """
+    offer(frame, result, meta) ทุกเฟรม (เร็ว ไม่เขียนดิสก์) ; stop() ตอนปิดโปรแกรม
+      frame   : เฟรมที่ส่งเข้า pipeline (พิกัดเดียวกับกล่องใน result)
+      geometry: เช็ครูปทรงขัดกับ geometry hint (GeometryHintCache → คำนวณใหม่เฉพาะเมื่อจานขยับ)
+    """
+
+    def __init__(self, out_dir, defect_band=DEFECT_BAND, shape_band=SHAPE_BAND, geometry=True,
+                 max_items=MAX_ITEMS, max_bytes=MAX_BYTES, dedup_bits=DEDUP_BITS, queue_size=QUEUE_SIZE,
+                 min_interval_s=MIN_INTERVAL_S, jpeg_quality=95, log=print):
+        self.out_dir = os.path.abspath(out_dir)
+        self.defect_band = defect_band
+        self.shape_band = shape_band
+        self.geometry = geometry
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.dedup_bits = dedup_bits
+        self.min_interval_s = min_interval_s
+        self.jpeg_quality = jpeg_quality
+        self.log = log
+        self.enabled = True
+
+        self.hint_cache = GeometryHintCache()
+        self.counts = {"offered": 0, "sampled": 0, "dropped": 0, "duplicates": 0, "written": 0,
+                       "evicted": 0, "errors": 0}
+        self._q = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._last_t = 0.0
+        self._items = None        # [(stem, hash, bytes)] เรียงเก่า → ใหม่ (โหลดใน thread เขียน)
+        self._bytes = 0
+
+    # -----------------------------
+    # ฝั่ง GUI
+    # -----------------------------
+    def reasons(self, frame, result):
+        """เหตุผลที่เฟรมนี้น่าเก็บ → [str] (ว่าง = ไม่เก็บ)"""
+        out = []
+        lo, hi = self.defect_band
+        for box, label, conf in list(result.defect_dets) + list(getattr(result, "candidates", [])):
+            if lo <= conf < hi:
+                out.append(f"defect_band:{label}:{conf:.2f}")
+                break
+        lo, hi = self.shape_band
+        for box, label, conf in result.shape_dets:
+            if lo <= conf < hi:
+                out.append(f"shape_band:{label}:{conf:.2f}")
+                break
+        if self.geometry and result.shape_dets:
+            box, label, conf = max(result.shape_dets, key=lambda d: d[2])
+            if conf >= self.shape_band[0]:
+                hint = self.hint_cache.get(frame, [int(v) for v in box])
+                if hint is not None and hint != label:
+                    out.append(f"geometry:{label}->{hint}")
+        return out
+
+    def offer(self, frame, result, meta=None):
+        """คืน True ถ้าเฟรมเข้า queue ; ไม่ block"""
+        if not self.enabled:
+            return False
+        self.counts["offered"] += 1
+        now = time.monotonic()
+        if now - self._last_t < self.min_interval_s:
+            return False
+        why = self.reasons(frame, result)
+        if not why:
+            return False
+        self.counts["sampled"] += 1
+        item = {
+            "time": datetime.now(), "reasons": why, "frame": frame.copy(),
+            "shape_dets": _dets_json(result.shape_dets), "defect_dets": _dets_json(result.defect_dets),
+            "candidates": _dets_json(getattr(result, "candidates", [])), "meta": dict(meta or {}),
+        }
+        try:
+            self._q.put_nowait(item)
+        except queue.Full:
+            self.counts["dropped"] += 1
+            return False
+        self._last_t = now
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, daemon=True, name="hard-example-miner")
+            self._thread.start()
+        return True
+
+    def stop(self, timeout=5.0):
+        """เขียนที่ค้างใน queue ให้จบ (ไม่เกิน timeout) แล้วหยุด thread"""
+        self.enabled = False
+        if self._thread is not None and self._thread.is_alive():
+            try:
+                self._q.put(None, timeout=timeout)
+            except queue.Full:
+                pass
+            self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        s = dict(self.counts)
+        s["queued"] = self._q.qsize()
+        s["stored"] = len(self._items) if self._items is not None else None
+        return s
+
+    # -----------------------------
+    # thread เขียน
+    # -----------------------------
+    def _run(self):
+        if self._items is None:
+            self._items = load_items(self.out_dir)
+            self._bytes = sum(b for _, _, b in self._items)
+        while True:
+            item = self._q.get()
+            if item is None:
+                break
+            try:
+                self._write(item)
+            except Exception as e:
+                self.counts["errors"] += 1
+                self.log(f"[Mining] เขียนไม่สำเร็จ: {e}")
+
+    def _write(self, item):
+        h = phash(item["frame"])
+        for _, other, _ in reversed(self._items):
+            if hamming(h, other) <= self.dedup_bits:
+                self.counts["duplicates"] += 1
+                return
+        t = item["time"]
+        day_dir = os.path.join(self.out_dir, t.strftime("%Y%m%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        stem = os.path.join(day_dir, f"{t.strftime('%Y%m%d_%H%M%S')}_{t.microsecond // 1000:03d}_{h:016x}")
+        ok, buf = cv2.imencode(".jpg", item["frame"], [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise RuntimeError("imencode failed")
+        h_img, w_img = item["frame"].shape[:2]
+        side = {"time": t.isoformat(timespec="milliseconds"), "phash": f"{h:016x}", "size": [w_img, h_img],
+                "reasons": item["reasons"], "shape_dets": item["shape_dets"], "defect_dets": item["defect_dets"],
+                "candidates": item["candidates"], "meta": item["meta"]}
+        _write_atomic(stem + ".jpg", buf.tobytes())
+        _write_atomic(stem + ".json", json.dumps(side, ensure_ascii=False, indent=1).encode("utf-8"))
+        n = len(buf) + os.path.getsize(stem + ".json")
+        self._items.append((stem, h, n))
+        self._bytes += n
+        self.counts["written"] += 1
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        while self._items and (len(self._items) > self.max_items or self._bytes > self.max_bytes):
+            stem, _, n = self._items.pop(0)
+            remove_item(stem)
+            self._bytes -= n
+            self.counts["evicted"] += 1
+
+
+def _write_atomic(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def load_items(out_dir):
+    """คู่ .jpg + .json ที่ครบใน out_dir → [(stem, hash, bytes)] เรียงเก่า → ใหม่ ; ไฟล์ค้างครึ่งคู่ถูกลบ"""
+    items = []
+    if not os.path.isdir(out_dir):
+        return items
+    for day in sorted(os.listdir(out_dir)):
+        d = os.path.join(out_dir, day)
+        if not os.path.isdir(d):
+            continue
+        names = set(os.listdir(d))
+        for name in sorted(names):
+            stem, ext = os.path.splitext(name)
+            path = os.path.join(d, name)
+            if ext == ".tmp" or (ext == ".jpg" and stem + ".json" not in names):
+                os.remove(path)          # เขียนไม่จบ (ปิดโปรแกรมกลางคัน)
+                continue
+            if ext != ".json":
+                continue
+            if stem + ".jpg" not in names:
+                os.remove(path)
+                continue
+            try:
+                h = int(stem.rsplit("_", 1)[1], 16)
+            except (IndexError, ValueError):
+                continue
+            full = os.path.join(d, stem)
+            items.append((full, h, os.path.getsize(full + ".jpg") + os.path.getsize(path)))
+    return items
+
+
+def remove_item(stem):
+    for ext in (".jpg", ".json"):
+        try:
+            os.remove(stem + ext)
+        except OSError:
+            pass
+    try:
+        os.rmdir(os.path.dirname(stem))     # โฟลเดอร์วันที่ว่างแล้ว
+    except OSError:
+        pass
+
+
+def export(out_dir, dest, move=False):
+    """
+    ชุดที่เก็บไว้ → dest/images + dest/labels (YOLO pre-label จากผลทำนาย รวม candidates) + classes.txt
+    ให้คนตรวจ/แก้ label ต่อ ; move=True ลบออกจาก queue หลัง export
+    """
+    items = load_items(out_dir)
+    sides = []
+    for stem, _, _ in items:
+        with open(stem + ".json", "r", encoding="utf-8") as f:
+            sides.append(json.load(f))
+    names = sorted({d[1] for s in sides for k in ("shape_dets", "defect_dets", "candidates") for d in s[k]})
+    index = {n: i for i, n in enumerate(names)}
+    os.makedirs(os.path.join(dest, "images"), exist_ok=True)
+    os.makedirs(os.path.join(dest, "labels"), exist_ok=True)
+    for (stem, _, _), s in zip(items, sides):
+        base = os.path.basename(stem)
+        shutil.copy2(stem + ".jpg", os.path.join(dest, "images", base + ".jpg"))
+        w, h = s["size"]
+        lines = []
+        for d in s["shape_dets"] + s["defect_dets"] + s["candidates"]:
+            x1, y1, x2, y2 = d[0]
+            lines.append(f"{index[d[1]]} {(x1 + x2) / 2 / w:.6f} {(y1 + y2) / 2 / h:.6f} "
+                         f"{(x2 - x1) / w:.6f} {(y2 - y1) / h:.6f}")
+        with open(os.path.join(dest, "labels", base + ".txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + ("\n" if lines else ""))
+        with open(os.path.join(dest, "labels", base + ".json"), "w", encoding="utf-8") as f:
+            json.dump(s, f, ensure_ascii=False, indent=1)
+        if move:
+            remove_item(stem)
+    with open(os.path.join(dest, "classes.txt"), "w", encoding="utf-8") as f:
+        f.write("\n".join(names) + "\n")
+    return len(items), names
+
+
+def summarize(out_dir):
+    items = load_items(out_dir)
+    reasons, days = {}, {}
+    for stem, _, _ in items:
+        with open(stem + ".json", "r", encoding="utf-8") as f:
+            s = json.load(f)
+        for r in s.get("reasons", []):
+            key = r.split(":", 1)[0]
+            reasons[key] = reasons.get(key, 0) + 1
+        day = os.path.basename(os.path.dirname(stem))
+        days[day] = days.get(day, 0) + 1
+    return {"items": len(items), "bytes": sum(b for _, _, b in items), "reasons": reasons, "days": days}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Inspect / export the hard-example queue")
+    ap.add_argument("out_dir", nargs="?", default="mining")
+    ap.add_argument("--stats", action="store_true")
+    ap.add_argument("--export", metavar="DEST", help="คัดลอกเป็น images/ + labels/ สำหรับ label ต่อ")
+    ap.add_argument("--move", action="store_true", help="ลบออกจาก queue หลัง export")
+    args = ap.parse_args(argv)
+
+    if args.export:
+        n, names = export(args.out_dir, args.export, move=args.move)
+        print(f"export {n} รูป → {args.export} (classes: {', '.join(names) or '-'})")
+        return 0
+    s = summarize(args.out_dir)
+    print(f"{args.out_dir}: {s['items']} รูป, {s['bytes'] / 2 ** 20:.1f} MB")
+    for k, v in sorted(s["reasons"].items()):
+        print(f"  {k:<12}{v:>7}")
+    if args.stats:
+        for day, v in sorted(s["days"].items()):
+            print(f"  {day}{v:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,272 @@
+# inspection_core/pipelines.py
+# -*- coding: utf-8 -*-
+# strategy การ inference: เฟรม → InspectionResult (กล่องรูปทรง + กล่องตำหนิ)
+#
+# - SingleModelPipeline : โมเดลเดียวเห็นทั้งรูปทรงและตำหนิ (GUI_w_model, GUI_w_model_v2)
+# - TwoStagePipeline    : shape model + defect model แยกกัน, defect ทุก N เฟรม / แบบไทล์ได้
+#                         (GUI_w_two_stage_model, GUI_mac, GUI_multi_camera)
+# ค่าทุกตัวเป็น attribute ธรรมดา → GUI ปรับระหว่างรันได้ (runtime_config) โดยไม่ต้องสร้าง pipeline ใหม่
+
+import time
+
+import numpy as np
+
+from sliced_inference import scale_dets
+from .detections import result_dets, nms_dets, union_box, apply_geometry_hint, GeometryHintCache
+
+
+class InspectionResult:
+    """ผลตรวจหนึ่งเฟรม (พิกัดเดียวกับเฟรมที่ส่งเข้า run)"""
+
+    def __init__(self, shape_dets, defect_dets, ran_defect, shape_conf, infer_ms=0.0, candidates=None):
+        self.shape_dets = shape_dets      # ทุกกล่องรูปทรง รวม conf ต่ำ (ให้ tracker ใช้ต่อ track เดิม)
+        self.defect_dets = defect_dets
+        self.candidates = candidates or []   # ตำหนิ conf ต่ำกว่า defect_conf แต่ >= candidate_conf (ไม่นับ ไม่แสดง)
+        self.ran_defect = ran_defect      # เฟรมนี้รันโมเดล defect หรือไม่ (defect_every_n)
+        self.shape_conf = shape_conf
+        self.infer_ms = infer_ms
+
+    def shapes(self):
+        """กล่องรูปทรงที่มั่นใจพอจะแสดง/นับ"""
+        return [d for d in self.shape_dets if d[2] >= self.shape_conf]
+
+    def shapes_found(self):
+        return {d[1] for d in self.shapes()}
+
+    def defect_counts(self):
+        out = {}
+        for d in self.defect_dets:
+            out[d[1]] = out.get(d[1], 0) + 1
+        return out
+
+    def defect_names(self):
+        return {d[1] for d in self.defect_dets}
+
+    def union_box(self):
+        """กรอบรวมของรูปทรง (ไม่มีรูปทรง → กรอบรวมของตำหนิ)"""
+        return union_box([d[0] for d in self.shapes()]) or union_box([d[0] for d in self.defect_dets])
+
+
+class InspectionPipeline:
+    """
+    ฐานของ strategy
+      shape_map      : ชื่อคลาสรูปทรงของโมเดล → ชื่อสั้น (heart/rectangle/circle)
+      defect_classes : ชื่อคลาสตำหนิที่นับ
+      shape_conf     : conf ขั้นต่ำของรูปทรงที่นับ/แสดง
+      track_conf     : conf ขั้นต่ำที่ส่งให้ tracker (ต่ำกว่า shape_conf ใช้ต่อ track เดิมเท่านั้น)
+      candidate_conf : ตำหนิ conf ในช่วง [candidate_conf, defect_conf) คืนแยกใน result.candidates
+                       (ให้ HardExampleMiner เห็นช่วงไม่แน่ใจรอบ defect_conf ; None = ไม่ทำ)
+    """
+
+    def __init__(self, shape_map, defect_classes, imgsz=896, shape_conf=0.55, track_conf=0.25, defect_conf=0.25,
+                 candidate_conf=None):
+        self.shape_map = dict(shape_map)
+        self.defect_classes = set(defect_classes)
+        self.imgsz = imgsz
+        self.shape_conf = shape_conf
+        self.track_conf = track_conf
+        self.defect_conf = defect_conf
+        self.candidate_conf = candidate_conf
+        self.frame_idx = 0
+        self.last_ms = 0.0
+
+    def models(self):
+        return []
+
+    def configure(self, **params):
+        for k, v in params.items():
+            if hasattr(self, k):
+                setattr(self, k, v)
+
+    def warmup(self):
+        """dummy inference ที่ imgsz จริง: จ่ายค่า lazy init (fuse layer, จอง memory, CUDA context) ก่อนเฟรมแรก"""
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        for model in self.models():
+            model.predict(source=dummy, imgsz=self.imgsz, conf=0.99, max_det=1, verbose=False)
+
+    def run(self, frame, frame_full=None, plate_hint=None):
+        raise NotImplementedError
+
+    def run_batch(self, frames):
+        return [self.run(f) for f in frames]
+
+    def _defect_floor(self):
+        """conf ที่ส่งให้โมเดล defect: ต่ำลงถึง candidate_conf ถ้าเปิดไว้"""
+        if self.candidate_conf is None:
+            return self.defect_conf
+        return min(self.defect_conf, self.candidate_conf)
+
+    def _split_candidates(self, dets):
+        """→ (ตำหนิที่นับ, candidates)"""
+        kept = [d for d in dets if d[2] >= self.defect_conf]
+        if self.candidate_conf is None:
+            return kept, []
+        return kept, [d for d in dets if self.candidate_conf <= d[2] < self.defect_conf]
+
+
+class SingleModelPipeline(InspectionPipeline):
+    """
+    โมเดลเดียวตรวจทั้งรูปทรงและตำหนิ
+      class_nms_iou  : NMS แยกคลาสซ้ำอีกรอบหลัง NMS ของ YOLO (None = ไม่ทำ)
+      geometry_hint  : (low, high) แก้ชื่อรูปทรงที่ conf ต่ำด้วยรูปร่างเส้นขอบ (None = ไม่ใช้)
+                       ผลต่อจานถูก cache (GeometryHintCache) จนกรอบขยับมาก
+    """
+
+    def __init__(self, model, shape_map, defect_classes, imgsz=896, iou=0.65,
+                 shape_conf=0.55, track_conf=0.25, defect_conf=0.25,
+                 class_nms_iou=None, geometry_hint=None, candidate_conf=None):
+        super().__init__(shape_map, defect_classes, imgsz, shape_conf, track_conf, defect_conf, candidate_conf)
+        self.model = model
+        self.iou = iou
+        self.class_nms_iou = class_nms_iou
+        self.geometry_hint = geometry_hint
+        self.hint_cache = GeometryHintCache()
+
+    def models(self):
+        return [self.model] if self.model is not None else []
+
+    def _split(self, frame, res):
+        dets = result_dets(res, self.model.names)
+        if self.class_nms_iou is not None:
+            dets = nms_dets(dets, self.class_nms_iou, class_wise=True)
+        shape_dets = [(b, self.shape_map[l], p) for b, l, p in dets if l in self.shape_map]
+        defect_dets, candidates = self._split_candidates([d for d in dets if d[1] in self.defect_classes])
+        if self.geometry_hint is not None:
+            shape_dets = apply_geometry_hint(frame, shape_dets, *self.geometry_hint, cache=self.hint_cache)
+        return shape_dets, defect_dets, candidates
+
+    def _conf(self):
+        return min(self.shape_conf, self.track_conf, self._defect_floor())
+
+    def run(self, frame, frame_full=None, plate_hint=None):
+        t0 = time.perf_counter()
+        self.frame_idx += 1
+        res = self.model.predict(source=frame, imgsz=self.imgsz, conf=self._conf(), iou=self.iou, verbose=False)[0]
+        shape_dets, defect_dets, candidates = self._split(frame, res)
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        return InspectionResult(shape_dets, defect_dets, True, self.shape_conf, self.last_ms, candidates)
+
+    def run_batch(self, frames):
+        t0 = time.perf_counter()
+        self.frame_idx += 1
+        results = self.model.predict(source=list(frames), imgsz=self.imgsz, conf=self._conf(), iou=self.iou, verbose=False)
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        out = []
+        for frame, res in zip(frames, results):
+            shape_dets, defect_dets, candidates = self._split(frame, res)
+            out.append(InspectionResult(shape_dets, defect_dets, True, self.shape_conf, self.last_ms, candidates))
+        return out
+
+
+class TwoStagePipeline(InspectionPipeline):
+    """
+    shape model → defect model (โมเดลใดเป็น None ก็ข้ามขั้นนั้น)
+      shape_max_det / shape_agnostic : ส่งต่อให้ YOLO (จานเดียวต่อเฟรม = max_det 1 + agnostic NMS)
+      shape_nms_iou                  : NMS ข้ามคลาสรอบสอง กันกล่องคนละรูปทรงซ้อนบนจานเดียว (None = ไม่ทำ)
+      defect_every_n / defect_imgsz  : รัน defect ถี่/ละเอียดแค่ไหน (รวมหลักฐานข้ามเฟรมชดเชยได้)
+      defect_mode="sliced" + sliced  : ตรวจตำหนิเป็นไทล์เฉพาะกรอบจานบน frame_full (SlicedDefectInference)
+    """
+
+    def __init__(self, shape_model, defect_model, shape_map, defect_classes, imgsz=896,
+                 shape_conf=0.55, track_conf=0.25, shape_iou=0.72, defect_conf=0.25, defect_iou=0.65,
+                 shape_max_det=300, shape_agnostic=False, shape_nms_iou=None,
+                 defect_imgsz=None, defect_every_n=1, defect_mode="full", sliced=None, candidate_conf=None):
+        super().__init__(shape_map, defect_classes, imgsz, shape_conf, track_conf, defect_conf, candidate_conf)
+        self.shape_model = shape_model
+        self.defect_model = defect_model
+        self.shape_iou = shape_iou
+        self.defect_iou = defect_iou
+        self.shape_max_det = shape_max_det
+        self.shape_agnostic = shape_agnostic
+        self.shape_nms_iou = shape_nms_iou
+        self.defect_imgsz = defect_imgsz
+        self.defect_every_n = defect_every_n
+        self.defect_mode = defect_mode
+        self.sliced = sliced
+
+    def models(self):
+        return [m for m in (self.shape_model, self.defect_model) if m is not None]
+
+    def warmup(self, full_size=(720, 1280)):
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        if self.shape_model is not None:
+            self._predict_shapes(dummy)
+        if self.defect_model is not None:
+            self._predict_defects(dummy)
+            if self.defect_mode == "sliced" and self.sliced is not None:
+                h, w = full_size
+                self.sliced.predict(np.zeros((h, w, 3), dtype=np.uint8), (0, 0, w, h))
+
+    def _shape_dets(self, res):
+        dets = result_dets(res, self.shape_model.names, keep=self.shape_map, rename=self.shape_map)
+        if self.shape_nms_iou is not None:
+            dets = nms_dets(dets, self.shape_nms_iou)
+        return dets
+
+    def _predict_shapes(self, source):
+        return self.shape_model.predict(
+            source=source, imgsz=self.imgsz, conf=self.track_conf, iou=self.shape_iou,
+            max_det=self.shape_max_det, agnostic_nms=self.shape_agnostic, verbose=False,
+        )
+
+    def _predict_defects(self, source):
+        return self.defect_model.predict(
+            source=source, imgsz=self.defect_imgsz or self.imgsz,
+            conf=self._defect_floor(), iou=self.defect_iou, verbose=False,
+        )
+
+    def _sliced_dets(self, frame, frame_full, shape_dets, plate_hint):
+        # กรอบจาน: กล่องรูปทรง conf สูงสุดของเฟรมนี้ ไม่มีก็ใช้กรอบที่ tracker ทำนายไว้
+        box = max(shape_dets, key=lambda d: d[2])[0] if shape_dets else plate_hint
+        if box is None:
+            return []
+        sx = frame_full.shape[1] / float(frame.shape[1])
+        sy = frame_full.shape[0] / float(frame.shape[0])
+        box_full = [box[0] * sx, box[1] * sy, box[2] * sx, box[3] * sy]
+        dets = scale_dets(self.sliced.predict(frame_full, box_full), 1.0 / sx, 1.0 / sy)
+        return [d for d in dets if d[1] in self.defect_classes]
+
+    def run(self, frame, frame_full=None, plate_hint=None):
+        self.frame_idx += 1
+        run_defect = self.frame_idx % max(1, self.defect_every_n) == 0
+        return self.run_stages(frame, defect=run_defect, frame_full=frame_full, plate_hint=plate_hint)
+
+    def run_stages(self, frame, shape=True, defect=True, frame_full=None, plate_hint=None):
+        """รันเฉพาะขั้นที่ขอ (process pool แยก shape/defect คนละ process) ; ไม่นับ frame_idx"""
+        t0 = time.perf_counter()
+
+        shape_dets = []
+        if shape and self.shape_model is not None:
+            shape_dets = self._shape_dets(self._predict_shapes(frame)[0])
+
+        defect_dets, candidates = [], []
+        ran_defect = defect and self.defect_model is not None
+        if ran_defect:
+            if self.defect_mode == "sliced" and self.sliced is not None:
+                defect_dets = self._sliced_dets(frame, frame if frame_full is None else frame_full,
+                                                shape_dets, plate_hint)
+            else:
+                defect_dets, candidates = self._split_candidates(result_dets(
+                    self._predict_defects(frame)[0], self.defect_model.names, keep=self.defect_classes))
+
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        return InspectionResult(shape_dets, defect_dets, ran_defect, self.shape_conf, self.last_ms, candidates)
+
+    def run_batch(self, frames):
+        """หลายเฟรม (เช่น กล้องหลายตัว) predict ครั้งเดียวต่อโมเดล ; defect รันทุกเฟรม แบบเต็มภาพ"""
+        t0 = time.perf_counter()
+        self.frame_idx += 1
+        frames = list(frames)
+        shape_res = self._predict_shapes(frames) if self.shape_model is not None else [None] * len(frames)
+        defect_res = self._predict_defects(frames) if self.defect_model is not None else [None] * len(frames)
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        out = []
+        for s_res, d_res in zip(shape_res, defect_res):
+            shape_dets = self._shape_dets(s_res) if s_res is not None else []
+            defect_dets, candidates = [], []
+            if d_res is not None:
+                defect_dets, candidates = self._split_candidates(
+                    result_dets(d_res, self.defect_model.names, keep=self.defect_classes))
+            out.append(InspectionResult(shape_dets, defect_dets, d_res is not None, self.shape_conf, self.last_ms,
+                                        candidates))
+        return out
@@ -0,0 +1,510 @@
+# inspection_core/process_pool.py
+# -*- coding: utf-8 -*-
+# inference หลาย process บน CPU: replica ของ shape/defect model คนละ process (ไม่ติด GIL, ใช้ core ได้ครบ)
+#
+# โหมด
+#   "stage"       : worker shape กับ worker defect แยกกัน → สองขั้นของเฟรมเดียวกันรันขนานกัน
+#                   (แทนที่จะรอ predict สองรอบต่อกัน) และเฟรมถัดไปเข้าได้ทันทีที่ worker ว่าง
+#   "round_robin" : ทุก worker มีทั้ง shape + defect → เฟรมไปลง worker ที่งานค้างน้อยสุด
+# ผลกลับมาไม่เรียงลำดับ → ประกอบ shape/defect ของ seq เดียวกัน แล้วปล่อยตามลำดับ seq ก่อนถึง gating
+# torch threads ต่อ worker = core ทั้งหมด / จำนวน worker (กัน oversubscription)
+# เฟรมอยู่ใน SharedFrameRing (shared memory) → queue ส่งแค่ (slot, seq) ; เฟรมที่ลง ring ไม่ได้ค่อย pickle
+#
+# Benchmark (เทียบกับ TwoStagePipeline ใน process เดียว / ส่งเฟรมแบบ pickle):
+#   python -m inspection_core.process_pool --source captures/ --frames 200 --replicas 1 2 4 --mode stage
+#   python -m inspection_core.process_pool --source captures/ --replicas 2 --no-shm
+
+import os, sys, time, argparse
+import multiprocessing as mp
+import queue as queue_mod
+
+from .pipelines import InspectionResult, TwoStagePipeline
+from .frame_ring import SharedFrameRing
+
+MODES = ("stage", "round_robin")
+
+
+def build_spec(shape_weights, defect_weights, shape_map, defect_classes, sliced=None, **pipeline_params):
+    """
+    ทุกอย่างที่ worker ต้องใช้สร้าง TwoStagePipeline เอง (pickle ได้ ไม่มีตัวโมเดล)
+      sliced          : kwargs ของ SlicedDefectInference (None = ไม่สร้าง)
+      pipeline_params : kwargs ของ TwoStagePipeline (imgsz, shape_conf, track_conf, ...)
+    """
+    return {
+        "shape_weights": shape_weights,
+        "defect_weights": defect_weights,
+        "shape_map": dict(shape_map),
+        "defect_classes": set(defect_classes),
+        "sliced": dict(sliced) if sliced else None,
+        "pipeline": dict(pipeline_params),
+    }
+
+
+# -----------------------------
+# Worker process
+# -----------------------------
+def _build_worker_pipeline(spec, role):
+    from ultralytics import YOLO
+    shape_model = YOLO(spec["shape_weights"]) if role in ("both", "shape") else None
+    defect_model = YOLO(spec["defect_weights"]) if role in ("both", "defect") else None
+    sliced = None
+    if defect_model is not None and spec["sliced"]:
+        from sliced_inference import SlicedDefectInference
+        sliced = SlicedDefectInference(defect_model, classes=spec["defect_classes"], **spec["sliced"])
+    return TwoStagePipeline(shape_model, defect_model, spec["shape_map"], spec["defect_classes"],
+                            sliced=sliced, **spec["pipeline"])
+
+
+def _resolve(ref, ring):
+    """ref จาก queue → เฟรม: ("ring", slot, seq) = view ใน shared memory, อย่างอื่น = array ที่ pickle มา"""
+    if isinstance(ref, tuple):
+        return ring.read(ref[1], ref[2])
+    return ref
+
+
+def _worker_main(idx, role, spec, threads, in_q, out_q, ring=None):
+    # ต้องตั้งก่อน import torch (ultralytics) ใน process นี้
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    try:
+        pipe = _build_worker_pipeline(spec, role)
+        try:
+            import torch
+            torch.set_num_threads(threads)
+        except ImportError:
+            pass
+        pipe.warmup()
+    except Exception as e:
+        out_q.put(("failed", idx, repr(e)))
+        return
+    out_q.put(("ready", idx, None))
+
+    while True:
+        msg = in_q.get()
+        if msg is None:
+            break
+        if msg[0] == "config":
+            _, params, sliced = msg
+            pipe.configure(**params)
+            if sliced and pipe.sliced is not None:
+                for k, v in sliced.items():
+                    setattr(pipe.sliced, k, v)
+            continue
+        _, seq, frame_ref, full_ref, plate_hint, shape, defect = msg
+        try:
+            frame, frame_full = _resolve(frame_ref, ring), _resolve(full_ref, ring)
+            result = pipe.run_stages(frame, shape=shape, defect=defect, frame_full=frame_full, plate_hint=plate_hint)
+            out_q.put(("result", idx, (seq, result)))
+        except Exception as e:
+            out_q.put(("error", idx, (seq, repr(e))))
+        finally:
+            frame = frame_full = None
+            for ref in (frame_ref, full_ref):
+                if isinstance(ref, tuple):
+                    ring.release(ref[1])
+
+
+# -----------------------------
+# Pool (ฝั่ง GUI)
+# -----------------------------
+class ProcessInferencePool:
+    """
+    submit(frame, ...) → seq (None = งานค้างเต็ม ทิ้งเฟรมนี้) ; poll() → [(seq, frame, InspectionResult)] เรียงตาม seq
+      replicas        : จำนวน worker ต่อโมเดล (stage: shape กับ defect อย่างละ replicas ; defect_replicas แยกได้)
+      threads         : torch threads ต่อ worker (None = แบ่ง core เท่า ๆ กัน)
+      max_inflight    : เฟรมค้างในระบบสูงสุด (เกิน = ทิ้งเฟรมใหม่ เหมือนกล้องที่เก็บเฉพาะเฟรมล่าสุด)
+      timeout         : seq ที่รอนานเกินนี้ (วินาที) ถูกข้าม ไม่ให้ค้างทั้งแถว
+      use_shm         : ส่งเฟรมผ่าน SharedFrameRing (ring_shape = เฟรมใหญ่สุด, ring_slots = จำนวน slot)
+    defect_every_n ตัดสินที่นี่ตาม seq (worker รันเฉพาะขั้นที่สั่ง)
+    เฟรมที่ poll() คืนเป็น view ใน ring ใช้ได้ถึง poll() ครั้งถัดไป (annotate ทำสำเนาอยู่แล้ว)
+    """
+
+    def __init__(self, spec, replicas=2, mode="stage", defect_replicas=None, threads=None,
+                 max_inflight=None, timeout=2.0, use_shm=True, ring_shape=(1080, 1920, 3), ring_slots=None):
+        if mode not in MODES:
+            raise ValueError(f"mode ต้องเป็นหนึ่งใน {MODES}: {mode!r}")
+        self.spec = spec
+        self.mode = mode
+        if mode == "stage":
+            self.roles = ["shape"] * max(1, replicas) + ["defect"] * max(1, defect_replicas or replicas)
+        else:
+            self.roles = ["both"] * max(1, replicas)
+        self.threads = threads or max(1, (os.cpu_count() or 1) // len(self.roles))
+        self.max_inflight = max_inflight or 2 * len(self.roles)
+        self.timeout = timeout
+
+        params = spec["pipeline"]
+        self.shape_conf = params.get("shape_conf", 0.55)
+        self.defect_every_n = params.get("defect_every_n", 1)
+        self.defect_mode = params.get("defect_mode", "full")
+
+        self._ctx = mp.get_context("spawn")
+        self._procs, self._in_qs, self._load = [], [], []
+        self._out_q = None
+        self._pending = {}        # seq -> {"frame", "slot", "t", "need", "shape", "defect"}
+        self._rr = 0
+
+        self.use_shm = use_shm
+        self.ring_shape = ring_shape
+        # ต่อเฟรมค้าง: เฟรมย่อ + เฟรมเต็ม (sliced) ; +2 = เฟรมที่ผู้เรียกถือระหว่าง poll และเฟรมที่ claim ไว้
+        self.ring_slots = ring_slots or 2 * self.max_inflight + 2
+        self.ring = None
+        self._claimed = {}        # id(view) -> (slot, view) ที่ claim_frame จองไว้ ยังไม่ submit
+        self._held = []           # slot ของเฟรมที่ poll() คืนไปแล้ว ปล่อยตอน poll() ครั้งถัดไป
+        self.ring_misses = 0      # เฟรมที่ลง ring ไม่ได้ (เต็ม/ใหญ่เกิน) ต้อง pickle แทน
+
+        self.seq = 0              # seq ล่าสุดที่รับเข้า
+        self.next_seq = 1         # seq ถัดไปที่จะปล่อย
+        self.completed = 0
+        self.dropped = 0          # ทิ้งตอน submit (งานค้างเต็ม)
+        self.skipped = 0          # ข้ามเพราะรอเกิน timeout
+        self.errors = 0
+        self.latency_ms = 0.0
+        self.fps = 0.0
+        self._last_out_t = None
+
+    # ---- lifecycle ----
+    def start(self, wait=True, timeout=300.0):
+        self._out_q = self._ctx.Queue()
+        if self.use_shm:
+            self.ring = SharedFrameRing(self.ring_slots, self.ring_shape, self._ctx.Lock())
+        for idx, role in enumerate(self.roles):
+            in_q = self._ctx.Queue()
+            p = self._ctx.Process(target=_worker_main, name=f"infer-{role}-{idx}", daemon=True,
+                                  args=(idx, role, self.spec, self.threads, in_q, self._out_q, self.ring))
+            p.start()
+            self._procs.append(p)
+            self._in_qs.append(in_q)
+            self._load.append(0)
+        if wait:
+            self.wait_ready(timeout)
+        return self
+
+    def wait_ready(self, timeout=300.0):
+        """รอทุก worker โหลดโมเดล + warm-up เสร็จ ; worker ใดล้ม → ปิด pool แล้ว raise RuntimeError"""
+        ready = set()
+        deadline = time.perf_counter() + timeout
+        while len(ready) < len(self._procs):
+            try:
+                kind, idx, info = self._out_q.get(timeout=max(0.1, deadline - time.perf_counter()))
+            except queue_mod.Empty:
+                self.close()
+                raise RuntimeError(f"worker พร้อม {len(ready)}/{len(self._procs)} ภายใน {timeout:.0f}s")
+            if kind == "failed":
+                self.close()
+                raise RuntimeError(f"worker {idx} ({self.roles[idx]}) โหลดโมเดลไม่สำเร็จ: {info}")
+            if kind == "ready":
+                ready.add(idx)
+
+    def close(self):
+        for q in self._in_qs:
+            try:
+                q.put(None)
+            except Exception:
+                pass
+        for p in self._procs:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        self._procs, self._in_qs, self._load = [], [], []
+        self._pending.clear()
+        self._claimed.clear()
+        self._held = []
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+    def alive(self):
+        return bool(self._procs) and all(p.is_alive() for p in self._procs)
+
+    # ---- config ----
+    def configure(self, sliced=None, **params):
+        """ส่งค่าใหม่ให้ทุก worker (เหมือน InspectionPipeline.configure) ; sliced = ค่าของ SlicedDefectInference"""
+        self.shape_conf = params.get("shape_conf", self.shape_conf)
+        self.defect_every_n = params.get("defect_every_n", self.defect_every_n)
+        self.defect_mode = params.get("defect_mode", self.defect_mode)
+        for q in self._in_qs:
+            q.put(("config", params, sliced))
+
+    def reset(self):
+        """ทิ้งงานค้างทั้งหมด (เช่น ตอนกดเริ่มใหม่) ; ผลของ seq เก่าที่มาทีหลังถูกเมิน"""
+        for entry in self._pending.values():
+            self._unhold(entry["slot"])
+        self._pending.clear()
+        self.next_seq = self.seq + 1
+
+    # ---- shared-memory frames ----
+    def claim_frame(self, shape):
+        """
+        slot ว่างใน ring ให้ผู้เรียกเขียนเฟรมลงตรง ๆ เช่น cv2.resize(frame, size, dst=view) แล้วส่ง view เข้า submit
+        (ไม่มี copy เพิ่ม) ; ring เต็ม/ไม่ใช้ shm → None
+        """
+        if self.ring is None:
+            return None
+        slot, view = self.ring.acquire(-1, shape)
+        if slot is None:
+            return None
+        self._claimed[id(view)] = (slot, view)
+        return view
+
+    def _share(self, arr, seq, readers, keep):
+        """
+        เฟรม → (ref ที่ส่งเข้า queue, slot ที่ pool ถือ)
+        ref = ("ring", slot, seq) ถ้าอยู่/ลง ring ได้ ไม่งั้นตัว array (pickle) ; keep = pool ถือ slot ไว้ด้วย
+        """
+        if self.ring is None or arr is None:
+            return arr, None
+        claimed = self._claimed.pop(id(arr), None)
+        if claimed is not None and claimed[1] is arr:
+            slot = claimed[0]
+            self.ring.set_seq(slot, seq)
+        else:
+            slot = self.ring.put(arr, seq)
+            if slot is None:
+                self.ring_misses += 1
+                return arr, None
+        self.ring.retain(slot, readers)
+        ref = ("ring", slot, seq)
+        if not keep:
+            self.ring.release(slot)
+            return ref, None
+        return ref, slot
+
+    def _unhold(self, slot):
+        if slot is not None and self.ring is not None:
+            self.ring.release(slot)
+
+    def _drop_claims(self):
+        for slot, _ in self._claimed.values():
+            self.ring.release(slot)
+        self._claimed.clear()
+
+    # ---- dispatch ----
+    def _pick(self, role):
+        """worker ของ role ที่งานค้างน้อยสุด (เท่ากันวนแบบ round-robin)"""
+        self._rr += 1
+        n = len(self.roles)
+        idxs = [i for i, r in enumerate(self.roles) if r == role]
+        return min(idxs, key=lambda i: (self._load[i], (i - self._rr) % n))
+
+    def full(self):
+        return len(self._pending) >= self.max_inflight
+
+    def submit(self, frame, frame_full=None, plate_hint=None):
+        if self.full():
+            self.dropped += 1
+            if self.ring is not None:
+                self._drop_claims()
+            return None
+        self.seq += 1
+        seq = self.seq
+        run_defect = seq % max(1, self.defect_every_n) == 0
+        if self.mode == "stage":
+            jobs = [("shape", True, False)]
+            if run_defect:
+                jobs.append(("defect", False, True))
+        else:
+            jobs = [("both", True, run_defect)]
+        # เฟรมเต็มใช้เฉพาะ defect แบบ sliced ; ไม่ใช้ก็ไม่ต้องส่ง
+        full_readers = sum(1 for _, _, d in jobs if d) if self.defect_mode == "sliced" else 0
+
+        frame_ref, slot = self._share(frame, seq, len(jobs), keep=True)
+        full_ref = None
+        if frame_full is not None and full_readers:
+            full_ref, _ = self._share(frame_full, seq, full_readers, keep=False)
+        if self.ring is not None:
+            self._drop_claims()
+        if slot is not None:
+            frame = self.ring.read(slot, seq)
+
+        self._pending[seq] = {"frame": frame, "slot": slot, "t": time.perf_counter(), "need": len(jobs),
+                              "shape": None, "defect": None}
+        for role, shape, defect in jobs:
+            i = self._pick(role)
+            self._in_qs[i].put(("job", seq, frame_ref, full_ref if defect else None, plate_hint, shape, defect))
+            self._load[i] += 1
+        return seq
+
+    # ---- collect ----
+    def poll(self):
+        """ดึงผลที่เสร็จแล้ว (ไม่ block) คืนเฉพาะ seq ที่ต่อเนื่องจากครั้งก่อน"""
+        for slot in self._held:
+            self._unhold(slot)
+        self._held = []
+        while True:
+            try:
+                kind, idx, info = self._out_q.get_nowait()
+            except queue_mod.Empty:
+                break
+            if kind not in ("result", "error"):
+                continue
+            self._load[idx] = max(0, self._load[idx] - 1)
+            seq, payload = info
+            entry = self._pending.get(seq)
+            if entry is None:
+                continue          # ถูกข้าม/reset ไปแล้ว
+            if kind == "error":
+                self.errors += 1
+                print(f"[InferPool] worker {idx} seq {seq}: {payload}")
+                payload = InspectionResult([], [], False, self.shape_conf)
+            role = self.roles[idx]
+            if role in ("both", "shape"):
+                entry["shape"] = payload
+            if role in ("both", "defect"):
+                entry["defect"] = payload
+            entry["need"] -= 1
+        return self._release()
+
+    def _release(self):
+        now = time.perf_counter()
+        out = []
+        while self.next_seq <= self.seq:
+            seq = self.next_seq
+            entry = self._pending.get(seq)
+            if entry is not None and entry["need"] > 0:
+                if now - entry["t"] < self.timeout:
+                    break
+                self.skipped += 1
+                self._unhold(entry["slot"])
+            elif entry is not None:
+                out.append((seq, entry["frame"], self._assemble(entry, now)))
+                if entry["slot"] is not None:
+                    self._held.append(entry["slot"])
+            self._pending.pop(seq, None)
+            self.next_seq += 1
+        return out
+
+    def _assemble(self, entry, now):
+        s, d = entry["shape"], entry["defect"]
+        parts = [r for r in (s, d) if r is not None]
+        result = InspectionResult(
+            s.shape_dets if s is not None else [],
+            d.defect_dets if d is not None else [],
+            d.ran_defect if d is not None else False,
+            self.shape_conf,
+            max(r.infer_ms for r in parts) if parts else 0.0,   # stage: สองขั้นรันขนานกัน
+            d.candidates if d is not None else [],
+        )
+        self.completed += 1
+        self.latency_ms = 0.9 * self.latency_ms + 0.1 * ((now - entry["t"]) * 1000.0)
+        if self._last_out_t is not None and now > self._last_out_t:
+            self.fps = 0.9 * self.fps + 0.1 * (1.0 / (now - self._last_out_t))
+        self._last_out_t = now
+        return result
+
+    def stats(self):
+        return {
+            "mode": self.mode,
+            "workers": len(self._procs),
+            "threads": self.threads,
+            "inflight": len(self._pending),
+            "completed": self.completed,
+            "fps": round(self.fps, 2),
+            "latency_ms": round(self.latency_ms, 1),
+            "dropped": self.dropped,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "shm_slots_in_use": self.ring.in_use() if self.ring is not None else None,
+            "shm_misses": self.ring_misses,
+        }
+
+
+# -----------------------------
+# Benchmark CLI
+# -----------------------------
+def _read_frames(source, n, size):
+    from capture_backend import open_source
+    from lazy_imports import lazy_import
+    cv2 = lazy_import("cv2")
+    cap = open_source(source, threaded=False, loop=True, realtime=False)
+    frames = []
+    try:
+        while len(frames) < n:
+            ret, f = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.resize(f, size))
+    finally:
+        cap.release()
+    return frames
+
+
+def _bench_inprocess(spec, frames):
+    from ultralytics import YOLO
+    pipe = TwoStagePipeline(YOLO(spec["shape_weights"]), YOLO(spec["defect_weights"]),
+                            spec["shape_map"], spec["defect_classes"], **spec["pipeline"])
+    pipe.warmup()
+    t0 = time.perf_counter()
+    lat = []
+    for f in frames:
+        t = time.perf_counter()
+        pipe.run(f)
+        lat.append((time.perf_counter() - t) * 1000.0)
+    dt = time.perf_counter() - t0
+    return len(frames) / dt, sum(lat) / len(lat), 0
+
+
+def _bench_pool(spec, frames, replicas, mode, use_shm):
+    pool = ProcessInferencePool(spec, replicas=replicas, mode=mode, timeout=30.0, use_shm=use_shm,
+                                ring_shape=frames[0].shape).start()
+    try:
+        lat, t_sub = [], {}
+
+        def collect():
+            for s, _, _ in pool.poll():
+                lat.append((time.perf_counter() - t_sub.pop(s)) * 1000.0)
+
+        t0 = time.perf_counter()
+        for f in frames:
+            # ป้อนเต็มกำลัง: งานค้างเต็ม → รอผลก่อน (benchmark ไม่ทิ้งเฟรม)
+            while pool.full():
+                collect()
+                time.sleep(0.001)
+            t_sub[pool.submit(f)] = time.perf_counter()
+        while pool.next_seq <= pool.seq:
+            collect()
+            time.sleep(0.001)
+        dt = time.perf_counter() - t0
+        return len(frames) / dt, sum(lat) / max(1, len(lat)), pool.threads
+    finally:
+        pool.close()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark multi-process two-stage inference vs single process")
+    ap.add_argument("--shape-weights", default=os.path.join("models", "shape_best_rf.pt"))
+    ap.add_argument("--defect-weights", default=os.path.join("models", "defect_best.pt"))
+    ap.add_argument("--source", required=True, help="index กล้อง, ไฟล์วิดีโอ หรือโฟลเดอร์รูป")
+    ap.add_argument("--frames", type=int, default=200)
+    ap.add_argument("--display", default="960x540", help="ขนาดเฟรมที่ GUI ย่อก่อนส่งเข้าโมเดล")
+    ap.add_argument("--imgsz", type=int, default=896)
+    ap.add_argument("--replicas", type=int, nargs="+", default=[1, 2, 4])
+    ap.add_argument("--mode", choices=MODES, nargs="+", default=list(MODES))
+    ap.add_argument("--no-shm", action="store_true", help="ส่งเฟรมแบบ pickle ผ่าน queue (เทียบกับ shared memory)")
+    args = ap.parse_args(argv)
+
+    shape_map = {"heart_shaped_leaf_plate": "heart", "rectangular_leaf_plate": "rectangle",
+                 "circle_leaf_plate": "circle"}
+    spec = build_spec(args.shape_weights, args.defect_weights, shape_map, {"crack", "hole"},
+                      imgsz=args.imgsz, shape_max_det=1, shape_agnostic=True)
+    w, h = [int(v) for v in args.display.lower().split("x")]
+    frames = _read_frames(args.source, args.frames, (w, h))
+    if not frames:
+        print(f"[ERROR] no frames from {args.source}")
+        return 1
+
+    print(f"{len(frames)} frames {w}x{h} | imgsz {args.imgsz} | {os.cpu_count()} cores | "
+          f"frames via {'pickle' if args.no_shm else 'shared memory'}")
+    print(f"{'mode':<14}{'workers':>8}{'threads':>8}{'fps':>8}{'mean ms':>10}{'speedup':>9}")
+    base_fps, base_ms, _ = _bench_inprocess(spec, frames)
+    print(f"{'in-process':<14}{1:>8}{'-':>8}{base_fps:>8.1f}{base_ms:>10.1f}{1.0:>8.2f}x")
+    for mode in args.mode:
+        for r in args.replicas:
+            fps, ms, threads = _bench_pool(spec, frames, r, mode, not args.no_shm)
+            workers = r * 2 if mode == "stage" else r
+            print(f"{mode:<14}{workers:>8}{threads:>8}{fps:>8.1f}{ms:>10.1f}{fps / base_fps:>8.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+# inspection_core/services.py
+# -*- coding: utf-8 -*-
+# ของที่ทุก GUI ต่อเหมือนกันรอบ ๆ pipeline: dependency หนักแบบ lazy, captures/, retention, hard-example mining,
+# Firebase และแหล่งภาพ ; GUI สร้าง AppServices ตัวเดียวใน initialize_data แล้วเรียก start()/stop()
+#
+# ปรับผ่าน env (ทดสอบโดยไม่มีกล้อง / ไม่ต่อ Firebase จริงได้):
+#   LEAFPLATE_SOURCE        index กล้อง / ไฟล์วิดีโอ / โฟลเดอร์รูป (ค่าเริ่มต้น 0)
+#   LEAFPLATE_MINING=0      ปิด HardExampleMiner (ดู python -m inspection_core.mining)
+#   LEAFPLATE_FIREBASE_URL  RTDB ปลายทาง (เช่น fake_rtdb.py ตอนทดสอบ)
+
+import os
+
+from lazy_imports import lazy_import, lazy_from
+# dependency หนักโหลดแบบ lazy (ดู lazy_imports.py) → หน้าต่างขึ้นก่อน ค่อยจ่ายค่า import ตอนใช้จริง
+cv2 = lazy_import("cv2", cache_attrs=True)
+YOLO = lazy_from("ultralytics", "YOLO")
+
+from capture_backend import open_source
+from retention_manager import RetentionManager
+from .firebase import FirebaseClient
+from .mining import HardExampleMiner
+
+FIREBASE_URL = "https://leaf-plate-defect-detec-w-cnn-default-rtdb.asia-southeast1.firebasedatabase.app"
+
+
+class AppServices:
+    """
+    base_dir : โฟลเดอร์ของ GUI (captures/, mining/, serviceAccountKey.json อยู่ใต้นี้)
+    mining   : False = ไม่เก็บ hard example เลย (เช่น GUI หลายกล้อง)
+    """
+
+    def __init__(self, base_dir, mining=True):
+        self.base_dir = base_dir
+        self.captures_dir = os.path.join(base_dir, "captures")
+        os.makedirs(self.captures_dir, exist_ok=True)
+        # แพ็กรูปเก่าเป็น shard รายวัน + คุมพื้นที่ดิสก์ (thread เบื้องหลัง)
+        self.retention = RetentionManager(base_dir)
+        # เฟรมที่โมเดลไม่แน่ใจ → mining/ ไว้เทรนต่อ
+        self.miner = HardExampleMiner(os.path.join(base_dir, "mining"))
+        self.miner.enabled = mining and os.environ.get("LEAFPLATE_MINING", "1") != "0"
+        self.firebase_base = os.environ.get("LEAFPLATE_FIREBASE_URL", FIREBASE_URL)
+        self.fb = FirebaseClient(self.firebase_base, os.path.join(base_dir, "serviceAccountKey.json"))
+
+    @property
+    def candidate_conf(self):
+        """ค่า candidate_conf ของ pipeline: เก็บกล่องตำหนิ conf ต่ำไว้ให้ miner (None = ไม่ต้องเก็บ)"""
+        return self.miner.defect_band[0] if self.miner.enabled else None
+
+    def open_camera(self, width=1280, height=720):
+        """เปิด LEAFPLATE_SOURCE → CaptureSource หรือ None ถ้าเปิดไม่ได้"""
+        cap = open_source(os.environ.get("LEAFPLATE_SOURCE", "0"), width=width, height=height, loop=True)
+        if not cap.isOpened():
+            print("Cannot open camera")
+            return None
+        print(f"[Camera] {cap.stats()}")
+        return cap
+
+    def start(self):
+        self.retention.start_background()
+
+    def stop(self):
+        self.retention.stop()
+        self.miner.stop()
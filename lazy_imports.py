@@ -0,0 +1,152 @@
+# lazy_imports.py
+# -*- coding: utf-8 -*-
+# import แบบ lazy สำหรับ dependency หนัก ๆ ของ GUI (ultralytics, cv2, firebase_admin, openpyxl, emojis, colorama)
+#
+# - lazy_import("cv2")                  → proxy ของ module, import จริงตอนใช้ attribute ครั้งแรก
+# - lazy_from("ultralytics", "YOLO")    → proxy ของ object ใน module, import ตอนเรียก/ใช้ครั้งแรก
+# - is_available("emojis")              → เช็คว่าติดตั้งไว้ไหม โดยไม่ import จริง
+# ผล: หน้าต่าง GUI ขึ้นได้ก่อน แล้วค่อยจ่ายค่า import ตอนเปิดกล้อง/โหลดโมเดล/บันทึก Excel จริง
+#
+# วัดค่า import ต่อ module (แต่ละตัวรันใน interpreter ใหม่ = cold import):
+#   python lazy_imports.py GUI_mac
+#   python lazy_imports.py GUI_w_two_stage_model --top 30
+
+import os, sys, re, argparse, importlib, importlib.util, subprocess
+
+
+class LazyModule:
+    """proxy ของ module: import จริงเมื่อเข้าถึง attribute ครั้งแรก (thread-safe ด้วย import lock ของ Python)"""
+
+    def __init__(self, name, cache_attrs=False, on_load=None):
+        d = self.__dict__
+        d["_lazy_name"] = name
+        d["_lazy_mod"] = None
+        d["_lazy_cache"] = cache_attrs    # True: เก็บ attribute ไว้ที่ proxy (เช่น cv2 ที่ถูกเรียกทุกเฟรม)
+        d["_lazy_on_load"] = on_load
+
+    def _lazy_load(self):
+        mod = self.__dict__["_lazy_mod"]
+        if mod is None:
+            mod = importlib.import_module(self.__dict__["_lazy_name"])
+            self.__dict__["_lazy_mod"] = mod
+            hook = self.__dict__["_lazy_on_load"]
+            if hook is not None:
+                hook(mod)
+        return mod
+
+    def __getattr__(self, item):
+        val = getattr(self._lazy_load(), item)
+        if self.__dict__["_lazy_cache"]:
+            self.__dict__[item] = val
+        return val
+
+    def __setattr__(self, item, value):
+        setattr(self._lazy_load(), item, value)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_mod"] is not None else "not loaded"
+        return f"<lazy module '{self.__dict__['_lazy_name']}' ({state})>"
+
+
+class LazyAttr:
+    """proxy ของ object ใน module (class/ฟังก์ชัน) เช่น YOLO, Font, get_column_letter"""
+
+    def __init__(self, module, attr):
+        self._module = module
+        self._attr = attr
+        self._obj = None
+
+    def _resolve(self):
+        if self._obj is None:
+            self._obj = getattr(importlib.import_module(self._module), self._attr)
+        return self._obj
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __getattr__(self, item):
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return getattr(self._resolve(), item)
+
+    def __repr__(self):
+        return f"<lazy {self._module}.{self._attr}>"
+
+
+def lazy_import(name, cache_attrs=False, on_load=None):
+    return LazyModule(name, cache_attrs=cache_attrs, on_load=on_load)
+
+
+def lazy_from(module, attr):
+    return LazyAttr(module, attr)
+
+
+def is_available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+# -----------------------------
+# Import-time profiler
+# -----------------------------
+HEAVY_MODULES = ["ultralytics", "torch", "cv2", "numpy", "PIL", "customtkinter",
+                 "firebase_admin", "openpyxl", "emojis", "colorama"]
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def _importtime(stmt, cwd):
+    """รัน python -X importtime ใน process ใหม่ คืน [(self_us, cum_us, depth, name)]"""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", stmt],
+                          cwd=cwd, capture_output=True, text=True)
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if m:
+            rows.append((int(m.group(1)), int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return rows, proc.returncode, proc.stderr
+
+
+def profile_module(target, top=20, cwd=None):
+    cwd = cwd or os.path.dirname(os.path.abspath(__file__))
+    target = target[:-3] if target.endswith(".py") else target
+
+    rows, rc, err = _importtime(f"import {target}", cwd)
+    if rc != 0:
+        tail = [l for l in err.splitlines() if not l.startswith("import time:")][-3:]
+        print(f"[WARN] import {target} failed (rc={rc}): {' | '.join(tail)}")
+    total_us = sum(r[0] for r in rows)
+    print(f"import {target}: {total_us / 1000.0:.1f} ms total ({len(rows)} modules)")
+
+    # top-level packages (depth 0) เรียงตาม cumulative
+    tops = sorted((r for r in rows if r[2] == 0), key=lambda r: r[1], reverse=True)[:top]
+    print(f"\n{'package (cumulative)':<40}{'ms':>10}")
+    for self_us, cum_us, _, name in tops:
+        print(f"{name:<40}{cum_us / 1000.0:>10.1f}")
+
+    # dependency หนัก: วัดแยกทีละตัวแบบ cold ว่าถ้า import ตอนเปิดโปรแกรมจะเสียเท่าไร
+    print(f"\n{'heavy dependency (cold, alone)':<40}{'ms':>10}  {'loaded by ' + target}")
+    loaded = {r[3] for r in rows}
+    for mod in HEAVY_MODULES:
+        if not is_available(mod):
+            print(f"{mod:<40}{'-':>10}  not installed")
+            continue
+        r2, _, _ = _importtime(f"import {mod}", cwd)
+        cum = max((r[1] for r in r2 if r[3] == mod), default=0)
+        print(f"{mod:<40}{cum / 1000.0:>10.1f}  {'yes' if mod in loaded else 'no (lazy)'}")
+    return total_us / 1000.0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Per-module import-time profile of a GUI entry point")
+    ap.add_argument("target", help="ชื่อ module/ไฟล์ เช่น GUI_mac หรือ GUI_w_two_stage_model.py")
+    ap.add_argument("--top", type=int, default=20)
+    args = ap.parse_args(argv)
+    profile_module(args.target, top=args.top)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# model_eval.py
+# -*- coding: utf-8 -*-
+# วัดผลโมเดลแบบเดียวกันทุกเครื่องมือเทรน (sweep / promote / distill / prune / เทียบ pipeline)
+#
+# - eval_metrics : mAP50 / mAP50-95 / precision / recall ต่อคลาส จาก model.val บน split ที่กำหนด
+# - fixed_frames : ชุดเฟรมคงที่จาก split ของ data.yaml (เรียงชื่อไฟล์ → ได้ชุดเดิมทุกครั้ง)
+# - bench_latency: เวลา predict ทีละเฟรม (batch 1 แบบที่ GUI ใช้จริง) บน CPU → median / p90 ms
+
+import os, time
+
+import numpy as np
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+from dataset_check import load_data_yaml, _scan, IMG_EXTS
+
+
+def split_for_eval(data_yaml, prefer="test"):
+    """split ที่ใช้วัดผล: prefer ถ้ามีใน data.yaml ไม่งั้น val"""
+    _, _, _, splits = load_data_yaml(data_yaml)
+    return prefer if prefer in splits else "val"
+
+
+def _read_frames(paths, n):
+    frames = []
+    for p in sorted(paths):
+        im = cv2.imdecode(np.fromfile(p, np.uint8), cv2.IMREAD_COLOR)
+        if im is not None:
+            frames.append(im)
+        if len(frames) >= n:
+            break
+    return frames
+
+
+def fixed_frames(data_yaml, split="test", n=20):
+    """n เฟรมแรก (เรียงตาม path) ของ split → [ndarray BGR]"""
+    _, _, _, splits = load_data_yaml(data_yaml)
+    paths = []
+    for d in splits.get(split) or splits.get("val") or []:
+        paths.extend(p for p, _, _ in _scan(d, IMG_EXTS).values())
+    return _read_frames(paths, n)
+
+
+def frames_from_dir(folder, n=20):
+    """n รูปแรก (เรียงตาม path) จากโฟลเดอร์ เช่น captures/ → [ndarray BGR]"""
+    from pathlib import Path
+    return _read_frames([p for p, _, _ in _scan(Path(folder), IMG_EXTS).values()], n)
+
+
+def bench_latency(model, frames, imgsz, device="cpu", warmup=3, **predict_kw):
+    """เวลา predict ทีละเฟรม → {"median_ms", "p90_ms", "frames"} ; model = ultralytics YOLO"""
+    if not frames:
+        return {"median_ms": None, "p90_ms": None, "frames": 0}
+    for i in range(warmup):
+        model.predict(frames[i % len(frames)], imgsz=imgsz, device=device, verbose=False, **predict_kw)
+    times = []
+    for f in frames:
+        t0 = time.perf_counter()
+        model.predict(f, imgsz=imgsz, device=device, verbose=False, **predict_kw)
+        times.append((time.perf_counter() - t0) * 1000.0)
+    return {"median_ms": float(np.median(times)), "p90_ms": float(np.percentile(times, 90)), "frames": len(times)}
+
+
+def eval_metrics(model, data_yaml, split="test", imgsz=896, device="cpu", batch=8, **val_kw):
+    """model.val → {"map50", "map50_95", "precision", "recall", "per_class": {ชื่อ: {"p", "r", "ap50", "ap"}}}"""
+    m = model.val(data=str(data_yaml), split=split, imgsz=imgsz, device=device, batch=batch,
+                  plots=False, verbose=False, **val_kw)
+    box = m.box
+    names = getattr(m, "names", None) or getattr(model, "names", {}) or {}
+    per_class = {}
+    for i, c in enumerate(getattr(box, "ap_class_index", [])):
+        p, r, ap50, ap = box.class_result(i)
+        per_class[str(names.get(int(c), c))] = {"p": round(float(p), 4), "r": round(float(r), 4),
+                                               "ap50": round(float(ap50), 4), "ap": round(float(ap), 4)}
+    return {"map50": float(box.map50), "map50_95": float(box.map),
+            "precision": float(box.mp), "recall": float(box.mr), "per_class": per_class}
+
+
+def model_size_mb(path):
+    try:
+        return os.path.getsize(path) / 2 ** 20
+    except OSError:
+        return None
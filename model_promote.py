@@ -0,0 +1,331 @@
+# model_promote.py
+# -*- coding: utf-8 -*-
+# ขั้น promote หลังเทรน: เอาโมเดลจาก run ที่เทรนเสร็จไปแทนโมเดลที่ GUI ใช้ เฉพาะเมื่อไม่แย่ลง
+#
+# ขั้นตอนต่อ candidate (runs/<run>/weights/best.pt):
+#   1) export รูปแบบที่ deploy ได้ (onnx / openvino ; export ไม่ผ่าน = บันทึกไว้ ไม่หยุดทั้งขั้น)
+#   2) วัด latency CPU ที่ imgsz ตอนรันจริง (config/two_stage.yaml) บนชุดเฟรมคงที่ ทั้ง .pt และไฟล์ที่ export
+#   3) validate บน test split (mAP, recall ต่อคลาส)
+#   4) ทำข้อ 2-3 กับโมเดลที่ deploy อยู่ (ชุดเฟรม/split เดียวกัน) แล้วเทียบ
+#   5) promote เมื่อ mAP50-95 ไม่ลดเกิน max_map_drop, recall ทุกคลาสไม่ลดเกิน max_recall_drop
+#      และ latency (.pt) ไม่เพิ่มเกิน max_latency_increase
+# registry: models/registry/<role>/vNNN/ (best.pt + ไฟล์ export + report.json)
+#           models/registry.json = manifest ทุกเวอร์ชัน (รวม candidate ที่ไม่ผ่าน + เหตุผล) และเวอร์ชันที่ใช้อยู่
+# การแทนไฟล์ deploy ใช้ copy ลง .tmp แล้ว os.replace (GUI ที่กำลังเปิดไฟล์จะไม่เห็นไฟล์ครึ่ง ๆ)
+#
+# ใช้งาน:
+#   python model_promote.py runs/defect_only_from_shape_img896_e100 --role defect
+#   python model_promote.py runs/shape_only_from_dataset2_img896_e100/weights/best.pt --role shape --dry-run
+#   python model_promote.py --list
+#   python model_promote.py --rollback defect 2
+
+import os, sys, json, shutil, hashlib, argparse
+from datetime import datetime
+
+import yaml
+
+from model_eval import eval_metrics, fixed_frames, frames_from_dir, bench_latency, split_for_eval, model_size_mb
+
+ROLES = {
+    "shape":  {"deploy": os.path.join("models", "shape_best_rf.pt"),
+               "data": os.path.join("dataset2_only_shape", "data.yaml"),
+               "imgsz_key": ("inference", "imgsz")},
+    "defect": {"deploy": os.path.join("models", "defect_best.pt"),
+               "data": os.path.join("dataset2_only_defect", "data.yaml"),
+               "imgsz_key": ("defect", "defect_imgsz")},
+}
+REGISTRY_DIR = os.path.join("models", "registry")
+MANIFEST = os.path.join("models", "registry.json")
+RUNTIME_CONFIG = os.path.join("config", "two_stage.yaml")
+FORMATS = ("onnx", "openvino")
+
+MAX_MAP_DROP = 0.005          # mAP50-95 ลดได้ไม่เกิน
+MAX_RECALL_DROP = 0.02        # recall ต่อคลาสลดได้ไม่เกิน
+MAX_LATENCY_INCREASE = 0.05   # latency เพิ่มได้ไม่เกิน 5%
+
+
+def runtime_imgsz(role, default=896):
+    """imgsz ที่ GUI ใช้จริงจาก config/two_stage.yaml (ไม่มีไฟล์/ไม่มี key = default)"""
+    try:
+        with open(RUNTIME_CONFIG, "r", encoding="utf-8") as f:
+            cfg = yaml.safe_load(f) or {}
+        section, key = ROLES[role]["imgsz_key"]
+        return int(cfg.get(section, {}).get(key, default))
+    except (OSError, ValueError, AttributeError):
+        return default
+
+
+def sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _now():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+# -----------------------------
+# manifest
+# -----------------------------
+def load_manifest():
+    try:
+        with open(MANIFEST, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(man):
+    os.makedirs(os.path.dirname(MANIFEST), exist_ok=True)
+    tmp = MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(man, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, MANIFEST)
+
+
+def _role_entry(man, role):
+    return man.setdefault(role, {"current": None, "versions": []})
+
+
+def _next_version(entry):
+    return max([v["version"] for v in entry["versions"] if v.get("version")] or [0]) + 1
+
+
+def _version_dir(role, version):
+    return os.path.join(REGISTRY_DIR, role, f"v{version:03d}")
+
+
+def _deploy_file(src, dst):
+    os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+    tmp = dst + ".tmp"
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _adopt_deployed(man, role):
+    """ไฟล์ deploy ที่ยังไม่อยู่ใน registry (วางเองก่อนมี registry) → เก็บเป็นเวอร์ชันหนึ่งไว้ rollback ได้"""
+    deploy = ROLES[role]["deploy"]
+    if not os.path.isfile(deploy):
+        return
+    entry = _role_entry(man, role)
+    digest = sha256(deploy)
+    if any(v.get("sha256") == digest and v.get("promoted") for v in entry["versions"]):
+        return
+    version = _next_version(entry)
+    vdir = _version_dir(role, version)
+    os.makedirs(vdir, exist_ok=True)
+    shutil.copy2(deploy, os.path.join(vdir, "best.pt"))
+    entry["versions"].append({"version": version, "created": _now(), "source": "pre-registry",
+                              "sha256": digest, "promoted": True, "reason": ["ไฟล์ deploy เดิมก่อนใช้ registry"]})
+    entry["current"] = version
+
+
+# -----------------------------
+# ประเมิน
+# -----------------------------
+def export_formats(weights, imgsz, formats=FORMATS):
+    """export ทุกรูปแบบ → {format: path หรือ {"error": ...}}"""
+    from ultralytics import YOLO
+    out = {}
+    for fmt in formats:
+        try:
+            out[fmt] = str(YOLO(weights).export(format=fmt, imgsz=imgsz))
+        except Exception as e:
+            out[fmt] = {"error": f"{type(e).__name__}: {e}"}
+    return out
+
+
+def evaluate(weights, data_yaml, split, frames, imgsz, exports=None, device="cpu"):
+    """mAP / recall บน split + latency (.pt และไฟล์ export) บนชุดเฟรมคงที่"""
+    from ultralytics import YOLO
+    model = YOLO(weights)
+    res = eval_metrics(model, data_yaml, split=split, imgsz=imgsz, device=device)
+    res["latency"] = {"pt": bench_latency(model, frames, imgsz, device=device)}
+    for fmt, path in (exports or {}).items():
+        if isinstance(path, str):
+            try:
+                res["latency"][fmt] = bench_latency(YOLO(path, task="detect"), frames, imgsz, device=device)
+            except Exception as e:
+                res["latency"][fmt] = {"error": f"{type(e).__name__}: {e}"}
+    res["size_mb"] = model_size_mb(weights)
+    return res
+
+
+def decide(cand, cur, max_map_drop=MAX_MAP_DROP, max_recall_drop=MAX_RECALL_DROP,
+           max_latency_increase=MAX_LATENCY_INCREASE):
+    """คืน (promote?, [เหตุผล])"""
+    if cur is None:
+        return True, ["ยังไม่มีโมเดลที่ deploy"]
+    reasons = []
+    if cand["map50_95"] < cur["map50_95"] - max_map_drop:
+        reasons.append(f"mAP50-95 ลดลง {cur['map50_95']:.4f} → {cand['map50_95']:.4f}")
+    for name, c in cur["per_class"].items():
+        r = cand["per_class"].get(name, {}).get("r", 0.0)
+        if r < c["r"] - max_recall_drop:
+            reasons.append(f"recall {name} ลดลง {c['r']:.3f} → {r:.3f}")
+    lat_c, lat_o = cand["latency"]["pt"]["median_ms"], cur["latency"]["pt"]["median_ms"]
+    if lat_c is not None and lat_o is not None and lat_c > lat_o * (1 + max_latency_increase):
+        reasons.append(f"latency เพิ่มขึ้น {lat_o:.1f} → {lat_c:.1f} ms")
+    if reasons:
+        return False, reasons
+    msg = f"mAP50-95 {cur['map50_95']:.4f} → {cand['map50_95']:.4f}"
+    if lat_c is not None and lat_o is not None:
+        msg += f", latency {lat_o:.1f} → {lat_c:.1f} ms"
+    return True, [msg]
+
+
+def _candidate_weights(path):
+    if os.path.isdir(path):
+        for rel in (("weights", "best.pt"), ("best.pt",)):
+            p = os.path.join(path, *rel)
+            if os.path.isfile(p):
+                return p
+        return None
+    return path if os.path.isfile(path) else None
+
+
+def promote(candidate, role, data_yaml=None, imgsz=None, formats=FORMATS, n_frames=30, frames_dir=None,
+            force=False, dry_run=False, device="cpu", **gate):
+    """ประเมิน candidate เทียบกับโมเดลที่ deploy อยู่ แล้ว promote ถ้าผ่าน ; คืน entry ที่บันทึกใน manifest"""
+    weights = _candidate_weights(candidate)
+    if weights is None:
+        raise FileNotFoundError(f"ไม่พบ best.pt ใน {candidate}")
+    spec = ROLES[role]
+    data_yaml = data_yaml or spec["data"]
+    imgsz = imgsz or runtime_imgsz(role)
+    split = split_for_eval(data_yaml)
+    frames = frames_from_dir(frames_dir, n_frames) if frames_dir else fixed_frames(data_yaml, split, n_frames)
+    print(f"[PROMOTE] {role}: {weights}  imgsz={imgsz}  split={split}  frames={len(frames)}")
+
+    man = load_manifest()
+    stage = os.path.join(REGISTRY_DIR, role, "_staging")
+    shutil.rmtree(stage, ignore_errors=True)
+    os.makedirs(stage)
+    staged = os.path.join(stage, "best.pt")
+    shutil.copy2(weights, staged)
+
+    exports = export_formats(staged, imgsz, formats) if formats else {}
+    for fmt, res in exports.items():
+        print(f"  export {fmt}: {res if isinstance(res, str) else res['error']}")
+    cand = evaluate(staged, data_yaml, split, frames, imgsz, exports, device)
+    cur = None
+    if os.path.isfile(spec["deploy"]):
+        cur = evaluate(spec["deploy"], data_yaml, split, frames, imgsz, None, device)
+    ok, reasons = decide(cand, cur, **gate)
+    if force and not ok:
+        reasons.append("--force")
+        ok = True
+
+    for label, r in (("candidate", cand), ("deployed", cur)):
+        if r is not None:
+            lat = "  ".join(f"{k} {v['median_ms']:.1f} ms" for k, v in r["latency"].items()
+                            if v.get("median_ms") is not None)
+            rec = " ".join(f"{k}={v['r']:.3f}" for k, v in r["per_class"].items())
+            print(f"  {label:<10} mAP50-95 {r['map50_95']:.4f}  mAP50 {r['map50']:.4f}  recall {rec}  {lat}")
+    print(f"[PROMOTE] {'ผ่าน' if ok else 'ไม่ผ่าน'}: " + "; ".join(reasons))
+
+    record = {"version": None, "created": _now(), "source": os.path.abspath(weights),
+              "sha256": sha256(staged), "promoted": ok, "reason": reasons, "imgsz": imgsz, "split": split,
+              "data": data_yaml, "candidate": cand, "deployed": cur,
+              "exports": {k: (os.path.basename(v) if isinstance(v, str) else v) for k, v in exports.items()}}
+    if dry_run:
+        shutil.rmtree(stage, ignore_errors=True)
+        print("[PROMOTE] --dry-run: ไม่แก้ registry / ไฟล์ deploy")
+        return record
+
+    if ok:
+        _adopt_deployed(man, role)
+        entry = _role_entry(man, role)
+        version = record["version"] = _next_version(entry)
+        vdir = _version_dir(role, version)
+        shutil.rmtree(vdir, ignore_errors=True)
+        os.makedirs(os.path.dirname(vdir), exist_ok=True)
+        os.replace(stage, vdir)
+        with open(os.path.join(vdir, "report.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=2)
+        _deploy_file(os.path.join(vdir, "best.pt"), spec["deploy"])
+        entry["current"] = version
+        print(f"[PROMOTE] {spec['deploy']} ← v{version:03d}")
+    else:
+        shutil.rmtree(stage, ignore_errors=True)
+    _role_entry(man, role)["versions"].append(record)
+    save_manifest(man)
+    return record
+
+
+def rollback(role, version):
+    man = load_manifest()
+    entry = _role_entry(man, role)
+    src = os.path.join(_version_dir(role, version), "best.pt")
+    if not any(v.get("version") == version and v.get("promoted") for v in entry["versions"]) or not os.path.isfile(src):
+        print(f"[ROLLBACK] ไม่พบ {role} v{version:03d} ใน registry")
+        return 1
+    _deploy_file(src, ROLES[role]["deploy"])
+    entry["current"] = version
+    save_manifest(man)
+    print(f"[ROLLBACK] {ROLES[role]['deploy']} ← v{version:03d}")
+    return 0
+
+
+def print_registry():
+    man = load_manifest()
+    if not man:
+        print("registry ว่าง")
+        return
+    for role, entry in man.items():
+        print(f"[{role}] ใช้อยู่: v{entry['current']:03d}" if entry.get("current") else f"[{role}] ใช้อยู่: -")
+        for v in entry["versions"]:
+            tag = f"v{v['version']:03d}" if v.get("version") else "----"
+            cur = "*" if v.get("version") and v["version"] == entry.get("current") else " "
+            c = v.get("candidate") or {}
+            lat = (c.get("latency") or {}).get("pt", {}).get("median_ms")
+            perf = (f"mAP50-95 {c['map50_95']:.4f}  {lat:.1f} ms" if c.get("map50_95") is not None and lat is not None
+                    else "")
+            print(f"  {cur}{tag} {v['created']}  {'promoted' if v.get('promoted') else 'rejected':<9}"
+                  f"{perf}  {'; '.join(v.get('reason') or [])}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Export, benchmark, validate and promote a finished training run")
+    ap.add_argument("candidate", nargs="?", help="โฟลเดอร์ run หรือไฟล์ best.pt")
+    ap.add_argument("--role", choices=sorted(ROLES), default="defect")
+    ap.add_argument("--data", help="data.yaml (ค่าเริ่มต้นตาม role)")
+    ap.add_argument("--imgsz", type=int, help="ค่าเริ่มต้น = imgsz ตอนรันจาก config/two_stage.yaml")
+    ap.add_argument("--formats", nargs="*", default=list(FORMATS))
+    ap.add_argument("--frames", type=int, default=30, help="จำนวนเฟรมคงที่ที่ใช้วัด latency")
+    ap.add_argument("--frames-dir", help="ใช้รูปจากโฟลเดอร์นี้ (เช่น captures/) แทน split ของ data.yaml")
+    ap.add_argument("--max-map-drop", type=float, default=MAX_MAP_DROP)
+    ap.add_argument("--max-recall-drop", type=float, default=MAX_RECALL_DROP)
+    ap.add_argument("--max-latency-increase", type=float, default=MAX_LATENCY_INCREASE)
+    ap.add_argument("--force", action="store_true", help="promote แม้ไม่ผ่านเกณฑ์ (บันทึกเหตุผลไว้)")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--list", action="store_true", help="แสดง registry")
+    ap.add_argument("--rollback", nargs=2, metavar=("ROLE", "VERSION"))
+    args = ap.parse_args(argv)
+
+    if args.list:
+        print_registry()
+        return 0
+    if args.rollback:
+        role, version = args.rollback
+        if role not in ROLES:
+            ap.error(f"role ต้องเป็น {' / '.join(sorted(ROLES))}")
+        return rollback(role, int(version))
+    if not args.candidate:
+        ap.error("ต้องระบุ run / best.pt หรือ --list / --rollback")
+    try:
+        rec = promote(args.candidate, args.role, data_yaml=args.data, imgsz=args.imgsz, formats=args.formats,
+                      n_frames=args.frames, frames_dir=args.frames_dir, force=args.force, dry_run=args.dry_run,
+                      max_map_drop=args.max_map_drop, max_recall_drop=args.max_recall_drop,
+                      max_latency_increase=args.max_latency_increase)
+    except FileNotFoundError as e:
+        print(f"[PROMOTE] {e}")
+        return 2
+    return 0 if rec["promoted"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
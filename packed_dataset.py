@@ -0,0 +1,74 @@
+# packed_dataset.py
+# -*- coding: utf-8 -*-
+# ต่อ cache ของ train_cache.py เข้ากับการเทรน ultralytics
+#
+# - PackedYOLODataset.load_image อ่านรูปที่ resize แล้วจาก memmap แทน imread + resize ทุก epoch
+#   รูปที่ไม่มีใน cache (เพิ่ม/แก้หลัง build) กลับไปใช้ load_image เดิม
+# - packed_trainer(cache_dir) → DetectionTrainer ที่ใช้ dataset นี้ทั้ง train และ val
+#
+#   model.train(data=..., imgsz=896, cache=False, trainer=packed_trainer("cache/shape_img896"))
+
+import os
+
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+
+from train_cache import PackedImageCache, INDEX_NAME
+
+_opened = {}
+
+
+def open_cache(cache_dir):
+    """PackedImageCache ต่อโฟลเดอร์ (เปิดครั้งเดียว ใช้ร่วมกันทั้ง train/val) ; ไม่มี index → None"""
+    key = os.path.abspath(cache_dir)
+    if key not in _opened:
+        _opened[key] = PackedImageCache(key) if os.path.isfile(os.path.join(key, INDEX_NAME)) else None
+    return _opened[key]
+
+
+class PackedYOLODataset(YOLODataset):
+    packed = None     # PackedImageCache
+
+    def load_image(self, i, rect_mode=True):
+        hit = self.packed.get(self.im_files[i]) if (self.packed is not None and rect_mode) else None
+        if hit is None:
+            return super().load_image(i, rect_mode)
+        im, hw0 = hit
+        if self.augment:
+            # mosaic สุ่มรูปจาก buffer → ใส่ index ไว้เหมือนเดิม แต่ไม่ถือภาพไว้ใน RAM (อ่านจาก memmap ใหม่ได้ถูก)
+            self.buffer.append(i)
+            if len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return im, hw0, im.shape[:2]
+
+
+def use_packed(dataset, cache_dir):
+    """เปลี่ยน YOLODataset ที่สร้างแล้วให้อ่านจาก cache (imgsz ต้องตรงกับตอน build)"""
+    cache = open_cache(cache_dir)
+    if cache is None:
+        print(f"[CACHE] ไม่พบ {cache_dir}/{INDEX_NAME} ใช้การอ่านไฟล์แบบเดิม")
+        return dataset
+    if cache.imgsz != dataset.imgsz:
+        print(f"[CACHE] imgsz ไม่ตรง (cache {cache.imgsz}, เทรน {dataset.imgsz}) ใช้การอ่านไฟล์แบบเดิม")
+        return dataset
+    if type(dataset) is YOLODataset:
+        # สลับ class แทนการสร้างใหม่: argument ของ build_yolo_dataset เปลี่ยนบ่อยตามเวอร์ชัน ultralytics
+        dataset.__class__ = PackedYOLODataset
+        dataset.packed = cache
+        n = sum(cache.lookup(f) is not None for f in dataset.im_files)
+        print(f"[CACHE] {n}/{len(dataset.im_files)} รูปอ่านจาก {cache.cache_dir}"
+              + (f" (ไฟล์เปลี่ยนหลัง build {cache.stale})" if cache.stale else ""))
+    return dataset
+
+
+class PackedDetectionTrainer(DetectionTrainer):
+    cache_dir = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        dataset = super().build_dataset(img_path, mode, batch)
+        return use_packed(dataset, self.cache_dir) if self.cache_dir else dataset
+
+
+def packed_trainer(cache_dir):
+    """class ของ trainer สำหรับ model.train(trainer=...) ที่อ่านรูปจาก cache_dir"""
+    return type("PackedDetectionTrainer", (PackedDetectionTrainer,), {"cache_dir": str(cache_dir)})
@@ -0,0 +1,376 @@
+# pipeline_compare.py
+# -*- coding: utf-8 -*-
+# เทียบ topology ของการตรวจ: โมเดลเดียว (best.pt / best2.pt ของ GUI_w_model*.py)
+# กับสองขั้น shape + defect (GUI_w_two_stage_model.py / GUI_mac.py) บนคลิปที่มี label ชุดเดียวกัน
+#
+# ต่อ pipeline วนทุกคลิปแบบเดียวกับ loop ของ GUI: resize → pipeline.run → annotate → PlateSession.update
+# แล้วสรุป
+#   - FPS end-to-end (รวม resize / annotate / tracking ไม่ใช่แค่ predict)
+#   - decision latency ต่อจาน: จากเฟรมสุดท้ายที่เห็นจาน จนบันทึกผลจาน (รวมรอ gate_absent_thresh เฟรม)
+#   - defect recall ระดับจาน (จานที่มีตำหนิจริงถูกตีเป็นเสีย) + ต่อชนิดตำหนิ + false reject ของจานดี
+#   - shape accuracy ระดับจาน (track.label เทียบ label) + จานที่หาไม่เจอ / จานเกิน
+# แล้วแนะนำ topology: recall ไม่ต่ำกว่าตัวที่ดีที่สุดเกิน RECALL_TOL (shape ด้วย SHAPE_TOL) แล้วเลือก FPS สูงสุด
+#
+# ไฟล์ label (YAML, path ของคลิปนับจากโฟลเดอร์ของไฟล์นี้):
+#   clips:
+#     - source: lot_a.mp4          # ไฟล์วิดีโอ หรือโฟลเดอร์รูป (fps: ใส่ได้)
+#       plates:                    # เรียงตามลำดับที่ผ่านกล้อง
+#         - {shape: heart, defects: [crack], frames: [12, 80]}
+#         - {shape: circle, defects: []}
+#   frames (index เฟรมของคลิป เริ่ม 0) ใส่ครบทุกจาน = จับคู่จานด้วยช่วงเฟรมที่ซ้อนกัน
+#   ไม่ใส่ = จับคู่ตามลำดับจานที่บันทึก
+#
+# ใช้งาน:
+#   python pipeline_compare.py clips/labels.yaml
+#   python pipeline_compare.py clips/labels.yaml --pipelines single_v2 two_stage --realtime
+#   python pipeline_compare.py clips/labels.yaml --defect-every-n 2 --out runs/compare_n2.json
+
+import os, sys, json, time, argparse
+
+import numpy as np
+import yaml
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+from plate_tracker import PlateTracker
+from runtime_config import _read_file, validate, TWO_STAGE_SCHEMA, TWO_STAGE_RULES
+from inspection_core import open_source, SingleModelPipeline, TwoStagePipeline, PlateSession, annotate
+
+SHAPE_MAP = {
+    "heart_shaped_leaf_plate": "heart",
+    "rectangular_leaf_plate": "rectangle",
+    "circle_leaf_plate": "circle",
+}
+# ค่าเดียวกับใน GUI แต่ละตัว (two_stage ทับด้วย config/two_stage.yaml)
+PIPELINES = {
+    "single": dict(kind="single", weights="best.pt", defect_classes={"crack", "hole"},
+                   conf=0.27, iou=0.65, track_low_thresh=0.15, class_nms_iou=None, geometry_hint=None),
+    "single_v2": dict(kind="single", weights="best2.pt", defect_classes={"crack", "hole", "bulge", "burn"},
+                      conf=0.27, iou=0.65, track_low_thresh=0.15, class_nms_iou=0.65, geometry_hint=(0.62, 0.78)),
+    "two_stage": dict(kind="two_stage", shape_weights=os.path.join("models", "shape_best_rf.pt"),
+                      defect_weights=os.path.join("models", "defect_best.pt"), defect_classes={"crack", "hole"},
+                      config=os.path.join("config", "two_stage.yaml")),
+}
+TWO_STAGE_DEFAULTS = dict(
+    imgsz=896, conf_shape=0.55, iou_shape=0.72, conf_defect=0.25, iou_defect=0.65,
+    defect_every_n=1, defect_imgsz=896, defect_mode="full", slice_tile=640, slice_overlap=0.2,
+    track_low_thresh=0.25, gate_present_thresh=5, gate_absent_thresh=10,
+)
+GATE_PRESENT, GATE_ABSENT = 5, 10
+RECALL_TOL = 0.02
+SHAPE_TOL = 0.02
+OUT_PATH = os.path.join("runs", "pipeline_compare", "report.json")
+
+
+# -----------------------------
+# label
+# -----------------------------
+def load_labels(path):
+    """→ [{"source", "fps", "plates": [{"shape", "defects": set, "frames": (a, b) | None}]}]"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    base = os.path.dirname(os.path.abspath(path))
+    clips = []
+    for i, c in enumerate(data.get("clips") or []):
+        if not isinstance(c, dict) or "source" not in c:
+            raise ValueError(f"clips[{i}]: ต้องมี source")
+        plates = []
+        for j, p in enumerate(c.get("plates") or []):
+            frames = p.get("frames")
+            if frames is not None and (len(frames) != 2 or int(frames[0]) > int(frames[1])):
+                raise ValueError(f"clips[{i}].plates[{j}].frames ต้องเป็น [เริ่ม, จบ]")
+            plates.append({"shape": p.get("shape"), "defects": set(p.get("defects") or []),
+                           "frames": (int(frames[0]), int(frames[1])) if frames is not None else None})
+        src = str(c["source"])
+        clips.append({"source": src if os.path.isabs(src) else os.path.join(base, src),
+                      "fps": c.get("fps"), "plates": plates})
+    if not clips:
+        raise ValueError(f"{path}: ไม่มี clips")
+    return clips
+
+
+# -----------------------------
+# pipeline
+# -----------------------------
+def two_stage_params(config_path):
+    """ค่า default ของ GUI_w_two_stage_model ทับด้วย config (ไฟล์ผิด = ใช้ default ทั้งชุด)"""
+    params = dict(TWO_STAGE_DEFAULTS)
+    if config_path and os.path.isfile(config_path):
+        values, errors = validate(_read_file(config_path), TWO_STAGE_SCHEMA, TWO_STAGE_RULES, base=params)
+        if errors:
+            print(f"[WARN] {config_path}: " + "; ".join(errors) + " → ใช้ค่าในโค้ด")
+        else:
+            params.update(values)
+    return params
+
+
+def build(name, overrides=None):
+    """→ (pipeline, PlateSession, ค่าที่ใช้) ; โหลดโมเดลจริง"""
+    from ultralytics import YOLO
+    spec = PIPELINES[name]
+    if spec["kind"] == "single":
+        p = dict(spec)
+        p.update(overrides or {})
+        pipe = SingleModelPipeline(YOLO(p["weights"]), SHAPE_MAP, p["defect_classes"], imgsz=p.get("imgsz", 896),
+                                   iou=p["iou"], shape_conf=p["conf"], track_conf=p["track_low_thresh"],
+                                   defect_conf=p["conf"], class_nms_iou=p["class_nms_iou"],
+                                   geometry_hint=p["geometry_hint"])
+        high, low = p["conf"], p["track_low_thresh"]
+        present, absent = GATE_PRESENT, GATE_ABSENT
+    else:
+        p = two_stage_params(spec["config"])
+        p.update(overrides or {})
+        defect_model = YOLO(spec["defect_weights"])
+        sliced = None
+        if p["defect_mode"] == "sliced":
+            from sliced_inference import SlicedDefectInference
+            sliced = SlicedDefectInference(defect_model, tile=p["slice_tile"], imgsz=p["slice_tile"],
+                                           overlap=p["slice_overlap"], conf=p["conf_defect"], iou=p["iou_defect"],
+                                           classes=spec["defect_classes"])
+        pipe = TwoStagePipeline(
+            YOLO(spec["shape_weights"]), defect_model, SHAPE_MAP, spec["defect_classes"],
+            imgsz=p["imgsz"], shape_conf=p["conf_shape"], track_conf=p["track_low_thresh"],
+            shape_iou=p["iou_shape"], defect_conf=p["conf_defect"], defect_iou=p["iou_defect"],
+            defect_imgsz=p["defect_imgsz"], defect_every_n=p["defect_every_n"], defect_mode=p["defect_mode"],
+            shape_max_det=1, shape_agnostic=True, sliced=sliced,
+        )
+        high, low = p["conf_shape"], p["track_low_thresh"]
+        present, absent = p["gate_present_thresh"], p["gate_absent_thresh"]
+    tracker = PlateTracker(high_thresh=high, low_thresh=low, min_hits=present, max_misses=absent, class_aware=True)
+    return pipe, PlateSession(tracker, track_conf=low), p
+
+
+def weights_of(name):
+    spec = PIPELINES[name]
+    return [spec["weights"]] if spec["kind"] == "single" else [spec["shape_weights"], spec["defect_weights"]]
+
+
+# -----------------------------
+# รันคลิป
+# -----------------------------
+def run_clip(pipe, session, clip, display, realtime=False):
+    """
+    → (plates, stats) ; plates = [{"shape", "defects", "frames": (src เริ่ม, src จบ), "decision_ms"}]
+    realtime=True: ทิ้งเฟรมที่ประมวลผลไม่ทันตาม fps ของคลิป (แบบกล้องจริง)
+    """
+    cap = open_source(clip["source"], realtime=False, fps=clip["fps"])
+    if not cap.isOpened():
+        raise FileNotFoundError(clip["source"])
+    fps = float(cap.get(cv2.CAP_PROP_FPS) or clip["fps"] or 30.0)
+    session.reset()
+    pipe.frame_idx = 0
+    src_idx = []        # tracker frame (1..) → index เฟรมของคลิป
+    seen_t = []         # tracker frame → เวลาที่ประมวลผลเฟรมนั้นเสร็จ
+    plates, infer_ms = [], []
+    n_src = dropped = 0
+
+    def record(track, now):
+        ev = session.evidence_of(track)
+        start = src_idx[track.start_frame - 1] if 0 < track.start_frame <= len(src_idx) else None
+        last = src_idx[track.last_frame - 1] if 0 < track.last_frame <= len(src_idx) else None
+        last_t = seen_t[track.last_frame - 1] if 0 < track.last_frame <= len(seen_t) else now
+        plates.append({"shape": track.label, "defects": sorted(ev.names()), "frames": (start, last),
+                       "decision_ms": (now - last_t) * 1000.0})
+
+    t0 = time.perf_counter()
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            i = n_src
+            n_src += 1
+            if realtime and i / fps < time.perf_counter() - t0 - 1.0 / fps:
+                dropped += 1
+                continue
+            small = cv2.resize(frame, display)
+            result = pipe.run(small, frame_full=frame, plate_hint=session.plate_box())
+            infer_ms.append(result.infer_ms)
+            annotated = annotate(small, result, shape_names={v: k for k, v in SHAPE_MAP.items()})
+            upd = session.update(result, annotated)
+            now = time.perf_counter()
+            src_idx.append(i)
+            seen_t.append(now)
+            for gone in upd.finished:
+                if not gone.counted:
+                    gone.counted = True
+                    record(gone, now)
+        now = time.perf_counter()
+        for t in session.flush():
+            if not t.counted:
+                t.counted = True
+                record(t, now)
+    finally:
+        cap.release()
+    wall = time.perf_counter() - t0
+    return plates, {"src_frames": n_src, "processed": len(src_idx), "dropped": dropped, "wall_s": wall,
+                    "infer_ms": infer_ms}
+
+
+def match_plates(truth, pred):
+    """→ [(truth index, pred index | None)], [pred index ที่ไม่มีคู่]"""
+    if truth and all(t["frames"] is not None for t in truth):
+        cand = []
+        for ti, t in enumerate(truth):
+            for pi, p in enumerate(pred):
+                if p["frames"][0] is None:
+                    continue
+                ov = min(t["frames"][1], p["frames"][1]) - max(t["frames"][0], p["frames"][0]) + 1
+                if ov > 0:
+                    cand.append((ov, ti, pi))
+        pairs, used_t, used_p = {}, set(), set()
+        for ov, ti, pi in sorted(cand, reverse=True):
+            if ti not in used_t and pi not in used_p:
+                pairs[ti] = pi
+                used_t.add(ti)
+                used_p.add(pi)
+        return [(ti, pairs.get(ti)) for ti in range(len(truth))], [pi for pi in range(len(pred)) if pi not in used_p]
+    n = min(len(truth), len(pred))
+    return [(ti, ti if ti < n else None) for ti in range(len(truth))], list(range(n, len(pred)))
+
+
+def score(clips, runs):
+    """clips กับผลของ pipeline หนึ่งตัว (รายคลิป) → ตัวชี้วัดระดับจาน"""
+    n_truth = correct_shape = missed = extra = 0
+    bad_total = bad_hit = good_total = good_flagged = 0
+    cls_total, cls_hit = {}, {}
+    rows = []
+    for clip, (pred, _) in zip(clips, runs):
+        pairs, extras = match_plates(clip["plates"], pred)
+        extra += len(extras)
+        for ti, pi in pairs:
+            t = clip["plates"][ti]
+            p = pred[pi] if pi is not None else None
+            n_truth += 1
+            if p is None:
+                missed += 1
+            elif p["shape"] == t["shape"]:
+                correct_shape += 1
+            flagged = bool(p and p["defects"])
+            if t["defects"]:
+                bad_total += 1
+                bad_hit += flagged
+                for c in t["defects"]:
+                    cls_total[c] = cls_total.get(c, 0) + 1
+                    cls_hit[c] = cls_hit.get(c, 0) + bool(p and c in p["defects"])
+            else:
+                good_total += 1
+                good_flagged += flagged
+            rows.append({"clip": os.path.basename(clip["source"]), "truth": {"shape": t["shape"],
+                         "defects": sorted(t["defects"]), "frames": t["frames"]}, "pred": p})
+    return {
+        "plates": n_truth, "missed": missed, "extra": extra,
+        "shape_acc": correct_shape / n_truth if n_truth else None,
+        "defect_recall": bad_hit / bad_total if bad_total else None,
+        "defect_recall_per_class": {c: cls_hit[c] / cls_total[c] for c in sorted(cls_total)},
+        "false_reject": good_flagged / good_total if good_total else None,
+        "rows": rows,
+    }
+
+
+def evaluate(name, clips, display, realtime=False, overrides=None):
+    pipe, session, params = build(name, overrides)
+    pipe.warmup()
+    runs = [run_clip(pipe, session, c, display, realtime) for c in clips]
+    res = score(clips, runs)
+    processed = sum(s["processed"] for _, s in runs)
+    wall = sum(s["wall_s"] for _, s in runs)
+    infer = [m for _, s in runs for m in s["infer_ms"]]
+    decision = [p["decision_ms"] for pred, _ in runs for p in pred]
+    res.update({
+        "pipeline": name, "weights": weights_of(name),
+        "params": {k: (sorted(v) if isinstance(v, set) else v) for k, v in params.items()},
+        "frames": processed, "dropped": sum(s["dropped"] for _, s in runs),
+        "fps": processed / wall if wall > 0 else 0.0,
+        "infer_ms": float(np.mean(infer)) if infer else None,
+        "decision_ms": float(np.median(decision)) if decision else None,
+        "decision_p90_ms": float(np.percentile(decision, 90)) if decision else None,
+    })
+    return res
+
+
+def recommend(results):
+    """recall ก่อน (ห่างตัวดีสุดไม่เกิน RECALL_TOL, shape ไม่เกิน SHAPE_TOL) แล้วค่อย FPS → (ชื่อ, เหตุผล)"""
+    if not results:
+        return None, "ไม่มีผล"
+    best_recall = max(r["defect_recall"] or 0.0 for r in results)
+    best_shape = max(r["shape_acc"] or 0.0 for r in results)
+    ok = [r for r in results if (r["defect_recall"] or 0.0) >= best_recall - RECALL_TOL
+          and (r["shape_acc"] or 0.0) >= best_shape - SHAPE_TOL]
+    if not ok:
+        ok = [r for r in results if (r["defect_recall"] or 0.0) >= best_recall - RECALL_TOL]
+    pick = max(ok, key=lambda r: r["fps"])
+    others = [r["pipeline"] for r in results if r is not pick]
+    why = (f"defect recall {pick['defect_recall'] or 0:.3f} (ดีสุด {best_recall:.3f}), shape acc "
+           f"{pick['shape_acc'] or 0:.3f}, {pick['fps']:.1f} FPS")
+    if len(ok) > 1:
+        why += " ; FPS สูงสุดในกลุ่มที่ recall เท่ากันในช่วง ±%.2f" % RECALL_TOL
+    elif others:
+        why += " ; ตัวอื่นได้ recall / shape ต่ำกว่าเกณฑ์"
+    return pick["pipeline"], why
+
+
+def print_report(results, rec):
+    print(f"\n{'pipeline':<12}{'FPS':>7}{'infer ms':>10}{'decide ms':>11}{'p90':>8}{'recall':>8}{'shape':>8}"
+          f"{'falseRej':>9}{'plates':>8}{'miss':>6}{'extra':>6}{'drop':>6}")
+    f = lambda v, w, d: f"{v:>{w}.{d}f}" if v is not None else f"{'-':>{w}}"
+    for r in results:
+        print(f"{r['pipeline']:<12}{f(r['fps'], 7, 1)}{f(r['infer_ms'], 10, 1)}{f(r['decision_ms'], 11, 0)}"
+              f"{f(r['decision_p90_ms'], 8, 0)}{f(r['defect_recall'], 8, 3)}{f(r['shape_acc'], 8, 3)}"
+              f"{f(r['false_reject'], 9, 3)}{r['plates']:>8}{r['missed']:>6}{r['extra']:>6}{r['dropped']:>6}")
+        if r["defect_recall_per_class"]:
+            print("    recall ต่อชนิด: " + ", ".join(f"{c} {v:.3f}" for c, v in r["defect_recall_per_class"].items()))
+    name, why = rec
+    if name:
+        print(f"\n[แนะนำ] {name}: {why}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Compare single-model vs two-stage inspection on labelled clips")
+    ap.add_argument("labels", help="ไฟล์ YAML ของคลิป + label ระดับจาน")
+    ap.add_argument("--pipelines", nargs="+", choices=sorted(PIPELINES), help="ค่าเริ่มต้น = ทุกตัวที่มี weights")
+    ap.add_argument("--display", default="960x540", help="ขนาดเฟรมที่ GUI ย่อก่อนส่งเข้าโมเดล")
+    ap.add_argument("--realtime", action="store_true", help="ทิ้งเฟรมที่ไม่ทันตาม fps ของคลิป (แบบกล้องจริง)")
+    ap.add_argument("--defect-every-n", type=int, help="ทับค่า defect_every_n ของ two_stage")
+    ap.add_argument("--out", default=OUT_PATH)
+    args = ap.parse_args(argv)
+
+    try:
+        clips = load_labels(args.labels)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        print(f"[ERROR] {e}")
+        return 2
+    names = args.pipelines or [n for n in PIPELINES if all(os.path.isfile(w) for w in weights_of(n))]
+    missing = [w for n in names for w in weights_of(n) if not os.path.isfile(w)]
+    if not names or missing:
+        print("[ERROR] ไม่พบ weights: " + (", ".join(missing) or "ไม่มี pipeline ที่ weights ครบ"))
+        return 2
+    w, h = [int(v) for v in args.display.lower().split("x")]
+
+    print(f"{len(clips)} clips, {sum(len(c['plates']) for c in clips)} plates | pipelines: {', '.join(names)}"
+          f" | {'realtime' if args.realtime else 'ทุกเฟรม'}")
+    results = []
+    for name in names:
+        overrides = {"defect_every_n": args.defect_every_n} if args.defect_every_n and name == "two_stage" else None
+        try:
+            results.append(evaluate(name, clips, (w, h), args.realtime, overrides))
+        except FileNotFoundError as e:
+            print(f"[ERROR] {name}: เปิดคลิปไม่ได้ {e}")
+            return 2
+        r = results[-1]
+        print(f"[{name}] {r['frames']} frames, {r['fps']:.1f} FPS")
+    rec = recommend(results)
+    print_report(results, rec)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump({"labels": os.path.abspath(args.labels), "realtime": args.realtime, "display": [w, h],
+                   "recommendation": {"pipeline": rec[0], "reason": rec[1]}, "results": results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"บันทึก {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
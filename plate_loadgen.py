@@ -0,0 +1,359 @@
+# plate_loadgen.py
+# -*- coding: utf-8 -*-
+# ตัวป้อนจานจำลองอัตราสูง สำหรับวัดชั้นบันทึกผล / รายงาน ของ GUI_mac.py โดยไม่ต้องมีกล้องหรือโมเดล
+#
+# - ต่อยอด mock producer ใน GUI.py (random_defects_for_cell / next_mock_row / start_collect_loop)
+#   แต่ส่งจานเข้าเมธอดจริงของ GUI_mac.LeafPlateDetectionApp (ไม่เปิดหน้าต่าง):
+#     ต่อจาน : _save_detection_record → imwrite, _append_excel_row (+ _update_excel_session_times),
+#              _write_json_to_path, FirebaseClient.put/post (ไปที่ fake_rtdb.py)
+#     ต่อล็อต: _check_and_continue_session, generate_lot_id, _ensure_session_files, _build_weekly_excel,
+#              _reset_all_and_next_lot
+# - เวลาใน GUI_mac ถูกแทนด้วยนาฬิกาจำลอง (วันละ --hours-per-day ชั่วโมง, ข้ามวันได้) ; ไฟล์รายงานถูกตั้ง mtime
+#   ตามเวลาจำลองด้วย → ตัวกรอง _reports_modified_since ทำงานเหมือนใช้งานจริง
+# - วัด latency ต่อ operation เทียบกับขนาดประวัติ (แถวใน Excel ของวัน / แถวในล็อต / แถวในสัปดาห์)
+#   แล้วประมาณ O(n^k) ; งบต่อจาน = 3600 / rate วินาที — หยุดเองเมื่อช้ากว่างบเกิน --give-up เท่า
+# - ข้อมูลทั้งหมดเขียนใน runs/plate_loadgen/<stamp>/site/ (ไม่แตะ savefile/ ของจริง)
+#
+# ใช้งาน:
+#   python plate_loadgen.py                                   # 10000 จาน/ชม. 2 วัน วันละ 2 ชม. 4 ล็อต/วัน
+#   python plate_loadgen.py --rate 20000 --days 5 --hours-per-day 8 --give-up 20
+#   python plate_loadgen.py --max-plates 3000 --no-sync --report-every 250
+#   python plate_loadgen.py --fb-latency 150 --start 2025-03-03
+
+import os, sys, csv, json, time, random, argparse, contextlib
+from datetime import datetime, date, timedelta
+
+import numpy as np
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+from fake_rtdb import FakeRTDB
+from inspection_core import FirebaseClient, PlateSession
+from plate_tracker import PlateTracker
+
+DEFECTS = ["crack", "hole", "bulge", "burn"]
+SHAPES = ["heart", "rectangle", "circle"]
+# op → ขนาดประวัติที่ op นั้นควรแปรผันตาม (ใช้ประมาณ O(n^k))
+OP_SCOPE = {
+    "save_record": "day_rows", "excel_append": "day_rows", "excel_times": "day_rows", "json_write": "lot_rows",
+    "fb_put": "lot_rows", "fb_post": "lot_rows",
+    "continue_session": "day_rows", "generate_lot_id": "day_rows", "weekly_report": "week_rows",
+}
+PLATE_OPS = ["save_record", "excel_append", "excel_times", "json_write", "fb_put", "fb_post"]
+LOT_OPS = ["continue_session", "generate_lot_id", "weekly_report"]
+
+
+class SimClock:
+    """แทน datetime / date ในโมดูล GUI_mac : now() / today() คืนเวลาจำลองที่ตัวป้อนตั้งไว้"""
+
+    def __init__(self, start):
+        self.current = start
+        clock = self
+
+        class _Datetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return clock.current
+
+        class _Date(date):
+            @classmethod
+            def today(cls):
+                return clock.current.date()
+
+        self.datetime, self.date = _Datetime, _Date
+
+    def install(self, module):
+        module.datetime, module.date = self.datetime, self.date
+
+
+class PlateEventGenerator:
+    """
+    จานสุ่มแบบ mock producer ของ GUI.py: ครึ่งหนึ่งไม่มีตำหนิ ที่เหลือ 1 ชนิด (70%) หรือ 2 ชนิด
+    คืน (shapes, defects) เป็นชื่อคลาสเหมือนที่ _finalize_plate ส่งให้ _save_detection_record
+    """
+
+    def __init__(self, defect_rate=0.5, seed=0):
+        self.defect_rate = defect_rate
+        self.rng = random.Random(seed)
+
+    def random_defects(self):
+        if self.rng.random() >= self.defect_rate:
+            return set()
+        k = 1 if self.rng.random() < 0.7 else 2
+        return set(self.rng.sample(DEFECTS, k=k))
+
+    def next_event(self):
+        return {self.rng.choice(SHAPES)}, self.random_defects()
+
+
+def make_snapshot(size, seed=0):
+    """ภาพจานสังเคราะห์ขนาดใกล้ snapshot จริง (jpg ราว 50–150 KB)"""
+    rng = np.random.default_rng(seed)
+    h, w = size
+    yy, xx = np.mgrid[0:h, 0:w]
+    base = ((xx + yy) * 255 // (h + w)).astype(np.uint8)
+    img = np.dstack([base, 255 - base, base // 2]).astype(np.int16) + rng.integers(0, 40, (h, w, 3))
+    img = np.ascontiguousarray(img.clip(0, 255).astype(np.uint8))
+    cv2.circle(img, (w // 2, h // 2), min(h, w) // 3, (40, 120, 60), -1)
+    return img
+
+
+class _NoSync:
+    """--no-sync: GUI เรียก fb.put/post ตามปกติแต่ไม่ส่งไปไหน"""
+
+    def put(self, path, obj):
+        pass
+
+    def post(self, path, obj):
+        pass
+
+
+class _Stop(Exception):
+    pass
+
+
+class _Timer:
+    """ห่อเมธอดของ instance/object ให้สะสมเวลา (ms) ต่อ op จนกว่าจะ take() (เรียกซ้อนได้ เช่น excel_times ใน excel_append)"""
+
+    def __init__(self):
+        self.last = {}
+
+    def wrap(self, obj, attr, op):
+        fn = getattr(obj, attr)
+
+        def timed(*a, **kw):
+            t0 = time.perf_counter()
+            try:
+                return fn(*a, **kw)
+            finally:
+                self.last[op] = self.last.get(op, 0.0) + (time.perf_counter() - t0) * 1000.0
+
+        setattr(obj, attr, timed)
+
+    def take(self):
+        out, self.last = self.last, {}
+        return out
+
+
+def headless_app(gui, base_dir, fb):
+    """LeafPlateDetectionApp ที่ไม่สร้างหน้าต่าง: ตั้งเฉพาะ attribute ที่เมธอดบันทึก/รายงานใช้ (ค่าเดียวกับ initialize_data)"""
+    app = gui.LeafPlateDetectionApp.__new__(gui.LeafPlateDetectionApp)
+    app.BASE_DIR = base_dir
+    app.save_root = os.path.join(base_dir, "savefile")
+    app.captures_dir = os.path.join(base_dir, "captures")
+    os.makedirs(app.save_root, exist_ok=True)
+    os.makedirs(app.captures_dir, exist_ok=True)
+    app.defect_th_map = {"crack": "รอยแตก", "hole": "รู", "bulge": "รอยขีดข่วน", "burn": "รอยไหม้"}
+    app.shape_display_map = {"heart": "หัวใจ", "rectangle": "สี่เหลี่ยมผืนผ้า", "circle": "วงกลม"}
+    app.defect_data = [(v, "ยังไม่พบ", "green") for v in app.defect_th_map.values()]
+    app._defect_defaults = {d: (s, c) for d, s, c in app.defect_data}
+    app._plate_defect_counts = {k: 0 for k in app.defect_th_map}
+    app.status_labels = {}
+    app.lbl_plate_status = None
+    app.shape_counts = {"heart": 0, "rectangle": 0, "circle": 0, "total": 0}
+    app.session_rows = []
+    app.session_meta = {}
+    app.plate_id_counter = 1
+    app._auto_xlsx_path = None
+    app._auto_json_path = None
+    app._session_stamp = None
+    app.firebase_session_key = None
+    app.session = PlateSession(PlateTracker())
+    app.fb = fb
+    app.lot_id = app.generate_lot_id()
+    return app
+
+
+def _touch(paths, ts):
+    for p in paths:
+        if p and os.path.exists(p):
+            os.utime(p, (ts, ts))
+
+
+def run(args, out_dir, log=print):
+    import GUI_mac as gui
+
+    site = os.path.join(out_dir, "site")
+    clock = SimClock(datetime.combine(args.start, datetime.min.time()) + timedelta(hours=8))
+    clock.install(gui)
+
+    rtdb = None
+    fb = _NoSync()
+    if args.sync:
+        rtdb = FakeRTDB(latency_ms=args.fb_latency).start()
+        fb = FirebaseClient(rtdb.url, os.path.join(site, "_no_service_account.json"))
+
+    timer = _Timer()
+    app = headless_app(gui, site, fb)
+    for attr, op in (("_append_excel_row", "excel_append"), ("_update_excel_session_times", "excel_times"),
+                     ("_write_json_to_path", "json_write"), ("_check_and_continue_session", "continue_session"),
+                     ("generate_lot_id", "generate_lot_id"), ("_build_weekly_excel", "weekly_report")):
+        timer.wrap(app, attr, op)
+    timer.wrap(fb, "put", "fb_put")
+    timer.wrap(fb, "post", "fb_post")
+
+    gen = PlateEventGenerator(args.defect_rate, args.seed)
+    snapshot = make_snapshot(args.image_size, args.seed)
+    budget_ms = 3600.0 / args.rate * 1000.0
+    plates_per_day = int(args.rate * args.hours_per_day)
+    plates_per_lot = max(1, plates_per_day // args.lots_per_day)
+    step = timedelta(seconds=3600.0 / args.rate)
+
+    samples, lot_samples = [], []
+    window = []
+    week_rows = {}
+    total, stopped = 0, None
+    devnull = open(os.devnull, "w", encoding="utf-8")
+    t_run = time.perf_counter()
+    try:
+        for day in range(args.days):
+            day_start = datetime.combine(args.start + timedelta(days=day), datetime.min.time()) + timedelta(hours=8)
+            clock.current = day_start
+            week_key = gui.LeafPlateDetectionApp._get_week_range_mon_sun(clock.current.date())
+            day_rows = 0
+            for lot in range(args.lots_per_day):
+                # ---- เริ่มล็อต: ลำดับเดียวกับ toggle_data_collection ----
+                with contextlib.redirect_stdout(devnull):
+                    app._check_and_continue_session()
+                    app.lot_id = app.generate_lot_id()
+                    app.session_meta.setdefault("start_time", clock.current.strftime("%H:%M:%S"))
+                    app._ensure_session_files()
+                    app._update_excel_session_times()
+                    if args.weekly:
+                        app._build_weekly_excel(os.path.join(app.save_root, "Weekly_loadgen.xlsx"), *week_key)
+                _touch([app._auto_xlsx_path, app._auto_json_path], clock.current.timestamp())
+                t = timer.take()
+                lot_samples.append({"sim": clock.current.isoformat(timespec="seconds"), "lot": app.lot_id,
+                                    "day_rows": day_rows, "week_rows": week_rows.get(week_key, 0),
+                                    **{op: round(t.get(op, 0.0), 2) for op in LOT_OPS}})
+                log(f"[{clock.current:%Y-%m-%d %H:%M}] ล็อต {app.lot_id}  "
+                    + "  ".join(f"{op} {t.get(op, 0.0):.0f} ms" for op in LOT_OPS if op in t))
+
+                for _ in range(plates_per_lot):
+                    shapes, defects = gen.next_event()
+                    t0 = time.perf_counter()
+                    with contextlib.redirect_stdout(devnull):
+                        app._save_detection_record(snapshot, defects, shapes)
+                    dt = (time.perf_counter() - t0) * 1000.0
+                    _touch([app._auto_xlsx_path, app._auto_json_path], clock.current.timestamp())
+                    day_rows += 1
+                    week_rows[week_key] = week_rows.get(week_key, 0) + 1
+                    total += 1
+                    t = timer.take()
+                    s = {"n": total, "sim": clock.current.isoformat(timespec="seconds"), "day_rows": day_rows,
+                         "lot_rows": len(app.session_rows), "week_rows": week_rows[week_key], "save_record": round(dt, 2),
+                         **{op: round(t.get(op, 0.0), 2) for op in PLATE_OPS[1:]}}
+                    samples.append(s)
+                    window.append(s)
+                    clock.current += step
+
+                    if len(window) >= args.report_every:
+                        st = np.array([w["save_record"] for w in window])
+                        p50 = float(np.percentile(st, 50))
+                        log(f"[{clock.current:%Y-%m-%d %H:%M}] จาน {total:>7}  แถวในวัน {day_rows:>6}  "
+                            f"save p50 {p50:7.1f} ms p95 {np.percentile(st, 95):7.1f} ms  "
+                            + "  ".join(f"{op} {np.median([w[op] for w in window]):.1f}" for op in PLATE_OPS[1:])
+                            + f"  (งบ {budget_ms:.0f} ms)")
+                        window = []
+                        if args.give_up and p50 > args.give_up * budget_ms:
+                            stopped = f"save p50 {p50:.0f} ms > {args.give_up:g}× งบ {budget_ms:.0f} ms ที่แถวในวัน {day_rows}"
+                            raise _Stop
+                    if args.max_plates and total >= args.max_plates:
+                        stopped = f"ครบ --max-plates {args.max_plates}"
+                        raise _Stop
+
+                # ---- จบล็อต: ส่วนบันทึกของ stop_and_finalize ----
+                with contextlib.redirect_stdout(devnull):
+                    app._update_excel_session_times()
+                    app.fb.put(f"sessions/{app.firebase_session_key}/meta", {
+                        "report_title": f"รายงานการตรวจจานใบไม้ วันที่ {app._title_date(clock.current)}",
+                        "lot_id": app.lot_id,
+                        "session": {"start_time": app.session_meta.get("start_time"),
+                                    "end_time": clock.current.strftime("%H:%M:%S")}})
+                    app._reset_all_and_next_lot()
+                timer.take()
+    except _Stop:
+        pass
+    except KeyboardInterrupt:
+        stopped = "หยุดโดยผู้ใช้"
+    finally:
+        devnull.close()
+        if rtdb is not None:
+            rtdb.stop()
+    wall = time.perf_counter() - t_run
+    return samples, lot_samples, {"stopped": stopped, "wall_s": round(wall, 1), "plates": total,
+                                  "achieved_per_hour": round(total / wall * 3600.0, 0) if wall > 0 else 0.0,
+                                  "budget_ms": round(budget_ms, 1)}
+
+
+def growth(samples, ops, min_n=50):
+    """log-log slope ของ latency เทียบขนาดประวัติ → k ใน O(n^k) ; 0 ≈ คงที่, 1 ≈ เชิงเส้นต่อครั้ง"""
+    out = {}
+    for op in ops:
+        scope = OP_SCOPE[op]
+        pts = [(s[scope], s[op]) for s in samples if s.get(scope, 0) >= min_n and s.get(op, 0) > 0]
+        if len(pts) < 3:
+            continue
+        n, ms = np.array(pts, dtype=np.float64).T
+        if n.max() / n.min() < 2:
+            continue
+        k = float(np.polyfit(np.log(n), np.log(ms), 1)[0])
+        lo, hi = n <= np.percentile(n, 10), n >= np.percentile(n, 90)
+        out[op] = {"scope": scope, "k": round(k, 2), "n_low": int(np.median(n[lo])), "ms_low": round(float(np.median(ms[lo])), 2),
+                   "n_high": int(np.median(n[hi])), "ms_high": round(float(np.median(ms[hi])), 2)}
+    return out
+
+
+def print_report(info, grow):
+    print(f"\n{'op':<18}{'scope':<11}{'n ต่ำ':>8}{'ms':>9}{'n สูง':>9}{'ms':>9}{'O(n^k)':>9}")
+    for op, g in grow.items():
+        print(f"{op:<18}{g['scope']:<11}{g['n_low']:>8}{g['ms_low']:>9.1f}{g['n_high']:>9}{g['ms_high']:>9.1f}{g['k']:>9.2f}")
+    print(f"\nจาน {info['plates']} ใน {info['wall_s']} s (ทำได้ ~{info['achieved_per_hour']:.0f} จาน/ชม. ; งบ {info['budget_ms']} ms/จาน)"
+          + (f"  หยุด: {info['stopped']}" if info["stopped"] else ""))
+    print("k ≈ 0 คงที่ ; k ≈ 1 แต่ละครั้งช้าลงตามประวัติ (รวมทั้งวัน = O(n²))")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="High-rate synthetic plate generator for the persistence/report paths")
+    ap.add_argument("--rate", type=float, default=10000, help="จาน/ชั่วโมง (เวลาจำลอง)")
+    ap.add_argument("--days", type=int, default=2)
+    ap.add_argument("--hours-per-day", type=float, default=2)
+    ap.add_argument("--lots-per-day", type=int, default=4)
+    ap.add_argument("--start", type=date.fromisoformat, default=date.today() - timedelta(days=date.today().weekday()),
+                    help="วันแรกของการจำลอง (ค่าเริ่มต้น = วันจันทร์ของสัปดาห์นี้)")
+    ap.add_argument("--defect-rate", type=float, default=0.5)
+    ap.add_argument("--image-size", type=int, nargs=2, default=[480, 640], metavar=("H", "W"))
+    ap.add_argument("--no-sync", dest="sync", action="store_false", help="ไม่ส่ง Firebase")
+    ap.add_argument("--fb-latency", type=float, default=0.0, help="latency ของ fake_rtdb (ms)")
+    ap.add_argument("--no-weekly", dest="weekly", action="store_false", help="ไม่สร้าง weekly report ตอนเริ่มล็อต")
+    ap.add_argument("--max-plates", type=int)
+    ap.add_argument("--give-up", type=float, default=10.0, help="หยุดเมื่อ save p50 เกินงบต่อจานกี่เท่า (0 = ไม่หยุด)")
+    ap.add_argument("--report-every", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default=os.path.join("runs", "plate_loadgen", datetime.now().strftime("%Y%m%d_%H%M%S")))
+    args = ap.parse_args(argv)
+    args.image_size = tuple(args.image_size)
+
+    os.makedirs(args.out, exist_ok=True)
+    print(f"[LOADGEN] {args.rate:.0f} จาน/ชม.  {args.days} วัน × {args.hours_per_day:g} ชม. × {args.lots_per_day} ล็อต  → {args.out}")
+    samples, lot_samples, info = run(args, args.out)
+    if not samples:
+        print("[LOADGEN] ไม่มีจานถูกบันทึก")
+        return 1
+    grow = growth(samples + lot_samples, PLATE_OPS + LOT_OPS)
+    print_report(info, grow)
+
+    with open(os.path.join(args.out, "samples.csv"), "w", newline="", encoding="utf-8") as f:
+        w = csv.DictWriter(f, fieldnames=list(samples[0]))
+        w.writeheader()
+        w.writerows(samples)
+    with open(os.path.join(args.out, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump({**info, "args": {k: str(v) for k, v in vars(args).items()}, "growth": grow, "lots": lot_samples},
+                  f, ensure_ascii=False, indent=2)
+    print(f"[LOADGEN] → {args.out}/summary.json")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
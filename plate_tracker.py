@@ -0,0 +1,336 @@
+# plate_tracker.py
+# -*- coding: utf-8 -*-
+# Tracker จานแบบเบา (แนว ByteTrack): Kalman ความเร็วคงที่ + จับคู่ด้วย IoU/Hungarian
+#
+# - ให้ ID จานคงที่ข้ามเฟรม → นับจาน "ครั้งเดียวต่อ track" แทน heuristic IoU/centroid/ROI-MAE
+# - จับคู่ 2 รอบแบบ ByteTrack: กล่อง conf สูงก่อน แล้วใช้กล่อง conf ต่ำต่อ track ที่ยังค้าง
+#   (กล่องต่ำไม่สร้าง track ใหม่ แค่ช่วยให้ track เดิมไม่หลุดตอนโมเดลไม่มั่นใจ)
+# - track ใหม่ต้องเจอ min_hits เฟรมติดกันก่อนยืนยัน / หายเกิน max_misses เฟรม = จานออกไปแล้ว
+# - ไม่มี scipy ก็ใช้ได้ (fallback เป็น greedy matching ตาม IoU)
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    SCIPY_AVAILABLE = True
+except ImportError:
+    SCIPY_AVAILABLE = False
+
+
+# -----------------------------
+# Geometry helpers (vectorized)
+# -----------------------------
+def iou_matrix(a, b):
+    """IoU ระหว่างกล่องทุกคู่: a (N,4), b (M,4) แบบ xyxy → (N,M)"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    ix1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    iy1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    ix2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    iy2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(ix2 - ix1, 0, None) * np.clip(iy2 - iy1, 0, None)
+    area_a = np.clip(a[:, 2] - a[:, 0], 0, None) * np.clip(a[:, 3] - a[:, 1], 0, None)
+    area_b = np.clip(b[:, 2] - b[:, 0], 0, None) * np.clip(b[:, 3] - b[:, 1], 0, None)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0).astype(np.float32)
+
+
+def linear_assignment(cost, thresh):
+    """
+    จับคู่ต้นทุนต่ำสุด (Hungarian ถ้ามี scipy) แล้วตัดคู่ที่ cost > thresh
+    คืน (matches[(i,j)], unmatched_rows, unmatched_cols)
+    """
+    n, m = cost.shape
+    if n == 0 or m == 0:
+        return [], list(range(n)), list(range(m))
+
+    if SCIPY_AVAILABLE:
+        rows, cols = linear_sum_assignment(cost)
+        pairs = [(int(i), int(j)) for i, j in zip(rows, cols) if cost[i, j] <= thresh]
+    else:
+        # greedy: หยิบคู่ cost ต่ำสุดก่อน (จานในเฟรมมีไม่กี่ใบ ผลแทบไม่ต่างจาก Hungarian)
+        pairs = []
+        used_r, used_c = set(), set()
+        for flat in np.argsort(cost, axis=None):
+            i, j = divmod(int(flat), m)
+            if cost[i, j] > thresh:
+                break
+            if i in used_r or j in used_c:
+                continue
+            pairs.append((i, j))
+            used_r.add(i); used_c.add(j)
+
+    mr = {i for i, _ in pairs}
+    mc = {j for _, j in pairs}
+    return pairs, [i for i in range(n) if i not in mr], [j for j in range(m) if j not in mc]
+
+
+def xyxy_to_cxcywh(b):
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    return np.stack([(b[:, 0] + b[:, 2]) / 2, (b[:, 1] + b[:, 3]) / 2,
+                     b[:, 2] - b[:, 0], b[:, 3] - b[:, 1]], axis=1)
+
+
+def cxcywh_to_xyxy(s):
+    s = np.asarray(s, dtype=np.float64).reshape(-1, 4)
+    return np.stack([s[:, 0] - s[:, 2] / 2, s[:, 1] - s[:, 3] / 2,
+                     s[:, 0] + s[:, 2] / 2, s[:, 1] + s[:, 3] / 2], axis=1)
+
+
+# -----------------------------
+# Constant-velocity Kalman (batched)
+# state = [cx, cy, w, h, vcx, vcy, vw, vh]
+# -----------------------------
+class KalmanBoxFilter:
+    STD_POS = 1.0 / 20
+    STD_VEL = 1.0 / 160
+
+    def __init__(self):
+        self.F = np.eye(8)
+        for i in range(4):
+            self.F[i, i + 4] = 1.0
+        self.H = np.eye(4, 8)
+
+    def initiate(self, z):
+        """z (4,) cx,cy,w,h → mean (8,), cov (8,8)"""
+        mean = np.r_[z, np.zeros(4)]
+        h = max(z[3], 1.0)
+        std = np.array([2 * self.STD_POS * h] * 4 + [10 * self.STD_VEL * h] * 4)
+        return mean, np.diag(std ** 2)
+
+    def predict(self, means, covs):
+        """means (N,8), covs (N,8,8) → ทำนายทุก track พร้อมกัน"""
+        if len(means) == 0:
+            return means, covs
+        h = np.maximum(means[:, 3], 1.0)
+        std = np.concatenate([np.repeat((self.STD_POS * h)[:, None], 4, axis=1),
+                              np.repeat((self.STD_VEL * h)[:, None], 4, axis=1)], axis=1)
+        Q = np.zeros_like(covs)
+        idx = np.arange(8)
+        Q[:, idx, idx] = std ** 2
+        means = means @ self.F.T
+        covs = self.F @ covs @ self.F.T + Q
+        return means, covs
+
+    def update(self, means, covs, zs):
+        """อัปเดตหลาย track พร้อมกันด้วย measurement zs (N,4)"""
+        if len(means) == 0:
+            return means, covs
+        h = np.maximum(zs[:, 3], 1.0)
+        R = np.zeros((len(zs), 4, 4))
+        idx = np.arange(4)
+        R[:, idx, idx] = (self.STD_POS * h)[:, None] ** 2
+        S = self.H @ covs @ self.H.T + R
+        K = covs @ self.H.T @ np.linalg.inv(S)
+        y = zs - means @ self.H.T
+        means = means + (K @ y[:, :, None])[:, :, 0]
+        covs = covs - K @ S @ np.transpose(K, (0, 2, 1))
+        return means, covs
+
+
+# -----------------------------
+# Track
+# -----------------------------
+class PlateTrack:
+    TENTATIVE, TRACKED, LOST, REMOVED = "tentative", "tracked", "lost", "removed"
+
+    def __init__(self, track_id, mean, cov, score, label, frame_idx):
+        self.track_id = track_id
+        self.mean = mean
+        self.cov = cov
+        self.score = float(score)
+        self.state = self.TENTATIVE
+        self.hits = 1
+        self.misses = 0
+        self.start_frame = frame_idx
+        self.last_frame = frame_idx
+        self.label_votes = {}
+        self.counted = False     # ผู้เรียกตั้งเป็น True หลังนับ/บันทึกจานนี้แล้ว
+        self.data = {}           # ที่เก็บข้อมูลต่อจานของผู้เรียก (เช่น หลักฐานตำหนิ)
+        self._vote(label, score)
+
+    def _vote(self, label, score):
+        if label is not None:
+            self.label_votes[label] = self.label_votes.get(label, 0.0) + float(score)
+
+    @property
+    def box(self):
+        """กล่อง xyxy จาก state ปัจจุบัน (int)"""
+        return [int(round(v)) for v in cxcywh_to_xyxy(self.mean[:4])[0]]
+
+    @property
+    def label(self):
+        """รูปทรงของ track = class ที่ได้คะแนนโหวต (รวม conf) สูงสุด"""
+        if not self.label_votes:
+            return None
+        return max(self.label_votes.items(), key=lambda kv: kv[1])[0]
+
+    @property
+    def is_confirmed(self):
+        return self.state in (self.TRACKED, self.LOST)
+
+    @property
+    def area(self):
+        return float(max(self.mean[2], 0) * max(self.mean[3], 0))
+
+
+# -----------------------------
+# Tracker
+# -----------------------------
+class PlateTracker:
+    """
+    update(boxes, scores, labels) ทุกเฟรมที่รัน inference
+      - boxes: xyxy (N,4) ในพิกัดเฟรมเดียวกับที่แสดงผล
+      - scores: conf (N,)   - labels: ชื่อ class (N,) หรือ None
+    หลัง update:
+      - self.tracks          : track ที่ยังมีชีวิต (ทุกสถานะ)
+      - self.new_confirmed   : track ที่เพิ่งยืนยันในเฟรมนี้ (= จานใหม่)
+      - self.removed         : track ที่ยืนยันแล้วและเพิ่งหลุดไป (= จานออกไปแล้ว)
+    """
+
+    def __init__(self, high_thresh=0.5, low_thresh=0.1, match_iou=0.2, low_match_iou=0.5,
+                 min_hits=3, max_misses=10, class_aware=False):
+        self.high_thresh = high_thresh
+        self.low_thresh = low_thresh
+        self.match_iou = match_iou
+        self.low_match_iou = low_match_iou
+        self.min_hits = max(1, int(min_hits))
+        self.max_misses = max(1, int(max_misses))
+        self.class_aware = class_aware
+        self.kf = KalmanBoxFilter()
+        self.reset()
+
+    def reset(self):
+        self.tracks = []
+        self.new_confirmed = []
+        self.removed = []
+        self.frame_idx = 0
+        self._next_id = 1
+
+    # ---- internals ----
+    def _cost(self, tracks, boxes, labels):
+        if not tracks or len(boxes) == 0:
+            return np.ones((len(tracks), len(boxes)), dtype=np.float32)
+        iou = iou_matrix([t.box for t in tracks], boxes)
+        if self.class_aware and labels is not None:
+            # track ที่มีรูปทรงชัดแล้วห้ามจับคู่กับกล่องคนละรูปทรง (ของใหม่ที่วางแทนที่เดิม)
+            for i, t in enumerate(tracks):
+                tl = t.label
+                if tl is None:
+                    continue
+                for j, dl in enumerate(labels):
+                    if dl is not None and dl != tl:
+                        iou[i, j] = 0.0
+        return 1.0 - iou
+
+    def _apply_matches(self, tracks, pairs, boxes, scores, labels):
+        if not pairs:
+            return
+        sel = [tracks[i] for i, _ in pairs]
+        zs = xyxy_to_cxcywh([boxes[j] for _, j in pairs])
+        means, covs = self.kf.update(np.stack([t.mean for t in sel]), np.stack([t.cov for t in sel]), zs)
+        for k, (i, j) in enumerate(pairs):
+            t = tracks[i]
+            t.mean, t.cov = means[k], covs[k]
+            t.score = float(scores[j])
+            t.hits += 1
+            t.misses = 0
+            t.last_frame = self.frame_idx
+            t._vote(labels[j] if labels is not None else None, scores[j])
+            if t.state == PlateTrack.TENTATIVE:
+                if t.hits >= self.min_hits:
+                    t.state = PlateTrack.TRACKED
+                    self.new_confirmed.append(t)
+            else:
+                t.state = PlateTrack.TRACKED
+
+    # ---- public ----
+    def update(self, boxes, scores, labels=None):
+        self.frame_idx += 1
+        self.new_confirmed = []
+        self.removed = []
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+        labels = list(labels) if labels is not None else None
+
+        # 1) predict ทุก track พร้อมกัน
+        if self.tracks:
+            means, covs = self.kf.predict(np.stack([t.mean for t in self.tracks]),
+                                          np.stack([t.cov for t in self.tracks]))
+            for t, m, c in zip(self.tracks, means, covs):
+                t.mean, t.cov = m, c
+
+        high = np.where(scores >= self.high_thresh)[0]
+        low = np.where((scores >= self.low_thresh) & (scores < self.high_thresh))[0]
+        hb, hs = boxes[high], scores[high]
+        hl = [labels[i] for i in high] if labels is not None else None
+        lb, ls = boxes[low], scores[low]
+        ll = [labels[i] for i in low] if labels is not None else None
+
+        # 2) รอบแรก: กล่อง conf สูง กับทุก track ที่ยืนยันแล้ว (รวม lost)
+        confirmed = [t for t in self.tracks if t.is_confirmed]
+        tentative = [t for t in self.tracks if not t.is_confirmed]
+        pairs, um_t, um_d = linear_assignment(self._cost(confirmed, hb, hl), 1.0 - self.match_iou)
+        self._apply_matches(confirmed, pairs, hb, hs, hl)
+
+        # 3) รอบสอง: กล่อง conf ต่ำ กับ track ที่ยังค้าง (ไม่รวม lost) — IoU ต้องสูงกว่า
+        remain = [confirmed[i] for i in um_t if confirmed[i].state == PlateTrack.TRACKED]
+        pairs2, um_t2, _ = linear_assignment(self._cost(remain, lb, ll), 1.0 - self.low_match_iou)
+        self._apply_matches(remain, pairs2, lb, ls, ll)
+        matched_ids = {id(remain[i]) for i, _ in pairs2} | {id(confirmed[i]) for i, _ in pairs}
+
+        # 4) track ที่ยังไม่ยืนยัน จับคู่กับกล่อง conf สูงที่เหลือ
+        rest_b = hb[um_d]
+        rest_s = hs[um_d]
+        rest_l = [hl[j] for j in um_d] if hl is not None else None
+        pairs3, um_tent, um_d3 = linear_assignment(self._cost(tentative, rest_b, rest_l), 1.0 - self.match_iou)
+        self._apply_matches(tentative, pairs3, rest_b, rest_s, rest_l)
+        matched_ids |= {id(tentative[i]) for i, _ in pairs3}
+
+        # 5) track ที่ไม่ได้จับคู่: tentative ทิ้งทันที / confirmed → lost → removed
+        alive = []
+        for t in self.tracks:
+            if id(t) in matched_ids:
+                alive.append(t)
+                continue
+            t.misses += 1
+            if not t.is_confirmed:
+                t.state = PlateTrack.REMOVED
+                continue
+            if t.misses > self.max_misses:
+                t.state = PlateTrack.REMOVED
+                self.removed.append(t)
+                continue
+            t.state = PlateTrack.LOST
+            alive.append(t)
+
+        # 6) กล่อง conf สูงที่เหลือ → track ใหม่
+        for j in um_d3:
+            z = xyxy_to_cxcywh(rest_b[j])[0]
+            mean, cov = self.kf.initiate(z)
+            t = PlateTrack(self._next_id, mean, cov, rest_s[j],
+                           rest_l[j] if rest_l is not None else None, self.frame_idx)
+            self._next_id += 1
+            if self.min_hits <= 1:
+                t.state = PlateTrack.TRACKED
+                self.new_confirmed.append(t)
+            alive.append(t)
+
+        self.tracks = alive
+        return [t for t in self.tracks if t.state == PlateTrack.TRACKED]
+
+    def primary(self):
+        """จานหลักในเฟรม: track ที่ยืนยันแล้วและยังเห็นอยู่ ที่ใหญ่ที่สุด"""
+        active = [t for t in self.tracks if t.state == PlateTrack.TRACKED]
+        if not active:
+            return None
+        return max(active, key=lambda t: t.area)
+
+    def flush(self):
+        """จบ session: คืน track ที่ยืนยันแล้วทั้งหมด (ให้ผู้เรียกบันทึกจานที่ยังไม่ถูกนับ) แล้วล้าง"""
+        left = [t for t in self.tracks if t.is_confirmed]
+        self.reset()
+        return left
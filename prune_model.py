@@ -0,0 +1,375 @@
+# prune_model.py
+# -*- coding: utf-8 -*-
+# structured channel pruning ของ models/defect_best.pt ให้ได้ FLOPs หรือ latency ตามงบ แล้ว fine-tune สั้น ๆ
+#
+# - ตัดเฉพาะ channel "ภายใน" ที่ไม่ต่อกับ concat / residual: Bottleneck.cv1→cv2 (ใน C3k2/C3k),
+#   FFN ของ PSABlock (C2PSA) และ conv กลางของ head (Detect.cv2 / cv3 รวม depthwise ที่คั่นอยู่)
+#   → โมเดลยังเป็น module ของ ultralytics ปกติ โหลด / export / predict ได้เหมือนเดิม
+# - ความสำคัญของ channel = |gamma| ของ BatchNorm (network slimming) เรียงรวมทั้งโมเดลแล้วตัดตัวต่ำสุด
+#   คงไว้อย่างน้อย MIN_KEEP ของแต่ละชั้น และปัดจำนวนที่เหลือเป็นทวีคูณของ ROUND (SIMD บน CPU)
+# - channel ที่ตัดออกยังส่งค่าคงที่ act(beta) ให้ชั้นถัดไป → ชดเชยลง running_mean / bias ของชั้นถัดไป
+# - หาอัตราการตัดด้วย binary search จนได้ FLOPs ≤ --flops (สัดส่วนของเดิม) หรือ latency ≤ --ms
+# - fine-tune ด้วย TRAIN_ARGS ของ fine_tune_2_stage.py (epochs สั้นลง, ไม่ freeze) → ตาราง ก่อน/หลัง
+#   (GFLOPs, params, latency CPU, mAP, recall) ใน runs/prune/<name>/prune_report.json
+#
+# ใช้งาน:
+#   python prune_model.py --flops 0.6
+#   python prune_model.py --ms 40 --epochs 30
+#   python prune_model.py --flops 0.5 --no-finetune          # ดูผลก่อน fine-tune อย่างเดียว
+#   python model_promote.py runs/prune/defect_pruned_f60 --role defect
+#   python model_promote.py runs/prune/defect_pruned_f50_raw.pt --role defect   # ผลของ --no-finetune
+
+import os, sys, json, copy, argparse, time
+import multiprocessing as mp
+
+import torch
+import torch.nn as nn
+
+WEIGHTS = os.path.join("models", "defect_best.pt")
+PROJECT = os.path.join("runs", "prune")
+FINETUNE_EPOCHS = 20
+MIN_KEEP = 0.25          # สัดส่วน channel ขั้นต่ำที่เหลือต่อชั้น
+ROUND = 8
+SEARCH_STEPS = 7
+
+
+# -----------------------------
+# หา channel ที่ตัดได้
+# -----------------------------
+class PruneGroup:
+    """producer (Conv+BN) → [depthwise Conv ที่ผ่าน channel เดิม] → consumer (Conv หรือ nn.Conv2d ใน Sequential)"""
+
+    def __init__(self, name, producer, passthrough, consumer_parent, consumer_key):
+        self.name = name
+        self.producer = producer
+        self.passthrough = passthrough
+        self.consumer_parent = consumer_parent
+        self.consumer_key = consumer_key
+
+    @property
+    def consumer(self):
+        p, k = self.consumer_parent, self.consumer_key
+        return p[k] if isinstance(k, int) else getattr(p, k)
+
+    @property
+    def channels(self):
+        return self.producer.conv.out_channels
+
+    def importance(self):
+        return self.producer.bn.weight.detach().abs().float().cpu()
+
+
+def _is_conv(m):
+    return hasattr(m, "conv") and hasattr(m, "bn") and isinstance(m.conv, nn.Conv2d)
+
+
+def _is_dw(m):
+    return _is_conv(m) and m.conv.groups == m.conv.in_channels == m.conv.out_channels and m.conv.groups > 1
+
+
+def find_groups(model):
+    """model = DetectionModel (ไม่ fuse) → [PruneGroup]"""
+    groups = []
+    for name, m in model.named_modules():
+        cls = type(m).__name__
+        if cls == "Bottleneck" and _is_conv(m.cv1) and _is_conv(m.cv2) and m.cv2.conv.groups == 1:
+            groups.append(PruneGroup(f"{name}.cv1", m.cv1, [], m, "cv2"))
+        elif cls == "PSABlock" and isinstance(getattr(m, "ffn", None), nn.Sequential) and len(m.ffn) == 2:
+            groups.append(PruneGroup(f"{name}.ffn.0", m.ffn[0], [], m.ffn, 1))
+        elif cls in ("Detect", "Segment", "Pose", "OBB"):
+            for i, seq in enumerate(m.cv2):
+                groups.append(PruneGroup(f"{name}.cv2.{i}.0", seq[0], [], seq, 1))
+                groups.append(PruneGroup(f"{name}.cv2.{i}.1", seq[1], [], seq, 2))
+            for i, seq in enumerate(m.cv3):
+                if _is_conv(seq[0]):                       # head แบบเก่า: Conv, Conv, Conv2d
+                    groups.append(PruneGroup(f"{name}.cv3.{i}.0", seq[0], [], seq, 1))
+                    groups.append(PruneGroup(f"{name}.cv3.{i}.1", seq[1], [], seq, 2))
+                elif isinstance(seq[0], nn.Sequential) and _is_dw(seq[1][0]):   # yolo11: (DW, Conv) x2, Conv2d
+                    groups.append(PruneGroup(f"{name}.cv3.{i}.0.1", seq[0][1], [seq[1][0]], seq[1], 1))
+                    groups.append(PruneGroup(f"{name}.cv3.{i}.1.1", seq[1][1], [], seq, 2))
+    return groups
+
+
+# -----------------------------
+# ตัด channel จริง
+# -----------------------------
+def _bn_eval(bn, x):
+    return (x - bn.running_mean) / torch.sqrt(bn.running_var + bn.eps) * bn.weight + bn.bias
+
+
+def _slice_conv(conv, out_idx=None, in_idx=None):
+    w = conv.weight.data
+    groups = conv.groups
+    if out_idx is not None:
+        w = w[out_idx]
+    if in_idx is not None and groups == 1:
+        w = w[:, in_idx]
+    if groups > 1:                      # depthwise: ตัด in/out ชุดเดียวกัน
+        groups = w.shape[0]
+    new = nn.Conv2d(w.shape[1] * groups, w.shape[0], conv.kernel_size, conv.stride, conv.padding,
+                    conv.dilation, groups, conv.bias is not None).to(w.device, w.dtype)
+    new.weight.data.copy_(w)
+    if conv.bias is not None:
+        new.bias.data.copy_(conv.bias.data[out_idx] if out_idx is not None else conv.bias.data)
+    return new
+
+
+def _slice_bn(bn, idx):
+    new = nn.BatchNorm2d(len(idx), bn.eps, bn.momentum).to(bn.weight.device, bn.weight.dtype)
+    for k in ("weight", "bias"):
+        getattr(new, k).data.copy_(getattr(bn, k).data[idx])
+    new.running_mean.copy_(bn.running_mean[idx])
+    new.running_var.copy_(bn.running_var[idx])
+    return new
+
+
+def prune_group(g, keep_idx):
+    """คง channel keep_idx (เรียงแล้ว) ของ group; ค่าคงที่จาก channel ที่ตัดถูกชดเชยลงชั้นถัดไป"""
+    n = g.channels
+    keep = torch.as_tensor(keep_idx, dtype=torch.long)
+    drop = torch.as_tensor(sorted(set(range(n)) - set(keep.tolist())), dtype=torch.long)
+    if not len(drop):
+        return
+    p = g.producer
+    with torch.no_grad():
+        const = p.act(p.bn.bias.data[drop])                   # gamma ≈ 0 → output ≈ act(beta)
+        for dw in g.passthrough:
+            ksum = dw.conv.weight.data[drop].sum((1, 2, 3))
+            const = dw.act(_bn_eval(dw.bn, ksum * const))
+        c = g.consumer
+        conv = c.conv if _is_conv(c) else c
+        shift = (conv.weight.data[:, drop].sum((2, 3)) * const).sum(1)
+        if _is_conv(c):
+            c.bn.running_mean.data -= shift
+        elif conv.bias is not None:
+            conv.bias.data += shift
+
+        p.conv = _slice_conv(p.conv, out_idx=keep)
+        p.bn = _slice_bn(p.bn, keep)
+        for dw in g.passthrough:
+            dw.conv = _slice_conv(dw.conv, out_idx=keep)
+            dw.bn = _slice_bn(dw.bn, keep)
+        if _is_conv(c):
+            c.conv = _slice_conv(c.conv, in_idx=keep)
+        elif isinstance(g.consumer_key, int):
+            g.consumer_parent[g.consumer_key] = _slice_conv(conv, in_idx=keep)
+        else:
+            setattr(g.consumer_parent, g.consumer_key, _slice_conv(conv, in_idx=keep))
+
+
+def _keep_count(n, n_above):
+    k = max(n_above, int(round(n * MIN_KEEP)), 1)
+    k = min(n, ((k + ROUND - 1) // ROUND) * ROUND)
+    return k
+
+
+def prune_ratio(model, ratio):
+    """สำเนาของ model ที่ตัด channel สำคัญน้อยสุด ratio (ของ channel ที่ตัดได้ทั้งหมด) → (model, {ชั้น: (เดิม, เหลือ)})"""
+    m = copy.deepcopy(model)
+    groups = find_groups(m)
+    if not groups:
+        return m, {}
+    scores = torch.cat([g.importance() for g in groups])
+    thr = float(torch.quantile(scores, ratio)) if ratio > 0 else -1.0
+    plan = {}
+    for g in groups:
+        imp = g.importance()
+        n = len(imp)
+        k = _keep_count(n, int((imp > thr).sum()))
+        keep = sorted(torch.argsort(imp, descending=True)[:k].tolist())
+        plan[g.name] = (n, k)
+        prune_group(g, keep)
+    return m, plan
+
+
+# -----------------------------
+# วัด
+# -----------------------------
+def count_flops(model, imgsz):
+    """GFLOPs (2 x MAC ของ Conv2d ทั้งหมด) ที่ imgsz x imgsz"""
+    total = [0]
+
+    def hook(mod, inp, out):
+        k = mod.kernel_size[0] * mod.kernel_size[1]
+        total[0] += 2 * out[0].numel() * (mod.in_channels // mod.groups) * k
+
+    hooks = [mm.register_forward_hook(hook) for mm in model.modules() if isinstance(mm, nn.Conv2d)]
+    p = next(model.parameters())
+    try:
+        with torch.no_grad():
+            model.eval()(torch.zeros(1, 3, imgsz, imgsz, device=p.device, dtype=p.dtype))
+    finally:
+        for h in hooks:
+            h.remove()
+    return total[0] / 1e9
+
+
+def count_params(model):
+    return sum(p.numel() for p in model.parameters())
+
+
+def _yolo_with(model, weights):
+    """ultralytics YOLO (โหลดจาก weights) ที่สลับมาใช้ DetectionModel นี้ (สำเนา: predictor fuse BN ลง conv ในตัว)"""
+    from ultralytics import YOLO
+    y = YOLO(weights)
+    y.model = copy.deepcopy(model).float().eval()
+    y.predictor = None
+    return y
+
+
+def save_checkpoint(model, path, extra=None):
+    """บันทึกแบบ checkpoint ของ ultralytics ("model") โหลดด้วย YOLO(path) ได้"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    args = getattr(model, "args", None)
+    ckpt = {"model": copy.deepcopy(model).half(), "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "train_args": dict(args) if isinstance(args, dict) else {}}
+    ckpt.update(extra or {})
+    tmp = path + ".tmp"
+    torch.save(ckpt, tmp)
+    os.replace(tmp, path)
+
+
+def search(model, weights, imgsz, flops=None, ms=None, frames=None, device="cpu", log=print):
+    """binary search อัตราการตัดที่มากพอให้ได้งบ (FLOPs สัดส่วนของเดิม หรือ latency ms) แต่ตัดน้อยสุด"""
+    from model_eval import bench_latency
+    base_flops = count_flops(model, imgsz)
+
+    def fits(m):
+        if flops is not None:
+            f = count_flops(m, imgsz)
+            return f <= flops * base_flops, f"{f:.1f} GFLOPs ({f / base_flops:.0%})"
+        lat = bench_latency(_yolo_with(m, weights), frames, imgsz, device=device)["median_ms"]
+        return lat <= ms, f"{lat:.1f} ms"
+
+    lo, hi = 0.0, 1.0
+    best = None
+    for _ in range(SEARCH_STEPS):
+        mid = (lo + hi) / 2
+        m, plan = prune_ratio(model, mid)
+        ok, desc = fits(m)
+        log(f"[PRUNE] ratio {mid:.3f} → {desc} {'ok' if ok else ''}")
+        if ok:
+            best, hi = (mid, m, plan), mid
+        else:
+            lo = mid
+    if best is None:
+        m, plan = prune_ratio(model, 1.0)
+        ok, desc = fits(m)
+        log(f"[PRUNE] ตัดเต็มที่ (เหลือ {MIN_KEEP:.0%} ต่อชั้น) → {desc}" + ("" if ok else " ยังไม่ถึงงบ"))
+        best = (1.0, m, plan)
+    return best
+
+
+def measure(weights, label, data_yaml, split, frames, imgsz, device="cpu"):
+    from ultralytics import YOLO
+    from model_eval import eval_metrics, bench_latency, model_size_mb
+    y = YOLO(weights)
+    det = y.model
+    res = {"label": label, "weights": os.path.abspath(weights), "gflops": count_flops(copy.deepcopy(det).float(), imgsz),
+           "params_m": count_params(det) / 1e6, "size_mb": model_size_mb(weights)}
+    res.update(eval_metrics(y, data_yaml, split=split, imgsz=imgsz, device=device))
+    res["latency"] = bench_latency(YOLO(weights), frames, imgsz, device=device)
+    return res
+
+
+def print_table(rows):
+    print(f"\n  {'':<16}{'GFLOPs':>8}{'params M':>10}{'lat ms':>9}{'p90 ms':>9}{'mAP50-95':>10}{'mAP50':>8}{'recall':>8}")
+    for r in rows:
+        lat = r["latency"]
+        print(f"  {r['label']:<16}{r['gflops']:>8.1f}{r['params_m']:>10.2f}{lat['median_ms'] or 0:>9.1f}"
+              f"{lat['p90_ms'] or 0:>9.1f}{r['map50_95']:>10.4f}{r['map50']:>8.4f}{r['recall']:>8.3f}")
+
+
+# -----------------------------
+# fine-tune
+# -----------------------------
+def keep_model_trainer(base=None):
+    """trainer ที่เทรนโมเดลที่โหลดมาตรง ๆ (ปกติ ultralytics สร้างใหม่จาก yaml ซึ่งมีจำนวน channel เดิม)"""
+    from ultralytics.models.yolo.detect import DetectionTrainer
+
+    class PrunedTrainer(base or DetectionTrainer):
+        def get_model(self, cfg=None, weights=None, verbose=True):
+            if not isinstance(weights, nn.Module):
+                raise ValueError("PrunedTrainer ต้องเริ่มจาก checkpoint ที่ตัดแล้ว")
+            return weights
+
+    return PrunedTrainer
+
+
+def finetune(pruned_pt, name, epochs=FINETUNE_EPOCHS, device="cpu"):
+    from ultralytics import YOLO
+    from fine_tune_2_stage import TRAIN_ARGS, PACKED_CACHE
+    from packed_dataset import packed_trainer
+    from train_telemetry import attach_telemetry
+
+    args = dict(TRAIN_ARGS)
+    args.update(epochs=epochs, freeze=0, project=os.path.abspath(PROJECT), name=name, exist_ok=True, device=device)
+    base = packed_trainer(PACKED_CACHE) if (PACKED_CACHE / "index.json").exists() else None
+    model = YOLO(pruned_pt)
+    attach_telemetry(model)
+    model.train(**args, trainer=keep_model_trainer(base))
+    best = os.path.join(str(model.trainer.save_dir), "weights", "best.pt")
+    return best if os.path.isfile(best) else os.path.join(str(model.trainer.save_dir), "weights", "last.pt")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Structured channel pruning of the defect model to a FLOPs or latency budget")
+    ap.add_argument("--weights", default=WEIGHTS)
+    budget = ap.add_mutually_exclusive_group(required=True)
+    budget.add_argument("--flops", type=float, help="งบ FLOPs เป็นสัดส่วนของโมเดลเดิม เช่น 0.6")
+    budget.add_argument("--ms", type=float, help="งบ latency CPU ต่อเฟรม (median, ms)")
+    ap.add_argument("--epochs", type=int, default=FINETUNE_EPOCHS, help="จำนวน epoch ของ fine-tune")
+    ap.add_argument("--no-finetune", action="store_true")
+    ap.add_argument("--frames", type=int, default=30, help="จำนวนเฟรมคงที่ที่ใช้วัด latency")
+    ap.add_argument("--device", default="cpu")
+    args = ap.parse_args(argv)
+
+    from ultralytics import YOLO
+    from fine_tune_2_stage import DATA_YAML
+    from model_eval import split_for_eval, fixed_frames
+    from model_promote import runtime_imgsz
+
+    if not os.path.isfile(args.weights):
+        print(f"ไม่พบ {args.weights}")
+        return 2
+    imgsz = runtime_imgsz("defect")
+    split = split_for_eval(DATA_YAML)
+    frames = fixed_frames(DATA_YAML, split, args.frames)
+
+    det = YOLO(args.weights).model.float().eval()
+    if not find_groups(det):
+        print("ไม่พบชั้นที่ตัดได้ (โมเดลถูก fuse แล้ว หรือไม่ใช่ YOLO detect)")
+        return 2
+    ratio, pruned, plan = search(det, args.weights, imgsz, flops=args.flops, ms=args.ms, frames=frames, device=args.device)
+    tag = f"f{round(args.flops * 100)}" if args.flops is not None else f"ms{args.ms:g}"
+    name = f"defect_pruned_{tag}"
+    raw_pt = os.path.join(PROJECT, name + "_raw.pt")
+    save_checkpoint(pruned, raw_pt, {"prune": {"ratio": ratio, "plan": plan, "source": os.path.abspath(args.weights)}})
+    kept = sum(k for _, k in plan.values())
+    total = sum(n for n, _ in plan.values())
+    print(f"[PRUNE] ratio {ratio:.3f}: เหลือ {kept}/{total} channel ในชั้นที่ตัดได้ → {raw_pt}")
+
+    rows = [measure(args.weights, "before", DATA_YAML, split, frames, imgsz, args.device),
+            measure(raw_pt, "pruned", DATA_YAML, split, frames, imgsz, args.device)]
+    out_pt = raw_pt
+    if not args.no_finetune:
+        out_pt = finetune(raw_pt, name, args.epochs, args.device)
+        rows.append(measure(out_pt, "pruned+finetune", DATA_YAML, split, frames, imgsz, args.device))
+    print_table(rows)
+
+    report = {"weights": os.path.abspath(args.weights), "budget": {"flops": args.flops, "ms": args.ms},
+              "ratio": ratio, "imgsz": imgsz, "split": split, "plan": plan, "output": os.path.abspath(out_pt),
+              "rows": rows}
+    out_dir = os.path.join(PROJECT, name)
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "prune_report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[PRUNE] โมเดล: {out_pt}")
+    # ชี้ที่ไฟล์โมเดลตรง ๆ : --no-finetune ไม่มี <out_dir>/weights/best.pt (มีแค่ <name>_raw.pt)
+    print(f"[PRUNE] promote: python model_promote.py {out_pt} --role defect")
+    return 0
+
+
+if __name__ == "__main__":
+    mp.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,364 @@
+# rescore_captures.py
+# -*- coding: utf-8 -*-
+# ตรวจรูปจานย้อนหลังด้วยโมเดล defect ตัวใหม่ แล้วเทียบกับตำหนิที่บันทึกไว้เดิมรายจาน / รายล็อต
+#
+# - รูป: captures/detect_*.jpg ทั้งไฟล์ปกติและที่ retention_manager แพ็กเป็น shard แล้ว (captures/archive/*.zip)
+#   หรือโฟลเดอร์รูปดิบอื่นด้วย --source (ค้นทุกโฟลเดอร์ย่อย)
+#   captures/ เป็นภาพที่วาดกรอบแล้ว (ภาพเดียวต่อจาน) → ผลต่างจากตอนรันจริงได้บ้าง ถ้ามีเฟรมดิบให้ใช้ --source
+# - ผลเดิม: savefile/Report_*.json (+ savefile/archive/) จับคู่กับรูปด้วยวันที่ + เวลา (วินาทีเดียวกัน เรียงตาม plate_id)
+# - inference: process pool (torch threads = core / workers) predict ทีละ batch ใหญ่ ;
+#   ผลทุก chunk ต่อท้าย results.jsonl ทันที → หยุดกลางคันแล้วรันคำสั่งเดิมซ้ำ = ทำต่อจากรูปที่ยังไม่ได้ตรวจ
+#   โฟลเดอร์ผลตั้งชื่อตาม sha256 ของ weights ; run.json (sha / imgsz / conf / iou / classes) ไม่ตรง = ไม่ยอมทำต่อ
+# - รายงาน: diff.csv (เฉพาะจานที่ผลเปลี่ยน) + summary.json + ตารางรายล็อต (เดิมเสีย / ใหม่เสีย / พบเพิ่ม / หายไป)
+#
+# ใช้งาน:
+#   python rescore_captures.py --weights models/registry/defect/v004/best.pt
+#   python rescore_captures.py --weights runs/defect_only_from_shape_img896_e100/weights/best.pt --workers 4 --batch 32
+#   python rescore_captures.py --weights models/defect_best.pt --source raw_frames/ --out runs/rescore/raw_v4
+#   python rescore_captures.py --report runs/rescore/3f2a9c1d0b7e          # สรุปใหม่จากผลที่มีอยู่
+
+import os, re, sys, csv, json, glob, time, zipfile, argparse
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+
+import numpy as np
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+from retention_manager import RetentionManager
+
+CAPTURE_RE = re.compile(r"^detect_(\d{8})_(\d{6})_(\d{3})(?:_([A-Za-z0-9]+))?\.(jpg|jpeg|png)$", re.IGNORECASE)
+IMG_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+# ชื่อไทยใน report ของ GUI ทุกตัว → ชื่อคลาส
+DEFECT_FROM_TH = {"รอยแตก": "crack", "รูเข็ม": "hole", "รู": "hole", "รอยขีดข่วน": "bulge", "รอยไหม้": "burn"}
+DEFECT_CLASSES = {"crack", "hole"}
+CHUNK = 64              # รูปต่องานที่ส่งให้ worker (= หน่วยของ checkpoint)
+RESULTS_NAME = "results.jsonl"
+RUN_NAME = "run.json"
+# ค่าที่ต้องตรงกับ run.json เดิมถึงจะทำต่อจาก results.jsonl ได้ (ต่างกัน = ผลคนละโมเดล/คนละเกณฑ์)
+RUN_KEYS = ("weights_sha256", "source", "imgsz", "conf", "iou", "classes")
+
+
+# -----------------------------
+# รายการรูป
+# -----------------------------
+def list_images(base_dir, source=None):
+    """→ [(key, ref)] เรียงตามชื่อ ; ref = ("file", path) หรือ ("zip", shard, name)"""
+    items = []
+    if source:
+        for root, _, files in os.walk(source):
+            for fn in files:
+                if fn.lower().endswith(IMG_EXTS):
+                    path = os.path.join(root, fn)
+                    items.append((os.path.relpath(path, source).replace(os.sep, "/"), ("file", path)))
+        return sorted(items)
+    rm = RetentionManager(base_dir)
+    seen = set()
+    if os.path.isdir(rm.captures_dir):
+        for fn in os.listdir(rm.captures_dir):
+            if CAPTURE_RE.match(fn):
+                items.append((fn, ("file", os.path.join(rm.captures_dir, fn))))
+                seen.add(fn)
+    for day, name, _ in rm.iter_archived():
+        if name not in seen:
+            items.append((name, ("zip", rm._shard_path(day), name)))
+    return sorted(items)
+
+
+# -----------------------------
+# worker
+# -----------------------------
+_W = {}
+
+
+def _init_worker(weights, threads, params):
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["MKL_NUM_THREADS"] = str(threads)
+    import torch
+    torch.set_num_threads(threads)
+    from ultralytics import YOLO
+    _W["model"] = YOLO(weights)
+    _W["params"] = params
+    _W["zips"] = {}
+
+
+def _read(ref):
+    if ref[0] == "file":
+        return cv2.imdecode(np.fromfile(ref[1], np.uint8), cv2.IMREAD_COLOR)
+    zf = _W["zips"].get(ref[1])
+    if zf is None:
+        if len(_W["zips"]) >= 4:            # shard รายวัน: เรียงตามชื่อ → ใช้ทีละไม่กี่ไฟล์
+            _W["zips"].pop(next(iter(_W["zips"]))).close()
+        zf = _W["zips"][ref[1]] = zipfile.ZipFile(ref[1], "r")
+    return cv2.imdecode(np.frombuffer(zf.read(ref[2]), np.uint8), cv2.IMREAD_COLOR)
+
+
+def _score_chunk(chunk):
+    """[(key, ref)] → [{"key", "defects": {ชื่อ: conf สูงสุด}, "n": {ชื่อ: จำนวน}} | {"key", "error"}]"""
+    model, p = _W["model"], _W["params"]
+    out, frames, keys = [], [], []
+    for key, ref in chunk:
+        try:
+            im = _read(ref)
+        except (OSError, KeyError, zipfile.BadZipFile) as e:
+            im, err = None, repr(e)
+        else:
+            err = "decode failed"
+        if im is None:
+            out.append({"key": key, "error": err})
+            continue
+        frames.append(im)
+        keys.append(key)
+    for i in range(0, len(frames), p["batch"]):
+        results = model.predict(frames[i:i + p["batch"]], imgsz=p["imgsz"], conf=p["conf"], iou=p["iou"],
+                                verbose=False)
+        for key, res in zip(keys[i:i + p["batch"]], results):
+            best, n = {}, {}
+            names = res.names
+            for c, s in zip(res.boxes.cls.tolist(), res.boxes.conf.tolist()):
+                label = names[int(c)]
+                if label not in p["classes"]:
+                    continue
+                best[label] = max(best.get(label, 0.0), round(float(s), 4))
+                n[label] = n.get(label, 0) + 1
+            out.append({"key": key, "defects": best, "n": n})
+    return out
+
+
+# -----------------------------
+# checkpoint
+# -----------------------------
+def check_run(out_dir, run):
+    """เขียน run.json ถ้ายังไม่มี ; ถ้ามีแล้วแต่ค่าใน RUN_KEYS ไม่ตรง → ValueError (ไม่ทำต่อจากผลของโมเดลอื่น)"""
+    path = os.path.join(out_dir, RUN_NAME)
+    if os.path.isfile(path):
+        with open(path, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        diff = [k for k in RUN_KEYS if old.get(k) != run.get(k)]
+        if diff:
+            raise ValueError(f"{out_dir} เป็นผลของการรันที่ค่าไม่ตรงกัน ({', '.join(f'{k}: {old.get(k)} → {run.get(k)}' for k in diff)})"
+                             " ใช้ --out โฟลเดอร์ใหม่")
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(run, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, path)
+
+
+def load_results(out_dir):
+    """results.jsonl → {key: rec} (บรรทัดท้ายที่เขียนไม่จบถูกข้าม)"""
+    done = {}
+    path = os.path.join(out_dir, RESULTS_NAME)
+    if not os.path.isfile(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            done[rec["key"]] = rec
+    return done
+
+
+def rescore(items, weights, out_dir, workers=None, batch=16, imgsz=896, conf=0.25, iou=0.65,
+            classes=DEFECT_CLASSES, source=None, weights_sha256=None, log=print):
+    """ตรวจทุกรูปที่ยังไม่มีใน results.jsonl ; คืนจำนวนรูปที่ตรวจรอบนี้ (run.json ไม่ตรง → ValueError)"""
+    from model_promote import sha256
+    os.makedirs(out_dir, exist_ok=True)
+    check_run(out_dir, {"weights": os.path.abspath(weights), "weights_sha256": weights_sha256 or sha256(weights),
+                        "source": os.path.abspath(source) if source else "captures", "imgsz": imgsz, "conf": conf,
+                        "iou": iou, "classes": sorted(classes)})
+    done = load_results(out_dir)
+    todo = [it for it in items if it[0] not in done]
+    log(f"[RESCORE] {len(items)} รูป ตรวจแล้ว {len(items) - len(todo)} เหลือ {len(todo)}")
+    if not todo:
+        return 0
+    workers = max(1, workers or min(4, os.cpu_count() or 1))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    params = {"batch": batch, "imgsz": imgsz, "conf": conf, "iou": iou, "classes": set(classes)}
+    chunks = [todo[i:i + CHUNK] for i in range(0, len(todo), CHUNK)]
+    n, t0 = 0, time.perf_counter()
+    with open(os.path.join(out_dir, RESULTS_NAME), "a", encoding="utf-8") as f, \
+            ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(weights, threads, params)) as ex:
+        pending, it = set(), iter(chunks)
+        while True:
+            while len(pending) < workers * 2:        # งานค้างจำกัด: ไม่สร้าง future ทีเดียวเป็นหมื่น
+                chunk = next(it, None)
+                if chunk is None:
+                    break
+                pending.add(ex.submit(_score_chunk, chunk))
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                recs = fut.result()
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in recs))
+                f.flush()
+                os.fsync(f.fileno())
+                n += len(recs)
+            dt = time.perf_counter() - t0
+            log(f"[RESCORE] {n}/{len(todo)}  {n / dt:.1f} รูป/วินาที  เหลือ ~{(len(todo) - n) / max(n / dt, 1e-9) / 60:.0f} นาที")
+    return n
+
+
+# -----------------------------
+# ผลเดิม + diff
+# -----------------------------
+def _parse_defects(text):
+    text = (text or "").strip()
+    if not text or text == "-":
+        return set()
+    return {DEFECT_FROM_TH.get(t.strip(), t.strip()) for t in text.split("/") if t.strip() and t.strip() != "-"}
+
+
+def _day_from_thai(date_text):
+    """"dd/mm/yyyy" (พ.ศ.) → "YYYYMMDD" """
+    try:
+        d, m, y = [int(v) for v in date_text.split("/")]
+    except (AttributeError, ValueError):
+        return None
+    if y > 2400:
+        y -= 543
+    return f"{y:04d}{m:02d}{d:02d}"
+
+
+def load_records(base_dir):
+    """savefile/Report_*.json (+ archive) → {(YYYYMMDD, HHMMSS): [record ...]} เรียงตาม plate_id"""
+    save_root = os.path.join(base_dir, "savefile")
+    paths = glob.glob(os.path.join(save_root, "Report_*.json")) + \
+        glob.glob(os.path.join(save_root, "archive", "*", "Report_*.json"))
+    by_sec = {}
+    for path in sorted(paths):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for r in data.get("records") or []:
+            day = _day_from_thai(r.get("date"))
+            t = (r.get("time") or "").replace(":", "")
+            if not day or len(t) != 6:
+                continue
+            rec = {"lot_id": r.get("lot_id") or data.get("lot_id"), "plate_id": r.get("plate_id"),
+                   "shape": r.get("shape"), "defects": _parse_defects(r.get("defects")),
+                   "report": os.path.basename(path)}
+            by_sec.setdefault((day, t), []).append(rec)
+    for recs in by_sec.values():
+        recs.sort(key=lambda r: (str(r["lot_id"]), int(r["plate_id"]) if str(r["plate_id"]).isdigit() else 0))
+    return by_sec
+
+
+def match_records(keys, by_sec):
+    """ชื่อรูป detect_YYYYMMDD_HHMMSS_mmm → record เดิม (รูปในวินาทีเดียวกันเรียงตาม ms คู่กับ plate_id)"""
+    groups = {}
+    for key in keys:
+        m = CAPTURE_RE.match(os.path.basename(key))
+        if m:
+            groups.setdefault((m.group(1), m.group(2)), []).append(key)
+    out = {}
+    for sec, ks in groups.items():
+        for key, rec in zip(sorted(ks), by_sec.get(sec, [])):
+            out[key] = rec
+    return out
+
+
+def diff_report(results, by_sec, out_dir, log=print):
+    """→ summary dict ; เขียน diff.csv + summary.json"""
+    matched = match_records(list(results), by_sec)
+    lots = {}
+    changed = []
+    errors = 0
+    for key in sorted(results):
+        r = results[key]
+        if "error" in r:
+            errors += 1
+            continue
+        new = set(r["defects"])
+        rec = matched.get(key)
+        lot = rec["lot_id"] if rec else "(ไม่มี record)"
+        old = rec["defects"] if rec else None
+        s = lots.setdefault(lot, {"plates": 0, "old_fail": 0, "new_fail": 0, "added": 0, "cleared": 0, "changed": 0})
+        s["plates"] += 1
+        s["new_fail"] += bool(new)
+        if old is None:
+            continue
+        s["old_fail"] += bool(old)
+        if old == new:
+            continue
+        status = "added" if new and not old else "cleared" if old and not new else "changed"
+        s[status] += 1
+        changed.append({"image": key, "lot_id": lot, "plate_id": rec["plate_id"], "report": rec["report"],
+                        "status": status, "old": " / ".join(sorted(old)) or "-", "new": " / ".join(sorted(new)) or "-",
+                        "new_conf": " ".join(f"{k}:{v:.2f}" for k, v in sorted(r["defects"].items()))})
+
+    with open(os.path.join(out_dir, "diff.csv"), "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.DictWriter(f, fieldnames=["image", "lot_id", "plate_id", "report", "status", "old", "new", "new_conf"])
+        w.writeheader()
+        w.writerows(changed)
+    total = {k: sum(s[k] for s in lots.values()) for k in ("plates", "old_fail", "new_fail", "added", "cleared", "changed")}
+    summary = {"created": datetime.now().isoformat(timespec="seconds"), "images": len(results), "errors": errors,
+               "matched": len(matched), "total": total, "lots": lots}
+    with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    log(f"\n{'lot':<18}{'plates':>8}{'old fail':>10}{'new fail':>10}{'added':>8}{'cleared':>9}{'changed':>9}")
+    for lot, s in sorted(lots.items()) + [("รวม", total)]:
+        log(f"{lot:<18}{s['plates']:>8}{s['old_fail']:>10}{s['new_fail']:>10}{s['added']:>8}{s['cleared']:>9}{s['changed']:>9}")
+    log(f"\nรูป {len(results)} (จับคู่ record ได้ {len(matched)}, อ่านไม่ได้ {errors}) → {out_dir}/diff.csv")
+    return summary
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Re-score historical plate images with a new defect model")
+    ap.add_argument("--weights", help="โมเดล defect ตัวใหม่")
+    ap.add_argument("--base-dir", default=os.path.dirname(os.path.abspath(__file__)), help="โฟลเดอร์ที่มี captures/ savefile/")
+    ap.add_argument("--source", help="โฟลเดอร์รูปดิบแทน captures/")
+    ap.add_argument("--out", help="ค่าเริ่มต้น runs/rescore/<sha256 ของ weights 12 ตัวแรก>")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--batch", type=int, default=16)
+    ap.add_argument("--imgsz", type=int, default=None, help="ค่าเริ่มต้น = imgsz ของ defect ใน config/two_stage.yaml")
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--iou", type=float, default=0.65)
+    ap.add_argument("--classes", nargs="+", default=sorted(DEFECT_CLASSES))
+    ap.add_argument("--limit", type=int, help="ตรวจแค่ N รูปแรก (ลองก่อนรันทั้งคืน)")
+    ap.add_argument("--report", metavar="OUT_DIR", help="ไม่ตรวจใหม่ สรุป diff จาก results.jsonl ที่มี")
+    args = ap.parse_args(argv)
+
+    if args.report:
+        results = load_results(args.report)
+        if not results:
+            print(f"ไม่พบ {os.path.join(args.report, RESULTS_NAME)}")
+            return 1
+        diff_report(results, load_records(args.base_dir), args.report)
+        return 0
+    if not args.weights or not os.path.isfile(args.weights):
+        ap.error("ต้องระบุ --weights ที่มีอยู่จริง")
+    from model_promote import runtime_imgsz, sha256
+    if args.imgsz is None:
+        args.imgsz = runtime_imgsz("defect")
+
+    # ตั้งชื่อตามเนื้อไฟล์ ไม่ใช่ชื่อไฟล์: best.pt / defect_best.pt คนละเวอร์ชันต้องไม่ใช้ผลร่วมกัน
+    digest = sha256(args.weights)
+    out_dir = args.out or os.path.join("runs", "rescore", digest[:12])
+    items = list_images(args.base_dir, args.source)
+    if args.limit:
+        items = items[:args.limit]
+    if not items:
+        print("ไม่พบรูป")
+        return 1
+    try:
+        rescore(items, args.weights, out_dir, args.workers, args.batch, args.imgsz, args.conf, args.iou, args.classes,
+                args.source, digest)
+    except ValueError as e:
+        print(f"[RESCORE] {e}")
+        return 1
+    keys = {k for k, _ in items}
+    results = {k: v for k, v in load_results(out_dir).items() if k in keys}
+    diff_report(results, load_records(args.base_dir), out_dir)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,424 @@
+# retention_manager.py
+# -*- coding: utf-8 -*-
+# จัดการพื้นที่ดิสก์ของ captures/ และ savefile/ (ทำงาน offline ได้ทั้งหมด)
+#
+# - รูปใน captures/ ที่เก่ากว่า HOT_DAYS วัน จะถูกแพ็กเป็น shard รายวัน (zip) + index (json)
+#   ไว้ใน captures/archive/  → เปิดอ่านรูปใดรูปหนึ่งแบบ random access ได้ทันที
+# - รายงานใน savefile/ ที่เก่ากว่า REPORT_HOT_DAYS วัน จะถูกย้ายไป savefile/archive/YYYY-MM/
+#   เพื่อให้ glob("Report_*.xlsx") ที่โฟลเดอร์บนสุดสแกนเฉพาะไฟล์ล่าสุด
+# - ถ้าขนาดรวมเกิน budget จะลบ shard ที่เก่าที่สุดก่อน (ไม่แตะวันที่ยัง hot และไม่ลบรายงาน)
+# - หยุดกลางคันได้ทุกเมื่อ: shard/index เขียนลงไฟล์ .tmp แล้ว os.replace
+#   ลบรูปต้นฉบับหลังจาก index ถูก commit แล้วเท่านั้น รอบถัดไปจะเก็บงานที่ค้างต่อเอง
+#
+# ใช้งาน:
+#   python retention_manager.py                      # รันหนึ่งรอบด้วยค่าเริ่มต้น
+#   python retention_manager.py --hot-days 3 --budget-gb 20
+#   python retention_manager.py --dry-run            # ดูว่าจะทำอะไรบ้าง ไม่แก้ไฟล์
+#   python retention_manager.py --read detect_20250101_120000_123.jpg --out x.jpg
+
+import os, re, sys, json, time, zipfile, argparse, threading
+from datetime import datetime, date, timedelta
+
+HOT_DAYS = 7               # เก็บรูปของ N วันล่าสุดไว้เป็นไฟล์ปกติ
+REPORT_HOT_DAYS = 14       # รายงานไม่เกิน N วันอยู่ที่ savefile/ (weekly report ต้องใช้ >= 7)
+BUDGET_GB = 50.0           # งบพื้นที่รวม captures/ + savefile/
+LOCK_STALE_SEC = 6 * 3600  # lock ค้างนานกว่านี้ถือว่าโปรเซสเดิมตายไปแล้ว
+
+_CAPTURE_RE = re.compile(r"^detect_(\d{8})_\d{6}_\d{3}(?:_[A-Za-z0-9]+)?\.(jpg|jpeg|png)$", re.IGNORECASE)  # _CAM1 = GUI หลายกล้อง
+_REPORT_RE = re.compile(r"^(Report|Weekly)_(\d{8})[_-].*\.(xlsx|csv|json)$")
+_SHARD_RE = re.compile(r"^captures_(\d{8})\.zip$")
+
+
+class RetentionManager:
+    """
+    แพ็ก captures เก่าเป็น shard รายวัน + ย้ายรายงานเก่า + คุม disk budget
+    เรียก run_once() ได้ทั้งจาก CLI และจาก thread เบื้องหลังของ GUI
+    """
+
+    def __init__(self, base_dir, hot_days=HOT_DAYS, report_hot_days=REPORT_HOT_DAYS,
+                 budget_gb=BUDGET_GB, compresslevel=6, dry_run=False, log=print):
+        self.base_dir = os.path.abspath(base_dir)
+        self.captures_dir = os.path.join(self.base_dir, "captures")
+        self.save_root = os.path.join(self.base_dir, "savefile")
+        self.archive_dir = os.path.join(self.captures_dir, "archive")
+        self.report_archive_dir = os.path.join(self.save_root, "archive")
+
+        self.hot_days = max(0, int(hot_days))
+        self.report_hot_days = max(7, int(report_hot_days))
+        self.budget_bytes = int(float(budget_gb) * (1024 ** 3))
+        self.compresslevel = compresslevel
+        self.dry_run = dry_run
+        self.log = log
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    # -----------------------------
+    # Public API
+    # -----------------------------
+    def run_once(self, today=None):
+        """รันหนึ่งรอบ คืน dict สรุปผล (จำนวนไฟล์ที่แพ็ก/ย้าย/ลบ, ขนาดรวม)"""
+        today = today or date.today()
+        summary = {"packed": 0, "reports_moved": 0, "shards_evicted": 0, "total_bytes": 0}
+        if not self._acquire_lock():
+            self.log("[Retention] another run is in progress, skip")
+            return summary
+        try:
+            self._cleanup_tmp()
+            summary["packed"] = self.pack_old_captures(today)
+            if not self._stop.is_set():
+                summary["reports_moved"] = self.archive_old_reports(today)
+            if not self._stop.is_set():
+                summary["shards_evicted"] = self.enforce_budget(today)
+            summary["total_bytes"] = self.total_bytes()
+        finally:
+            self._release_lock()
+        return summary
+
+    def start_background(self, interval_sec=3600, initial_delay_sec=30):
+        """รันเป็น daemon thread (ใช้ใน GUI) — หยุดได้ด้วย stop()"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def _loop():
+            if self._stop.wait(initial_delay_sec):
+                return
+            while not self._stop.is_set():
+                try:
+                    s = self.run_once()
+                    if s["packed"] or s["reports_moved"] or s["shards_evicted"]:
+                        self.log(f"[Retention] {s}")
+                except Exception as e:
+                    self.log(f"[Retention] run failed: {e}")
+                if self._stop.wait(interval_sec):
+                    break
+
+        self._thread = threading.Thread(target=_loop, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def read_capture(self, name):
+        """อ่าน bytes ของรูปจากไฟล์ hot หรือจาก shard (random access ผ่าน index)"""
+        hot = os.path.join(self.captures_dir, name)
+        if os.path.exists(hot):
+            with open(hot, "rb") as f:
+                return f.read()
+        day = self._day_of_capture(name)
+        if day is None:
+            raise FileNotFoundError(name)
+        shard = self._shard_path(day)
+        index = self.load_index(day)
+        if name not in index.get("files", {}) or not os.path.exists(shard):
+            raise FileNotFoundError(name)
+        with zipfile.ZipFile(shard, "r") as zf:
+            return zf.read(name)
+
+    def iter_archived(self):
+        """ไล่ (day, name, meta) ของรูปทุกใบที่อยู่ใน shard โดยอ่านเฉพาะ index"""
+        if not os.path.isdir(self.archive_dir):
+            return
+        for fn in sorted(os.listdir(self.archive_dir)):
+            m = _SHARD_RE.match(fn)
+            if not m:
+                continue
+            day = m.group(1)
+            for name, meta in sorted(self.load_index(day).get("files", {}).items()):
+                yield day, name, meta
+
+    def load_index(self, day):
+        """โหลด index ของ shard; ถ้าไม่มี/เสีย จะสร้างใหม่จาก central directory ของ zip"""
+        idx_path = self._index_path(day)
+        shard = self._shard_path(day)
+        try:
+            with open(idx_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            if os.path.exists(shard) and index.get("shard_size") == os.path.getsize(shard):
+                return index
+        except (OSError, ValueError):
+            pass
+        if not os.path.exists(shard):
+            return {"day": day, "files": {}}
+        index = self._build_index(day)
+        if not self.dry_run:
+            self._write_json_atomic(idx_path, index)
+        return index
+
+    # -----------------------------
+    # Captures → daily shards
+    # -----------------------------
+    def pack_old_captures(self, today):
+        if not os.path.isdir(self.captures_dir):
+            return 0
+        cutoff = (today - timedelta(days=self.hot_days)).strftime("%Y%m%d")
+
+        by_day = {}
+        with os.scandir(self.captures_dir) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                day = self._day_of_capture(entry.name)
+                if day is None:
+                    day = datetime.fromtimestamp(entry.stat().st_mtime).strftime("%Y%m%d")
+                if day < cutoff:
+                    by_day.setdefault(day, []).append(entry.name)
+
+        packed = 0
+        for day in sorted(by_day):
+            if self._stop.is_set():
+                break
+            packed += self._pack_day(day, sorted(by_day[day]))
+        return packed
+
+    def _pack_day(self, day, names):
+        shard = self._shard_path(day)
+        index = self.load_index(day) if os.path.exists(shard) else {"day": day, "files": {}}
+        already = index.get("files", {})
+
+        # ไฟล์ที่อยู่ใน shard แล้ว (รอบก่อนถูกหยุดก่อนลบต้นฉบับ) → ลบได้เลย
+        done = [n for n in names if n in already
+                and already[n]["size"] == os.path.getsize(os.path.join(self.captures_dir, n))]
+        todo = [n for n in names if n not in done]
+
+        if self.dry_run:
+            self.log(f"[Retention] (dry-run) pack {len(todo)} file(s) into {os.path.basename(shard)}")
+            return len(todo)
+
+        if todo:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            tmp = shard + ".tmp"
+            with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=self.compresslevel) as out:
+                # คัดลอกของเดิมใน shard (กรณีมีรูปวันเก่าเข้ามาเพิ่มภายหลัง)
+                if os.path.exists(shard):
+                    with zipfile.ZipFile(shard, "r") as src:
+                        for info in src.infolist():
+                            if info.filename not in todo:
+                                out.writestr(info, src.read(info.filename))
+                for n in todo:
+                    if self._stop.is_set():
+                        break
+                    out.write(os.path.join(self.captures_dir, n), arcname=n)
+            if self._stop.is_set():
+                os.remove(tmp)
+                return 0
+            self._fsync_path(tmp)
+            os.replace(tmp, shard)
+            index = self._build_index(day)
+            self._write_json_atomic(self._index_path(day), index)
+            done += [n for n in todo if n in index["files"]]
+
+        for n in done:
+            try:
+                os.remove(os.path.join(self.captures_dir, n))
+            except OSError:
+                pass
+        return len(todo)
+
+    def _build_index(self, day):
+        shard = self._shard_path(day)
+        files = {}
+        with zipfile.ZipFile(shard, "r") as zf:
+            for info in zf.infolist():
+                files[info.filename] = {
+                    "offset": info.header_offset,
+                    "size": info.file_size,
+                    "compress_size": info.compress_size,
+                    "crc": info.CRC,
+                    "mtime": "%04d-%02d-%02dT%02d:%02d:%02d" % info.date_time,
+                }
+        return {"day": day, "shard": os.path.basename(shard),
+                "shard_size": os.path.getsize(shard), "files": files}
+
+    # -----------------------------
+    # Reports → savefile/archive/YYYY-MM/
+    # -----------------------------
+    def archive_old_reports(self, today):
+        if not os.path.isdir(self.save_root):
+            return 0
+        cutoff = (today - timedelta(days=self.report_hot_days)).strftime("%Y%m%d")
+        moved = 0
+        with os.scandir(self.save_root) as it:
+            entries = [e for e in it if e.is_file()]
+        for entry in entries:
+            if self._stop.is_set():
+                break
+            m = _REPORT_RE.match(entry.name)
+            if not m:
+                continue
+            day = m.group(2)
+            # ไฟล์ที่ยังถูกเขียนอยู่ (mtime ใหม่) ไม่ย้าย แม้ชื่อไฟล์จะเก่า
+            mday = datetime.fromtimestamp(entry.stat().st_mtime).strftime("%Y%m%d")
+            if day >= cutoff or mday >= cutoff:
+                continue
+            dst_dir = os.path.join(self.report_archive_dir, f"{day[:4]}-{day[4:6]}")
+            if self.dry_run:
+                self.log(f"[Retention] (dry-run) move {entry.name} -> {dst_dir}")
+            else:
+                os.makedirs(dst_dir, exist_ok=True)
+                os.replace(entry.path, os.path.join(dst_dir, entry.name))
+            moved += 1
+        return moved
+
+    # -----------------------------
+    # Disk budget
+    # -----------------------------
+    def total_bytes(self):
+        total = 0
+        for root in (self.captures_dir, self.save_root):
+            for dirpath, _, files in os.walk(root):
+                for fn in files:
+                    try:
+                        total += os.path.getsize(os.path.join(dirpath, fn))
+                    except OSError:
+                        pass
+        return total
+
+    def enforce_budget(self, today):
+        total = self.total_bytes()
+        if total <= self.budget_bytes or not os.path.isdir(self.archive_dir):
+            return 0
+        hot_from = (today - timedelta(days=self.hot_days)).strftime("%Y%m%d")
+        shards = sorted(fn for fn in os.listdir(self.archive_dir) if _SHARD_RE.match(fn))
+        evicted = 0
+        for fn in shards:
+            if total <= self.budget_bytes or self._stop.is_set():
+                break
+            day = _SHARD_RE.match(fn).group(1)
+            if day >= hot_from:
+                break
+            shard = os.path.join(self.archive_dir, fn)
+            size = os.path.getsize(shard)
+            if self.dry_run:
+                self.log(f"[Retention] (dry-run) evict {fn} ({size / 1e6:.1f} MB)")
+            else:
+                # ลบ index ก่อน shard: ถ้าหยุดกลางทาง load_index() จะสร้างใหม่ได้
+                for p in (self._index_path(day), shard):
+                    try:
+                        os.remove(p)
+                    except OSError:
+                        pass
+            total -= size
+            evicted += 1
+        if total > self.budget_bytes:
+            self.log(f"[Retention] WARNING: {total / 1e9:.2f} GB still over budget "
+                     f"({self.budget_bytes / 1e9:.2f} GB) — hot data only, consider lowering hot_days")
+        return evicted
+
+    # -----------------------------
+    # Helpers
+    # -----------------------------
+    @staticmethod
+    def _day_of_capture(name):
+        m = _CAPTURE_RE.match(name)
+        return m.group(1) if m else None
+
+    def _shard_path(self, day):
+        return os.path.join(self.archive_dir, f"captures_{day}.zip")
+
+    def _index_path(self, day):
+        return os.path.join(self.archive_dir, f"captures_{day}.idx.json")
+
+    def _cleanup_tmp(self):
+        """ลบไฟล์ .tmp ที่ค้างจากรอบที่ถูกหยุดกลางคัน"""
+        for d in (self.archive_dir,):
+            if not os.path.isdir(d) or self.dry_run:
+                continue
+            for fn in os.listdir(d):
+                if fn.endswith(".tmp"):
+                    try:
+                        os.remove(os.path.join(d, fn))
+                    except OSError:
+                        pass
+
+    def _write_json_atomic(self, path, obj):
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(obj, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    @staticmethod
+    def _fsync_path(path):
+        try:
+            with open(path, "rb") as f:
+                os.fsync(f.fileno())
+        except OSError:
+            pass
+
+    def _lock_path(self):
+        return os.path.join(self.captures_dir, ".retention.lock")
+
+    def _acquire_lock(self):
+        if self.dry_run:
+            return True
+        os.makedirs(self.captures_dir, exist_ok=True)
+        path = self._lock_path()
+        try:
+            if os.path.exists(path) and time.time() - os.path.getmtime(path) > LOCK_STALE_SEC:
+                os.remove(path)
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode("ascii"))
+            os.close(fd)
+            return True
+        except FileExistsError:
+            return False
+        except OSError as e:
+            self.log(f"[Retention] lock error: {e}")
+            return False
+
+    def _release_lock(self):
+        if self.dry_run:
+            return
+        try:
+            os.remove(self._lock_path())
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Pack old captures into daily shards and enforce a disk budget")
+    ap.add_argument("--base-dir", default=os.path.dirname(os.path.abspath(__file__)))
+    ap.add_argument("--hot-days", type=int, default=HOT_DAYS)
+    ap.add_argument("--report-hot-days", type=int, default=REPORT_HOT_DAYS)
+    ap.add_argument("--budget-gb", type=float, default=BUDGET_GB)
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--list", action="store_true", help="แสดงรายการรูปใน shard ทั้งหมด")
+    ap.add_argument("--read", help="ชื่อไฟล์รูป detect_*.jpg ที่ต้องการดึงออกมา")
+    ap.add_argument("--out", help="path ปลายทางสำหรับ --read")
+    args = ap.parse_args(argv)
+
+    rm = RetentionManager(args.base_dir, hot_days=args.hot_days, report_hot_days=args.report_hot_days,
+                          budget_gb=args.budget_gb, dry_run=args.dry_run)
+
+    if args.read:
+        data = rm.read_capture(args.read)
+        out = args.out or args.read
+        with open(out, "wb") as f:
+            f.write(data)
+        print(f"[OK] {args.read} -> {out} ({len(data)} bytes)")
+        return 0
+    if args.list:
+        for day, name, meta in rm.iter_archived():
+            print(f"{day}  {name}  {meta['size']}")
+        return 0
+
+    t0 = time.perf_counter()
+    try:
+        s = rm.run_once()
+    except KeyboardInterrupt:
+        rm.stop()
+        print("[Retention] interrupted — rerun to continue")
+        return 1
+    print(f"[Retention] packed={s['packed']} reports_moved={s['reports_moved']} "
+          f"shards_evicted={s['shards_evicted']} total={s['total_bytes'] / 1e6:.1f} MB "
+          f"({time.perf_counter() - t0:.2f}s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# runtime_config.py
+# -*- coding: utf-8 -*-
+# ค่าปรับจูนตอนรัน (imgsz / conf / iou / gating) จากไฟล์ YAML แทนการ hard-code ใน initialize_data
+#
+# - schema: ชื่อ attribute ของแอป -> Param(ชนิด, ช่วงค่า, ตัวเลือก) ; key ที่ไม่รู้จัก = error (กันพิมพ์ผิดแล้วเงียบ)
+# - โหลดตอนเริ่ม แล้ว poll() ระหว่างเฟรม: เช็คแค่ mtime (os.stat) ทุก interval วินาที → ไฟล์เปลี่ยนค่อยอ่าน+validate ใหม่
+# - validate ไม่ผ่าน → คงค่าเดิมทั้งชุด (ไม่ apply ครึ่ง ๆ) แล้ว print error
+# - ไม่ต้อง reload โมเดล: ultralytics รับ imgsz/conf/iou ต่อการเรียก predict อยู่แล้ว
+#
+# ไฟล์ตั้งต้นอยู่ที่ config/two_stage.yaml และ config/mac.yaml (ลบ key ออกได้ = ใช้ค่าในโค้ด)
+# ตรวจไฟล์ก่อนใช้งาน:
+#   python runtime_config.py config/two_stage.yaml --schema two_stage
+
+import os, sys, json, time, argparse
+
+try:
+    import yaml
+    YAML_AVAILABLE = True
+except ImportError:
+    YAML_AVAILABLE = False
+
+
+class Param:
+    """นิยามค่าหนึ่งตัวใน config"""
+
+    def __init__(self, type_, lo=None, hi=None, choices=None, multiple_of=None):
+        self.type = type_
+        self.lo = lo
+        self.hi = hi
+        self.choices = choices
+        self.multiple_of = multiple_of
+
+    def check(self, key, value):
+        """คืน (ค่าที่แปลงชนิดแล้ว, ข้อความ error หรือ None)"""
+        if self.type is int and (isinstance(value, bool) or not isinstance(value, int)):
+            if not (isinstance(value, float) and value.is_integer()):
+                return None, f"{key}: ต้องเป็นจำนวนเต็ม (ได้ {value!r})"
+        if self.type is float and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            return None, f"{key}: ต้องเป็นตัวเลข (ได้ {value!r})"
+        if self.type is str and not isinstance(value, str):
+            return None, f"{key}: ต้องเป็นข้อความ (ได้ {value!r})"
+        value = self.type(value)
+        if self.choices is not None and value not in self.choices:
+            return None, f"{key}: ต้องเป็นหนึ่งใน {list(self.choices)} (ได้ {value!r})"
+        if self.lo is not None and value < self.lo:
+            return None, f"{key}: ต้อง >= {self.lo} (ได้ {value})"
+        if self.hi is not None and value > self.hi:
+            return None, f"{key}: ต้อง <= {self.hi} (ได้ {value})"
+        if self.multiple_of and value % self.multiple_of:
+            return None, f"{key}: ต้องหารด้วย {self.multiple_of} ลงตัว (ได้ {value})"
+        return value, None
+
+
+PROB = dict(lo=0.0, hi=1.0)
+IMGSZ = dict(lo=320, hi=1920, multiple_of=32)
+
+# GUI_w_two_stage_model.py
+TWO_STAGE_SCHEMA = {
+    "imgsz":               Param(int, **IMGSZ),
+    "conf_shape":          Param(float, **PROB),
+    "iou_shape":           Param(float, **PROB),
+    "conf_defect":         Param(float, **PROB),
+    "iou_defect":          Param(float, **PROB),
+    "track_low_thresh":    Param(float, **PROB),
+    "gate_present_thresh": Param(int, lo=1, hi=100),
+    "gate_absent_thresh":  Param(int, lo=1, hi=300),
+    "defect_every_n":      Param(int, lo=1, hi=30),
+    "defect_imgsz":        Param(int, **IMGSZ),
+    "defect_mode":         Param(str, choices=("full", "sliced")),
+    "slice_tile":          Param(int, lo=256, hi=1280, multiple_of=32),
+    "slice_overlap":       Param(float, lo=0.0, hi=0.5),
+}
+TWO_STAGE_RULES = [
+    (lambda c: c["track_low_thresh"] <= c["conf_shape"], "track_low_thresh ต้อง <= conf_shape"),
+]
+
+# GUI_mac.py
+MAC_SCHEMA = {
+    "imgsz":               Param(int, **IMGSZ),
+    "shape_conf_thr":      Param(float, **PROB),
+    "defect_conf_thr":     Param(float, **PROB),
+    "iou_thr":             Param(float, **PROB),
+    "track_low_thresh":    Param(float, **PROB),
+    "gate_present_thresh": Param(int, lo=1, hi=100),
+    "gate_absent_thresh":  Param(int, lo=1, hi=300),
+}
+MAC_RULES = [
+    (lambda c: c["track_low_thresh"] <= c["shape_conf_thr"], "track_low_thresh ต้อง <= shape_conf_thr"),
+]
+
+SCHEMAS = {"two_stage": (TWO_STAGE_SCHEMA, TWO_STAGE_RULES), "mac": (MAC_SCHEMA, MAC_RULES)}
+
+
+def _read_file(path):
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if path.lower().endswith(".json"):
+        return json.loads(text) if text.strip() else {}
+    if not YAML_AVAILABLE:
+        raise RuntimeError("ต้องติดตั้ง PyYAML (มากับ ultralytics) หรือใช้ไฟล์ .json")
+    return yaml.safe_load(text) or {}
+
+
+def _flatten(data):
+    """หัวข้อ 1 ชั้นใน YAML (inference:, gating: ...) มีไว้จัดกลุ่มอ่านง่ายเท่านั้น"""
+    flat = {}
+    for k, v in data.items():
+        if isinstance(v, dict):
+            flat.update(v)
+        else:
+            flat[k] = v
+    return flat
+
+
+def validate(data, schema, rules=(), base=None):
+    """คืน (ค่าที่ผ่านแล้ว, [error]) ; base = ค่าเดิมสำหรับ key ที่ไม่อยู่ในไฟล์ (ใช้ตรวจ rules)"""
+    if not isinstance(data, dict):
+        return {}, ["ไฟล์ config ต้องเป็น mapping (key: value)"]
+    values, errors = {}, []
+    for key, raw in _flatten(data).items():
+        param = schema.get(key)
+        if param is None:
+            errors.append(f"{key}: ไม่รู้จัก key นี้")
+            continue
+        val, err = param.check(key, raw)
+        if err:
+            errors.append(err)
+        else:
+            values[key] = val
+    if not errors:
+        merged = dict(base or {})
+        merged.update(values)
+        for fn, msg in rules:
+            try:
+                if not fn(merged):
+                    errors.append(msg)
+            except KeyError:
+                pass
+    return values, errors
+
+
+class RuntimeConfig:
+    """
+    ผูก config file กับ attribute ของแอป
+      bind(obj)  : จำค่าปัจจุบันของ obj เป็นค่า default (key ที่ไม่อยู่ในไฟล์ใช้ค่านี้)
+      load()     : อ่านไฟล์ครั้งแรก คืน {key: value} ที่ต่างจาก default
+      poll()     : เรียกระหว่างเฟรม คืน {key: value} ที่เปลี่ยน (ว่าง = ไม่มีอะไรเปลี่ยน)
+    """
+
+    def __init__(self, path, schema, rules=(), interval=1.0):
+        self.path = path
+        self.schema = schema
+        self.rules = list(rules)
+        self.interval = interval
+        self.defaults = {}
+        self.values = {}
+        self.errors = []
+        self._mtime = None
+        self._next_check = 0.0
+
+    def bind(self, obj):
+        self.defaults = {k: getattr(obj, k) for k in self.schema if hasattr(obj, k)}
+        self.values = dict(self.defaults)
+        return self
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _reload(self):
+        try:
+            data = _read_file(self.path) if self._mtime is not None else {}
+        except Exception as e:
+            self.errors = [f"อ่านไฟล์ไม่ได้: {e}"]
+            print(f"[Config] {self.path}: {self.errors[0]} (คงค่าเดิม)")
+            return {}
+        values, errors = validate(data, self.schema, self.rules, base=self.defaults)
+        self.errors = errors
+        if errors:
+            for e in errors:
+                print(f"[Config] {self.path}: {e}")
+            print("[Config] validate ไม่ผ่าน คงค่าเดิมทั้งชุด")
+            return {}
+        new = dict(self.defaults)
+        new.update(values)
+        changed = {k: v for k, v in new.items() if self.values.get(k) != v}
+        self.values = new
+        return changed
+
+    def load(self):
+        self._mtime = self._stat()
+        self._next_check = time.monotonic() + self.interval
+        if self._mtime is None:
+            print(f"[Config] ไม่พบ {self.path} ใช้ค่าในโค้ด")
+            return {}
+        changed = self._reload()
+        if changed:
+            print(f"[Config] loaded {self.path}: {changed}")
+        return changed
+
+    def poll(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return {}
+        self._next_check = now + self.interval
+        mtime = self._stat()
+        if mtime == self._mtime:
+            return {}
+        self._mtime = mtime
+        changed = self._reload()
+        if changed:
+            print(f"[Config] reloaded {self.path}: {changed}")
+        return changed
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Validate a runtime config file")
+    ap.add_argument("path")
+    ap.add_argument("--schema", choices=sorted(SCHEMAS), default="two_stage")
+    args = ap.parse_args(argv)
+
+    schema, rules = SCHEMAS[args.schema]
+    try:
+        data = _read_file(args.path)
+    except Exception as e:
+        print(f"[ERROR] {args.path}: {e}")
+        return 1
+    values, errors = validate(data, schema, rules)
+    for e in errors:
+        print(f"[ERROR] {e}")
+    if errors:
+        return 1
+    for k, v in values.items():
+        print(f"{k:<22}{v!r}")
+    print(f"[OK] {len(values)} keys")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
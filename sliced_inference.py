@@ -0,0 +1,259 @@
+# sliced_inference.py
+# -*- coding: utf-8 -*-
+# ตรวจตำหนิแบบแบ่งไทล์ (sliced inference) เฉพาะในกรอบจาน จากเฟรมกล้องความละเอียดเต็ม
+#
+# ปัญหา: รูเข็ม (hole) เหลือไม่กี่พิกเซลหลัง resize เฟรม 1280x720 → cam_w x cam_h แล้ว YOLO letterbox เป็น 896
+# วิธี:
+#   - ตัดไทล์ (มี overlap) ครอบเฉพาะกรอบจานบน "เฟรมต้นฉบับ" จากกล้อง
+#   - ส่งทุกไทล์เข้า model.predict เป็น batch เดียว (forward ครั้งเดียว)
+#   - แปลงกล่องกลับพิกัดเฟรม แล้วรวมด้วย NMS แบบ vectorized (numpy) แยกตาม class
+#
+# Benchmark (เทียบกับ full-frame 896):
+#   python sliced_inference.py --weights models/defect_best.pt --shape-weights models/shape_best_rf.pt \
+#       --source captures/ --tile 640 --overlap 0.2 --runs 20
+
+import os, sys, glob, time, argparse
+
+import numpy as np
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+
+# -----------------------------
+# Tiling + NMS
+# -----------------------------
+def _axis_starts(lo, hi, tile, stride):
+    """จุดเริ่มไทล์บนแกนเดียว ให้ครอบ [lo, hi) ครบ (ไทล์สุดท้ายชิดขอบขวา)"""
+    if hi - lo <= tile:
+        return [lo]
+    if hi - lo <= tile * 1.05:
+        # เกินไทล์นิดเดียว → ไทล์เดียวตรงกลาง (ตัด pad ขอบทิ้งเล็กน้อย) ดีกว่าเพิ่มอีกไทล์
+        return [lo + (hi - lo - tile) // 2]
+    starts = list(range(lo, hi - tile, stride))
+    starts.append(hi - tile)
+    return starts
+
+
+def make_tiles(box, frame_shape, tile=640, overlap=0.2, pad=0.04):
+    """
+    ไทล์ขนาด tile x tile (ตัดตามขอบเฟรม) ครอบกรอบ box (xyxy พิกัดเฟรม) ที่ขยายขอบด้วย pad
+    คืน list ของ (x1, y1, x2, y2)
+    """
+    h, w = frame_shape[:2]
+    x1, y1, x2, y2 = [float(v) for v in box]
+    px, py = (x2 - x1) * pad, (y2 - y1) * pad
+    x1 = int(max(0, x1 - px)); y1 = int(max(0, y1 - py))
+    x2 = int(min(w, x2 + px)); y2 = int(min(h, y2 + py))
+    if x2 <= x1 or y2 <= y1:
+        return []
+
+    # ROI เล็กกว่าไทล์ → ขยายรอบจุดกลางให้ได้ไทล์เต็ม (ได้ context รอบจานด้วย)
+    tw, th = min(tile, w), min(tile, h)
+    if x2 - x1 < tw:
+        cx = (x1 + x2) // 2
+        x1 = int(min(max(0, cx - tw // 2), w - tw)); x2 = x1 + tw
+    if y2 - y1 < th:
+        cy = (y1 + y2) // 2
+        y1 = int(min(max(0, cy - th // 2), h - th)); y2 = y1 + th
+
+    stride = max(1, int(tile * (1.0 - overlap)))
+    tiles = []
+    for ty in _axis_starts(y1, y2, th, stride):
+        for tx in _axis_starts(x1, x2, tw, stride):
+            tiles.append((tx, ty, tx + tw, ty + th))
+    return tiles
+
+
+def nms_xyxy(boxes, scores, iou_thr=0.5, classes=None):
+    """
+    NMS แบบ vectorized: IoU ของกล่องที่เหลือทั้งหมดกับกล่องบนสุดคำนวณทีเดียวต่อรอบ
+    classes: ถ้าให้มา จะ NMS แยก class (เลื่อนกล่องแต่ละ class ไม่ให้ซ้อนกัน)
+    คืน index ของกล่องที่เก็บไว้ (เรียงตาม score มาก→น้อย)
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if len(boxes) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    b = boxes
+    if classes is not None:
+        offset = (np.asarray(classes, dtype=np.float32).reshape(-1, 1) * (float(boxes.max()) + 1.0))
+        b = boxes + offset
+    x1, y1, x2, y2 = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    areas = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    order = np.argsort(-scores)
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        iw = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        ih = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = iw * ih
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_thr]
+    return np.asarray(keep, dtype=np.int64)
+
+
+# -----------------------------
+# Sliced defect inference
+# -----------------------------
+class SlicedDefectInference:
+    """
+    predict(frame, plate_box) → [(xyxy, label, conf), ...] ในพิกัดของ frame
+      frame     : เฟรมต้นฉบับจากกล้อง (ยังไม่ resize)
+      plate_box : กรอบจานในพิกัดของ frame
+    """
+
+    def __init__(self, model, tile=640, overlap=0.2, conf=0.25, iou=0.65,
+                 imgsz=None, pad=0.04, max_tiles=16, classes=None):
+        self.model = model
+        self.tile = int(tile)
+        self.overlap = float(overlap)
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz or self.tile     # ไทล์เข้าโมเดลที่ขนาดเดิม ไม่ย่อ
+        self.pad = pad
+        self.max_tiles = max_tiles
+        self.classes = set(classes) if classes else None
+        self.last_ms = 0.0
+        self.last_tiles = 0
+
+    def predict(self, frame, plate_box):
+        t0 = time.perf_counter()
+        tiles = make_tiles(plate_box, frame.shape, self.tile, self.overlap, self.pad)
+        if len(tiles) > self.max_tiles:
+            # จานใหญ่ผิดปกติ → ขยายไทล์ให้จำนวนไม่เกินงบ (ยอมเสียความละเอียดบ้าง)
+            scale = (len(tiles) / float(self.max_tiles)) ** 0.5
+            tiles = make_tiles(plate_box, frame.shape, int(self.tile * scale), self.overlap, self.pad)
+        self.last_tiles = len(tiles)
+        if not tiles:
+            self.last_ms = 0.0
+            return []
+
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+        results = self.model.predict(source=crops, imgsz=self.imgsz, conf=self.conf,
+                                     iou=self.iou, verbose=False)
+
+        names = getattr(self.model, "names", {}) or {}
+        all_b, all_s, all_c = [], [], []
+        for (ox, oy, _, _), r in zip(tiles, results):
+            if r is None or getattr(r, "boxes", None) is None or len(r.boxes) == 0:
+                continue
+            xyxy = r.boxes.xyxy.cpu().numpy()
+            xyxy[:, [0, 2]] += ox
+            xyxy[:, [1, 3]] += oy
+            all_b.append(xyxy)
+            all_s.append(r.boxes.conf.cpu().numpy())
+            all_c.append(r.boxes.cls.cpu().numpy().astype(int))
+
+        dets = []
+        if all_b:
+            b = np.concatenate(all_b); sc = np.concatenate(all_s); cl = np.concatenate(all_c)
+            for i in nms_xyxy(b, sc, self.iou, cl):
+                label = names.get(int(cl[i]), str(int(cl[i])))
+                if self.classes is not None and label not in self.classes:
+                    continue
+                x1, y1, x2, y2 = [int(v) for v in b[i]]
+                dets.append(([x1, y1, x2, y2], label, float(sc[i])))
+        self.last_ms = (time.perf_counter() - t0) * 1000.0
+        return dets
+
+
+def scale_dets(dets, sx, sy):
+    """แปลงพิกัดกล่องของ dets ด้วย scale (เช่น เฟรมต้นฉบับ → เฟรมแสดงผล)"""
+    out = []
+    for (x1, y1, x2, y2), label, conf in dets:
+        out.append(([int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy)], label, conf))
+    return out
+
+
+# -----------------------------
+# Benchmark CLI
+# -----------------------------
+def _load_frames(source, limit):
+    if os.path.isdir(source):
+        files = sorted(f for f in glob.glob(os.path.join(source, "*"))
+                       if f.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")))
+        return [(os.path.basename(f), cv2.imread(f)) for f in files[:limit]]
+    if source.lower().endswith((".jpg", ".jpeg", ".png", ".bmp")):
+        return [(os.path.basename(source), cv2.imread(source))]
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < limit:
+        ret, f = cap.read()
+        if not ret:
+            break
+        frames.append((f"frame{len(frames):04d}", f))
+    cap.release()
+    return frames
+
+
+def _timed(fn, runs):
+    fn()  # warm-up
+    ts = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        out = fn()
+        ts.append((time.perf_counter() - t0) * 1000.0)
+    ts.sort()
+    return out, sum(ts) / len(ts), ts[int(len(ts) * 0.95) if len(ts) > 1 else 0]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Benchmark sliced plate-ROI defect inference vs full-frame")
+    ap.add_argument("--weights", default=os.path.join("models", "defect_best.pt"))
+    ap.add_argument("--shape-weights", default=os.path.join("models", "shape_best_rf.pt"),
+                    help="ใช้หากรอบจาน (ไม่มีไฟล์ → ใช้ทั้งเฟรมเป็นกรอบ)")
+    ap.add_argument("--source", required=True, help="รูป, โฟลเดอร์รูป หรือไฟล์วิดีโอ")
+    ap.add_argument("--limit", type=int, default=10, help="จำนวนเฟรมสูงสุด")
+    ap.add_argument("--tile", type=int, default=640)
+    ap.add_argument("--overlap", type=float, default=0.2)
+    ap.add_argument("--full-imgsz", type=int, default=896)
+    ap.add_argument("--display", default="960x540", help="ขนาดเฟรมที่ GUI ย่อก่อนส่ง full-frame")
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--iou", type=float, default=0.65)
+    ap.add_argument("--runs", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    from ultralytics import YOLO
+    defect = YOLO(args.weights)
+    shape = YOLO(args.shape_weights) if os.path.exists(args.shape_weights) else None
+    dw, dh = [int(v) for v in args.display.lower().split("x")]
+    sliced = SlicedDefectInference(defect, tile=args.tile, overlap=args.overlap, conf=args.conf, iou=args.iou)
+
+    frames = [(n, f) for n, f in _load_frames(args.source, args.limit) if f is not None]
+    if not frames:
+        print(f"[ERROR] no frames from {args.source}")
+        return 1
+
+    print(f"{'frame':<24}{'mode':<10}{'tiles':>6}{'mean ms':>10}{'p95 ms':>10}{'dets':>6}")
+    tot = {"full": [0.0, 0], "sliced": [0.0, 0]}
+    for name, frame in frames:
+        h, w = frame.shape[:2]
+        box = (0, 0, w, h)
+        if shape is not None:
+            r = shape.predict(source=frame, imgsz=args.full_imgsz, conf=0.5, max_det=1, verbose=False)[0]
+            if r.boxes is not None and len(r.boxes):
+                box = tuple(r.boxes.xyxy.cpu().numpy()[0])
+
+        small = cv2.resize(frame, (dw, dh))
+        res, m, p = _timed(lambda: defect.predict(source=small, imgsz=args.full_imgsz, conf=args.conf,
+                                                   iou=args.iou, verbose=False)[0], args.runs)
+        nd = 0 if res.boxes is None else len(res.boxes)
+        print(f"{name[:23]:<24}{'full':<10}{1:>6}{m:>10.1f}{p:>10.1f}{nd:>6}")
+        tot["full"][0] += m; tot["full"][1] += nd
+
+        dets, m, p = _timed(lambda: sliced.predict(frame, box), args.runs)
+        print(f"{'':<24}{'sliced':<10}{sliced.last_tiles:>6}{m:>10.1f}{p:>10.1f}{len(dets):>6}")
+        tot["sliced"][0] += m; tot["sliced"][1] += len(dets)
+
+    n = len(frames)
+    print("-" * 66)
+    for mode in ("full", "sliced"):
+        print(f"{'average':<24}{mode:<10}{'':>6}{tot[mode][0] / n:>10.1f}{'':>10}{tot[mode][1] / n:>6.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
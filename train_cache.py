@@ -0,0 +1,255 @@
+# train_cache.py
+# -*- coding: utf-8 -*-
+# cache รูปสำหรับเทรนแบบ pack ลงไฟล์ shard + memory-map (แทน cache="ram" / decode JPEG ทุก epoch)
+#
+# - decode + resize ทุกรูปใน data.yaml ครั้งเดียวที่ imgsz ของการเทรน (กติกาเดียวกับ ultralytics
+#   load_image แบบ rect: ด้านยาว = imgsz, INTER_LINEAR) แล้วเขียนต่อกันเป็น shard_XXX.bin ก้อนละ ~1 GB
+# - index.json: path รูปต้นฉบับ (+ size/mtime) → shard, offset, h, w, h0, w0
+# - ตอนเทรนอ่านผ่าน np.memmap: OS page cache ดูแลเอง ไม่กิน RAM ของ process และไม่ swap
+#   แม้ชุดข้อมูลใหญ่กว่า RAM ; รูปที่ถูกแก้หลัง build (size/mtime ไม่ตรง) จะกลับไป decode จากไฟล์เดิม
+# ใช้กับ ultralytics ผ่าน packed_dataset.py
+#
+# ใช้งาน:
+#   python train_cache.py dataset2_only_shape/data.yaml --imgsz 896 --out cache/shape_img896
+#   python train_cache.py dataset2_only_defect/data.yaml --imgsz 896 --out cache/defect_img896 --workers 4
+#   python train_cache.py --bench cache/shape_img896 --n 300     # decode JPEG vs อ่านจาก memmap
+
+import os, sys, json, math, time, random, argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from lazy_imports import lazy_import
+cv2 = lazy_import("cv2", cache_attrs=True)
+
+from dataset_check import load_data_yaml, _scan, IMG_EXTS
+
+INDEX_NAME = "index.json"
+INDEX_VERSION = 1
+SHARD_BYTES = 1 << 30      # ขนาด shard ต่อไฟล์ (ไฟล์เดียวใหญ่เกินไปบาง filesystem จัดการไม่ดี)
+
+
+def load_resized(path, imgsz):
+    """อ่าน + resize แบบเดียวกับ ultralytics (rect_mode) → (im, (h0, w0)) ; อ่านไม่ได้ → (None, None)"""
+    im = cv2.imdecode(np.fromfile(path, np.uint8), cv2.IMREAD_COLOR)
+    if im is None:
+        return None, None
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    return im, (h0, w0)
+
+
+def _load_many(paths, imgsz):
+    out = []
+    for p in paths:
+        im, hw0 = load_resized(p, imgsz)
+        out.append((p, im, hw0))
+    return out
+
+
+def _file_key(path):
+    return os.path.normcase(os.path.realpath(path))
+
+
+class PackedImageCache:
+    """
+    ตัวอ่าน cache ที่ build แล้ว
+      get(path) → (im, (h0, w0)) หรือ None ถ้าไม่มีใน cache / ไฟล์ต้นฉบับเปลี่ยนไปแล้ว
+    เปิด memmap แบบ lazy ต่อ process: pickle ไป DataLoader worker ได้โดยไม่ copy ข้อมูลรูป
+    """
+
+    def __init__(self, cache_dir, verify=True):
+        self.cache_dir = os.path.abspath(cache_dir)
+        with open(os.path.join(self.cache_dir, INDEX_NAME), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{self.cache_dir}: index version {meta.get('version')} ไม่รองรับ (build ใหม่)")
+        self.imgsz = int(meta["imgsz"])
+        self.shards = list(meta["shards"])
+        self.entries = {}
+        self.stale = 0
+        for e in meta["images"]:
+            if verify:
+                try:
+                    st = os.stat(e["path"])
+                except OSError:
+                    self.stale += 1
+                    continue
+                if st.st_size != e["size"] or st.st_mtime_ns != e["mtime_ns"]:
+                    self.stale += 1
+                    continue
+            self.entries[_file_key(e["path"])] = (e["shard"], e["offset"], e["h"], e["w"], e["h0"], e["w0"])
+        self._maps = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        d = dict(self.__dict__)
+        d["_maps"] = None
+        return d
+
+    def _map(self, shard):
+        if self._maps is None:
+            self._maps = [None] * len(self.shards)
+        m = self._maps[shard]
+        if m is None:
+            m = self._maps[shard] = np.memmap(os.path.join(self.cache_dir, self.shards[shard]),
+                                              dtype=np.uint8, mode="r")
+        return m
+
+    def lookup(self, path):
+        return self.entries.get(_file_key(path))
+
+    def get(self, path, copy=True):
+        e = self.lookup(path)
+        if e is None:
+            return None
+        shard, off, h, w, h0, w0 = e
+        view = self._map(shard)[off:off + h * w * 3].reshape(h, w, 3)
+        return (np.array(view) if copy else view), (h0, w0)
+
+
+def build_cache(data_yaml, imgsz, out_dir, workers=None, shard_bytes=SHARD_BYTES, log=print):
+    """decode + resize ทุกรูปของทุก split → shard + index.json ใน out_dir ; คืนจำนวนรูปที่ pack"""
+    t0 = time.perf_counter()
+    _, _, _, splits = load_data_yaml(data_yaml)
+    paths = set()
+    for dirs in splits.values():
+        for d in dirs:
+            paths.update(p for p, _, _ in _scan(d, IMG_EXTS).values())
+    paths = sorted(paths)
+    if not paths:
+        log(f"[CACHE] ไม่พบรูปใน {data_yaml}")
+        return 0
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name in os.listdir(out_dir):          # เศษจากรอบที่หยุดกลางคัน
+        if name.endswith(".tmp"):
+            os.remove(os.path.join(out_dir, name))
+
+    workers = workers or os.cpu_count() or 1
+    step = 32
+    chunks = [paths[i:i + step] for i in range(0, len(paths), step)]
+    images, shards, failed = [], [], []
+    cur, cur_name, cur_off = None, None, 0
+    total_bytes = 0
+
+    def _results():
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                yield from ex.map(_load_many, chunks, [imgsz] * len(chunks))
+        else:
+            for c in chunks:
+                yield _load_many(c, imgsz)
+
+    try:
+        for done, batch in enumerate(_results(), 1):
+            for path, im, hw0 in batch:
+                if im is None:
+                    failed.append(path)
+                    continue
+                buf = np.ascontiguousarray(im)
+                if cur is None or cur_off + buf.nbytes > shard_bytes:
+                    if cur is not None:
+                        cur.close()
+                    cur_name = f"shard_{len(shards):03d}.bin"
+                    shards.append(cur_name)
+                    cur = open(os.path.join(out_dir, cur_name + ".tmp"), "wb")
+                    cur_off = 0
+                cur.write(buf.data)
+                st = os.stat(path)
+                h, w = buf.shape[:2]
+                images.append({"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+                               "shard": len(shards) - 1, "offset": cur_off, "h": h, "w": w,
+                               "h0": hw0[0], "w0": hw0[1]})
+                cur_off += buf.nbytes
+                total_bytes += buf.nbytes
+            if done % 20 == 0 or done == len(chunks):
+                log(f"[CACHE] {min(done * step, len(paths))}/{len(paths)} รูป  {total_bytes / 1e9:.2f} GB")
+    finally:
+        if cur is not None:
+            cur.close()
+
+    # shard เสร็จครบแล้วค่อยเปลี่ยนชื่อ + เขียน index เป็นขั้นสุดท้าย (index คือจุด commit)
+    # ลบ index เดิมก่อน: ถ้าหยุดกลางคัน cache จะหายไปเฉย ๆ (เทรนกลับไป decode ไฟล์เดิม) ไม่ชี้ shard ผิด
+    index_path = os.path.join(out_dir, INDEX_NAME)
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    for name in shards:
+        os.replace(os.path.join(out_dir, name + ".tmp"), os.path.join(out_dir, name))
+    meta = {"version": INDEX_VERSION, "imgsz": int(imgsz), "data_yaml": os.path.abspath(data_yaml),
+            "shards": shards, "images": images}
+    tmp = os.path.join(out_dir, INDEX_NAME + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, index_path)
+    for name in os.listdir(out_dir):          # shard เก่าที่เกินจำนวนของรอบนี้
+        if name.startswith("shard_") and name.endswith(".bin") and name not in shards:
+            os.remove(os.path.join(out_dir, name))
+
+    if failed:
+        log(f"[CACHE] อ่านรูปไม่ได้ {len(failed)} ไฟล์ เช่น {failed[:3]}")
+    log(f"[CACHE] pack {len(images)} รูป ({len(shards)} shard, {total_bytes / 1e9:.2f} GB) "
+        f"ใน {time.perf_counter() - t0:.1f}s → {out_dir}")
+    return len(images)
+
+
+def bench(cache_dir, n=200, seed=0):
+    """เวลาเฉลี่ยต่อรูป: decode JPEG + resize จากไฟล์เดิม เทียบกับอ่านจาก memmap (copy ออกมาหนึ่งครั้ง)"""
+    cache = PackedImageCache(cache_dir)
+    with open(os.path.join(cache.cache_dir, INDEX_NAME), "r", encoding="utf-8") as f:
+        paths = [e["path"] for e in json.load(f)["images"] if _file_key(e["path"]) in cache.entries]
+    random.Random(seed).shuffle(paths)
+    paths = paths[:n]
+    if not paths:
+        print("[BENCH] cache ว่าง")
+        return
+
+    t0 = time.perf_counter()
+    for p in paths:
+        load_resized(p, cache.imgsz)
+    t_decode = (time.perf_counter() - t0) * 1000.0 / len(paths)
+
+    t0 = time.perf_counter()
+    for p in paths:
+        cache.get(p)
+    t_cache = (time.perf_counter() - t0) * 1000.0 / len(paths)
+    print(f"[BENCH] {len(paths)} รูป imgsz={cache.imgsz}  decode+resize {t_decode:.2f} ms/รูป  "
+          f"memmap {t_cache:.2f} ms/รูป  (x{t_decode / max(t_cache, 1e-9):.1f})"
+          + (f"  stale {cache.stale}" if cache.stale else ""))
+
+
+def default_cache_dir(data_yaml, imgsz):
+    """cache/<ชื่อโฟลเดอร์ของ data.yaml>_img<imgsz>"""
+    name = os.path.basename(os.path.dirname(os.path.abspath(data_yaml))) or "dataset"
+    return os.path.join("cache", f"{name}_img{imgsz}")
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Decode/resize a YOLO dataset once into packed memory-mapped shards")
+    ap.add_argument("data_yaml", nargs="?")
+    ap.add_argument("--imgsz", type=int, default=896)
+    ap.add_argument("--out", help="โฟลเดอร์ cache (ค่าเริ่มต้น cache/<ชื่อโฟลเดอร์ชุดข้อมูล>_img<imgsz>)")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--shard-gb", type=float, default=SHARD_BYTES / (1 << 30))
+    ap.add_argument("--bench", metavar="CACHE_DIR", help="วัดเวลาอ่านจาก cache เทียบกับ decode ไฟล์เดิม")
+    ap.add_argument("--n", type=int, default=200, help="จำนวนรูปที่ใช้ใน --bench")
+    args = ap.parse_args(argv)
+
+    if args.bench:
+        bench(args.bench, args.n)
+        return 0
+    if not args.data_yaml or not os.path.isfile(args.data_yaml):
+        ap.error("ต้องระบุ data.yaml ที่มีอยู่จริง")
+    out = args.out or default_cache_dir(args.data_yaml, args.imgsz)
+    n = build_cache(args.data_yaml, args.imgsz, out, workers=args.workers,
+                    shard_bytes=int(args.shard_gb * (1 << 30)))
+    return 0 if n else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
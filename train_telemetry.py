@@ -0,0 +1,244 @@
+# train_telemetry.py
+# -*- coding: utf-8 -*-
+# เก็บเวลาการเทรนต่อ epoch ผ่าน callback ของ ultralytics แล้วสรุปว่าเวลาหมดไปกับอะไร
+#
+# ต่อ epoch (1 บรรทัด JSON ใน <run dir>/telemetry.jsonl):
+#   - data_wait_s : รอ DataLoader ส่ง batch (ช่วงระหว่าง batch_end ก่อนหน้า → batch_start)
+#   - compute_s   : forward + backward + optimizer (batch_start → batch_end)
+#   - val_s       : validate + save checkpoint (train_epoch_end → fit_epoch_end)
+#   - imgs_per_s  : จำนวนรูป train ต่อวินาทีของช่วง train
+#   - peak_rss_mb : RSS สูงสุดของ process หลัก + DataLoader worker (สุ่มวัดทุก RSS_EVERY batch)
+# บรรทัดแรกเป็น config ของ run (workers, batch, imgsz, cache, device) ไว้เทียบหลาย run
+# validate best.pt ตอนจบ (final_eval เรียก on_fit_epoch_end ซ้ำ) เขียนเป็น "final_val" แยก ไม่นับในสรุป
+#
+# ใช้งาน:
+#   attach_telemetry(model)  ก่อน model.train(...)  (yolo_train.py, yolo_train_2_stage.py, fine_tune_2_stage.py)
+#   python train_telemetry.py runs/shape_only_from_dataset2_img896_e100/telemetry.jsonl
+#   python train_telemetry.py runs/*/telemetry.jsonl --epochs     # เทียบหลาย run + ตารางราย epoch
+
+import os, sys, json, time, glob, argparse
+
+try:
+    import psutil
+except ImportError:      # ultralytics ติดตั้ง psutil มาให้อยู่แล้ว ; กันไว้สำหรับเครื่องที่ใช้แค่คำสั่งสรุป
+    psutil = None
+
+TELEMETRY_NAME = "telemetry.jsonl"
+RSS_EVERY = 20
+
+
+def _rss_bytes():
+    """RSS ของ process นี้ + process ลูก (DataLoader worker) ตอนนี้"""
+    if psutil is not None:
+        try:
+            p = psutil.Process()
+            total = p.memory_info().rss
+            for c in p.children(recursive=True):
+                try:
+                    total += c.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total
+        except psutil.Error:
+            return 0
+    try:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb if sys.platform == "darwin" else kb * 1024
+    except ImportError:
+        return 0
+
+
+class TrainTelemetry:
+    """callback ต่อ trainer หนึ่งตัว ; เขียนไฟล์ทีละ epoch (หยุดเทรนกลางคันก็ยังมีข้อมูลถึง epoch ล่าสุด)"""
+
+    def __init__(self, out_path=None):
+        self.out_path = out_path
+        self._f = None
+        self._reset_epoch(time.perf_counter())
+        self._t_train_end = None
+        self._last_epoch = 0          # epoch ล่าสุดที่เขียนแล้ว
+        self._t_fit_end = None
+
+    def _reset_epoch(self, now):
+        self._t_epoch = now
+        self._t_last = now
+        self._t_batch = None
+        self.data_wait = 0.0
+        self.compute = 0.0
+        self.batches = 0
+        self.peak_rss = 0
+
+    def _write(self, rec):
+        if self._f is None:
+            return
+        self._f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    # ---- callbacks ----
+    def on_train_start(self, trainer):
+        path = self.out_path or os.path.join(str(trainer.save_dir), TELEMETRY_NAME)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._f = open(path, "w", encoding="utf-8")
+        a = trainer.args
+        loader = getattr(trainer, "train_loader", None)
+        self._write({
+            "type": "run", "save_dir": str(trainer.save_dir),
+            "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "workers": getattr(a, "workers", None), "batch": getattr(trainer, "batch_size", None),
+            "imgsz": getattr(a, "imgsz", None), "cache": str(getattr(a, "cache", None)),
+            "device": str(getattr(a, "device", None)), "trainer": type(trainer).__name__,
+            "train_images": len(loader.dataset) if loader is not None else None,
+            "cpu_count": os.cpu_count(),
+        })
+
+    def on_train_epoch_start(self, trainer):
+        self._reset_epoch(time.perf_counter())
+
+    def on_train_batch_start(self, trainer):
+        now = time.perf_counter()
+        self.data_wait += now - self._t_last
+        self._t_batch = now
+
+    def on_train_batch_end(self, trainer):
+        now = time.perf_counter()
+        if self._t_batch is not None:
+            self.compute += now - self._t_batch
+        self._t_last = now
+        self.batches += 1
+        if self.batches % RSS_EVERY == 1:
+            self.peak_rss = max(self.peak_rss, _rss_bytes())
+
+    def on_train_epoch_end(self, trainer):
+        self._t_train_end = time.perf_counter()
+        self.peak_rss = max(self.peak_rss, _rss_bytes())
+
+    def on_fit_epoch_end(self, trainer):
+        now = time.perf_counter()
+        epoch = int(trainer.epoch) + 1
+        metrics = {k: round(float(v), 5) for k, v in (getattr(trainer, "metrics", None) or {}).items()
+                   if isinstance(v, (int, float))}
+        if epoch <= self._last_epoch:
+            # final_eval() เรียกซ้ำหลัง epoch สุดท้าย (validate best.pt) → แยก record ไม่นับใน summarize
+            self._write({"type": "final_val", "epoch": epoch,
+                         "val_s": round(now - (self._t_fit_end or now), 3), "metrics": metrics})
+            return
+        t_train_end = self._t_train_end or now
+        train_s = t_train_end - self._t_epoch
+        loader = getattr(trainer, "train_loader", None)
+        n_img = len(loader.dataset) if loader is not None else 0
+        self._write({
+            "type": "epoch", "epoch": epoch,
+            "epoch_s": round(now - self._t_epoch, 3), "train_s": round(train_s, 3),
+            "data_wait_s": round(self.data_wait, 3), "compute_s": round(self.compute, 3),
+            "val_s": round(now - t_train_end, 3), "batches": self.batches,
+            "imgs_per_s": round(n_img / train_s, 2) if train_s > 0 else None,
+            "peak_rss_mb": round(self.peak_rss / 2 ** 20, 1), "metrics": metrics,
+        })
+        self._t_train_end = None
+        self._last_epoch = epoch
+        self._t_fit_end = now
+
+    def on_train_end(self, trainer):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def attach_telemetry(model, out_path=None):
+    """ลงทะเบียน callback กับ ultralytics YOLO model ; ไฟล์ผลอยู่ที่ <save_dir>/telemetry.jsonl (หรือ out_path)"""
+    tel = TrainTelemetry(out_path)
+    for event in ("on_train_start", "on_train_epoch_start", "on_train_batch_start", "on_train_batch_end",
+                  "on_train_epoch_end", "on_fit_epoch_end", "on_train_end"):
+        model.add_callback(event, getattr(tel, event))
+    return tel
+
+
+# -----------------------------
+# สรุป
+# -----------------------------
+def load_telemetry(path):
+    run, epochs = {}, []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue          # บรรทัดสุดท้ายอาจเขียนไม่ครบถ้าเทรนถูก kill
+            if rec.get("type") == "run":
+                run = rec
+            elif rec.get("type") == "epoch":
+                epochs.append(rec)
+    return run, epochs
+
+
+def summarize(run, epochs):
+    """รวมทุก epoch → dict (เวลารวม, สัดส่วน data/compute/val, imgs/s เฉลี่ย, peak RSS) + คำแนะนำ"""
+    tot = {k: sum(e.get(k) or 0 for e in epochs) for k in ("epoch_s", "train_s", "data_wait_s", "compute_s", "val_s")}
+    total = tot["epoch_s"] or 1e-9
+    ips = [e["imgs_per_s"] for e in epochs if e.get("imgs_per_s")]
+    s = {
+        "epochs": len(epochs), "total_s": tot["epoch_s"],
+        "data_pct": 100.0 * tot["data_wait_s"] / total,
+        "compute_pct": 100.0 * tot["compute_s"] / total,
+        "val_pct": 100.0 * tot["val_s"] / total,
+        "other_pct": 100.0 * max(0.0, tot["train_s"] - tot["data_wait_s"] - tot["compute_s"]) / total,
+        "imgs_per_s": sum(ips) / len(ips) if ips else 0.0,
+        "peak_rss_mb": max((e.get("peak_rss_mb") or 0 for e in epochs), default=0),
+    }
+    hints = []
+    if s["data_pct"] > 25:
+        hints.append("รอ DataLoader นาน: เพิ่ม workers (ไม่เกินจำนวน core) หรือ build cache ด้วย train_cache.py")
+    if s["val_pct"] > 30:
+        hints.append("validate กินเวลามาก: ลดขนาดชุด val หรือ val ห่างขึ้น")
+    if s["compute_pct"] > 80 and s["data_pct"] < 5:
+        hints.append("compute เป็นคอขวด: workers มากกว่านี้ไม่ช่วย ลอง batch / imgsz ที่เล็กลง")
+    s["hints"] = hints
+    return s
+
+
+def _fmt_s(sec):
+    m, s = divmod(int(sec), 60)
+    h, m = divmod(m, 60)
+    return f"{h:d}:{m:02d}:{s:02d}"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Summarize per-epoch training telemetry (telemetry.jsonl)")
+    ap.add_argument("paths", nargs="+", help="telemetry.jsonl หรือโฟลเดอร์ run (รองรับ glob)")
+    ap.add_argument("--epochs", action="store_true", help="แสดงตารางราย epoch ด้วย")
+    args = ap.parse_args(argv)
+
+    files = []
+    for p in args.paths:
+        for m in sorted(glob.glob(p)) or [p]:
+            files.append(os.path.join(m, TELEMETRY_NAME) if os.path.isdir(m) else m)
+    files = [f for f in files if os.path.isfile(f)]
+    if not files:
+        print("ไม่พบไฟล์ telemetry")
+        return 1
+
+    print(f"{'run':<40}{'ep':>4}{'total':>10}{'data%':>7}{'comp%':>7}{'val%':>6}{'other%':>7}{'img/s':>8}"
+          f"{'RSS MB':>9}  workers/batch/cache")
+    for f in files:
+        run, epochs = load_telemetry(f)
+        s = summarize(run, epochs)
+        name = os.path.basename(run.get("save_dir") or os.path.dirname(os.path.abspath(f)))[:39]
+        cfg = f"{run.get('workers')}/{run.get('batch')}/{run.get('cache')}"
+        print(f"{name:<40}{s['epochs']:>4}{_fmt_s(s['total_s']):>10}{s['data_pct']:>7.1f}{s['compute_pct']:>7.1f}"
+              f"{s['val_pct']:>6.1f}{s['other_pct']:>7.1f}{s['imgs_per_s']:>8.1f}{s['peak_rss_mb']:>9.0f}  {cfg}")
+        for h in s["hints"]:
+            print(f"    - {h}")
+        if args.epochs:
+            print(f"    {'ep':>4}{'epoch s':>9}{'data s':>8}{'comp s':>8}{'val s':>7}{'img/s':>8}{'RSS MB':>8}")
+            for e in epochs:
+                print(f"    {e['epoch']:>4}{e['epoch_s']:>9.1f}{e['data_wait_s']:>8.1f}{e['compute_s']:>8.1f}"
+                      f"{e['val_s']:>7.1f}{e.get('imgs_per_s') or 0:>8.1f}{e.get('peak_rss_mb') or 0:>8.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,8 @@ from pathlib import Path
 from datetime import timedelta
 import time
 
+from train_telemetry import attach_telemetry
+
 DATA = r"E:\Final_project\dataset\data.yaml"
 MODEL = "yolo11s.pt"
 PROJECT = "runs"
@@ -13,6 +15,7 @@ EPOCHS = 200
 PATIENCE = 50
 
 model = YOLO(MODEL)
+attach_telemetry(model)   # เวลาราย epoch → <run dir>/telemetry.jsonl (python train_telemetry.py <run dir>)
 run_dir = Path(PROJECT) / "detect" / RUN_NAME
 run_dir.mkdir(parents=True, exist_ok=True)
 
@@ -1,8 +1,13 @@
 # train_shape.py
 from ultralytics import YOLO
 from pathlib import Path
+import multiprocessing as mp
 import torch, os
 
+from dataset_check import check_dataset
+from packed_dataset import packed_trainer
+from train_telemetry import attach_telemetry
+
 # ---------------------------------------
 # CONFIG (แก้ได้ตามชุดของคุณ)
 # ---------------------------------------
@@ -19,24 +24,15 @@ LR0      = 0.003               # เริ่มสูงนิด + cosine sche
 FREEZE   = 0                   # ให้ทั้งโมเดลเรียนรู้ (จะได้ unlearn ฉากเก่าได้ถ้าฟื้นจาก shape_best)
 PATIENCE = 25
 WORKERS  = 8
+# รูปที่ decode + resize แล้วแบบ memmap (python train_cache.py dataset2_only_shape/data.yaml --imgsz 896)
+# ไม่มีโฟลเดอร์นี้ = ใช้ cache="ram" แบบเดิม
+PACKED_CACHE = Path(f"cache/dataset2_only_shape_img{IMGSZ}")
 
 # เลือก device อัตโนมัติ
 DEVICE = 0 if torch.cuda.is_available() else "cpu"
 
-# ---------------------------------------
-# เลือกจุดเริ่ม: ถ้ามี shape_best.pt จะเริ่มจากของเดิม
-# ถ้าอยาก “เริ่มใหม่จาก yolov11s” ให้เปลี่ยน init_path = WEIGHTS_S
-# ---------------------------------------
-init_path = WEIGHTS_OLD if WEIGHTS_OLD.exists() else WEIGHTS_S
-print(f"[INFO] INIT_WEIGHTS = {init_path}")
-
-# โหลดโมเดล
-model = YOLO(str(init_path))
-
-# ---------------------------------------
-# TRAIN
-# ---------------------------------------
-model.train(
+# argument ของ model.train (hparam_sweep.py ใช้ชุดนี้เป็นค่าตั้งต้นแล้วแทนค่าเฉพาะที่ค้นหา)
+TRAIN_ARGS = dict(
     data=str(DATA_YAML),
     epochs=EPOCHS,
     imgsz=IMGSZ,
@@ -46,7 +42,6 @@ model.train(
     patience=PATIENCE,        # early stop
     workers=WORKERS,
     device=DEVICE,
-    cache="ram",              # โหลดไวขึ้น
     rect=True,                # pack รูปหลายอัตราส่วนให้ดี
     # ---- augmentation ที่เหมาะกับ "รูปร่างจาน" บนเฟรมเต็ม ----
     mosaic=0.8,               # ช่วงต้นช่วย generalize
@@ -69,15 +64,53 @@ model.train(
     verbose=True,
 )
 
-# ---------------------------------------
-# VALIDATE บน test split ของ shape
-# ---------------------------------------
-model.val(
-    data=str(DATA_YAML),
-    split="test",
-    imgsz=IMGSZ,
-    conf=0.25,       # ค่าเริ่มต้นโอเคสำหรับ Stage-A
-    iou=0.6,         # ให้กรอบกระชับขึ้นนิด
-    device=DEVICE,
-    verbose=True,
-)
+
+def main():
+    # ---------------------------------------
+    # ตรวจ label ของชุด shape ก่อนเทรน (ขนาน + cache ผลต่อไฟล์ ดู dataset_check.py)
+    # ---------------------------------------
+    report = check_dataset(DATA_YAML)
+    print(report.summary())
+    if not report.ok:
+        report.print_errors(30)
+        raise SystemExit("กรุณาแก้ label ของชุด shape แล้วรันใหม่ครับ")
+
+    # ---------------------------------------
+    # เลือกจุดเริ่ม: ถ้ามี shape_best.pt จะเริ่มจากของเดิม
+    # ถ้าอยาก “เริ่มใหม่จาก yolov11s” ให้เปลี่ยน init_path = WEIGHTS_S
+    # ---------------------------------------
+    init_path = WEIGHTS_OLD if WEIGHTS_OLD.exists() else WEIGHTS_S
+    print(f"[INFO] INIT_WEIGHTS = {init_path}")
+
+    # โหลดโมเดล
+    model = YOLO(str(init_path))
+    attach_telemetry(model)   # เวลาราย epoch → <run dir>/telemetry.jsonl (python train_telemetry.py <run dir>)
+
+    if (PACKED_CACHE / "index.json").exists():
+        print(f"[INFO] PACKED_CACHE = {PACKED_CACHE}")
+        cache_kw = dict(cache=False, trainer=packed_trainer(PACKED_CACHE))
+    else:
+        cache_kw = dict(cache="ram")      # โหลดไวขึ้น (แต่ต้องมี RAM พอทั้งชุด)
+
+    # ---------------------------------------
+    # TRAIN
+    # ---------------------------------------
+    model.train(**TRAIN_ARGS, **cache_kw)   # cache: memmap ถ้า build ไว้ ไม่งั้น cache="ram"
+
+    # ---------------------------------------
+    # VALIDATE บน test split ของ shape
+    # ---------------------------------------
+    model.val(
+        data=str(DATA_YAML),
+        split="test",
+        imgsz=IMGSZ,
+        conf=0.25,       # ค่าเริ่มต้นโอเคสำหรับ Stage-A
+        iou=0.6,         # ให้กรอบกระชับขึ้นนิด
+        device=DEVICE,
+        verbose=True,
+    )
+
+
+if __name__ == "__main__":
+    mp.freeze_support()
+    main()